@@ -1,9 +1,9 @@
 # app/crud/audit_event.py
 
-from typing import List
+from typing import Any, Dict, List, Sequence
 
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 from sqlalchemy.orm import Session
 
 from app.models.audit_event import AuditEvent
@@ -21,6 +21,17 @@ async def create_event(db: AsyncSession, event_type: str, message: str) -> Audit
     return evt
 
 
+async def insert_events(conn: AsyncConnection, events: Sequence[Dict[str, Any]]) -> int:
+    """
+    Insère un lot d'événements ({event_type, message, created_at}) en UN seul
+    INSERT multi-lignes (writer d'audit en tâche de fond, app/services/audit_writer.py).
+    """
+    if not events:
+        return 0
+    await conn.execute(insert(AuditEvent.__table__).values(list(events)))
+    return len(events)
+
+
 def get_recent(db: Session, limit: int = 20) -> List[AuditEvent]:
     """
     Retourne les derniers événements d'audit (ordre décroissant).
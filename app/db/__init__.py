@@ -1,13 +1,18 @@
-# app/db/__init__.py ? fa?ade simple pour les tests (sync)
-import os
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+# app/db/__init__.py — façade simple (sync) : engine partagé, sessions, smoke test
+from contextlib import contextmanager
+from typing import Iterator
+
+from sqlalchemy import text
+
+from app.db.engine import dispose_engines, env_db_url, get_engine, get_sessionmaker
+
 
 def db_url():
-    return os.getenv('HONOUA_DB_URL', 'sqlite:///./local.db')
+    return env_db_url('HONOUA_DB_URL', default='sqlite:///./local.db')
+
+
+SessionLocal = get_sessionmaker(db_url())
 
-_engine = create_engine(db_url(), future=True)
-SessionLocal = sessionmaker(bind=_engine, autocommit=False, autoflush=False, future=True)
 
 def get_db():
     db = SessionLocal()
@@ -16,12 +21,26 @@ def get_db():
     finally:
         db.close()
 
-def smoke():
+
+@contextmanager
+def db_conn() -> Iterator:
+    """Context manager connexion brute (pour requêtes simples)."""
+    conn = get_engine(db_url()).connect()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def smoke() -> bool:
+    """
+    Smoke test rapide : SELECT 1 (PG/SQLite). Retourne True si succès.
+    """
     try:
-        with _engine.connect() as conn:
+        with db_conn() as conn:
             conn.execute(text('SELECT 1'))
         return True
     except Exception:
         return False
 
-__all__ = ['get_db','db_url','smoke','SessionLocal']
+__all__ = ['get_db', 'db_url', 'db_conn', 'smoke', 'SessionLocal', 'get_engine', 'dispose_engines']
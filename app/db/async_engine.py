@@ -0,0 +1,145 @@
+# app/db/async_engine.py
+"""
+Pendant asynchrone de app/db/engine.py : AsyncEngine / AsyncSession pour les
+lectures chaudes servies par des handlers `async def` (scan produit, panier).
+
+- même URL que le pool synchrone, driver asynchrone substitué :
+  postgresql+psycopg2 → postgresql+asyncpg, sqlite → sqlite+aiosqlite ;
+- un AsyncEngine par URL et par processus, créé au premier appel (après le fork gunicorn) ;
+- mêmes réglages de pool (HONOUA_DB_POOL_*) et mêmes compteurs que le pool synchrone
+  (nom du pool suffixé ":async") ; SQLite : pas de pool (NullPool, une connexion par session).
+
+Les handlers qui gardent une Session synchrone restent en `def` (threadpool Starlette) :
+une Session synchrone dans un `async def` bloque la boucle d'événements.
+"""
+
+from __future__ import annotations
+
+from threading import Lock
+from typing import Any, AsyncIterator, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from app.db.engine import InstrumentedQueuePool, _label, db_url, normalize_db_url, pool_settings
+from app.telemetry.metrics import record_pool_event, register_pool_status_provider
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_db_url(url: Optional[str] = None) -> str:
+    """
+    URL synchrone (défaut : db_url()) → URL du driver asynchrone correspondant.
+    """
+    sa_url = make_url(normalize_db_url(url) or db_url())
+    backend = sa_url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise RuntimeError(f"no async driver configured for {backend}")
+    sa_url = sa_url.set(drivername=_ASYNC_DRIVERS[backend])
+    if backend == "postgresql" and "sslmode" in sa_url.query:
+        # asyncpg ne connaît pas sslmode (libpq) : ?sslmode=require → ?ssl=require
+        query = dict(sa_url.query)
+        query["ssl"] = query.pop("sslmode")
+        sa_url = sa_url.set(query=query)
+    return sa_url.render_as_string(hide_password=False)
+
+
+# ---------------------------------------------------------------------------
+#  Registre
+# ---------------------------------------------------------------------------
+_lock = Lock()
+_engines: Dict[str, AsyncEngine] = {}
+_sessionmakers: Dict[str, async_sessionmaker] = {}
+
+
+def _create_async_engine(url: str) -> AsyncEngine:
+    name = f"{_label(url)}:async"
+    target = async_db_url(url)
+    if make_url(target).get_backend_name() == "sqlite":
+        return create_async_engine(target, poolclass=NullPool)
+
+    pool_cls = type(
+        f"InstrumentedAsyncQueuePool_{len(_engines)}",
+        (InstrumentedQueuePool, AsyncAdaptedQueuePool),
+        {"metrics_name": name},
+    )
+    engine = create_async_engine(target, poolclass=pool_cls, **pool_settings())
+
+    @event.listens_for(engine.sync_engine, "checkout")
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        record_pool_event(name, "checkout")
+
+    @event.listens_for(engine.sync_engine, "checkin")
+    def _on_checkin(dbapi_conn, conn_record):
+        record_pool_event(name, "checkin")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        record_pool_event(name, "connect")
+
+    return engine
+
+
+def get_async_engine(url: Optional[str] = None) -> AsyncEngine:
+    """
+    AsyncEngine partagé pour `url` (défaut : db_url()). Créé au premier appel.
+    """
+    url = normalize_db_url(url) or db_url()
+    engine = _engines.get(url)
+    if engine is not None:
+        return engine
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = _create_async_engine(url)
+            _engines[url] = engine
+    return engine
+
+
+def get_async_sessionmaker(url: Optional[str] = None) -> async_sessionmaker:
+    url = normalize_db_url(url) or db_url()
+    factory = _sessionmakers.get(url)
+    if factory is None:
+        # expire_on_commit=False : pas de lazy-load implicite (interdit en asynchrone) après commit
+        factory = async_sessionmaker(bind=get_async_engine(url), autoflush=False, expire_on_commit=False)
+        _sessionmakers[url] = factory
+    return factory
+
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    Dépendance FastAPI : AsyncSession fermée en fin de requête.
+    """
+    async with get_async_sessionmaker()() as session:
+        yield session
+
+
+def async_pool_status() -> Dict[str, Dict[str, Any]]:
+    status: Dict[str, Dict[str, Any]] = {}
+    for url, engine in list(_engines.items()):
+        pool = engine.sync_engine.pool
+        if not isinstance(pool, AsyncAdaptedQueuePool):
+            continue
+        status[f"{_label(url)}:async"] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": pool._max_overflow,
+        }
+    return status
+
+
+async def dispose_async_engines() -> None:
+    """
+    Ferme les connexions asynchrones (arrêt de l'app).
+    """
+    with _lock:
+        engines = list(_engines.values())
+    for engine in engines:
+        await engine.dispose()
+
+
+register_pool_status_provider(async_pool_status)
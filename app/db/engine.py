@@ -0,0 +1,233 @@
+# app/db/engine.py
+"""
+Registre unique des Engines SQLAlchemy (un pool par URL et par processus).
+
+Tous les routers / middlewares passent par get_engine() / get_sessionmaker()
+au lieu d'appeler create_engine() eux-mêmes : un worker gunicorn n'ouvre
+plus qu'un seul pool vers Postgres.
+
+Chaque module garde sa variable d'environnement et son fallback historiques
+(env_db_url) ; les modules qui aboutissent à la même URL partagent le même pool :
+- app.main                      : DATABASE_URL puis HONOUA_DB_URL (pas de fallback)
+- app.routers.cart_history      : DATABASE_URL, sinon sqlite:///./honoua.db
+- app.db, app.db.session        : HONOUA_DB_URL, sinon sqlite:///./local.db
+- tokens, blacklist_guard       : HONOUA_DB_URL, sinon le Postgres de docker-compose
+
+Réglages du pool (env) :
+- HONOUA_DB_POOL_SIZE       (défaut 5)
+- HONOUA_DB_MAX_OVERFLOW    (défaut 10)
+- HONOUA_DB_POOL_RECYCLE    (secondes, défaut 1800)
+- HONOUA_DB_POOL_TIMEOUT    (secondes, défaut 30)
+- HONOUA_DB_POOL_PRE_PING   (1/0, défaut 1)
+- HONOUA_DB_POOL_WAIT_MS    (seuil au-delà duquel un checkout sur pool saturé compte comme attente, défaut 1)
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from app.telemetry.metrics import record_pool_event, register_pool_status_provider
+
+# Fallback de get_engine() sans URL (scripts) : même base que cart_history
+DEFAULT_SQLITE_URL = "sqlite:///./honoua.db"
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None:
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+# ---------------------------------------------------------------------------
+#  URL
+# ---------------------------------------------------------------------------
+def normalize_db_url(url: Optional[str]) -> str:
+    """
+    Force le driver psycopg2 (Railway n'a pas psycopg v3).
+    """
+    url = (url or "").strip()
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql+psycopg2://", 1)
+    elif url.startswith("postgresql://"):
+        url = url.replace("postgresql://", "postgresql+psycopg2://", 1)
+    elif url.startswith("postgresql+psycopg://"):
+        url = url.replace("postgresql+psycopg://", "postgresql+psycopg2://", 1)
+    return url
+
+
+def env_db_url(*names: str, default: str = "") -> str:
+    """
+    Première variable renseignée parmi `names` (normalisée), `default` sinon.
+    """
+    for name in names:
+        value = (os.getenv(name) or "").strip()
+        if value:
+            return normalize_db_url(value)
+    return normalize_db_url(default)
+
+
+def configured_db_url() -> str:
+    """
+    URL explicitement configurée (DATABASE_URL puis HONOUA_DB_URL), "" sinon.
+    """
+    return env_db_url("DATABASE_URL", "HONOUA_DB_URL")
+
+
+def db_url() -> str:
+    """
+    URL configurée ou fallback SQLite local (honoua.db).
+    """
+    return configured_db_url() or DEFAULT_SQLITE_URL
+
+
+# ---------------------------------------------------------------------------
+#  Pool instrumenté
+# ---------------------------------------------------------------------------
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool qui mesure le temps passé à attendre une connexion libre
+    (pool saturé) et compte les timeouts.
+    Seuls les checkouts qui trouvent le pool saturé (size + max_overflow connexions
+    empruntées) comptent comme attente : l'ouverture d'une nouvelle connexion n'en est pas une.
+    """
+
+    wait_threshold_s = _env_int("HONOUA_DB_POOL_WAIT_MS", 1) / 1000.0
+    metrics_name = "default"
+
+    def _do_get(self):
+        saturated = self._max_overflow >= 0 and self.checkedout() >= self.size() + self._max_overflow
+        t0 = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            record_pool_event(self.metrics_name, "timeout")
+            raise
+        waited = time.perf_counter() - t0
+        if saturated and waited >= self.wait_threshold_s:
+            record_pool_event(self.metrics_name, "wait")
+            record_pool_event(self.metrics_name, "wait_ms", waited * 1000.0)
+        return conn
+
+
+def pool_settings() -> Dict[str, Any]:
+    return {
+        "pool_size": _env_int("HONOUA_DB_POOL_SIZE", 5),
+        "max_overflow": _env_int("HONOUA_DB_MAX_OVERFLOW", 10),
+        "pool_recycle": _env_int("HONOUA_DB_POOL_RECYCLE", 1800),
+        "pool_timeout": _env_int("HONOUA_DB_POOL_TIMEOUT", 30),
+        "pool_pre_ping": _env_bool("HONOUA_DB_POOL_PRE_PING", True),
+    }
+
+
+# ---------------------------------------------------------------------------
+#  Registre
+# ---------------------------------------------------------------------------
+_lock = Lock()
+_engines: Dict[str, Engine] = {}
+_sessionmakers: Dict[str, sessionmaker] = {}
+
+
+def _label(url: str) -> str:
+    return "default" if url == db_url() else make_url(url).render_as_string(hide_password=True)
+
+
+def _create_engine(url: str) -> Engine:
+    name = _label(url)
+    kwargs: Dict[str, Any] = {"future": True}
+    sa_url = make_url(url)
+
+    if sa_url.get_backend_name() == "sqlite":
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if sa_url.database in (None, "", ":memory:"):
+            # SQLite mémoire : pool par défaut (une connexion par thread)
+            return create_engine(url, **kwargs)
+
+    pool_cls = type(f"InstrumentedQueuePool_{len(_engines)}", (InstrumentedQueuePool,), {"metrics_name": name})
+    engine = create_engine(url, poolclass=pool_cls, **kwargs, **pool_settings())
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        record_pool_event(name, "checkout")
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_conn, conn_record):
+        record_pool_event(name, "checkin")
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        record_pool_event(name, "connect")
+
+    return engine
+
+
+def get_engine(url: Optional[str] = None) -> Engine:
+    """
+    Engine partagé pour `url` (défaut : db_url()). Créé au premier appel.
+    """
+    url = normalize_db_url(url) or db_url()
+    engine = _engines.get(url)
+    if engine is not None:
+        return engine
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            engine = _create_engine(url)
+            _engines[url] = engine
+    return engine
+
+
+def get_sessionmaker(url: Optional[str] = None) -> sessionmaker:
+    url = normalize_db_url(url) or db_url()
+    factory = _sessionmakers.get(url)
+    if factory is None:
+        factory = sessionmaker(bind=get_engine(url), autocommit=False, autoflush=False, future=True)
+        _sessionmakers[url] = factory
+    return factory
+
+
+def pool_status() -> Dict[str, Dict[str, Any]]:
+    """
+    État instantané des pools : taille, connexions empruntées, overflow...
+    """
+    status: Dict[str, Dict[str, Any]] = {}
+    for url, engine in list(_engines.items()):
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        status[_label(url)] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": pool._max_overflow,
+        }
+    return status
+
+
+def dispose_engines() -> None:
+    """
+    Ferme toutes les connexions (arrêt de l'app, post-fork gunicorn).
+    """
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+
+
+register_pool_status_provider(pool_status)
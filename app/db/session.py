@@ -1,21 +1,19 @@
 from __future__ import annotations
-import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-
-DB_URL = os.getenv('HONOUA_DB_URL', 'sqlite:///./local.db')
-engine = create_engine(DB_URL, pool_pre_ping=True, echo=False, future=True)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
-Base = declarative_base()
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import declarative_base
 
+from app.db.async_engine import get_async_sessionmaker
+from app.db.engine import env_db_url, get_engine, get_sessionmaker
 
-# --- compatibility alias for legacy imports ---
-async_session = None
-
+DB_URL = env_db_url("HONOUA_DB_URL", default="sqlite:///./local.db")
+engine = get_engine(DB_URL)
+SessionLocal = get_sessionmaker(DB_URL)
+Base = declarative_base()
 
-# --- compatibility shim for legacy imports ---
-def async_session():
-    # Delayed import to avoid circular deps
-    from app.deps.db import get_db
-    return get_db()
 
+# --- AsyncSession réelle (asyncpg / aiosqlite), cf. app/db/async_engine.py ---
+def async_session() -> AsyncSession:
+    """
+    `async with async_session() as session: await session.execute(...)`
+    """
+    return get_async_sessionmaker()()
@@ -0,0 +1,20 @@
+# app/deps/admin.py
+from __future__ import annotations
+
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+
+def require_admin(x_honoua_admin_token: Optional[str] = Header(None, alias="X-Honoua-Admin-Token")) -> None:
+    """
+    Garde des endpoints d'administration : en-tête X-Honoua-Admin-Token == HONOUA_ADMIN_TOKEN.
+    Sans HONOUA_ADMIN_TOKEN configuré, les endpoints admin sont désactivés (404).
+    """
+    expected = os.getenv("HONOUA_ADMIN_TOKEN", "")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_honoua_admin_token or not hmac.compare_digest(x_honoua_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Forbidden")
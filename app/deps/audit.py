@@ -3,12 +3,12 @@ from __future__ import annotations
 from typing import Optional
 from fastapi import Request
 from sqlalchemy.orm import Session
-from app.crud.audit_event import create_event
+from app.services.audit_writer import audit_writer
 
 
-def audit(db: Session, event_type: str, message: str):
-    """Enregistre un événement d’audit (synchrone)."""
-    return create_event(db, event_type=event_type, message=message)
+def audit(event_type: str, message: str) -> bool:
+    """Met un événement d’audit en file (écrit par lots en tâche de fond, sans aller-retour DB)."""
+    return audit_writer.enqueue(event_type, message)
 
 
 class AuditEvent:
@@ -24,15 +24,16 @@ def audit_from_request_sync(
 ) -> AuditEvent:
     """
     Version unique — compatible production & CI.
-    - Si `db` est fourni → enregistre l’événement réel.
+    - Si `db` est fourni → enregistre l’événement réel (file du writer d’audit,
+      la session n’est pas utilisée : aucune requête SQL ici).
     - Sinon → retourne un stub pour les tests.
     """
     user = getattr(request.state, "user", None)
     user_id = getattr(user, "id", "anonymous")
     message = f"user={user_id} | {note or event_type}"
 
-    if db:
-        audit(db, event_type, message)
+    if db is not None:
+        audit(event_type, message)
     return AuditEvent(
         event_type=event_type,
         note=note,
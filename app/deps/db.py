@@ -1,4 +1,5 @@
 # Simple proxy de compatibilit? : on r?-exporte get_db (synchrone)
 from app.db import get_db
 from app.db.session import SessionLocal  # facultatif si utilis? ailleurs
-__all__ = ["get_db", "SessionLocal"]
+from app.db.async_engine import get_async_db  # AsyncSession (lectures chaudes en async def)
+__all__ = ["get_db", "get_async_db", "SessionLocal"]
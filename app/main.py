@@ -1,6 +1,5 @@
 ﻿import importlib
 import os
-import math
 from sqlalchemy import String, Float, Integer, create_engine
 from sqlalchemy import String, Float, BigInteger, create_engine
 from sqlalchemy.orm import declarative_base, sessionmaker, Mapped, mapped_column, Session
@@ -16,10 +15,30 @@ from app.routers import groups_a41
 from app.routers import groups_a42
 from app.routers import notifications as notifications_router  # 👈 IMPORTANT
 from app.core.logger import logger
-from app.telemetry.metrics import get_metrics_snapshot, record_request
+from app.telemetry.metrics import get_metrics_snapshot
 from app.telemetry.metrics import get_prometheus_metrics
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy import inspect
+from sqlalchemy import event as sa_event
+from app.services.transport import (
+    EMISSION_FACTOR_TONNE_KM,
+    FRANCE_LAT,
+    FRANCE_LON,
+    compute_transport_batch,
+    haversine_km,
+    transport_distance_km,
+    transport_emissions_kg,
+)
+from app.services.product_search import (
+    SEARCH_MAX_LIMIT,
+    ensure_search_index,
+    search_products as run_product_search,
+)
+from app.services.product_cache import (
+    MISSING as MISSING_PRODUCT,
+    product_cache,
+    invalidate_product_cache,
+)
 
 
 
@@ -200,11 +219,9 @@ def root():
 @app.get("/metrics", tags=["metrics"])
 async def read_metrics():
     """
-    Endpoint A43.4 : expose un snapshot des métriques backend.
-    On incrémente le compteur à chaque appel pour les tests.
+    Endpoint A43.4 : expose un snapshot des métriques backend
+    (alimenté par TelemetryMiddleware, y compris pour cet appel).
     """
-    # On enregistre une "fausse" requête de 0 ms, succès
-    record_request(0.0, is_error=False)
     return get_metrics_snapshot()
 
 # code prometheus 
@@ -226,23 +243,19 @@ async def read_metrics_prometheus():
 # APRÈS (version MVP, plus explicite)
 
 from app.db.base_class import Base  # ✅ Base unique pour tous les modèles
+from app.db.async_engine import dispose_async_engines, get_async_sessionmaker
+from app.services.audit_writer import audit_writer
+from app.db.engine import configured_db_url, dispose_engines, get_engine, get_sessionmaker
 
-DB_URL = (os.getenv("DATABASE_URL") or os.getenv("HONOUA_DB_URL") or "").strip()
-
-# Forcer psycopg2 (Railway n'a pas psycopg v3)
-if DB_URL.startswith("postgres://"):
-    DB_URL = DB_URL.replace("postgres://", "postgresql+psycopg2://", 1)
-elif DB_URL.startswith("postgresql://"):
-    DB_URL = DB_URL.replace("postgresql://", "postgresql+psycopg2://", 1)
-elif DB_URL.startswith("postgresql+psycopg://"):
-    DB_URL = DB_URL.replace("postgresql+psycopg://", "postgresql+psycopg2://", 1)
+# URL normalisée (psycopg2 forcé) — engine/pool partagés via app.db.engine
+DB_URL = configured_db_url()
 
 engine = None
 SessionLocal = None
 
 if DB_URL:
-    engine = create_engine(DB_URL, echo=False, future=True)
-    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+    engine = get_engine(DB_URL)
+    SessionLocal = get_sessionmaker(DB_URL)
     logger.info("[DB] DATABASE_URL configured")
 else:
     logger.warning("[DB] DATABASE_URL not configured (DB disabled)")
@@ -284,10 +297,6 @@ class ProductDB(Base):
     # Confiance sur l’origine / la donnée
     # origin_confidence: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
 
-# Coordonnées de référence : centre approximatif de la France
-FRANCE_LAT = 46.603354
-FRANCE_LON = 1.888334
-
 # --- Auto-init DB schema (SQLite & PostgreSQL) ---
 try:
     # Charge les modèles éventuels d'autres modules (si tu en as)
@@ -297,35 +306,26 @@ try:
     if engine:
         Base.metadata.create_all(bind=engine)
         logger.info("[DB] Schema created/checked (Base.metadata.create_all)")
+        # Index plein texte products (FTS5 en SQLite ; Postgres : migration Alembic)
+        if ensure_search_index(engine):
+            logger.info("[DB] Search index checked (products_fts)")
 except Exception as e:
     logger.warning(f"[DB] DB init error: {e}")
 
 
-# Facteur d'émission pour le transport (kg CO2e / tonne.km)
-# Valeur MVP simple à affiner plus tard.
-EMISSION_FACTOR_TONNE_KM = 0.1
-
-
-def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    """
-    Calcul de la distance entre deux points GPS (lat, lon) en km
-    en utilisant la formule de Haversine.
-    """
-    # Conversion en radians
-    rlat1 = math.radians(lat1)
-    rlon1 = math.radians(lon1)
-    rlat2 = math.radians(lat2)
-    rlon2 = math.radians(lon2)
-
-    dlat = rlat2 - rlat1
-    dlon = rlon2 - rlon1
+@app.on_event("startup")
+async def _start_audit_writer():
+    # Flush des événements d'audit par lots (tâche de fond du worker)
+    if DB_URL:
+        audit_writer.start(DB_URL)
 
-    a = math.sin(dlat / 2) ** 2 + math.cos(rlat1) * math.cos(rlat2) * math.sin(dlon / 2) ** 2
-    c = 2 * math.asin(math.sqrt(a))
 
-    # Rayon moyen de la Terre en km
-    R = 6371.0
-    return R * c
+@app.on_event("shutdown")
+async def _dispose_db_engines():
+    # Vide la file d'audit, puis ferme les connexions des pools partagés (arrêt du worker)
+    await audit_writer.stop()
+    dispose_engines()
+    await dispose_async_engines()
 
 
 # ==========================
@@ -339,7 +339,8 @@ def list_products():
     """Retourne la liste statique (smoke test)."""
     return _FAKE_PRODUCTS
 
-from typing import Generator
+from typing import AsyncIterator, Generator
+from sqlalchemy.ext.asyncio import AsyncSession
 
 def get_db() -> Generator[Session, None, None]:
     if SessionLocal is None:
@@ -350,6 +351,16 @@ def get_db() -> Generator[Session, None, None]:
     finally:
         db.close()
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    AsyncSession (asyncpg / aiosqlite, app/db/async_engine.py) pour les lectures
+    chaudes en `async def` : pas de passage par le threadpool.
+    """
+    if not DB_URL:
+        raise HTTPException(status_code=503, detail="DB not configured")
+    async with get_async_sessionmaker(DB_URL)() as db:
+        yield db
+
 def get_db_optional() -> Generator[Optional[Session], None, None]:
     """
     Variante tolérante : si la DB n’est pas configurée, on continue sans DB (fallback mémoire).
@@ -365,6 +376,16 @@ def get_db_optional() -> Generator[Optional[Session], None, None]:
     finally:
         db.close()
 
+async def get_async_db_optional() -> AsyncIterator[Optional[AsyncSession]]:
+    """
+    Pendant asynchrone de get_db_optional (None si la DB n’est pas configurée).
+    """
+    if not DB_URL:
+        yield None
+        return
+    async with get_async_sessionmaker(DB_URL)() as db:
+        yield db
+
 @app.get("/products/{ean}")
 def get_product(ean: str, db: Session = Depends(get_db)):
     
@@ -408,41 +429,154 @@ def get_product(ean: str, db: Session = Depends(get_db)):
 
 
 @app.post("/products/search", response_model=List[Product])
-def search_products(query: ProductSearchQuery):
+def search_products(
+    query: ProductSearchQuery,
+    db: Optional[Session] = Depends(get_db_optional),
+):
     """
-    MVP (Option A): recherche uniquement en mémoire, sans dépendre de la DB.
+    Recherche produits (contrat historique : liste simple, 20 premiers résultats).
+    Index plein texte de `products` si la DB est disponible, sinon / à défaut
+    de résultat : fallback mémoire (CI / MVP).
     """
     q = (query.q or "").strip().lower()
     if not q:
         return []
 
+    if db is not None:
+        try:
+            items, _ = run_product_search(db, q, limit=20)
+            if items:
+                return [
+                    Product(ean=it["ean"], name=it["name"], brand=it["brand"], category=it["category"])
+                    for it in items
+                ]
+        except Exception as e:
+            logger.error(f"[search_products] Erreur DB: {e}")
+
     return [
         p for p in _FAKE_PRODUCTS
         if (p.name or "").lower().find(q) != -1
     ]
 
 
+@app.get("/api/v1/products/search")
+def search_products_v1(
+    q: str = Query(..., min_length=1, description="Texte recherché (préfixes acceptés)"),
+    limit: int = Query(20, ge=1, le=SEARCH_MAX_LIMIT),
+    cursor: Optional[str] = Query(None, description="next_cursor de la page précédente"),
+    db: Session = Depends(get_db),
+):
+    """
+    Recherche classée sur `products` avec pagination keyset.
+    Réponse : {"items": [...], "next_cursor": "..." | null}
+    """
+    try:
+        items, next_cursor = run_product_search(db, q, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+
 # ==========================
 #        Compare
 # ==========================
+COMPARE_MAX_EANS = int(os.getenv("HONOUA_COMPARE_MAX_EANS", "50"))
+
+
 class CompareRequest(BaseModel):
     eans: list[str]
+    user_lat: float | None = None
+    user_lon: float | None = None
 
 class CompareItemResult(BaseModel):
     ean: str
     carbon_kgCO2e: float | None = None
+    found: bool = False
+    product_name: str | None = None
+    brand: str | None = None
+    category: str | None = None
+    carbon_product_kg: float | None = None
+    carbon_pack_kg: float | None = None
+    carbon_transport_kg: float | None = None
+    distance_km: float | None = None
+    rank: int | None = None              # 1 = plus faible empreinte
+    diff_vs_best_kg: float | None = None
+    diff_vs_best_pct: float | None = None
 
 class CompareResponse(BaseModel):
     results: list[CompareItemResult]
+    best_ean: str | None = None
 
 @app.post("/compare", response_model=CompareResponse)
 @app.post("/api/compare", response_model=CompareResponse)  # alias pour compat tests / front
-def compare_products(payload: CompareRequest):
+async def compare_products(
+    payload: CompareRequest,
+    db: Optional[AsyncSession] = Depends(get_async_db_optional),
+):
     """
-    Endpoint de comparaison carbone minimal (valeurs null pour préparer le front).
+    Comparaison carbone de plusieurs EAN (total = produit + emballage + transport).
+    - une seule requête SQL pour tous les EAN (cache produit + IN (...))
+    - même calcul que /api/v1/co2/product/{ean}
+    - classement croissant (rank 1 = le plus sobre), ex aequo = même rang
+    Les EAN invalides / introuvables restent dans la réponse avec carbon_kgCO2e = null.
     """
-    results = [CompareItemResult(ean=ean, carbon_kgCO2e=None) for ean in payload.eans]
-    return CompareResponse(results=results)
+    if len(payload.eans) > COMPARE_MAX_EANS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Trop d'EAN à comparer (max {COMPARE_MAX_EANS}).",
+        )
+
+    eans = [str(e).strip() for e in payload.eans]
+    valid_eans = [e for e in eans if _is_valid_ean(e)]
+
+    products: dict = {}
+    if db is not None and valid_eans:
+        try:
+            products = await _fetch_normalized_products(db, valid_eans)
+        except Exception as e:
+            logger.error(f"[compare_products] Erreur DB: {e}")
+            products = {}
+
+    found_eans = [e for e, p in products.items() if p is not None]
+    payloads = dict(zip(
+        found_eans,
+        _build_co2_payloads([products[e] for e in found_eans], payload.user_lat, payload.user_lon),
+    ))
+
+    # Classement sur les totaux connus (un rang par EAN distinct, ex aequo = même rang)
+    all_totals = sorted(d["carbon_total_kg"] for d in payloads.values())
+    best_total = all_totals[0] if all_totals else None
+    rank_of: dict = {}
+    for position, total in enumerate(all_totals, start=1):
+        rank_of.setdefault(total, position)
+
+    results = []
+    for ean in eans:
+        d = payloads.get(ean)
+        if d is None:
+            results.append(CompareItemResult(ean=ean))
+            continue
+
+        total = d["carbon_total_kg"]
+        diff_kg = total - best_total
+        results.append(CompareItemResult(
+            ean=ean,
+            carbon_kgCO2e=total,
+            found=True,
+            product_name=d["product_name"],
+            brand=d["brand"],
+            category=d["category"],
+            carbon_product_kg=d["carbon_product_kg"],
+            carbon_pack_kg=d["carbon_pack_kg"],
+            carbon_transport_kg=d["carbon_transport_kg"],
+            distance_km=d["distance_km"],
+            rank=rank_of[total],
+            diff_vs_best_kg=diff_kg,
+            diff_vs_best_pct=(diff_kg / best_total * 100.0) if best_total > 0 else 0.0,
+        ))
+
+    best_ean = next((r.ean for r in results if r.rank == 1), None)
+    return CompareResponse(results=results, best_ean=best_ean)
 
 # Monter le router /api
 # app.include_router(api_router)  # sans préfixe (compat tests)
@@ -601,6 +735,12 @@ from app.middleware.blacklist_guard import blacklist_guard
 @app.middleware("http")
 async def _blacklist_guard_mw(request, call_next):
     return await blacklist_guard(request, call_next)
+
+# Télémétrie (A43) : ajoutée en dernier = middleware le plus externe,
+# mesure donc toute la chaîne (blacklist, CORS, logs...).
+from app.middleware.telemetry import TelemetryMiddleware
+
+app.add_middleware(TelemetryMiddleware)
     
 # 🔹 Notifications — montées sur l’app principale
 if notifications_router is not None and hasattr(notifications_router, "router"):
@@ -649,44 +789,14 @@ def compute_reliability(origin_confidence: float | None) -> tuple[int, str]:
     return score, level
 
 
-@app.get("/api/v1/co2/product/{ean}")
-async def get_co2_product(
-    ean: str,
-    user_lat: float | None = Query(None),
-    user_lon: float | None = Query(None),
-    db: Session = Depends(get_db),
-):
+def _normalize_product_row(row: "ProductDB") -> dict:
     """
-    Endpoint MVP pour retourner les données CO₂ d’un produit à partir de l’EAN.
-    Lit dans honou.products (ProductDB) et renvoie un JSON normalisé pour le front.
+    Normalise une ligne ProductDB pour le calcul CO₂ :
+    - heuristique d'inversion lat/lon (origin_lat NULL, lon + zone_geo numériques)
+    - poids avec fallback 0,5 kg
+    - CO₂ production / emballage en float (0.0 si NULL)
+    Le résultat est indépendant de la position utilisateur → il peut être mis en cache.
     """
-
-    # 1) Validation simple de l’EAN (8 à 14 chiffres)
-    if not (8 <= len(ean) <= 14) or not ean.isdigit():
-        raise HTTPException(
-            status_code=400,
-            detail="EAN invalide (8 à 14 chiffres attendus).",
-        )
-
-    # 2) Récupération du produit dans honou.products
-    stmt = select(ProductDB).where(ProductDB.ean13_clean == ean)
-    result = db.execute(stmt).scalar_one_or_none()
-
-    if result is None:
-        raise HTTPException(
-            status_code=404,
-            detail="Produit introuvable pour cet EAN.",
-        )
-
-    row = result  # alias pour la lisibilité
-
-    # 3) Champs simples
-    ean_out = row.ean13_clean
-    product_name = row.product_name
-    brand = row.brand
-    category = row.category
-    origin_country = row.origin_country
-
     # Valeurs brutes venant de la DB
     origin_lat_db = row.origin_lat
     origin_lon_db = row.origin_lon
@@ -698,7 +808,6 @@ async def get_co2_product(
     origin_lon = origin_lon_db
     zone_geo = zone_geo_db
 
-
     try:
         lon_as_float = float(origin_lon_db) if origin_lon_db is not None else None
     except (TypeError, ValueError):
@@ -714,87 +823,71 @@ async def get_co2_product(
     if origin_lat_db is None and lon_as_float is not None and zone_as_float is not None:
         origin_lat = lon_as_float           # ex : 46.603354
         origin_lon = zone_as_float          # ex : 1.888334
-        # zone_geo : tu peux le mettre à None ou le garder pour autre usage
         zone_geo = None
 
-
-    # 4) Poids utilisé (avec fallback 0,5 kg)
+    # Poids utilisé (avec fallback 0,5 kg)
     if row.net_weight_kg is not None:
         weight_kg_used = float(row.net_weight_kg)
     else:
         weight_kg_used = 0.5  # valeur par défaut (500 g)
 
-            # 5) CO₂ production et emballage
-    carbon_product_kg = float(row.carbon_product_kgco2e or 0.0)
-    carbon_pack_kg = float(row.carbon_pack_kgco2e or 0.0)
-
-    # 6) Distance et transport
+    return {
+        "ean": row.ean13_clean,
+        "product_name": row.product_name,
+        "brand": row.brand,
+        "category": row.category,
+        "carbon_product_kg": float(row.carbon_product_kgco2e or 0.0),
+        "carbon_pack_kg": float(row.carbon_pack_kgco2e or 0.0),
+        "weight_kg_used": weight_kg_used,
+        "origin_country": row.origin_country,
+        "origin_lat": origin_lat,
+        "origin_lon": origin_lon,
+        "zone_geo": zone_geo,
+    }
 
-    # Par défaut
-    distance_km = 0.0
 
-    # 6.1. Si on a des coordonnées d'origine, on tente d'abord utilisateur → produit
-    try:
-        origin_lat_f = float(origin_lat) if origin_lat is not None else None
-        origin_lon_f = float(origin_lon) if origin_lon is not None else None
-    except (TypeError, ValueError):
-        origin_lat_f = None
-        origin_lon_f = None
-
-    # Si on a origine ET utilisateur, distance réelle origine → utilisateur
-    if (
-        origin_lat_f is not None
-        and origin_lon_f is not None
-        and user_lat is not None
-        and user_lon is not None
-    ):
-        try:
-            distance_km = haversine_km(
-                origin_lat_f,
-                origin_lon_f,
-                float(user_lat),
-                float(user_lon),
-            )
-        except (TypeError, ValueError):
-            distance_km = 0.0
-
-    # Si pas de distance utilisateur, mais origine connue : origine → centre France
-    if distance_km == 0.0 and origin_lat_f is not None and origin_lon_f is not None:
-        try:
-            distance_km = haversine_km(
-                origin_lat_f,
-                origin_lon_f,
-                FRANCE_LAT,
-                FRANCE_LON,
-            )
-        except (TypeError, ValueError):
-            distance_km = 0.0
-
-    # 6.2. Si on n'a toujours pas de distance, on applique tes valeurs de référence
-    if distance_km == 0.0:
-        if origin_country == "FR":
-            distance_km = 1100.0
-        else:
-            distance_km = 4500.0
-
-    # 6.3. Calcul des émissions de transport
-    weight_tonnes = weight_kg_used / 1000.0
-    carbon_transport_kg = distance_km * weight_tonnes * EMISSION_FACTOR_TONNE_KM
+def _build_co2_payload(
+    product: dict,
+    user_lat: float | None,
+    user_lon: float | None,
+    distance_km: float | None = None,
+    carbon_transport_kg: float | None = None,
+) -> dict:
+    """
+    Calcule transport + total à partir d'un produit normalisé
+    et construit le JSON final conforme au contrat validé.
+    distance_km / carbon_transport_kg peuvent être fournis déjà calculés
+    (calcul groupé du batch, compute_transport_batch) ; sinon calcul unitaire.
+    """
+    weight_kg_used = product["weight_kg_used"]
+    carbon_product_kg = product["carbon_product_kg"]
+    carbon_pack_kg = product["carbon_pack_kg"]
+
+    # 1) Distance et transport
+    if distance_km is None:
+        distance_km = transport_distance_km(
+            product["origin_lat"],
+            product["origin_lon"],
+            user_lat,
+            user_lon,
+            product["origin_country"],
+        )
+    if carbon_transport_kg is None:
+        carbon_transport_kg = transport_emissions_kg(distance_km, weight_kg_used)
 
-    # 7) Total CO₂
+    # 2) Total CO₂
     carbon_total_kg = carbon_product_kg + carbon_pack_kg + carbon_transport_kg
 
-
-       # 8) Fiabilité (MVP : fixée à "moyenne")
+    # 3) Fiabilité (MVP : fixée à "moyenne")
     reliability_score = 60
     reliability_level = "moyenne"
 
-    # 9) Construction du JSON final conforme au contrat validé
+    # 4) Construction du JSON final conforme au contrat validé
     return {
-        "ean": ean_out,
-        "product_name": product_name,
-        "brand": brand,
-        "category": category,
+        "ean": product["ean"],
+        "product_name": product["product_name"],
+        "brand": product["brand"],
+        "category": product["category"],
 
         "carbon_product_kg": carbon_product_kg,
         "carbon_pack_kg": carbon_pack_kg,
@@ -807,9 +900,197 @@ async def get_co2_product(
         "reliability_score": reliability_score,
         "reliability_level": reliability_level,
 
-        "origin_country": origin_country,
-        "origin_lat": origin_lat,
-        "origin_lon": origin_lon,
-        "zone_geo": zone_geo,
+        "origin_country": product["origin_country"],
+        "origin_lat": product["origin_lat"],
+        "origin_lon": product["origin_lon"],
+        "zone_geo": product["zone_geo"],
     }
 
+
+def _build_co2_payloads(
+    products: List[dict],
+    user_lat: float | None,
+    user_lon: float | None,
+) -> List[dict]:
+    """
+    Variante panier : transport calculé en une passe (compute_transport_batch) pour tous les produits.
+    """
+    if not products:
+        return []
+
+    distances, transports = compute_transport_batch(
+        [p["origin_lat"] for p in products],
+        [p["origin_lon"] for p in products],
+        [p["weight_kg_used"] for p in products],
+        dest_lat=user_lat,
+        dest_lon=user_lon,
+        origin_country=[p["origin_country"] for p in products],
+    )
+    return [
+        _build_co2_payload(p, user_lat, user_lon, float(d), float(t))
+        for p, d, t in zip(products, distances, transports)
+    ]
+
+
+# Invalidation automatique du cache produit quand une ligne est modifiée via l'ORM.
+# (Pour un rechargement en masse hors ORM : appeler invalidate_product_cache().)
+def _invalidate_cached_product(mapper, connection, target) -> None:
+    if target.ean13_clean:
+        invalidate_product_cache([target.ean13_clean])
+
+
+for _evt in ("after_insert", "after_update", "after_delete"):
+    sa_event.listen(ProductDB, _evt, _invalidate_cached_product)
+
+
+@app.get("/api/v1/co2/product/{ean}")
+async def get_co2_product(
+    ean: str,
+    user_lat: float | None = Query(None),
+    user_lon: float | None = Query(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Endpoint MVP pour retourner les données CO₂ d’un produit à partir de l’EAN.
+    Lit dans honou.products (ProductDB) et renvoie un JSON normalisé pour le front.
+    Les produits normalisés (et les EAN inconnus) sont mis en cache par worker.
+    Session asynchrone : un cache hit ne quitte pas la boucle d'événements.
+    """
+
+    # 1) Validation simple de l’EAN (8 à 14 chiffres)
+    if not (8 <= len(ean) <= 14) or not ean.isdigit():
+        raise HTTPException(
+            status_code=400,
+            detail="EAN invalide (8 à 14 chiffres attendus).",
+        )
+
+    # 2) Cache produit, puis honou.products si besoin
+    product = product_cache.get(ean)
+
+    if product is None:
+        stmt = select(ProductDB).where(ProductDB.ean13_clean == ean)
+        row = (await db.execute(stmt)).scalar_one_or_none()
+
+        if row is None:
+            product_cache.set_missing(ean)
+        else:
+            product = _normalize_product_row(row)
+            product_cache.set(ean, product)
+
+    if product is None or product is MISSING_PRODUCT:
+        raise HTTPException(
+            status_code=404,
+            detail="Produit introuvable pour cet EAN.",
+        )
+
+    # 3) Transport (dépend de la position utilisateur) + JSON final
+    return _build_co2_payload(product, user_lat, user_lon)
+
+
+# ==========================
+#   CO2 — Batch (panier)
+# ==========================
+CO2_BATCH_MAX_EANS = int(os.getenv("HONOUA_CO2_BATCH_MAX_EANS", "200"))
+
+
+class Co2BatchRequest(BaseModel):
+    eans: List[str]
+    user_lat: Optional[float] = None
+    user_lon: Optional[float] = None
+
+
+def _is_valid_ean(ean: str) -> bool:
+    return 8 <= len(ean) <= 14 and ean.isdigit()
+
+
+async def _fetch_normalized_products(db: AsyncSession, eans: List[str]) -> dict:
+    """
+    Résout plusieurs EAN d'un coup : cache produit d'abord, puis UNE requête
+    `WHERE ean13_clean IN (...)` pour les absents du cache.
+    Retourne {ean: produit normalisé | None}.
+    """
+    resolved: dict = {}
+    to_fetch: List[str] = []
+
+    for ean in dict.fromkeys(eans):  # dédoublonnage en gardant l'ordre
+        cached = product_cache.get(ean)
+        if cached is None:
+            to_fetch.append(ean)
+        else:
+            resolved[ean] = None if cached is MISSING_PRODUCT else cached
+
+    if to_fetch:
+        stmt = select(ProductDB).where(ProductDB.ean13_clean.in_(to_fetch))
+        for row in (await db.execute(stmt)).scalars():
+            if row.ean13_clean in resolved:
+                continue  # doublon éventuel en base : on garde la première ligne
+            product = _normalize_product_row(row)
+            product_cache.set(row.ean13_clean, product)
+            resolved[row.ean13_clean] = product
+
+        for ean in to_fetch:
+            if ean not in resolved:
+                product_cache.set_missing(ean)
+                resolved[ean] = None
+
+    return resolved
+
+
+@app.post("/api/v1/co2/products")
+async def get_co2_products_batch(
+    payload: Co2BatchRequest,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Version batch de /api/v1/co2/product/{ean} pour valider un panier complet
+    en une seule requête HTTP (et une seule requête SQL pour les EAN non cachés).
+    Chaque EAN est rapporté individuellement : ok | not_found | invalid.
+    """
+    eans = [str(e).strip() for e in payload.eans]
+    if not eans:
+        raise HTTPException(status_code=422, detail="eans ne peut pas être vide.")
+    if len(eans) > CO2_BATCH_MAX_EANS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Trop d'EAN dans la requête (max {CO2_BATCH_MAX_EANS}).",
+        )
+
+    valid_eans = [e for e in eans if _is_valid_ean(e)]
+    products = await _fetch_normalized_products(db, valid_eans) if valid_eans else {}
+
+    # Transport des produits trouvés en une passe (compute_transport_batch, un calcul par EAN distinct)
+    found_eans = [e for e, p in products.items() if p is not None]
+    payloads = dict(zip(
+        found_eans,
+        _build_co2_payloads([products[e] for e in found_eans], payload.user_lat, payload.user_lon),
+    ))
+
+    items = []
+    found = 0
+    for ean in eans:
+        if not _is_valid_ean(ean):
+            items.append({
+                "ean": ean,
+                "status": "invalid",
+                "detail": "EAN invalide (8 à 14 chiffres attendus).",
+            })
+            continue
+
+        data = payloads.get(ean)
+        if data is None:
+            items.append({
+                "ean": ean,
+                "status": "not_found",
+                "detail": "Produit introuvable pour cet EAN.",
+            })
+            continue
+
+        found += 1
+        items.append({"ean": ean, "status": "ok", "data": data})
+
+    return {
+        "count": len(items),
+        "found": found,
+        "missing": len(items) - found,
+        "items": items,
+    }
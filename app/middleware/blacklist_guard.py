@@ -1,7 +1,10 @@
 ﻿from typing import Callable
 from fastapi import Request, Response
 from fastapi.responses import JSONResponse
-from sqlalchemy import create_engine, text
+from starlette.concurrency import run_in_threadpool
+
+from app.db.engine import get_engine
+from app.security.revocation import revocation_cache
 import os
 import jwt
 
@@ -10,7 +13,7 @@ DATABASE_URL = os.getenv("HONOUA_DB_URL", "postgresql+psycopg://honou:Honou2025L
 JWT_SECRET = os.getenv("HONOUA_JWT_SECRET", "devsecret")
 JWT_ALGO = os.getenv("HONOUA_JWT_ALGO", "HS256")
 
-engine = create_engine(DATABASE_URL, future=True)
+engine = get_engine(DATABASE_URL)  # pool partagé (app.db.engine)
 
 # Chemins exemptés (santé, docs, openapi, static)
 EXEMPT = {
@@ -46,9 +49,22 @@ async def blacklist_guard(request: Request, call_next: Callable) -> Response:
     if not jti:
         return await call_next(request)
 
-    with engine.begin() as conn:
-        hit = conn.execute(text("SELECT 1 FROM token_blacklist WHERE jti=:jti"), {"jti": jti}).first()
-        if hit:
+    # Cache mémoire des JTI révoqués : pas d'accès DB sur le chemin courant.
+    # Rafraîchissement incrémental (périodique) hors de la boucle d'événements.
+    if revocation_cache.needs_refresh():
+        await run_in_threadpool(revocation_cache.refresh, engine)
+
+    if revocation_cache.is_revoked(jti):
+        return JSONResponse(status_code=401, content={"detail": "Token revoked"})
+
+    if revocation_cache.is_stale():
+        # Cache trop ancien (base injoignable aux derniers refresh) : lecture directe,
+        # requête refusée si elle échoue aussi (fail closed)
+        try:
+            revoked = await run_in_threadpool(revocation_cache.lookup, engine, jti)
+        except Exception:
+            return JSONResponse(status_code=503, content={"detail": "Revocation list unavailable"})
+        if revoked:
             return JSONResponse(status_code=401, content={"detail": "Token revoked"})
 
     return await call_next(request)
@@ -1,55 +1,92 @@
 # app/middleware/telemetry.py
+"""
+Middleware ASGI "pur" (pas de BaseHTTPMiddleware : pas de tâche ni de copie
+de la réponse par requête). Il mesure la latence, le statut et la taille de
+la réponse, puis alimente les histogrammes de app.telemetry.metrics.
+
+La route est étiquetée par son gabarit (`/products/{ean}`) et non par le
+chemin réel, pour borner la cardinalité des séries.
+"""
 
 import time
 import logging
-from typing import Callable, Optional
+from typing import Optional
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
-from app.telemetry.metrics import record_request
+from app.telemetry.metrics import record_http_request, track_in_flight
 
 logger = logging.getLogger("honoua.telemetry")
 
+# Étiquette des requêtes sans route (404, fichiers statiques...)
+UNMATCHED_ROUTE = "__unmatched__"
+
 
-def _get_client_ip(request: Request) -> Optional[str]:
+def _get_client_ip(scope: Scope, headers: Headers) -> Optional[str]:
     """
     Récupère l'adresse IP du client.
 
     Priorité :
     1) x-forwarded-for (première IP)
-    2) request.client.host
+    2) client ASGI (scope["client"])
     """
-    xff = request.headers.get("x-forwarded-for")
+    xff = headers.get("x-forwarded-for")
     if xff:
         # x-forwarded-for: client, proxy1, proxy2...
         first_ip = xff.split(",")[0].strip()
         if first_ip:
             return first_ip
 
-    client = request.client
-    return client.host if client else None
+    client = scope.get("client")
+    return client[0] if client else None
 
 
-class TelemetryMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
-        start = time.perf_counter()
+def _route_label(scope: Scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path_format", None) or getattr(route, "path", None)
+    return path or UNMATCHED_ROUTE
+
 
-        client_ip = _get_client_ip(request)
-        user_agent = request.headers.get("user-agent")
-        request_id = request.headers.get("x-request-id")
+class TelemetryMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
 
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        headers = Headers(scope=scope)
+        client_ip = _get_client_ip(scope, headers)
+        user_agent = headers.get("user-agent")
+        request_id = headers.get("x-request-id")
+        path = scope.get("path", "")
+        method = scope.get("method", "GET")
+
+        status_code = 500
+        response_bytes = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        track_in_flight(1)
         try:
-            response = await call_next(request)
+            await self.app(scope, receive, send_wrapper)
         except Exception:
             duration_ms = (time.perf_counter() - start) * 1000.0
 
             logger.exception(
                 "request_failed",
                 extra={
-                    "path": request.url.path,
-                    "method": request.method,
+                    "path": path,
+                    "method": method,
                     "status_code": 500,
                     "duration_ms": round(duration_ms, 3),
                     "client_ip": client_ip,
@@ -60,18 +97,19 @@ class TelemetryMiddleware(BaseHTTPMiddleware):
             )
 
             # Enregistrement métrique : requête en erreur
-            record_request(duration_ms, is_error=True)
-
+            record_http_request(_route_label(scope), method, 500, duration_ms, response_bytes)
             raise
+        finally:
+            track_in_flight(-1)
 
         duration_ms = (time.perf_counter() - start) * 1000.0
 
         logger.info(
             "request_completed",
             extra={
-                "path": request.url.path,
-                "method": request.method,
-                "status_code": response.status_code,
+                "path": path,
+                "method": method,
+                "status_code": status_code,
                 "duration_ms": round(duration_ms, 3),
                 "client_ip": client_ip,
                 "user_agent": user_agent,
@@ -80,7 +118,4 @@ class TelemetryMiddleware(BaseHTTPMiddleware):
             },
         )
 
-        # Enregistrement métrique : requête réussie
-        record_request(duration_ms, is_error=False)
-
-        return response
+        record_http_request(_route_label(scope), method, status_code, duration_ms, response_bytes)
@@ -13,7 +13,7 @@ except ModuleNotFoundError:
 router = APIRouter(prefix="/logs", tags=["logs"])
 
 @router.get("/recent", response_model=List[AuditEventRead])
-async def get_recent_logs(limit: int = 20, db: Session = Depends(get_db)):  # ← Session
+def get_recent_logs(limit: int = 20, db: Session = Depends(get_db)):  # ← Session
     logger.info("GET /logs/recent called")
     limit = limit if 1 <= limit <= 100 else 20
     events = get_recent(db, limit=limit)
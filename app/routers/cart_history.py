@@ -1,22 +1,35 @@
 ﻿# app/routers/cart_history.py
 
 import os
-from datetime import datetime, timezone
-from pydantic import BaseModel
-from typing import Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker, Session
+from datetime import date, datetime, timedelta, timezone
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Dict, Literal, Optional, List
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+
+from app.db.engine import env_db_url, get_engine, get_sessionmaker
+from app.services.cart_summary import (
+    SERIES_MONTHS, SERIES_WEEKS, budget_state, cart_summary
+)
+from app.services.challenge_catalogue import compute_etag, etag_matches
+from app.services.co2_daily import record_cart
 
 # ==========================
 #      Connexion DB
 # ==========================
-DB_URL = os.getenv("DATABASE_URL", "sqlite:///./honoua.db")
+# Engine / pool partagés (app.db.engine) : même pool que main.py si même URL
+DB_URL = env_db_url("DATABASE_URL", default="sqlite:///./honoua.db")
+engine = get_engine(DB_URL)
+SessionLocal = get_sessionmaker(DB_URL)
 
-# Pour SQLite, même logique que dans main.py
-connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
-engine = create_engine(DB_URL, echo=False, future=True, connect_args=connect_args)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+# POST /api/cart/history/batch : paniers max par appel, lignes max par INSERT multi-lignes
+CART_BATCH_MAX = int(os.getenv("HONOUA_CART_BATCH_MAX", "100"))
+CART_BATCH_INSERT_ROWS = 500
+# validated_at client d'un panier rejoué : ramené dans [maintenant - N jours, maintenant]
+CART_BATCH_MAX_AGE_DAYS = int(os.getenv("HONOUA_CART_BATCH_MAX_AGE_DAYS", "30"))
 
 
 def get_db() -> Session:
@@ -42,6 +55,9 @@ class CartHistoryCreate(BaseModel):
     total_distance_km: float
     days_captured_by_tree: float
     tree_equivalent: float
+    # Clé générée par le client à la validation du panier : un POST dont la réponse
+    # s'est perdue, puis rejoué par la file hors ligne, n'est enregistré qu'une fois
+    idempotency_key: Optional[str] = Field(None, min_length=1, max_length=128)
 
 
 class CartHistoryResponse(BaseModel):
@@ -51,6 +67,32 @@ class CartHistoryResponse(BaseModel):
     period_month: str
     period_week: str
 
+class CartHistoryBatchItem(CartHistoryCreate):
+    # Même clé que le POST unitaire (créée à la validation), obligatoire dans la file
+    idempotency_key: str = Field(..., min_length=1, max_length=128)
+    # Date de validation côté client (panier mis en file hors ligne) ; absente = réception
+    validated_at: Optional[datetime] = None
+
+
+class CartHistoryBatchRequest(BaseModel):
+    # Validation élément par élément (un panier invalide ne bloque pas le reste de la file)
+    items: List[Dict[str, Any]]
+
+
+class CartHistoryBatchResult(BaseModel):
+    idempotency_key: Optional[str] = None
+    status: Literal["created", "duplicate", "invalid"]
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class CartHistoryBatchResponse(BaseModel):
+    validated_at: datetime
+    period_month: str
+    period_week: str
+    created: int
+    items: List[CartHistoryBatchResult]
+
 class CartHistoryItem(BaseModel):
     id: int
     user_id: Optional[str]
@@ -65,6 +107,37 @@ class CartHistoryItem(BaseModel):
     created_at: datetime
 
 
+class CartSummaryPoint(BaseModel):
+    label: str
+    co2_kg: float
+    distance_km: float
+    tree_equivalent: float
+    days_captured_by_tree: float
+    carts: int
+
+
+class CartBudget(BaseModel):
+    year: int
+    household_size: int
+    budget_annual_kg: float
+    co2_annual_kg: float
+    percent_used: float
+    percent_remaining: float
+    budget_remaining_kg: float
+    status: Literal["ok", "warning", "over"]
+    tree_equivalent: float
+    days_captured_by_tree: float
+
+
+class CartHistorySummary(BaseModel):
+    budget: CartBudget
+    month: List[CartSummaryPoint]
+    week: List[CartSummaryPoint]
+
+
+# GET /api/cart/history : taille de page max ; colonnes projetables (fields=)
+CART_HISTORY_MAX_LIMIT = int(os.getenv("HONOUA_CART_HISTORY_MAX_LIMIT", "500"))
+CART_HISTORY_FIELDS = tuple(CartHistoryItem.model_fields)
 
 # ==========================
 #          Router
@@ -73,7 +146,7 @@ router = APIRouter(prefix="/api/cart", tags=["cart"])
 
 
 @router.post("/history", response_model=CartHistoryResponse)
-async def create_cart_history(
+def create_cart_history(
     payload: CartHistoryCreate,
     db: Session = Depends(get_db),
     x_honoua_user_id: Optional[str] = Header(None, alias="X-Honoua-User-Id"),
@@ -84,7 +157,9 @@ async def create_cart_history(
 
     - Reçoit les métriques du panier (total CO2, nb articles, distance, arbres)
     - Calcule la date de validation et les périodes (mois / semaine)
-    - Insère une ligne dans honou.co2_cart_history
+    - Insère une ligne dans honou.co2_cart_history (+ cumul journalier co2_cart_daily)
+    - idempotency_key déjà enregistrée pour l'utilisateur (panier déjà reçu, ou déjà
+      rejoué par /history/batch) : rien n'est inséré, status "duplicate" et id existant
     - Renvoie un objet de confirmation
     """
 
@@ -121,9 +196,11 @@ async def create_cart_history(
         "days_captured_by_tree": payload.days_captured_by_tree,
         "tree_equivalent": payload.tree_equivalent,
         "created_at": now.isoformat(),
+        "idempotency_key": payload.idempotency_key,
     }
 
     # 4) INSERT adapté à la structure réelle de la table SQLite
+    #    (clé connue : DO NOTHING, RETURNING vide)
     stmt = text("""
         INSERT INTO honou.co2_cart_history (
             user_id,
@@ -135,7 +212,8 @@ async def create_cart_history(
             total_distance_km,
             days_captured_by_tree,
             tree_equivalent,
-            created_at
+            created_at,
+            idempotency_key
         ) VALUES (
             :user_id,
             :period_type,
@@ -146,15 +224,31 @@ async def create_cart_history(
             :total_distance_km,
             :days_captured_by_tree,
             :tree_equivalent,
-            :created_at
+            :created_at,
+            :idempotency_key
         )
+        ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
         RETURNING id;
     """)
 
+    status = "ok"
     try:
         # Exécution de l'INSERT + récupération de l'ID (compatible PostgreSQL + SQLite récent)
         result = db.execute(stmt, params)
-        new_id = result.scalar_one()
+        new_id = result.scalar_one_or_none()
+        if new_id is None:
+            # Panier déjà enregistré : id et date d'origine, cumul journalier inchangé
+            status = "duplicate"
+            existing = db.execute(
+                _EXISTING_KEYS_SQL, {"user_id": user_id, "keys": [payload.idempotency_key]}
+            ).one()
+            new_id, now = existing[0], _as_utc(existing[1]) or now
+            year, week_num, _ = now.isocalendar()
+            period_month = now.strftime("%Y-%m")
+            period_week = f"{year}-W{week_num:02d}"
+        else:
+            # Cumul journalier (co2_cart_daily) mis à jour dans la même transaction
+            record_cart(db, user_id, now, payload.total_co2_g)
         db.commit()
 
     except Exception as e:
@@ -166,7 +260,7 @@ async def create_cart_history(
 
     return CartHistoryResponse(
         id=new_id,
-        status="ok",
+        status=status,
         validated_at=now,
         period_month=period_month,
         period_week=period_week,
@@ -174,74 +268,315 @@ async def create_cart_history(
 
 
 
-@router.get("/history", response_model=List[CartHistoryItem])
+def _user_id_from_header(x_honoua_user_id: Optional[str]) -> int:
+    if not x_honoua_user_id:
+        raise HTTPException(status_code=400, detail="Missing X-Honoua-User-Id")
+    try:
+        return int(x_honoua_user_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid X-Honoua-User-Id (integer expected)")
+
+
+_CART_COLUMNS = (
+    "user_id", "period_type", "period_label", "total_co2_g", "nb_articles", "nb_distinct_products",
+    "total_distance_km", "days_captured_by_tree", "tree_equivalent", "created_at", "idempotency_key",
+)
+
+
+def _insert_batch_sql(n: int):
+    """
+    INSERT multi-lignes (n lignes, paramètres suffixés _0.._n-1) ; les clés déjà connues
+    sont ignorées (index unique partiel) et RETURNING ne renvoie que les lignes insérées.
+    """
+    values = ",\n".join(
+        "(" + ", ".join(f":{col}_{i}" for col in _CART_COLUMNS) + ")" for i in range(n)
+    )
+    return text(f"""
+        INSERT INTO honou.co2_cart_history ({", ".join(_CART_COLUMNS)})
+        VALUES {values}
+        ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+        RETURNING id, idempotency_key
+    """)
+
+
+def _clamp_validated_at(value: Optional[datetime], now: datetime) -> datetime:
+    """
+    Date de validation retenue pour un panier rejoué : celle du client (naïve = UTC),
+    bornée à [now - CART_BATCH_MAX_AGE_DAYS, now] (horloge client fausse ou file ancienne).
+    """
+    if value is None:
+        return now
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    value = value.astimezone(timezone.utc)
+    return min(max(value, now - timedelta(days=CART_BATCH_MAX_AGE_DAYS)), now)
+
+
+_EXISTING_KEYS_SQL = text("""
+    SELECT id, created_at, idempotency_key
+    FROM honou.co2_cart_history
+    WHERE user_id = :user_id AND idempotency_key IN :keys
+""").bindparams(bindparam("keys", expanding=True))
+
+
+@router.post("/history/batch", response_model=CartHistoryBatchResponse)
+def create_cart_history_batch(
+    payload: CartHistoryBatchRequest,
+    db: Session = Depends(get_db),
+    x_honoua_user_id: Optional[str] = Header(None, alias="X-Honoua-User-Id"),
+):
+    """
+    Rejeu groupé de la file hors ligne du front (paniers validés sans réseau).
+
+    - Chaque élément porte une idempotency_key : une clé déjà enregistrée pour
+      l'utilisateur (ou répétée dans le lot) est renvoyée en "duplicate" avec son id
+    - validated_at (optionnel, horodatage client de la validation) date le panier :
+      created_at, period_label et cumul journalier ; borné à CART_BATCH_MAX_AGE_DAYS
+    - Les nouveaux paniers sont insérés en INSERT multi-lignes, cumul journalier
+      mis à jour en un upsert, le tout dans une seule transaction
+    - Statut par élément : created / duplicate / invalid
+    """
+    user_id = _user_id_from_header(x_honoua_user_id)
+    if len(payload.items) > CART_BATCH_MAX:
+        raise HTTPException(status_code=422, detail=f"Too many items (max {CART_BATCH_MAX})")
+
+    now = datetime.now(timezone.utc)
+    year, week_num, _ = now.isocalendar()
+    period_month = now.strftime("%Y-%m")
+    period_week = f"{year}-W{week_num:02d}"
+
+    # 1) Validation élément par élément, dédoublonnage des clés du lot
+    results: List[CartHistoryBatchResult] = []
+    fresh: Dict[str, CartHistoryBatchItem] = {}
+    for raw in payload.items:
+        try:
+            item = CartHistoryBatchItem.model_validate(raw)
+        except ValidationError as e:
+            key = raw.get("idempotency_key") if isinstance(raw, dict) else None
+            results.append(CartHistoryBatchResult(
+                idempotency_key=key if isinstance(key, str) else None,
+                status="invalid",
+                detail=str(e.errors()[0].get("msg")) if e.errors() else "invalid item",
+            ))
+            continue
+        results.append(CartHistoryBatchResult(idempotency_key=item.idempotency_key, status="duplicate"))
+        fresh.setdefault(item.idempotency_key, item)
+
+    # 2) INSERT multi-lignes + cumul, une transaction
+    inserted: Dict[str, int] = {}
+    ids: Dict[str, int] = {}
+    stamps = {key: _clamp_validated_at(item.validated_at, now) for key, item in fresh.items()}
+    try:
+        items = list(fresh.values())
+        for lo in range(0, len(items), CART_BATCH_INSERT_ROWS):
+            chunk = items[lo:lo + CART_BATCH_INSERT_ROWS]
+            params: Dict[str, Any] = {}
+            for i, item in enumerate(chunk):
+                params.update({
+                    f"user_id_{i}": user_id,
+                    f"period_type_{i}": "month",
+                    f"period_label_{i}": stamps[item.idempotency_key].strftime("%Y-%m"),
+                    f"total_co2_g_{i}": item.total_co2_g,
+                    f"nb_articles_{i}": item.nb_articles,
+                    f"nb_distinct_products_{i}": item.nb_distinct_products,
+                    f"total_distance_km_{i}": item.total_distance_km,
+                    f"days_captured_by_tree_{i}": item.days_captured_by_tree,
+                    f"tree_equivalent_{i}": item.tree_equivalent,
+                    f"created_at_{i}": stamps[item.idempotency_key].isoformat(),
+                    f"idempotency_key_{i}": item.idempotency_key,
+                })
+            for row in db.execute(_insert_batch_sql(len(chunk)), params):
+                inserted[row[1]] = row[0]
+
+        # Cumul journalier : un upsert par jour de validation
+        days: Dict[date, List[str]] = {}
+        for key in inserted:
+            days.setdefault(stamps[key].date(), []).append(key)
+        for keys in days.values():
+            record_cart(
+                db, user_id, stamps[keys[0]], sum(fresh[k].total_co2_g for k in keys), cart_count=len(keys)
+            )
+        known = [k for k in fresh if k not in inserted]
+        if known:
+            ids = {row[2]: row[0] for row in db.execute(_EXISTING_KEYS_SQL, {"user_id": user_id, "keys": known})}
+        db.commit()
+
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erreur lors de l'enregistrement de l'historique du panier CO₂ : {e}",
+        )
+    # 3) Statuts : la première occurrence d'une clé insérée est "created"
+    for res in results:
+        key = res.idempotency_key
+        if res.status == "invalid":
+            continue
+        if key in inserted:
+            res.status, res.id = "created", inserted.pop(key)
+            ids[key] = res.id
+        else:
+            res.id = ids.get(key)
+
+    return CartHistoryBatchResponse(
+        validated_at=now,
+        period_month=period_month,
+        period_week=period_week,
+        created=sum(1 for r in results if r.status == "created"),
+        items=results,
+    )
+
+
+def _summary_point(bucket: dict) -> CartSummaryPoint:
+    return CartSummaryPoint(
+        label=bucket["label"],
+        co2_kg=bucket["co2_g"] / 1000,
+        distance_km=bucket["distance_km"],
+        tree_equivalent=bucket["tree_equivalent"],
+        days_captured_by_tree=bucket["days_captured_by_tree"],
+        carts=int(bucket["carts"]),
+    )
+
+
+@router.get("/history/summary", response_model=CartHistorySummary)
+def get_cart_history_summary(
+    household_size: int = Query(1, ge=1, le=20),
+    months: int = Query(12, ge=1, le=SERIES_MONTHS),
+    weeks: int = Query(12, ge=1, le=SERIES_WEEKS),
+    db: Session = Depends(get_db),
+    x_honoua_user_id: Optional[str] = Header(None, alias="X-Honoua-User-Id"),
+):
+    """
+    Budget annuel et séries semaine / mois de suivi-co2, calculés côté serveur
+    (app/services/cart_summary.py, cache par utilisateur, clé sur son dernier panier).
+    Séries : `months` / `weeks` derniers buckets, du plus ancien au plus récent.
+    """
+    user_id = _user_id_from_header(x_honoua_user_id)
+    try:
+        summary = cart_summary(db, user_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erreur lors du calcul du résumé des paniers CO₂ : {e}",
+        )
+
+    year = summary["year"]
+    return CartHistorySummary(
+        budget=CartBudget(
+            year=int(year["label"]),
+            household_size=household_size,
+            tree_equivalent=year["tree_equivalent"],
+            days_captured_by_tree=year["days_captured_by_tree"],
+            **budget_state(year["co2_g"] / 1000, household_size),
+        ),
+        month=[_summary_point(b) for b in summary["month"][-months:]],
+        week=[_summary_point(b) for b in summary["week"][-weeks:]],
+    )
+
+
+# Dernier panier de l'utilisateur : base de l'ETag (index (user_id, id)).
+# Pas de Last-Modified : created_at d'un panier rejoué est sa date de validation
+# côté client, antérieure à son insertion (un If-Modified-Since le manquerait).
+_LATEST_SQL = text("""
+    SELECT id
+    FROM honou.co2_cart_history
+    WHERE user_id = :user_id
+    ORDER BY id DESC
+    LIMIT 1
+""")
+
+
+def _projection(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(CART_HISTORY_FIELDS)
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in CART_HISTORY_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(unknown)}")
+    # id toujours renvoyé (curseur before_id), ordre du modèle
+    return [f for f in CART_HISTORY_FIELDS if f == "id" or f in wanted]
+
+
+def _as_utc(value: Any) -> Optional[datetime]:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+@router.get(
+    "/history",
+    # Projection (fields=) : lignes renvoyées telles quelles, pas de validation CartHistoryItem
+    response_model=None,
+    responses={200: {
+        "model": List[Dict[str, Any]],
+        "description": "Paniers : colonnes de CartHistoryItem, ou seulement celles de fields= (id toujours inclus)",
+    }},
+)
 def list_cart_history(
-    limit: int = 50,
+    request: Request,
+    limit: int = Query(50, ge=1),
+    before_id: Optional[int] = Query(None, ge=1, description="curseur : paniers d'id inférieur (X-Next-Before-Id)"),
+    fields: Optional[str] = Query(None, description="colonnes renvoyées, séparées par des virgules (id toujours inclus)"),
+    db: Session = Depends(get_db),
     x_honoua_user_id: Optional[str] = Header(None, alias="X-Honoua-User-Id"),
 ):
 
     """
     Retourne les `limit` derniers paniers CO2, du plus récent au plus ancien.
+
+    - Pagination keyset : before_id=<id> → paniers plus anciens ; en-tête
+      X-Next-Before-Id tant qu'il en reste
+    - fields=total_co2_g,created_at : projection (payload réduit) ; chaque élément ne
+      porte que ces colonnes + id, d'où un schéma List[Dict] plutôt que CartHistoryItem
+    - ETag calculé sur le dernier panier (id) de l'utilisateur : historique
+      inchangé → 304 sans relire les lignes
     """
+    user_id = _user_id_from_header(x_honoua_user_id)
+    limit = min(limit, CART_HISTORY_MAX_LIMIT)
+    columns = _projection(fields)
 
-    # ✅ INSÉRER ICI (juste avant "db = SessionLocal()")
-    if not x_honoua_user_id:
-        raise HTTPException(status_code=400, detail="Missing X-Honoua-User-Id")
-    
     try:
-        user_id = int(x_honoua_user_id)
-    except (TypeError, ValueError):
-        raise HTTPException(status_code=400, detail="Invalid X-Honoua-User-Id (integer expected)")
+        latest_id = db.execute(_LATEST_SQL, {"user_id": user_id}).scalar()
+        etag = compute_etag(
+            [{"latest_id": latest_id, "limit": limit, "before_id": before_id, "fields": columns}],
+            str(user_id),
+        )
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "X-Honoua-User-Id"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
 
-    db = SessionLocal()
-    try:
-        stmt = text("""
-            SELECT
-                id,
-                user_id,
-                period_type,
-                period_label,
-                total_co2_g,
-                nb_articles,
-                nb_distinct_products,
-                total_distance_km,
-                days_captured_by_tree,
-                tree_equivalent,
-                created_at
+        where_before = "AND id < :before_id" if before_id is not None else ""
+        stmt = text(f"""
+            SELECT {", ".join(columns)}
             FROM honou.co2_cart_history
-            WHERE user_id = :user_id
+            WHERE user_id = :user_id {where_before}
             ORDER BY id DESC
             LIMIT :limit;
         """)
-
-
-        result = db.execute(stmt, {"limit": limit, "user_id": user_id})
-        rows = result.fetchall()
-
-        items = [
-            CartHistoryItem(
-                id=row[0],
-                user_id=str(row[1]),
-                period_type=row[2],
-                period_label=row[3],
-                total_co2_g=row[4],
-                nb_articles=row[5],
-                nb_distinct_products=row[6],
-                total_distance_km=row[7],
-                days_captured_by_tree=row[8],
-                tree_equivalent=row[9],
-                created_at=row[10],
-            )
-            for row in rows
-        ]
-
-        return items
+        # +1 ligne : savoir s'il reste une page sans requête supplémentaire
+        params = {"limit": limit + 1, "user_id": user_id, "before_id": before_id}
+        rows = db.execute(stmt, params).mappings().all()
 
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Erreur lors de la récupération de l'historique des paniers CO₂ : {e}",
         )
-    finally:
-        db.close()
 
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Before-Id"] = str(rows[-1]["id"])
+
+    # Dicts sérialisés directement (pas de modèle Pydantic par ligne)
+    items = []
+    for row in rows:
+        item = dict(row)
+        if "user_id" in item and item["user_id"] is not None:
+            item["user_id"] = str(item["user_id"])
+        items.append(item)
+    return JSONResponse(content=jsonable_encoder(items), headers=headers)
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta, timezone
 import calendar
@@ -22,6 +22,25 @@ from app.schemas.challenges import (
     ChallengeEvaluateResponse,
 )
 from app.db import get_db # adapte ce chemin si besoin
+from app.deps.admin import require_admin
+from app.services.challenge_catalogue import CACHE_MAX_AGE_S, challenge_catalogue, etag_matches
+from app.services.co2_daily import two_window_sql, window_params
+from app.services.co2_source import (
+    ROLLUP_TABLE,
+    Co2Source,
+    invalidate_co2_source_cache,
+    resolve_co2_rollup,
+    resolve_co2_source,
+)
+from app.services.challenge_scoring import (
+    CO2_30D_CODE,
+    DB_STATUS_ACTIVE,
+    DB_STATUS_FAILED,
+    DB_STATUS_SUCCESS,
+    challenge_windows,
+    score_co2_challenge,
+    to_naive_utc,
+)
 
 
 router = APIRouter(
@@ -29,9 +48,7 @@ router = APIRouter(
 )
 
 # --- Challenge status mapping (DB <-> API) ---
-DB_STATUS_ACTIVE = "ACTIVE"
-DB_STATUS_SUCCESS = "SUCCESS"
-DB_STATUS_FAILED = "FAILED"
+# (valeurs DB et calcul du score : app/services/challenge_scoring.py)
 
 API_STATUS_MAP = {
     DB_STATUS_ACTIVE: "en_cours",
@@ -70,67 +87,43 @@ def repair_mojibake(s: str) -> str:
 
 # ---------- 1) Lister les défis disponibles ---------- #
 @router.get("/challenges", response_model=list[ChallengeRead])
-def list_challenges(db: Session = Depends(get_db)):
+def list_challenges(
+    response: Response = None,
+    if_none_match: str | None = Header(None, alias="If-None-Match"),
+    db: Session = Depends(get_db),
+):
 
 
     """
     Retourne la liste des défis disponibles (catalogue).
+    Servi depuis le cache du worker (app/services/challenge_catalogue.py) avec ETag :
+    If-None-Match identique → 304.
     Robuste : en cas de mismatch de schéma (colonne/table), renvoie [] au lieu de 500.
     """
+    if response is None:
+        response = Response()
 
-    try:
-        rows = db.execute(
-            text("""
-                SELECT
-                    id,
-                    code,
-                    COALESCE(name, title, code) AS name,
-                    COALESCE(metric, 'CO2') AS metric,
-                    COALESCE(logic_type, 'REDUCTION_PCT') AS logic_type,
-                    COALESCE(period_type, 'DAYS') AS period_type,
-                    COALESCE(default_target_value, target_reduction_pct, 0)::float AS default_target_value,
-                    COALESCE(scope_type, 'CART') AS scope_type,
-                    metric,
-                    logic_type,
-                    period_type,
-                    default_target_value,
-                    COALESCE(scope_type, score_type) AS scope_type,
-                    COALESCE(active, is_active, TRUE) AS active
-                FROM public.challenges
-                WHERE COALESCE(active, is_active, TRUE) = TRUE
-                ORDER BY id ASC
-            """)
-
-
-        ).mappings().all()
+    items, etag = challenge_catalogue.get(db)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CACHE_MAX_AGE_S}, must-revalidate",
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
 
-        return [dict(r) for r in rows]
-
-    except (OperationalError, ProgrammingError) as e:
-        # Fallback schema-safe: only columns very likely to exist.
-        print("[A54][WARN] /challenges list schema mismatch:", e)
-
-        rows = db.execute(
-            text("""
-                SELECT
-                    id,
-                    code,
-                    COALESCE(name, code) AS name,
-                    'CO2' AS metric,
-                    'REDUCTION_PCT' AS logic_type,
-                    'DAYS' AS period_type,
-                    0::float AS default_target_value,
-                    'CART' AS scope_type,
-                    TRUE AS active
-                FROM public.challenges
-                ORDER BY id ASC
-            """)
-        ).mappings().all()
+    response.headers.update(headers)
+    return items
 
-        return [dict(r) for r in rows]
 
-    except (OperationalError, ProgrammingError):
-        return []
+@router.post("/admin/challenges/reload", dependencies=[Depends(require_admin)])
+def reload_challenges(db: Session = Depends(get_db)):
+    """
+    Recharge le catalogue des défis de CE worker (les autres suivent au plus tard
+    après HONOUA_CHALLENGES_CATALOGUE_TTL_S, ou immédiatement via un changement
+    de HONOUA_CHALLENGES_CATALOGUE_VERSION).
+    """
+    items, etag = challenge_catalogue.reload(db)
+    return {"count": len(items), "etag": etag, "version": challenge_catalogue.version}
 
 
 
@@ -547,128 +540,59 @@ def evaluate_challenge(
              .replace("\r", " ")
         )[:180]
             
-# --- Helpers schema (CO2) ---
-    def _table_exists(table_name: str) -> bool:
-        res = db.execute(
-            text("SELECT to_regclass(:fqtn) IS NOT NULL AS ok"),
-            {"fqtn": table_name},
-        )
-        # SQLAlchemy Result
-        try:
-            row = res.mappings().first()
-            return bool(row and row.get("ok"))
-        except Exception:
-            pass
-        # fallback minimal
-        try:
-            row2 = res.fetchone()
-            return bool(row2 and row2[0])
-        except Exception:
-            return False
-
-    def _table_columns(schema: str, table: str) -> set[str]:
-        try:
-            rows = db.execute(
-                text("""
-                    SELECT column_name
-                    FROM information_schema.columns
-                    WHERE table_schema = :schema
-                      AND table_name = :table
-                """),
-                {"schema": schema, "table": table},
-            ).scalars().all()
-            return set(rows or [])
-        except Exception:
-            try:
-                db.rollback()
-            except Exception:
-                pass
-            return set()
-
-
-    def _pick_ts_col(cols: set[str]) -> str | None:
-        # ordre volontaire : on privilégie created_at si présent, sinon validated_at, etc.
-        for c in ("created_at", "validated_at", "timestamp", "ts"):
-            if c in cols:
-                return c
-        return None
-
-
-    def _pick_co2_expr(cols: set[str]) -> tuple[str | None, str]:
-        # Retourne (expr_sql, unit) où expr_sql est en grammes
-        if "total_co2_g" in cols:
-            return "total_co2_g", "g"
-        if "co2_g" in cols:
-            return "co2_g", "g"
-        if "total_co2_kg" in cols:
-            return "(total_co2_kg * 1000)", "kg"
-        if "co2_kg" in cols:
-            return "(co2_kg * 1000)", "kg"
-        return None, "na"
-
-    # --- CO2 helpers (schema-aware) ---
-        
+# --- CO2 helpers (schema-aware) ---
+    # Source (schéma / table / colonnes) résolue une fois par processus et mise en cache :
+    # voir app/services/co2_source.py
     co2_table_schema = ""
     co2_table_ref = ""
+    # Cumul journalier (app/services/co2_daily.py) : jours entiers lus dans co2_cart_daily
+    co2_rollup: Co2Source | None = None
 
     co2_ts_col = "created_at"
     co2_co2_expr = "total_co2_g"
-    
-    def _co2_sum_and_days(
-            table_name: str,
-            start: datetime,
-            end: datetime,
-            end_inclusive: bool,
-        ) -> tuple[float | None, int]:
-            nonlocal co2_table_schema, co2_table_ref, co2_ts_col, co2_co2_expr
-
-            op = "<=" if end_inclusive else "<"
-
-            # 0) Résolution table/schema (honou prioritaire)
-            if IS_PYTEST:
-                schema = "public"
-                table_ref = table_name
-            else:
-                if _table_exists(f"honou.{table_name}"):
-                    schema = "honou"
-                    table_ref = f"honou.{table_name}"
-                elif _table_exists(f"public.{table_name}"):
-                    schema = "public"
-                    table_ref = f"public.{table_name}"
-                else:
-                    return None, 0
 
-            co2_table_schema = schema
-            co2_table_ref = table_ref
+    def _resolve_source(table_name: str) -> Co2Source | None:
+        nonlocal co2_table_schema, co2_table_ref, co2_ts_col, co2_co2_expr, co2_rollup
 
-            # 1) Colonnes (pytest = stub minimal, prod = information_schema)
-            cols = {"created_at", "total_co2_g"} if IS_PYTEST else _table_columns(schema, table_name)
-
-            ts_col = _pick_ts_col(cols)
-            co2_expr, _unit = _pick_co2_expr(cols)
-
-            co2_ts_col = ts_col or ""
-            co2_co2_expr = co2_expr or ""
-
-            if not ts_col or not co2_expr:
-                return None, 0
+        if IS_PYTEST:
+            # pytest = stub minimal (pas de to_regclass / information_schema), table brute
+            source = Co2Source("public", table_name, "created_at", "total_co2_g", "g")
+        else:
+            source = resolve_co2_source(db, table_name)
+            co2_rollup = resolve_co2_rollup(db, source)
+
+        if source is not None:
+            co2_table_schema = source.schema
+            co2_table_ref = source.table_ref
+            co2_ts_col = source.ts_col
+            co2_co2_expr = source.co2_expr
+        return source
+
+    def _co2_windows(
+            source: Co2Source | None,
+            ref_start: datetime,
+            cur_start: datetime,
+            cur_end: datetime,
+        ) -> tuple[float | None, int, float | None, int]:
+            """
+            (ref_total_g, ref_days, cur_total_g, cur_days) des deux fenêtres en UNE requête
+            (agrégat conditionnel, cf. app/services/co2_daily.py).
+            """
+            if source is None:
+                return None, 0, None, 0
 
             params = {
                 "user_id_str": str(user_id),
                 "user_id_uuid": str(user_id),  # garde la clé pour compat, même valeur
-                "start": start,
-                "end": end,
             }
-
-            q = text(f"""
-                SELECT
-                    SUM({co2_expr}) AS total_co2_g,
-                    COUNT(DISTINCT DATE({ts_col})) AS days_count
-                FROM {table_ref}
-                WHERE user_id::text IN (:user_id_str, :user_id_uuid)
-                  AND {ts_col} >= :start
-                  AND {ts_col} {op} :end
-            """)
+            # Avec cumul : jours entiers depuis co2_cart_daily, jours partiels depuis la table brute
+            params.update(window_params("postgresql", ref_start, cur_start, cur_end))
+            q = text(two_window_sql(
+                "postgresql",
+                source,
+                co2_rollup,
+                lambda col: f"{col}::text IN (:user_id_str, :user_id_uuid)",
+            ))
 
             try:
                 res = db.execute(q, params)
@@ -688,26 +612,33 @@ def evaluate_challenge(
                 if hasattr(r, "_mapping"):
                     r = dict(r._mapping)
                 elif not isinstance(r, dict):
-                    # tuple (total, days)
-                    if isinstance(r, (list, tuple)) and len(r) >= 2:
-                        r = {"total_co2_g": r[0], "days_count": r[1]}
+                    # tuple (ref_total, ref_days, cur_total, cur_days)
+                    if isinstance(r, (list, tuple)) and len(r) >= 4:
+                        r = {"ref_total_g": r[0], "ref_days": r[1], "cur_total_g": r[2], "cur_days": r[3]}
                     else:
                         try:
                             r = dict(r)
                         except Exception:
                             r = {}
 
-                total_g = r.get("total_co2_g")
-                days = int(r.get("days_count") or 0)
-
-                return (float(total_g) if total_g is not None else None), days
+                ref_g = r.get("ref_total_g")
+                cur_g = r.get("cur_total_g")
+                return (
+                    float(ref_g) if ref_g is not None else None,
+                    int(r.get("ref_days") or 0),
+                    float(cur_g) if cur_g is not None else None,
+                    int(r.get("cur_days") or 0),
+                )
 
             except Exception:
                 try:
                     db.rollback()
                 except Exception:
                     pass
-                return None, 0
+                # Schéma modifié depuis la mise en cache ? On redétectera au prochain appel.
+                invalidate_co2_source_cache(source.table_ref.split(".")[-1])
+                invalidate_co2_source_cache(ROLLUP_TABLE)
+                return None, 0, None, 0
     # --- Core ---
     try:
         now = datetime.utcnow()
@@ -744,7 +675,7 @@ def evaluate_challenge(
             raise HTTPException(status_code=404, detail="Instance de défi introuvable pour cet utilisateur.")
 
         code = (row.get("code") or "").upper()
-        if code != "CO2_30D_MINUS_10":
+        if code != CO2_30D_CODE:
             raise HTTPException(status_code=400, detail="Ce type de défi n'est pas pris en charge.")
         
         # start_date / end_date peuvent ne pas exister selon le schéma DB.
@@ -752,77 +683,44 @@ def evaluate_challenge(
         start_date = row.get("start_date") or row.get("created_at") or now
         end_date = row.get("end_date") or (start_date + timedelta(days=30))
 
-
         # Prod: la DB peut renvoyer des datetimes tz-aware ; on normalise en UTC naive
-        if getattr(start_date, "tzinfo", None) is not None:
-            start_date = start_date.astimezone(timezone.utc).replace(tzinfo=None)
-        if getattr(end_date, "tzinfo", None) is not None:
-            end_date = end_date.astimezone(timezone.utc).replace(tzinfo=None)
+        start_date = to_naive_utc(start_date)
+        end_date = to_naive_utc(end_date)
 
         # 2) Périodes
-        ref_end = start_date
-        ref_start = start_date - timedelta(days=30)
-
-        cur_start = start_date
-        cur_end = end_date if now > end_date else now
+        ref_start, ref_end, cur_start, cur_end = challenge_windows(start_date, end_date, now)
 
         # 3) CO2 : détecter source
         # (si ta prod utilise un autre nom, on ajoutera une 2e option ici)
         table_name = "co2_cart_history"
 
-        ref_total_g, ref_days = _co2_sum_and_days(table_name, ref_start, ref_end, end_inclusive=False)
-        cur_total_g, cur_days = _co2_sum_and_days(table_name, cur_start, cur_end, end_inclusive=True)
+        source = _resolve_source(table_name)
 
-        reference_value = (ref_total_g / 1000.0) if ref_total_g is not None else None  # kg
-        current_value = (cur_total_g / 1000.0) if cur_total_g is not None else 0.0    # kg
+        # référence [ref_start, ref_end = cur_start[ et courante [cur_start, cur_end] : une passe
+        ref_total_g, ref_days, cur_total_g, cur_days = _co2_windows(source, ref_start, cur_start, cur_end)
 
-        MIN_REF_DAYS = 7
-        MIN_CUR_DAYS = 1
-
-        has_ref = (reference_value is not None) and (reference_value > 0) and (ref_days >= MIN_REF_DAYS)
-        has_cur = (cur_days >= MIN_CUR_DAYS) or (cur_total_g is not None)
-
-        target_value = float(row.get("target_value") or 10.0)  # 10 = 10%
-        target_value_pct = (target_value / 100.0) if target_value > 1 else target_value
-
-        db_status = to_db_status(row.get("status"))
+        # Score (même calcul que la réévaluation en masse)
+        score = score_co2_challenge(
+            ref_total_g, ref_days, cur_total_g, cur_days,
+            target_value=row.get("target_value"),
+            db_status=to_db_status(row.get("status")),
+            end_date=end_date,
+            now=now,
+        )
+        db_status = score.db_status
         api_status = to_api_status(db_status)
-        progress_percent = None
-        message = ""
-
-        if not has_cur:
-            db_status = DB_STATUS_ACTIVE if now < end_date else DB_STATUS_FAILED
-            api_status = to_api_status(db_status)
-            message = "Pas encore de donnees CO2 sur la periode du defi. Commence a scanner des produits."
-        elif not has_ref:
-            db_status = DB_STATUS_ACTIVE if now < end_date else DB_STATUS_FAILED
-            api_status = to_api_status(db_status)
-            message = "Pas assez d'historique CO2 avant le debut du defi (min 7 jours). Continue a scanner."
-        else:
-            reduction = 1.0 - (current_value / reference_value) if reference_value > 0 else 0.0
-            progress_percent = (reduction / target_value_pct) * 100.0 if target_value_pct > 0 else None
-
-            if progress_percent is not None:
-                progress_percent = max(0.0, min(100.0, progress_percent))
-
-            if reduction >= target_value_pct:
-                db_status = DB_STATUS_SUCCESS
-                api_status = to_api_status(db_status)
-                message = "Bravo ! Objectif deja atteint." if now < end_date else "Bravo ! Defi reussi sur 30 jours."
-            else:
-                db_status = DB_STATUS_ACTIVE if now < end_date else DB_STATUS_FAILED
-                api_status = to_api_status(db_status)
-                if now < end_date:
-                    message = f"Reduction actuelle: {reduction * 100:.1f} %, objectif: {target_value_pct * 100:.0f} %. Continue !"
-                else:
-                    message = f"Defi termine. Reduction: {reduction * 100:.1f} %, objectif: {target_value_pct * 100:.0f} %."
+        reference_value = score.reference_value
+        current_value = score.current_value
+        target_value = score.target_value
+        progress_percent = score.progress_percent
+        message = score.message
 
         message = repair_mojibake(message)
 
             # En tests (FakeSession), on ne fait pas d'UPDATE DB : le test attend uniquement
             # select_row -> ref_row -> cur_row. Les UPDATE/commit/rollback cassent l'ordre.
         response.headers["X-Honoua-Evaluate-Resources"] = (
-            f"table={table_name};schema={co2_table_schema};ref={co2_table_ref};ts={co2_ts_col};expr={co2_co2_expr};ref_days={ref_days};cur_days={cur_days};pytest={int(IS_PYTEST)}"
+            f"table={table_name};schema={co2_table_schema};ref={co2_table_ref};ts={co2_ts_col};expr={co2_co2_expr};rollup={co2_rollup.table_ref if co2_rollup else ''};ref_days={ref_days};cur_days={cur_days};pytest={int(IS_PYTEST)}"
             )
 
         if IS_PYTEST:
@@ -1,13 +1,21 @@
 from __future__ import annotations
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 # ---- PATCH A42: safe import for legacy db_conn ----
 try:
     from app.db import db_conn  # legacy (peut ne pas exister en CI)
 except Exception:               # ImportError ou autre
     db_conn = None
-# ---- /PATCH ---------------------------------------from sqlalchemy import text
-from fastapi.responses import StreamingResponse
-import io, csv
+# ---- /PATCH ---------------------------------------
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.deps.db import get_db
+from app.services import emission_cube
+from app.services.co2_source import dialect_name
+from app.services.csv_export import csv_response, stream_rows
+from app.services.emissions_history import (
+    build_history_cube_sql, build_history_sql, bucket_totals, compute_trend_slope, page_limit, split_page
+)
 
 from app.schemas.emissions_history import (
     HistoryQuery, HistoryResponse, HistorySummary, DataPoint, Interval, GroupBy
@@ -37,49 +45,44 @@ def db_ping_a37():
         val = conn.execute(text("SELECT 1")).scalar_one()
     return {"db_ok": bool(val == 1)}
 
+def _opt_float(r, key):
+    v = r.get(key)
+    return float(v) if v is not None else None
+
 def _rows_to_models(rows):
     series = []
     sum_total = 0.0
     for r in rows:
         dp = DataPoint(
             t=r["t"],
-            sum=float(r["sum"]) if r["sum"] is not None else None,
-            avg=None,
-            count=int(r["count"]) if r["count"] is not None else None,
-            min=None,
-            max=None,
-            group=None,
+            sum=_opt_float(r, "sum"),
+            avg=_opt_float(r, "avg"),
+            count=int(r["count"]) if r.get("count") is not None else None,
+            min=_opt_float(r, "min"),
+            max=_opt_float(r, "max"),
+            group=str(r["group"]) if r.get("group") is not None else None,
         )
         series.append(dp)
-        if r["sum"] is not None:
+        if r.get("sum") is not None:
             sum_total += float(r["sum"])
     summary = HistorySummary(
         sum_total=sum_total,
-        trend_slope_per_interval=0.0,  # calcul avancé ajouté plus tard
+        # pente sur les buckets de la page (somme des groupes par bucket)
+        trend_slope_per_interval=compute_trend_slope(bucket_totals(rows)),
         count_points=len(series),
     )
     return series, summary
 
-def _rows_to_csv(rows):
-    headers = ["t", "sum", "avg", "count", "min", "max", "group"]
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(headers)
-    for r in rows:
-        w.writerow([
-            r.get("t"),
-            r.get("sum"),
-            None,
-            r.get("count"),
-            None,
-            None,
-            None,
-        ])
-    buf.seek(0)
-    return StreamingResponse(
-        buf,
-        media_type="text/csv; charset=utf-8",
-        headers={"Content-Disposition": 'inline; filename="emissions_history.csv"'}
+CSV_HEADER = ["t", "sum", "avg", "count", "min", "max", "group"]
+
+
+def _rows_to_csv(request: Request, rows):
+    # rows : itérateur (curseur côté serveur), encodé au fil de l'eau
+    return csv_response(
+        request,
+        CSV_HEADER,
+        ([r.get(col) for col in CSV_HEADER] for r in rows),
+        filename="emissions_history.csv",
     )
 
 @router.get(
@@ -87,29 +90,23 @@ def _rows_to_csv(rows):
     response_model=HistoryResponse,
     summary="Time-aggregated emissions (A37 JSON or CSV)"
 )
-def get_emissions_history_a37(request: Request, q: HistoryQuery = Depends()):
-    # 1) Agrégat minimal (semaine)
-    sql = """
-        WITH base AS (
-            SELECT
-                DATE_TRUNC('week', created_at) AS t,
-                SUM(emissions_gco2e) AS sum,
-                COUNT(*) AS count
-            FROM public.emission_calculations
-            WHERE 1=1
-            GROUP BY t
-            ORDER BY t ASC
-            LIMIT 366
-        )
-        SELECT * FROM base;
-    """
-    with db_conn() as conn:
-        rows = conn.execute(text(sql)).mappings().all()
+def get_emissions_history_a37(request: Request, q: HistoryQuery = Depends(), db: Session = Depends(get_db)):
+    # 1) SQL paramétré (interval, metrics, group_by, from/to, tz, keyset after)
+    accept = (request.headers.get("accept") or "").lower()
+    as_csv = "text/csv" in accept
+    try:
+        # CSV : une page exacte (pas de bucket en plus pour détecter la suite)
+        # Cube pré-agrégé si disponible (même fuseau), sinon lecture brute
+        built = build_history_cube_sql(q, dialect_name(db), emission_cube.cube_state(db), extra_bucket=not as_csv)
+        sql, params = built or build_history_sql(q, extra_bucket=not as_csv)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
     # 2) Content negotiation
-    accept = (request.headers.get("accept") or "").lower()
-    if "text/csv" in accept:
-        return _rows_to_csv(rows)
+    if as_csv:
+        return _rows_to_csv(request, stream_rows(db, text(sql), params))
+
+    rows, next_cursor = split_page(db.execute(text(sql), params).mappings().all(), page_limit(q))
 
     # 3) JSON par défaut
     series, summary = _rows_to_models(rows)
@@ -121,6 +118,7 @@ def get_emissions_history_a37(request: Request, q: HistoryQuery = Depends()):
         series=series,
         summary=summary,
         export_ready=True,
+        next_cursor=next_cursor,
     )
 
 
@@ -1,15 +1,18 @@
 from fastapi.encoders import jsonable_encoder
 from fastapi import APIRouter, Query, HTTPException, Request, Depends
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse
 from typing import Optional, Literal, List
 from pydantic import BaseModel, field_validator
-from datetime import date
-import io
-import csv
+from datetime import date, timedelta
 
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from app.deps.db import get_db
+from app.services import emission_cube
+from app.services.co2_source import dialect_name
+from app.services.csv_export import csv_response, stream_rows
+
+CSV_HEADER = ["category_code", "subcategory_code", "avg_emission", "min_emission", "max_emission", "total_emission"]
 
 router = APIRouter(prefix="/emissions", tags=["emissions"])
 
@@ -47,7 +50,7 @@ class SummaryItem(BaseModel):
 
 
 @router.get("/summary_a40")
-async def get_emissions_summary_a40(
+def get_emissions_summary_a40(
     request: Request,
     category_code: Optional[str] = Query(None),
     start_date: Optional[str] = Query(None, description="YYYY-MM-DD"),
@@ -97,18 +100,21 @@ async def get_emissions_summary_a40(
         # Filtres : category_code (égalité), start_date/end_date (sur created_at en UTC)
         conditions = []
         params = {}
+        # sort_by / order validés par SummaryParams (Literal) : interpolation sûre
+        col = payload.sort_by
+        dir_sql = payload.order.upper()
 
         if payload.category_code:
             conditions.append("ec.category_code = :category_code")
             params["category_code"] = payload.category_code
 
         if payload.start_date:
-            conditions.append("ec.created_at >= :start_date::timestamptz")
+            conditions.append("ec.created_at >= CAST(:start_date AS timestamptz)")
             params["start_date"] = payload.start_date
 
         if payload.end_date:
             # + 1 jour pour inclure la fin de journée
-            conditions.append("ec.created_at < (:end_date::date + INTERVAL '1 day')")
+            conditions.append("ec.created_at < (CAST(:end_date AS date) + INTERVAL '1 day')")
             params["end_date"] = payload.end_date
 
         where_sql = ("WHERE " + " AND ".join(conditions)) if conditions else ""
@@ -128,11 +134,46 @@ async def get_emissions_summary_a40(
         LIMIT :_limit OFFSET :_offset
         """
 
+        state = emission_cube.cube_state(db)
+        if state is not None:
+            # Cube pré-agrégé : jours du fuseau du cube, end_date incluse
+            dialect = dialect_name(db)
+            sql, params = emission_cube.summary_cube_sql(
+                dialect,
+                state,
+                emission_cube.day_start(payload.start_date) if payload.start_date else None,
+                emission_cube.day_start(payload.end_date + timedelta(days=1)) if payload.end_date else None,
+                {"category_code": payload.category_code} if payload.category_code else {},
+                col,
+                dir_sql,
+                emission_cube.cube_tz(dialect),
+            )
+
         params["_limit"] = int(payload.limit)
         params["_offset"] = int(payload.offset)
 
 
 
+        if negotiated == "csv":
+            # Export : curseur côté serveur, lignes encodées au fil de l'eau
+            rows = stream_rows(db, text(sql), params)
+            return csv_response(
+                request,
+                CSV_HEADER,
+                (
+                    [
+                        r["category_code"] or "",
+                        r.get("subcategory_code") or "",
+                        float(r["avg_emission"] or 0),
+                        float(r["min_emission"] or 0),
+                        float(r["max_emission"] or 0),
+                        float(r["total_emission"] or 0),
+                    ]
+                    for r in rows
+                ),
+                filename="emissions_summary_a40.csv",
+            )
+
         rows = db.execute(text(sql), params).mappings().all()
         summary = [
             SummaryItem(
@@ -164,19 +205,5 @@ async def get_emissions_summary_a40(
         return JSONResponse(content=jsonable_encoder(data))
 
 
-    # CSV : en-tête + éventuelles lignes (si agrégations OK)
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(["category_code", "subcategory_code", "avg_emission", "min_emission", "max_emission", "total_emission"])
-    for s in summary:
-        writer.writerow([
-            s.category_code,
-            s.subcategory_code or "",
-            s.avg_emission,
-            s.min_emission,
-            s.max_emission,
-            s.total_emission,
-        ])
-    csv_text = buf.getvalue()
-    headers = {"Content-Disposition": 'inline; filename="emissions_summary_a40.csv"'}
-    return PlainTextResponse(csv_text, media_type="text/csv", headers=headers)
+    # CSV : en-tête seul (agrégation indisponible, cf. note)
+    return csv_response(request, CSV_HEADER, [], filename="emissions_summary_a40.csv")
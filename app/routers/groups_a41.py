@@ -1,4 +1,5 @@
-﻿from datetime import date
+﻿import os
+from datetime import date
 from typing import Optional, List, Literal
 
 from fastapi import (
@@ -9,13 +10,21 @@ from fastapi import (
     Depends,
     status,
 )
-from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from fastapi.responses import JSONResponse, Response
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, field_validator
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
 from app.deps.db import get_db
+from app.services.csv_export import csv_response
+from app.services.group_emissions import (
+    fetch_group_rows,
+    summary_groups_sql,
+)
+
+# Nombre max de groupes comparés par appel à /emissions/summary_groups
+SUMMARY_GROUPS_MAX = int(os.getenv("HONOUA_SUMMARY_GROUPS_MAX", "50"))
 
 # ---------- Router ----------
 router = APIRouter(tags=["groups"])
@@ -57,7 +66,7 @@ class SummaryGroupsParams(BaseModel):
 # ---------- Groups CRUD minimal ----------
 
 @router.post("/groups", response_model=GroupOut, status_code=status.HTTP_201_CREATED)
-async def create_group(payload: GroupCreate, db: Session = Depends(get_db)):
+def create_group(payload: GroupCreate, db: Session = Depends(get_db)):
     """
     Création de groupe avec session SQLAlchemy synchrone.
     """
@@ -90,12 +99,12 @@ async def create_group(payload: GroupCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/groups", response_model=List[GroupOut])
-async def list_groups(
+def list_groups(
     owner_id: Optional[str] = Query(None),
     db: Session = Depends(get_db),
 ):
     """
-    Liste des groupes. DB en mode synchrone (pas de await sur db).
+    Liste des groupes. DB synchrone : handler `def` (threadpool).
     """
     if owner_id:
         result = db.execute(
@@ -133,15 +142,12 @@ async def list_groups(
 
 
 @router.delete("/groups/{group_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_group(group_id: int, db: Session = Depends(get_db)):
+def delete_group(group_id: int, db: Session = Depends(get_db)):
     """
-    Suppression d'un groupe + ses sessions associées.
+    Suppression d'un groupe + ses sessions associées (ON DELETE CASCADE : le trigger
+    de user_group_sessions ne recalcule rien pour un groupe supprimé).
     """
     try:
-        db.execute(
-            text("DELETE FROM public.user_group_sessions WHERE group_id = :gid"),
-            {"gid": group_id},
-        )
         db.execute(
             text("DELETE FROM public.user_groups WHERE id = :gid"),
             {"gid": group_id},
@@ -154,15 +160,17 @@ async def delete_group(group_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/groups/{group_id}/sessions", status_code=status.HTTP_204_NO_CONTENT)
-async def add_session_to_group(
+def add_session_to_group(
     group_id: int,
     payload: GroupSessionAdd,
     db: Session = Depends(get_db),
 ):
     """
-    Ajoute une session à un groupe (sans doublon).
+    Ajoute une session à un groupe (sans doublon). L'agrégat group_emissions_daily
+    est mis à jour par le trigger de user_group_sessions, dans la même transaction.
     """
     try:
+        # Déjà membre : ON CONFLICT DO NOTHING, le trigger ne se déclenche pas
         db.execute(
             text(
                 """
@@ -181,13 +189,14 @@ async def add_session_to_group(
 
 
 @router.delete("/groups/{group_id}/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_session_from_group(
+def remove_session_from_group(
     group_id: int,
     session_id: str,
     db: Session = Depends(get_db),
 ):
     """
-    Retire une session d'un groupe.
+    Retire une session d'un groupe (ses calculs quittent l'agrégat group_emissions_daily
+    par le trigger de user_group_sessions).
     """
     try:
         db.execute(
@@ -209,7 +218,7 @@ async def remove_session_from_group(
 # ---------- A41 — Summary par groupes ----------
 
 @router.get("/emissions/summary_groups")
-async def get_emissions_summary_groups(
+def get_emissions_summary_groups(
     request: Request,
     group_ids: List[int] = Query(..., description="IDs de groupes à comparer, ex: ?group_ids=1&group_ids=2"),
     start_date: Optional[str] = Query(None, description="YYYY-MM-DD"),
@@ -219,7 +228,7 @@ async def get_emissions_summary_groups(
 ):
     """
     Summary d'émissions par groupe (A41).
-    DB synchrone => pas de await sur db.execute.
+    DB synchrone => handler `def` (threadpool), pas de await sur db.execute.
     """
     # 1) Validation/normalisation des paramètres
     params = SummaryGroupsParams(
@@ -235,52 +244,39 @@ async def get_emissions_summary_groups(
     if negotiated is None:
         negotiated = "csv" if "text/csv" in (request.headers.get("accept") or "").lower() else "json"
 
-    # 2) Agrégation par groupe (une série par group_id)
-    series = []
-    for gid in params.group_ids:
-        conditions = [
-            "ec.session_id IN (SELECT ugs.session_id FROM public.user_group_sessions ugs WHERE ugs.group_id = :gid)"
-        ]
-        bind = {"gid": gid}
-
-        if params.start_date:
-            conditions.append("ec.created_at::date >= :start_date")
-            bind["start_date"] = params.start_date
-        if params.end_date:
-            conditions.append("ec.created_at::date <= :end_date")
-            bind["end_date"] = params.end_date
-
-        where_sql = "WHERE " + " AND ".join(conditions)
-
-        sql = f"""
-            SELECT
-                COALESCE(ec.category_code, '') AS category_code,
-                AVG(ec.emissions_gco2e)::float8 AS avg_emission,
-                MIN(ec.emissions_gco2e)::float8 AS min_emission,
-                MAX(ec.emissions_gco2e)::float8 AS max_emission,
-                SUM(ec.emissions_gco2e)::float8 AS total_emission
-            FROM public.emission_calculations ec
-            {where_sql}
-            GROUP BY 1
-            ORDER BY total_emission DESC NULLS LAST
-        """
-
-        rows = db.execute(text(sql), bind).mappings().all()
-        series.append(
+    # 2) Agrégation de tous les groupes en UNE requête : agrégat group_emissions_daily
+    #    si disponible, sinon jointure brute sur user_group_sessions
+    if len(set(params.group_ids)) > SUMMARY_GROUPS_MAX:
+        raise HTTPException(
+            status_code=422,
+            detail=f"too many group_ids (max {SUMMARY_GROUPS_MAX})",
+        )
+
+    bind = {"gids": sorted(set(params.group_ids))}
+    if params.start_date:
+        bind["start_date"] = params.start_date
+    if params.end_date:
+        bind["end_date"] = params.end_date
+
+    rows = fetch_group_rows(
+        db,
+        lambda aggregate: summary_groups_sql(aggregate, bool(params.start_date), bool(params.end_date)),
+        bind,
+    )
+
+    # Mise en forme en une passe (lignes déjà triées par groupe puis total décroissant)
+    items_by_group = {gid: [] for gid in params.group_ids}
+    for r in rows:
+        items_by_group[r["group_id"]].append(
             {
-                "group_id": gid,
-                "items": [
-                    {
-                        "category_code": r["category_code"] or "",
-                        "avg_emission": float(r["avg_emission"] or 0),
-                        "min_emission": float(r["min_emission"] or 0),
-                        "max_emission": float(r["max_emission"] or 0),
-                        "total_emission": float(r["total_emission"] or 0),
-                    }
-                    for r in rows
-                ],
+                "category_code": r["category_code"] or "",
+                "avg_emission": float(r["avg_emission"] or 0),
+                "min_emission": float(r["min_emission"] or 0),
+                "max_emission": float(r["max_emission"] or 0),
+                "total_emission": float(r["total_emission"] or 0),
             }
         )
+    series = [{"group_id": gid, "items": items_by_group[gid]} for gid in params.group_ids]
 
     data = {
         "status": "A41 groups summary OK",
@@ -291,23 +287,20 @@ async def get_emissions_summary_groups(
     if negotiated == "json":
         return JSONResponse(content=jsonable_encoder(data))
 
-    # CSV (groupé)
-    import io
-    import csv
-
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["group_id", "category_code", "avg_emission", "min_emission", "max_emission", "total_emission"])
-    for s in series:
-        for it in s["items"]:
-            w.writerow(
-                [
-                    s["group_id"],
-                    it["category_code"],
-                    it["avg_emission"],
-                    it["min_emission"],
-                    it["max_emission"],
-                    it["total_emission"],
-                ]
-            )
-    return PlainTextResponse(buf.getvalue(), media_type="text/csv")
+    # CSV (groupé), encodé au fil de l'eau
+    return csv_response(
+        request,
+        ["group_id", "category_code", "avg_emission", "min_emission", "max_emission", "total_emission"],
+        (
+            [
+                s["group_id"],
+                it["category_code"],
+                it["avg_emission"],
+                it["min_emission"],
+                it["max_emission"],
+                it["total_emission"],
+            ]
+            for s in series
+            for it in s["items"]
+        ),
+    )
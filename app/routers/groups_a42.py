@@ -1,46 +1,41 @@
 ﻿from fastapi import APIRouter, HTTPException, Query, Request, Depends
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
 from typing import Optional, List, Literal, Dict, Any
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
+from sqlalchemy.orm import Session
 from datetime import date
+import os
 from app.deps.db import get_db
+from app.services.csv_export import csv_response
+from app.services.group_emissions import fetch_group_rows, group_timeseries_sql
+from app.services.group_timeseries import (
+    AxisTooLong, bucket_count, fill_buckets, low_co2_ranks, period_averages, trend_slopes
+)
 
 router = APIRouter(tags=["groups"])
 
 Interval = Literal["week", "month"]
 
-def _trend_slope_from_items(items: List[Dict[str, Any]]) -> float:
-    """
-    Pente de tendance (moindres carrés) sur (index, total_emission).
-    Retourne 0.0 si < 2 points.
-    """
-    n = len(items)
-    if n < 2:
-        return 0.0
-    # x = 0..n-1 ; y = total_emission
-    sum_x = sum(range(n))
-    ys = [float(it.get("total_emission") or 0.0) for it in items]
-    sum_y = sum(ys)
-    sum_xx = sum(i * i for i in range(n))
-    sum_xy = sum(i * ys[i] for i in range(n))
-    denom = (n * sum_xx - sum_x * sum_x)
-    if denom == 0:
-        return 0.0
-    slope = (n * sum_xy - sum_x * sum_y) / denom
-    return float(slope)
+# Nombre max de groupes comparés par appel à /groups/compare
+COMPARE_GROUPS_MAX = int(os.getenv("HONOUA_COMPARE_GROUPS_MAX", "200"))
+# Nombre max de buckets de l'axe commun (défaut : 10 ans de semaines)
+COMPARE_MAX_BUCKETS = int(os.getenv("HONOUA_COMPARE_MAX_BUCKETS", "520"))
 
 @router.get("/groups/compare")
-async def compare_groups_evolution(
+def compare_groups_evolution(
     request: Request,
     ids: List[int] = Query(..., description="IDs des groupes, ex: ?ids=1&ids=2"),
     start_date: Optional[str] = Query(None, description="YYYY-MM-DD"),
     end_date: Optional[str] = Query(None, description="YYYY-MM-DD"),
     interval: Interval = Query("week", description="week | month"),
     format: Optional[str] = Query(None, description='"json" ou "csv"'),
-    db: AsyncSession = Depends(get_db),
+    db: Session = Depends(get_db),
 ):
+    """
+    Évolution comparée des groupes (A42). DB synchrone => handler `def` (threadpool), pas de await sur db.execute.
+    Une seule requête pour tous les groupes ; buckets alignés sur un axe commun
+    (semaines/mois sans données = 0) pour des pentes comparables.
+    """
     # --- Validation basique ---
     if not ids:
         raise HTTPException(status_code=422, detail="ids is required")
@@ -63,59 +58,55 @@ async def compare_groups_evolution(
         raise HTTPException(status_code=422, detail="interval must be 'week' or 'month'")
     bucket = "week" if interval == "week" else "month"
 
-    # --- 1) Collecte temporaire par groupe (timeseries + totaux de période) ---
-    tmp: List[Dict[str, Any]] = []
-    for gid in ids:
-        conditions = [
-            "ec.session_id IN (SELECT ugs.session_id FROM public.user_group_sessions ugs WHERE ugs.group_id = :gid)"
-        ]
-        bind: Dict[str, Any] = {"gid": gid}
-        if sd:
-            conditions.append("ec.created_at::date >= :start_date")
-            bind["start_date"] = sd
-        if ed:
-            conditions.append("ec.created_at::date <= :end_date")
-            bind["end_date"] = ed
-        where_sql = "WHERE " + " AND ".join(conditions)
-
-        sql = f"""
-            SELECT
-                date_trunc('{bucket}', ec.created_at::date)::date AS bucket_start,
-                SUM(ec.emissions_gco2e)::float8 AS total_emission,
-                AVG(ec.emissions_gco2e)::float8 AS avg_emission
-            FROM public.emission_calculations ec
-            {where_sql}
-            GROUP BY 1
-            ORDER BY bucket_start ASC
-        """
-        rows = (await db.execute(text(sql), bind)).mappings().all()
-        items = [
-            {
-                "bucket_start": r["bucket_start"].isoformat() if r["bucket_start"] else None,
-                "total_emission": float(r["total_emission"] or 0),
-                "avg_emission": float(r["avg_emission"] or 0),
-            }
-            for r in rows
-        ]
-
-        period_total = sum(it["total_emission"] for it in items) if items else 0.0
-        period_avg = (sum(it["avg_emission"] for it in items) / len(items)) if items else 0.0
-        trend_slope = _trend_slope_from_items(items)
-
-        tmp.append({
-            "group_id": gid,
+    if len(set(ids)) > COMPARE_GROUPS_MAX:
+        raise HTTPException(status_code=422, detail=f"too many ids (max {COMPARE_GROUPS_MAX})")
+    if bucket_count(sd, ed, bucket) > COMPARE_MAX_BUCKETS:
+        raise HTTPException(status_code=422, detail=f"date range too wide (max {COMPARE_MAX_BUCKETS} {bucket}s)")
+
+    # --- 1) Toutes les séries en UNE requête (agrégat group_emissions_daily si disponible,
+    #        sinon jointure brute sur user_group_sessions) ---
+    bind: Dict[str, Any] = {"gids": sorted(set(ids))}
+    if sd:
+        bind["start_date"] = sd
+    if ed:
+        bind["end_date"] = ed
+    rows = fetch_group_rows(
+        db,
+        lambda aggregate: group_timeseries_sql(aggregate, bucket, bool(sd), bool(ed)),
+        bind,
+    )
+
+    # --- 2) Buckets alignés (trous = 0) puis pentes / rangs vectorisés ---
+    #        (une seule borne fournie : l'autre vient des données, axe borné aussi)
+    try:
+        axis, totals, avgs, present = fill_buckets(rows, ids, bucket, sd, ed, max_buckets=COMPARE_MAX_BUCKETS)
+    except AxisTooLong as e:
+        raise HTTPException(status_code=422, detail=f"date range too wide: {e}")
+    period_totals = totals.sum(axis=1)
+    period_avgs = period_averages(avgs, present)
+    slopes = trend_slopes(totals)
+    order, ranks = low_co2_ranks(period_totals)
+    labels = [b.isoformat() for b in axis]
+
+    ordered: List[Dict[str, Any]] = []
+    for i in order.tolist():
+        ordered.append({
+            "group_id": ids[i],
             "interval": interval,
-            "items": items,
-            "period_total": float(period_total),
-            "period_avg": float(period_avg),
-            "trend_slope": float(trend_slope),
+            "items": [
+                {
+                    "bucket_start": label,
+                    "total_emission": total,
+                    "avg_emission": avg,
+                }
+                for label, total, avg in zip(labels, totals[i].tolist(), avgs[i].tolist())
+            ],
+            "period_total": float(period_totals[i]),
+            "period_avg": float(period_avgs[i]),
+            "trend_slope": float(slopes[i]),
+            "low_co2_rank": int(ranks[i]),
         })
 
-    # --- 2) Classement low-CO2 (tri croissant par total sur la période) ---
-    ordered = sorted(tmp, key=lambda x: x["period_total"])
-    for rank, entry in enumerate(ordered, start=1):
-        entry["low_co2_rank"] = rank
-
     # --- 2bis) Diff absolu/relatif vs meilleur total ---
     best_total = ordered[0]["period_total"] if ordered else 0.0
     comparison = []
@@ -160,32 +151,34 @@ async def compare_groups_evolution(
     if negotiated == "json":
         return JSONResponse(content=jsonable_encoder(data))
 
-    # CSV export
-    import io, csv
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["group_id", "interval", "low_co2_rank", "bucket_start", "total_emission", "avg_emission"])
-    for s in series:
-        for it in s["items"]:
-            w.writerow([
-                s["group_id"],
-                s["interval"],
-                s["low_co2_rank"],
-                it["bucket_start"],
-                it["total_emission"],
-                it["avg_emission"],
-            ])
-    # Résumé comparatif (période)
-    w.writerow([])
-    w.writerow(["group_id", "low_co2_rank", "period_total", "period_avg", "trend_slope", "diff_abs_total", "diff_rel_total(%)"])
-    for row in comparison:
-        w.writerow([
-            row["group_id"],
-            row["low_co2_rank"],
-            row["period_total"],
-            row["period_avg"],
-            row["trend_slope"],
-            row["diff_abs_total"],
-            row["diff_rel_total"],
-        ])
-    return PlainTextResponse(buf.getvalue(), media_type="text/csv")
\ No newline at end of file
+    # CSV export (séries puis résumé comparatif), encodé au fil de l'eau
+    def _csv_rows():
+        for s in series:
+            for it in s["items"]:
+                yield [
+                    s["group_id"],
+                    s["interval"],
+                    s["low_co2_rank"],
+                    it["bucket_start"],
+                    it["total_emission"],
+                    it["avg_emission"],
+                ]
+        # Résumé comparatif (période)
+        yield []
+        yield ["group_id", "low_co2_rank", "period_total", "period_avg", "trend_slope", "diff_abs_total", "diff_rel_total(%)"]
+        for row in comparison:
+            yield [
+                row["group_id"],
+                row["low_co2_rank"],
+                row["period_total"],
+                row["period_avg"],
+                row["trend_slope"],
+                row["diff_abs_total"],
+                row["diff_rel_total"],
+            ]
+
+    return csv_response(
+        request,
+        ["group_id", "interval", "low_co2_rank", "bucket_start", "total_emission", "avg_emission"],
+        _csv_rows(),
+    )
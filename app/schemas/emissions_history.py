@@ -38,6 +38,7 @@ class HistoryQuery(BaseModel):
     normalize: Normalize = Normalize.none
     tz: str = "Europe/Paris"
     limit: int = 366
+    after: Optional[datetime] = None  # keyset : next_cursor de la page précédente
 
     class Config:
         allow_population_by_field_name = True
@@ -64,3 +65,4 @@ class HistoryResponse(BaseModel):
     series: List[DataPoint]
     summary: HistorySummary
     export_ready: bool = True
+    next_cursor: Optional[datetime] = None
@@ -0,0 +1,34 @@
+import argparse
+import os
+import sys
+
+# S'assurer que la racine du projet (/app dans le conteneur) est dans le PYTHONPATH
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from app.db.engine import get_sessionmaker  # noqa: E402
+from app.services.co2_daily import rebuild_cart_daily  # noqa: E402
+
+
+def main() -> int:
+    # Reconstruit co2_cart_daily depuis co2_cart_history : python -m app.scripts.backfill_co2_daily
+    parser = argparse.ArgumentParser(description="Reconstruit le cumul journalier CO2 (co2_cart_daily).")
+    parser.add_argument("--user-id", default=None, help="un seul utilisateur (défaut : tous)")
+    args = parser.parse_args()
+
+    db = get_sessionmaker()()
+    try:
+        written = rebuild_cart_daily(db, user_id=args.user_id)
+    except RuntimeError as e:
+        print(f"[backfill] {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+
+    print(f"[backfill] {written} ligne(s) (utilisateur, jour) écrites")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
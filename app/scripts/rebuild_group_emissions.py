@@ -0,0 +1,36 @@
+import argparse
+import os
+import sys
+
+# S'assurer que la racine du projet (/app dans le conteneur) est dans le PYTHONPATH
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy.exc import SQLAlchemyError  # noqa: E402
+
+from app.db.engine import get_sessionmaker  # noqa: E402
+from app.services.group_emissions import rebuild_group_emissions  # noqa: E402
+
+
+def main() -> int:
+    # Reconstruit group_emissions_daily depuis la jointure brute : python -m app.scripts.rebuild_group_emissions
+    parser = argparse.ArgumentParser(description="Reconstruit l'agrégat des émissions par groupe (group_emissions_daily).")
+    parser.add_argument("--group-id", type=int, default=None, help="un seul groupe (défaut : tous)")
+    args = parser.parse_args()
+
+    db = get_sessionmaker()()
+    try:
+        written = rebuild_group_emissions(db, group_id=args.group_id)
+    except SQLAlchemyError as e:
+        print(f"[rebuild] {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+
+    print(f"[rebuild] {written} cellule(s) (groupe, jour, catégorie) écrites")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
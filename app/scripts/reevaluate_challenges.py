@@ -0,0 +1,39 @@
+import argparse
+import json
+import os
+import sys
+
+# S'assurer que la racine du projet (/app dans le conteneur) est dans le PYTHONPATH
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from app.db.engine import get_sessionmaker  # noqa: E402
+from app.services.challenge_batch import DEFAULT_CHUNK_SIZE, reevaluate_active_challenges  # noqa: E402
+
+
+def main() -> int:
+    # Job planifié (cron / tâche K8s) : python -m app.scripts.reevaluate_challenges
+    parser = argparse.ArgumentParser(description="Réévalue en masse les défis CO2_30D_MINUS_10 actifs.")
+    parser.add_argument("--chunk-size", type=int, default=int(os.getenv("HONOUA_CHALLENGE_BATCH_SIZE", DEFAULT_CHUNK_SIZE)))
+    parser.add_argument("--max-instances", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="calcule sans écrire")
+    args = parser.parse_args()
+
+    db = get_sessionmaker()()
+    try:
+        stats = reevaluate_active_challenges(
+            db,
+            chunk_size=args.chunk_size,
+            dry_run=args.dry_run,
+            max_instances=args.max_instances,
+        )
+    finally:
+        db.close()
+
+    print(json.dumps(stats, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import argparse
+import os
+import sys
+
+# S'assurer que la racine du projet (/app dans le conteneur) est dans le PYTHONPATH
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy.exc import SQLAlchemyError  # noqa: E402
+
+from app.db.engine import get_sessionmaker  # noqa: E402
+from app.services.emission_cube import refresh_cube  # noqa: E402
+
+
+def main() -> int:
+    # Rafraîchit le cube des émissions (cron, ex. toutes les heures) : python -m app.scripts.refresh_emission_cube
+    argparse.ArgumentParser(description="Rafraîchit le cube pré-agrégé des émissions (emission_cube_*).").parse_args()
+
+    db = get_sessionmaker()()
+    try:
+        done = refresh_cube(db)
+    except SQLAlchemyError as e:
+        print(f"[emission_cube] {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+
+    for grain, boundary in done.items():
+        print(f"[emission_cube] {grain} : finalisé jusqu'au {boundary}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
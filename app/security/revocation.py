@@ -0,0 +1,206 @@
+# app/security/revocation.py
+"""
+Cache mémoire (par worker) des JTI révoqués (table token_blacklist).
+
+- Chaque entrée vit jusqu'à l'expiration du token : au-delà, le JWT est de
+  toute façon refusé par jwt.decode(), inutile de le garder.
+- Rafraîchissement incrémental : seules les lignes avec revoked_at >= dernier
+  filigrane - HONOUA_REVOCATION_OVERLAP_S sont relues, au plus toutes les
+  HONOUA_REVOCATION_REFRESH_S secondes. Le recouvrement rattrape les révocations
+  dont revoked_at (NOW() = début de transaction sous Postgres) est antérieur au
+  filigrane mais qui ont été validées après la lecture précédente ; les JTI relus
+  deux fois sont dédoublonnés par le dict.
+- Le chemin courant (token non révoqué, cache à jour) ne touche pas la base.
+- Base indisponible : le cache courant sert encore HONOUA_REVOCATION_MAX_STALE_S
+  secondes après le dernier rafraîchissement réussi ; au-delà (is_stale), le
+  middleware interroge token_blacklist directement (lookup) et refuse la requête
+  si cette lecture échoue aussi (fail closed, comme la lecture directe d'origine).
+
+Une révocation faite par un autre worker est visible au plus tard après un
+intervalle de rafraîchissement ; celle faite localement (rotate_token) l'est
+immédiatement via add().
+"""
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Any, Dict, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.security.jwt_utils import EXPIRES
+from app.telemetry.metrics import record_cache_event
+
+logger = logging.getLogger("honoua")
+
+ExpLike = Union[None, int, float, datetime]
+
+
+def _to_epoch(value: ExpLike) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_ts(value: Any) -> Optional[datetime]:
+    # SQLite renvoie du texte, Postgres des datetime
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str):
+        try:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    return None
+
+
+class RevocationCache:
+    """
+    Ensemble de JTI révoqués avec TTL = exp du token, alimenté par token_blacklist.
+    """
+
+    def __init__(
+        self,
+        refresh_interval_s: float = 15.0,
+        max_token_lifetime_s: float = EXPIRES,
+        overlap_s: float = 60.0,
+        max_stale_s: Optional[float] = None,
+    ):
+        self.refresh_interval_s = float(refresh_interval_s)
+        self.max_token_lifetime_s = float(max_token_lifetime_s)
+        self.overlap_s = float(overlap_s)
+        # Défaut : quelques intervalles de rafraîchissement manqués
+        self.max_stale_s = float(max_stale_s) if max_stale_s is not None else 4 * self.refresh_interval_s
+        self._revoked: Dict[str, float] = {}   # jti -> expiration (epoch)
+        self._watermark: Optional[datetime] = None  # max(revoked_at) déjà lu (UTC)
+        self._next_refresh = 0.0               # time.monotonic()
+        self._last_ok: Optional[float] = None  # time.monotonic() du dernier refresh réussi
+        self._lock = Lock()
+
+    # ------------------------------------------------------------------
+    def add(self, jti: str, exp: ExpLike = None) -> None:
+        """
+        Marque un JTI révoqué jusqu'à `exp` (défaut : maintenant + durée de vie max d'un token).
+        """
+        if not jti:
+            return
+        expires_at = _to_epoch(exp) or (time.time() + self.max_token_lifetime_s)
+        with self._lock:
+            if expires_at > self._revoked.get(jti, 0.0):
+                self._revoked[jti] = expires_at
+
+    def is_revoked(self, jti: str) -> bool:
+        now = time.time()
+        with self._lock:
+            expires_at = self._revoked.get(jti)
+            if expires_at is None:
+                record_cache_event("revocation", "miss")
+                return False
+            if expires_at <= now:
+                del self._revoked[jti]
+                record_cache_event("revocation", "expired")
+                return False
+        record_cache_event("revocation", "hit")
+        return True
+
+    def needs_refresh(self) -> bool:
+        return time.monotonic() >= self._next_refresh
+
+    def is_stale(self) -> bool:
+        """
+        True si le dernier rafraîchissement réussi date de plus de max_stale_s (ou n'a jamais eu lieu).
+        """
+        last_ok = self._last_ok
+        return last_ok is None or time.monotonic() - last_ok > self.max_stale_s
+
+    def lookup(self, engine: Engine, jti: str) -> bool:
+        """
+        Lecture directe de token_blacklist (cache périmé). Les erreurs DB sont propagées.
+        """
+        with engine.connect() as conn:
+            hit = conn.execute(text("SELECT 1 FROM token_blacklist WHERE jti = :jti"), {"jti": jti}).first()
+        record_cache_event("revocation", "lookup")
+        return hit is not None
+
+    def refresh(self, engine: Engine) -> int:
+        """
+        Relit les révocations depuis le dernier filigrane. Retourne le nombre de lignes lues.
+        En cas d'erreur (table absente, DB indisponible), le cache courant est conservé
+        (warning) ; is_stale() devient vrai passé max_stale_s.
+        """
+        with self._lock:
+            self._next_refresh = time.monotonic() + self.refresh_interval_s
+            watermark = self._watermark
+
+        if watermark is None:
+            # Premier chargement : seules les révocations encore "vivantes" nous intéressent
+            since = datetime.now(timezone.utc) - timedelta(seconds=self.max_token_lifetime_s)
+        else:
+            # Recouvrement : transactions commencées avant la lecture précédente, validées après
+            since = watermark - timedelta(seconds=self.overlap_s)
+        if engine.dialect.name == "sqlite":
+            # CURRENT_TIMESTAMP SQLite : texte 'YYYY-MM-DD HH:MM:SS' (UTC)
+            since = since.strftime("%Y-%m-%d %H:%M:%S")
+
+        try:
+            with engine.connect() as conn:
+                rows = conn.execute(
+                    text(
+                        "SELECT jti, revoked_at FROM token_blacklist "
+                        "WHERE revoked_at >= :since ORDER BY revoked_at"
+                    ),
+                    {"since": since},
+                ).all()
+        except Exception as e:
+            last_ok = self._last_ok
+            age = "never" if last_ok is None else f"{time.monotonic() - last_ok:.0f}s ago"
+            logger.warning("[revocation] refresh failed (last success: %s): %s", age, e)
+            record_cache_event("revocation", "refresh_error")
+            return 0
+
+        now = time.time()
+        with self._lock:
+            for jti, revoked_at in rows:
+                revoked_dt = _parse_ts(revoked_at)
+                base = revoked_dt.timestamp() if revoked_dt else now
+                expires_at = base + self.max_token_lifetime_s
+                if expires_at > self._revoked.get(jti, 0.0):
+                    self._revoked[jti] = expires_at
+                if revoked_dt and (self._watermark is None or revoked_dt > self._watermark):
+                    self._watermark = revoked_dt
+            # Purge des entrées expirées
+            for jti in [j for j, exp in self._revoked.items() if exp <= now]:
+                del self._revoked[jti]
+            self._last_ok = time.monotonic()
+
+        record_cache_event("revocation", "refresh")
+        return len(rows)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._revoked.clear()
+            self._watermark = None
+            self._next_refresh = 0.0
+            self._last_ok = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._revoked)
+
+
+revocation_cache = RevocationCache(
+    refresh_interval_s=float(os.getenv("HONOUA_REVOCATION_REFRESH_S", "15")),
+    overlap_s=float(os.getenv("HONOUA_REVOCATION_OVERLAP_S", "60")),
+    max_stale_s=float(os.getenv("HONOUA_REVOCATION_MAX_STALE_S", "60")),
+)
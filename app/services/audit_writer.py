@@ -0,0 +1,164 @@
+# app/services/audit_writer.py
+"""
+Writer d'audit en tâche de fond : aucun aller-retour DB sur le chemin de la requête.
+
+- enqueue() (thread-safe, appelable depuis un handler `def` du threadpool) ajoute
+  l'événement à une file mémoire ; created_at est figé à la mise en file ;
+- une tâche asyncio vide la file par lots : dès HONOUA_AUDIT_BATCH_SIZE événements
+  ou toutes les HONOUA_AUDIT_FLUSH_INTERVAL_S secondes, en UN INSERT multi-lignes
+  par lot (AsyncEngine, app/db/async_engine.py) ;
+- backpressure : au-delà de HONOUA_AUDIT_QUEUE_MAX événements en attente, les
+  nouveaux sont perdus (compteur audit/dropped) plutôt que de ralentir la requête ;
+  un lot en échec d'écriture est perdu aussi (audit/write_error + audit/dropped) ;
+- stop() (arrêt du worker) vide la file avant la fermeture des pools.
+
+Un worker = une file : au plus HONOUA_AUDIT_FLUSH_INTERVAL_S de retard sur /logs/recent.
+"""
+
+import asyncio
+import logging
+import os
+from collections import deque
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Deque, Dict, List, Optional
+
+from app.crud.audit_event import insert_events
+from app.db.async_engine import get_async_engine
+from app.telemetry.metrics import record_audit_event
+
+logger = logging.getLogger("honoua.audit")
+
+# Longueur max de audit_events.message (String(512))
+MESSAGE_MAX_LEN = 512
+
+
+class AuditWriter:
+    def __init__(self, batch_size: int = 200, flush_interval_s: float = 1.0, max_queue: int = 10000):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_s
+        self.max_queue = max(1, max_queue)
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._lock = Lock()
+        self._url: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+    # ------------------------------------------------------------------
+    #  Chemin de la requête
+    # ------------------------------------------------------------------
+    def enqueue(self, event_type: str, message: str) -> bool:
+        """
+        Met l'événement en file. False si la file est pleine (événement perdu).
+        """
+        event = {
+            "event_type": event_type,
+            "message": message[:MESSAGE_MAX_LEN],
+            "created_at": datetime.now(timezone.utc),
+        }
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                full = None
+            else:
+                self._queue.append(event)
+                full = len(self._queue) >= self.batch_size
+        if full is None:
+            record_audit_event("dropped")
+            return False
+        record_audit_event("enqueued")
+        if full:
+            self._notify()
+        return True
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def _notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            pass  # boucle en cours de fermeture : stop() videra la file
+
+    # ------------------------------------------------------------------
+    #  Tâche de fond
+    # ------------------------------------------------------------------
+    def _take(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            n = min(self.batch_size, len(self._queue))
+            return [self._queue.popleft() for _ in range(n)]
+
+    async def flush(self) -> int:
+        """
+        Écrit tout ce qui est en file (lots de batch_size). Retourne le nombre écrit.
+        """
+        if self._url is None:
+            return 0
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        written = 0
+        async with self._flush_lock:
+            while True:
+                batch = self._take()
+                if not batch:
+                    return written
+                try:
+                    async with get_async_engine(self._url).begin() as conn:
+                        written += await insert_events(conn, batch)
+                except Exception:
+                    logger.exception("[audit] batch write failed (%s events dropped)", len(batch))
+                    record_audit_event("write_error")
+                    record_audit_event("dropped", len(batch))
+                    return written
+                record_audit_event("written", len(batch))
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self, url: str) -> None:
+        """
+        Démarre la tâche de flush sur la boucle courante (startup de l'app).
+        """
+        if self._task is not None and not self._task.done():
+            return
+        self._url = url
+        self._stopping = False
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = self._loop.create_task(self._run())
+        if self.pending() >= self.batch_size:
+            self._wake.set()
+
+    async def stop(self) -> int:
+        """
+        Arrête la tâche puis vide la file (shutdown, avant dispose des pools).
+        """
+        task, self._task = self._task, None
+        if task is not None:
+            # Pas de cancel : un lot en cours d'écriture ne doit pas être perdu
+            self._stopping = True
+            self._wake.set()
+            await task
+        written = await self.flush()
+        self._loop = self._wake = None
+        return written
+
+
+audit_writer = AuditWriter(
+    batch_size=int(os.getenv("HONOUA_AUDIT_BATCH_SIZE", "200")),
+    flush_interval_s=float(os.getenv("HONOUA_AUDIT_FLUSH_INTERVAL_S", "1.0")),
+    max_queue=int(os.getenv("HONOUA_AUDIT_QUEUE_MAX", "10000")),
+)
@@ -0,0 +1,201 @@
+# app/services/cart_summary.py
+"""
+Résumé de l'historique paniers pour suivi-co2 (GET /api/cart/history/summary) :
+budget annuel consommé, totaux par semaine ISO / par mois, équivalent arbres.
+
+- une requête : agrégat journalier (SUM / COUNT par DATE(created_at)) sur la fenêtre
+  [min(1er janvier, début des séries), aujourd'hui] ; filtre sur (user_id::text, created_at)
+  comme l'évaluation des défis (index ix_co2_cart_history_user_ts) ;
+- regroupement semaine / mois en Python (quelques centaines de jours au plus) ;
+- cache par worker (LRU + TTL) clé (utilisateur, jour, id du dernier panier) : une
+  lecture indexée (ix_co2_cart_history_user_id) suffit à détecter un panier enregistré
+  par n'importe quel worker ; l'historique étant en ajout seul, le résumé n'est jamais périmé.
+
+Jours UTC, comme co2_cart_daily (created_at est enregistré en UTC).
+"""
+
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.co2_daily import bind_value
+from app.services.co2_source import dialect_name
+from app.services.product_cache import TTLCache
+
+# Budget du GIEC : 2 tCO₂/an/personne (même valeur que suivi-co2.js)
+BUDGET_PER_PERSON_KG = 2000.0
+# Profondeur maximale des séries (fenêtre mise en cache)
+SERIES_MONTHS = 24
+SERIES_WEEKS = 52
+
+summary_cache = TTLCache(
+    name="cart_summary",
+    max_size=int(os.getenv("HONOUA_CART_SUMMARY_CACHE_SIZE", "10000")),
+    ttl_s=float(os.getenv("HONOUA_CART_SUMMARY_CACHE_TTL_S", "300")),
+)
+
+_DAILY_SQL = text("""
+    SELECT
+        DATE(created_at) AS day,
+        SUM(total_co2_g) AS co2_g,
+        SUM(total_distance_km) AS distance_km,
+        SUM(tree_equivalent) AS tree_equivalent,
+        SUM(days_captured_by_tree) AS days_captured_by_tree,
+        COUNT(*) AS carts
+    FROM honou.co2_cart_history
+    WHERE CAST(user_id AS TEXT) = :user_id
+      AND created_at >= :since
+    GROUP BY DATE(created_at)
+""")
+
+# Dernier panier de l'utilisateur (index (user_id, id)) : part de la clé de cache
+_LATEST_ID_SQL = text("""
+    SELECT id
+    FROM honou.co2_cart_history
+    WHERE user_id = :user_id
+    ORDER BY id DESC
+    LIMIT 1
+""")
+
+_METRICS = ("co2_g", "distance_km", "tree_equivalent", "days_captured_by_tree", "carts")
+
+
+def _utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+def _month_start(d: date, back: int = 0) -> date:
+    index = d.year * 12 + d.month - 1 - back
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _week_start(d: date, back: int = 0) -> date:
+    return d - timedelta(days=d.weekday(), weeks=back)
+
+
+def window_start(today: date) -> date:
+    return min(
+        date(today.year, 1, 1),
+        _month_start(today, SERIES_MONTHS - 1),
+        _week_start(today, SERIES_WEEKS - 1),
+    )
+
+
+def load_daily(db: Session, user_id: Any, since: date) -> List[Dict[str, Any]]:
+    rows = db.execute(
+        _DAILY_SQL,
+        {"user_id": str(user_id), "since": bind_value(dialect_name(db), datetime.combine(since, datetime.min.time()))},
+    ).mappings().all()
+    days = []
+    for r in rows:
+        day = r["day"]
+        if isinstance(day, str):
+            day = date.fromisoformat(day[:10])
+        elif isinstance(day, datetime):
+            day = day.date()
+        if day is None:
+            continue
+        days.append({"day": day, **{m: float(r[m] or 0) for m in _METRICS}})
+    return days
+
+
+def _month_label(d: date) -> str:
+    return d.strftime("%Y-%m")
+
+
+def _week_label(d: date) -> str:
+    # Même libellé que period_week de POST /api/cart/history ("2025-W47")
+    iso_year, iso_week, _ = d.isocalendar()
+    return f"{iso_year}-W{iso_week:02d}"
+
+
+def _next_month(d: date) -> date:
+    return _month_start(d + timedelta(days=31))
+
+
+def _next_week(d: date) -> date:
+    return d + timedelta(days=7)
+
+
+def _bucket(label: str) -> Dict[str, Any]:
+    return {"label": label, **{m: 0.0 for m in _METRICS}}
+
+
+def _series(buckets: Dict[date, Dict[str, Any]], current: date, step, label) -> List[Dict[str, Any]]:
+    # Du premier bucket non vide au bucket courant, trous à 0
+    if not buckets:
+        return []
+    out, cur = [], min(buckets)
+    while cur <= current:
+        out.append(buckets.get(cur) or _bucket(label(cur)))
+        cur = step(cur)
+    return out
+
+
+def build_summary(days: List[Dict[str, Any]], today: date) -> Dict[str, Any]:
+    """
+    {"year": totaux de l'année civile, "month": [...], "week": [...]} ;
+    séries chronologiques (au plus SERIES_MONTHS / SERIES_WEEKS buckets).
+    """
+    year = _bucket(str(today.year))
+    months: Dict[date, Dict[str, Any]] = {}
+    weeks: Dict[date, Dict[str, Any]] = {}
+    first_month, first_week = _month_start(today, SERIES_MONTHS - 1), _week_start(today, SERIES_WEEKS - 1)
+
+    for d in days:
+        targets = []
+        if d["day"].year == today.year:
+            targets.append(year)
+        m = _month_start(d["day"])
+        if first_month <= m:
+            targets.append(months.setdefault(m, _bucket(_month_label(m))))
+        w = _week_start(d["day"])
+        if first_week <= w:
+            targets.append(weeks.setdefault(w, _bucket(_week_label(w))))
+        for t in targets:
+            for metric in _METRICS:
+                t[metric] += d[metric]
+
+    return {
+        "year": year,
+        "month": _series(months, _month_start(today), _next_month, _month_label),
+        "week": _series(weeks, _week_start(today), _next_week, _week_label),
+    }
+
+
+def cart_summary(db: Session, user_id: Any, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Agrégats de l'utilisateur (cache par worker, clé utilisateur + jour UTC + dernier panier).
+    """
+    today = today or _utc_today()
+    latest_id = db.execute(_LATEST_ID_SQL, {"user_id": user_id}).scalar()
+    key = f"{user_id}:{today.isoformat()}:{latest_id}"
+    cached = summary_cache.get(key)
+    if cached is not None:
+        return cached
+    value = build_summary(load_daily(db, user_id, window_start(today)), today)
+    summary_cache.set(key, value)
+    return value
+
+
+def budget_state(co2_year_kg: float, household_size: int) -> Dict[str, Any]:
+    # Même règle que computeBudgetStateFromHistory (suivi-co2.js)
+    budget_kg = BUDGET_PER_PERSON_KG * max(1, household_size)
+    percent_used = min(max(co2_year_kg / budget_kg * 100, 0.0), 300.0)
+    if percent_used > 100:
+        status = "over"
+    elif percent_used > 80:
+        status = "warning"
+    else:
+        status = "ok"
+    return {
+        "budget_annual_kg": budget_kg,
+        "co2_annual_kg": co2_year_kg,
+        "percent_used": percent_used,
+        "percent_remaining": max(0.0, 100 - percent_used),
+        "budget_remaining_kg": max(0.0, budget_kg - co2_year_kg),
+        "status": status,
+    }
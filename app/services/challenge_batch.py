@@ -0,0 +1,345 @@
+# app/services/challenge_batch.py
+"""
+Réévaluation en masse des défis CO2_30D_MINUS_10 actifs.
+
+Par lot (keyset sur challenge_instances.id) :
+1. SELECT des instances ACTIVE du lot ;
+2. UNE requête d'agrégat ensembliste sur co2_cart_history : les fenêtres
+   (référence / courante) de toutes les instances du lot sont passées en
+   VALUES et agrégées en une passe (FILTER sur PostgreSQL, CASE sur SQLite) ;
+   si le cumul co2_cart_daily existe, les jours entiers y sont lus ;
+3. UN UPDATE ... FROM (VALUES ...) pour écrire tous les résultats.
+
+Le score est calculé par app.services.challenge_scoring.score_co2_challenge,
+exactement comme POST /users/{user_id}/challenges/{instance_id}/evaluate.
+"""
+
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from app.services.challenge_scoring import (
+    CO2_30D_CODE,
+    DB_STATUS_ACTIVE,
+    challenge_windows,
+    score_co2_challenge,
+    to_naive_utc,
+)
+from app.services.co2_daily import (
+    bind_value,
+    window_aggregates_select,
+    window_points_sql,
+    window_split_values,
+)
+from app.services.co2_source import Co2Source, dialect_name, resolve_co2_rollup, resolve_co2_source
+
+DEFAULT_CHUNK_SIZE = 500
+
+# Instances créées avec un user_id "UUID" synthétique (00000000-0000-0000-0000-000000000042)
+_SYNTHETIC_UUID_RE = re.compile(r"^00000000-0000-0000-0000-(\d{12})$")
+
+
+def user_key(raw_user_id: Any) -> str:
+    """
+    Clé texte comparée à co2_cart_history.user_id (même règle que l'évaluation unitaire,
+    qui filtre l'historique sur str(user_id)).
+    """
+    s = str(raw_user_id)
+    m = _SYNTHETIC_UUID_RE.match(s)
+    return str(int(m.group(1))) if m else s
+
+
+def _tables(dialect: str) -> Dict[str, str]:
+    prefix = "public." if dialect == "postgresql" else ""
+    return {
+        "instances": f"{prefix}challenge_instances",
+        "challenges": f"{prefix}challenges",
+    }
+
+
+# Types des colonnes de la CTE `w` (PostgreSQL), TIMESTAMP par défaut
+_VALUE_TYPES = {
+    "instance_id": "BIGINT",
+    "user_key": "TEXT",
+    "ref_full_start": "DATE",
+    "ref_full_end": "DATE",
+    "cur_full_start": "DATE",
+    "cur_full_end": "DATE",
+}
+
+
+def _typed(dialect: str, param: str, sql_type: str) -> str:
+    # PostgreSQL ne peut pas typer un VALUES de paramètres (NULL compris) : cast explicite
+    return f"CAST(:{param} AS {sql_type})" if dialect == "postgresql" else f":{param}"
+
+
+# ---------------------------------------------------------------------------
+#  1) Instances
+# ---------------------------------------------------------------------------
+def fetch_active_instances(db: Session, after_id: int, limit: int) -> List[Dict[str, Any]]:
+    dialect = dialect_name(db)
+    t = _tables(dialect)
+    target_sql = "COALESCE(c.default_target_value, c.target_reduction_pct, 0)"
+    rows = db.execute(
+        text(f"""
+            SELECT
+                ci.id AS instance_id,
+                ci.user_id,
+                ci.status,
+                COALESCE(ci.period_start, ci.created_at) AS start_date,
+                COALESCE(ci.period_end, ci.created_at) AS end_date,
+                {target_sql} AS target_value
+            FROM {t["instances"]} ci
+            JOIN {t["challenges"]} c ON c.id = ci.challenge_id
+            WHERE UPPER(c.code) = :code
+              AND TRIM(UPPER(ci.status)) = :active
+              AND ci.id > :after_id
+            ORDER BY ci.id
+            LIMIT :limit
+        """),
+        {"code": CO2_30D_CODE, "active": DB_STATUS_ACTIVE, "after_id": after_id, "limit": limit},
+    ).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return None
+
+
+# ---------------------------------------------------------------------------
+#  2) Agrégats des deux fenêtres, pour tout le lot, en une requête
+# ---------------------------------------------------------------------------
+def window_aggregates(
+    db: Session,
+    source: Co2Source,
+    windows: List[Dict[str, Any]],
+    rollup: Optional[Co2Source] = None,
+) -> Dict[int, Dict[str, Any]]:
+    """
+    windows : [{"instance_id", "user_key", "ref_start", "cur_start", "cur_end"}, ...]
+    Retourne {instance_id: {ref_total_g, ref_days, cur_total_g, cur_days}}.
+    Avec `rollup` : jours entiers lus dans co2_cart_daily, jours partiels dans la table brute.
+    """
+    if not windows:
+        return {}
+
+    dialect = dialect_name(db)
+    params: Dict[str, Any] = {}
+    columns: List[str] = []
+    values_sql = []
+    for i, w in enumerate(windows):
+        row = {"instance_id": w["instance_id"], "user_key": w["user_key"]}
+        row.update(window_split_values(w["ref_start"], w["cur_start"], w["cur_end"]))
+        columns = list(row)
+        cells = []
+        for col, value in row.items():
+            params[f"{col}{i}"] = bind_value(dialect, value)
+            cells.append(_typed(dialect, f"{col}{i}", _VALUE_TYPES.get(col, "TIMESTAMP")))
+        values_sql.append("(" + ", ".join(cells) + ")")
+
+    points_sql = window_points_sql(
+        source,
+        rollup,
+        user_cond=lambda col: f"CAST({col} AS TEXT) = w.user_key",
+        ref=lambda name: f"w.{name}",
+        join_w=True,
+    )
+    sql = f"""
+        WITH w({", ".join(columns)}) AS (
+            VALUES {", ".join(values_sql)}
+        ),
+        p AS (
+            {points_sql}
+        )
+        SELECT
+            w.instance_id,
+            {window_aggregates_select(dialect, "p")}
+        FROM w
+        LEFT JOIN p ON p.instance_id = w.instance_id
+        GROUP BY w.instance_id
+    """
+    rows = db.execute(text(sql), params).mappings().all()
+    return {
+        int(r["instance_id"]): {
+            "ref_total_g": float(r["ref_total_g"]) if r["ref_total_g"] is not None else None,
+            "ref_days": int(r["ref_days"] or 0),
+            "cur_total_g": float(r["cur_total_g"]) if r["cur_total_g"] is not None else None,
+            "cur_days": int(r["cur_days"] or 0),
+        }
+        for r in rows
+    }
+
+
+# ---------------------------------------------------------------------------
+#  3) UPDATE en masse
+# ---------------------------------------------------------------------------
+_UPDATE_COLUMNS = [
+    # (colonne, type PostgreSQL)
+    ("reference_value", "DOUBLE PRECISION"),
+    ("current_value", "DOUBLE PRECISION"),
+    ("progress_percent", "DOUBLE PRECISION"),
+    ("status", "TEXT"),
+    ("message", "TEXT"),
+]
+
+
+def _bulk_update(db: Session, results: List[Dict[str, Any]], now: datetime, columns: List[str]) -> None:
+    dialect = dialect_name(db)
+    table = _tables(dialect)["instances"]
+    types = dict(_UPDATE_COLUMNS)
+
+    params: Dict[str, Any] = {"now": bind_value(dialect, now)}
+    values_sql = []
+    for i, r in enumerate(results):
+        cells = [_typed(dialect, f"id{i}", "BIGINT")]
+        params[f"id{i}"] = r["instance_id"]
+        for col in columns:
+            params[f"{col}{i}"] = r[col]
+            cells.append(_typed(dialect, f"{col}{i}", types[col]))
+        values_sql.append("(" + ", ".join(cells) + ")")
+
+    set_sql = ",\n                ".join(f"{col} = v.{col}" for col in columns)
+    extra = ",\n                last_evaluated_at = :now" if "reference_value" in columns else ""
+    db.execute(
+        text(f"""
+            WITH v(id, {", ".join(columns)}) AS (
+                VALUES {", ".join(values_sql)}
+            )
+            UPDATE {table}
+            SET
+                {set_sql}{extra},
+                updated_at = CURRENT_TIMESTAMP
+            FROM v
+            WHERE {table}.id = v.id
+        """),
+        params,
+    )
+
+
+def write_results(db: Session, results: List[Dict[str, Any]], now: datetime) -> None:
+    """
+    UPDATE unique ; colonnes optionnelles tolérées comme dans evaluate_challenge
+    (sans message, puis statut seul).
+    """
+    if not results:
+        return
+    attempts = [
+        [c for c, _ in _UPDATE_COLUMNS],
+        [c for c, _ in _UPDATE_COLUMNS if c != "message"],
+        ["status"],
+    ]
+    for i, columns in enumerate(attempts):
+        try:
+            _bulk_update(db, results, now, columns)
+            db.commit()
+            return
+        except (ProgrammingError, OperationalError):
+            db.rollback()
+            if i == len(attempts) - 1:
+                raise
+
+
+# ---------------------------------------------------------------------------
+#  Orchestration
+# ---------------------------------------------------------------------------
+def score_chunk(
+    db: Session,
+    instances: List[Dict[str, Any]],
+    source: Optional[Co2Source],
+    now: datetime,
+    rollup: Optional[Co2Source] = None,
+) -> List[Dict[str, Any]]:
+    windows = []
+    for inst in instances:
+        start_date = _as_datetime(inst.get("start_date")) or now
+        end_date = _as_datetime(inst.get("end_date")) or (start_date + timedelta(days=30))
+        start_date = to_naive_utc(start_date)
+        end_date = to_naive_utc(end_date)
+        ref_start, _ref_end, cur_start, cur_end = challenge_windows(start_date, end_date, now)
+        windows.append({
+            "instance_id": inst["instance_id"],
+            "user_key": user_key(inst["user_id"]),
+            "ref_start": ref_start,
+            "cur_start": cur_start,
+            "cur_end": cur_end,
+            "end_date": end_date,
+            "target_value": inst.get("target_value"),
+        })
+
+    aggregates = window_aggregates(db, source, windows, rollup) if source is not None else {}
+
+    results = []
+    for w in windows:
+        agg = aggregates.get(w["instance_id"], {})
+        score = score_co2_challenge(
+            agg.get("ref_total_g"), agg.get("ref_days", 0),
+            agg.get("cur_total_g"), agg.get("cur_days", 0),
+            target_value=w["target_value"],
+            db_status=DB_STATUS_ACTIVE,
+            end_date=w["end_date"],
+            now=now,
+        )
+        results.append({
+            "instance_id": w["instance_id"],
+            "reference_value": score.reference_value,
+            "current_value": score.current_value,
+            "progress_percent": score.progress_percent,
+            "status": score.db_status,
+            "message": score.message,
+        })
+    return results
+
+
+def reevaluate_active_challenges(
+    db: Session,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    now: Optional[datetime] = None,
+    dry_run: bool = False,
+    max_instances: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Réévalue toutes les instances ACTIVE par lots de `chunk_size`.
+    Retourne des statistiques {instances, chunks, by_status}.
+    """
+    now = now or datetime.utcnow()
+    chunk_size = max(1, int(chunk_size))
+    source = resolve_co2_source(db, "co2_cart_history")
+    rollup = resolve_co2_rollup(db, source)
+
+    stats: Dict[str, Any] = {"instances": 0, "chunks": 0, "by_status": {}}
+    after_id = 0
+    while True:
+        limit = chunk_size
+        if max_instances is not None:
+            limit = min(limit, max_instances - stats["instances"])
+            if limit <= 0:
+                break
+
+        instances = fetch_active_instances(db, after_id, limit)
+        if not instances:
+            break
+
+        results = score_chunk(db, instances, source, now, rollup)
+        if dry_run:
+            db.rollback()
+        else:
+            write_results(db, results, now)
+
+        stats["instances"] += len(results)
+        stats["chunks"] += 1
+        for r in results:
+            stats["by_status"][r["status"]] = stats["by_status"].get(r["status"], 0) + 1
+        after_id = max(int(i["instance_id"]) for i in instances)
+
+    return stats
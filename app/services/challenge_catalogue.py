@@ -0,0 +1,173 @@
+# app/services/challenge_catalogue.py
+"""
+Catalogue des défis (GET /challenges) chargé une fois par worker et servi depuis la mémoire.
+
+- ETag fort = hash du contenu + version du catalogue (HONOUA_CHALLENGES_CATALOGUE_VERSION) :
+  If-None-Match identique → 304 sans toucher la base.
+- Rechargement : changement de version, expiration (HONOUA_CHALLENGES_CATALOGUE_TTL_S,
+  défaut 3600 s, filet de sécurité pour les autres workers) ou POST /admin/challenges/reload.
+- Un échec de chargement (schéma incompatible) renvoie [] sans être mis en cache.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from app.telemetry.metrics import record_cache_event
+
+logger = logging.getLogger("honoua")
+
+CATALOGUE_TTL_S = float(os.getenv("HONOUA_CHALLENGES_CATALOGUE_TTL_S", "3600"))
+CACHE_MAX_AGE_S = int(os.getenv("HONOUA_CHALLENGES_CACHE_MAX_AGE", "300"))
+
+
+def catalogue_version() -> str:
+    # Lu à chaque appel : un changement de version (sans redémarrage) force le rechargement
+    return os.getenv("HONOUA_CHALLENGES_CATALOGUE_VERSION", "1")
+
+
+def load_catalogue(db: Session) -> Optional[List[Dict[str, Any]]]:
+    """
+    Lecture de public.challenges. Robuste : en cas de mismatch de schéma (colonne/table),
+    repli sur les colonnes quasi certaines ; None si même le repli échoue.
+    """
+    try:
+        rows = db.execute(
+            text("""
+                SELECT
+                    id,
+                    code,
+                    COALESCE(name, title, code) AS name,
+                    COALESCE(metric, 'CO2') AS metric,
+                    COALESCE(logic_type, 'REDUCTION_PCT') AS logic_type,
+                    COALESCE(period_type, 'DAYS') AS period_type,
+                    COALESCE(default_target_value, target_reduction_pct, 0)::float AS default_target_value,
+                    COALESCE(scope_type, 'CART') AS scope_type,
+                    metric,
+                    logic_type,
+                    period_type,
+                    default_target_value,
+                    COALESCE(scope_type, score_type) AS scope_type,
+                    COALESCE(active, is_active, TRUE) AS active
+                FROM public.challenges
+                WHERE COALESCE(active, is_active, TRUE) = TRUE
+                ORDER BY id ASC
+            """)
+        ).mappings().all()
+        return [dict(r) for r in rows]
+
+    except (OperationalError, ProgrammingError) as e:
+        # Fallback schema-safe: only columns very likely to exist.
+        print("[A54][WARN] /challenges list schema mismatch:", e)
+        try:
+            db.rollback()
+        except Exception:
+            pass
+
+    try:
+        rows = db.execute(
+            text("""
+                SELECT
+                    id,
+                    code,
+                    COALESCE(name, code) AS name,
+                    'CO2' AS metric,
+                    'REDUCTION_PCT' AS logic_type,
+                    'DAYS' AS period_type,
+                    0::float AS default_target_value,
+                    'CART' AS scope_type,
+                    TRUE AS active
+                FROM public.challenges
+                ORDER BY id ASC
+            """)
+        ).mappings().all()
+        return [dict(r) for r in rows]
+
+    except (OperationalError, ProgrammingError):
+        try:
+            db.rollback()
+        except Exception:
+            pass
+        return None
+
+
+def compute_etag(items: List[Dict[str, Any]], version: str) -> str:
+    payload = json.dumps(items, sort_keys=True, default=str, separators=(",", ":"))
+    digest = hashlib.sha256(f"{version}\n{payload}".encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match: "a", "b"  |  *  |  W/"a" (comparaison faible autorisée pour GET)
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    if "*" in candidates:
+        return True
+    return any(c.removeprefix("W/") == etag for c in candidates)
+
+
+class ChallengeCatalogue:
+    """
+    Catalogue en mémoire (par worker) : liste des défis + ETag.
+    """
+
+    def __init__(self, ttl_s: float = CATALOGUE_TTL_S):
+        self.ttl_s = float(ttl_s)
+        self._items: Optional[List[Dict[str, Any]]] = None
+        self._etag = ""
+        self._version = ""
+        self._expires_at = 0.0  # time.monotonic()
+        self._lock = Lock()
+
+    def get(self, db: Session) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        (items, etag) ; charge depuis la base au premier appel, après expiration
+        ou changement de version.
+        """
+        version = catalogue_version()
+        items = self._items
+        if items is not None and self._version == version and time.monotonic() < self._expires_at:
+            record_cache_event("challenge_catalogue", "hit")
+            return items, self._etag
+
+        record_cache_event("challenge_catalogue", "miss")
+        return self.reload(db)
+
+    def reload(self, db: Session) -> Tuple[List[Dict[str, Any]], str]:
+        version = catalogue_version()
+        items = load_catalogue(db)
+        if items is None:
+            # Schéma incompatible : réponse vide, non mise en cache (on retentera)
+            return [], compute_etag([], version)
+
+        etag = compute_etag(items, version)
+        with self._lock:
+            self._items = items
+            self._etag = etag
+            self._version = version
+            self._expires_at = time.monotonic() + self.ttl_s
+        record_cache_event("challenge_catalogue", "reload")
+        logger.info("challenge catalogue loaded: %d item(s), version=%s, etag=%s", len(items), version, etag)
+        return items, etag
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._items = None
+            self._expires_at = 0.0
+        record_cache_event("challenge_catalogue", "invalidation")
+
+    @property
+    def version(self) -> str:
+        return self._version
+
+
+challenge_catalogue = ChallengeCatalogue()
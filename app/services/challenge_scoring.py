@@ -0,0 +1,126 @@
+# app/services/challenge_scoring.py
+"""
+Calcul du score d'un défi CO2_30D_MINUS_10, partagé entre l'évaluation
+unitaire (POST /users/{user_id}/challenges/{instance_id}/evaluate) et la
+réévaluation en masse (app/services/challenge_batch.py) : mêmes fenêtres,
+mêmes seuils, mêmes messages.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional, Tuple
+
+# --- Challenge status (valeurs DB) ---
+DB_STATUS_ACTIVE = "ACTIVE"
+DB_STATUS_SUCCESS = "SUCCESS"
+DB_STATUS_FAILED = "FAILED"
+
+CO2_30D_CODE = "CO2_30D_MINUS_10"
+
+REFERENCE_DAYS = 30
+MIN_REF_DAYS = 7
+MIN_CUR_DAYS = 1
+DEFAULT_TARGET_VALUE = 10.0  # 10 = 10%
+
+
+class ChallengeScore(NamedTuple):
+    db_status: str
+    reference_value: Optional[float]  # kg
+    current_value: float              # kg
+    target_value: float               # valeur brute (10 = 10%)
+    progress_percent: Optional[float]
+    message: str
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    # Prod: la DB peut renvoyer des datetimes tz-aware ; on normalise en UTC naive
+    if getattr(value, "tzinfo", None) is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def challenge_windows(
+    start_date: datetime,
+    end_date: datetime,
+    now: datetime,
+) -> Tuple[datetime, datetime, datetime, datetime]:
+    """
+    (ref_start, ref_end, cur_start, cur_end) :
+    - référence : les 30 jours avant le début du défi, fin exclue
+    - courante  : du début du défi à min(fin, maintenant), fin incluse
+    """
+    ref_end = start_date
+    ref_start = start_date - timedelta(days=REFERENCE_DAYS)
+
+    cur_start = start_date
+    cur_end = end_date if now > end_date else now
+    return ref_start, ref_end, cur_start, cur_end
+
+
+def score_co2_challenge(
+    ref_total_g: Optional[float],
+    ref_days: int,
+    cur_total_g: Optional[float],
+    cur_days: int,
+    target_value: Optional[float],
+    db_status: str,
+    end_date: datetime,
+    now: datetime,
+) -> ChallengeScore:
+    """
+    Score d'un défi "−10 % de CO2 sur 30 jours" à partir des agrégats des deux fenêtres.
+    `db_status` : statut DB courant (déjà normalisé), conservé si rien ne change.
+    """
+    reference_value = (ref_total_g / 1000.0) if ref_total_g is not None else None  # kg
+    current_value = (cur_total_g / 1000.0) if cur_total_g is not None else 0.0    # kg
+
+    has_ref = (reference_value is not None) and (reference_value > 0) and (ref_days >= MIN_REF_DAYS)
+    has_cur = (cur_days >= MIN_CUR_DAYS) or (cur_total_g is not None)
+
+    target_value = float(target_value or DEFAULT_TARGET_VALUE)
+    target_value_pct = (target_value / 100.0) if target_value > 1 else target_value
+
+    progress_percent = None
+    message = ""
+
+    if not has_cur:
+        db_status = DB_STATUS_ACTIVE if now < end_date else DB_STATUS_FAILED
+        message = "Pas encore de donnees CO2 sur la periode du defi. Commence a scanner des produits."
+    elif not has_ref:
+        db_status = DB_STATUS_ACTIVE if now < end_date else DB_STATUS_FAILED
+        message = "Pas assez d'historique CO2 avant le debut du defi (min 7 jours). Continue a scanner."
+    else:
+        reduction = 1.0 - (current_value / reference_value) if reference_value > 0 else 0.0
+        progress_percent = (reduction / target_value_pct) * 100.0 if target_value_pct > 0 else None
+
+        if progress_percent is not None:
+            progress_percent = max(0.0, min(100.0, progress_percent))
+
+        if reduction >= target_value_pct:
+            db_status = DB_STATUS_SUCCESS
+            message = "Bravo ! Objectif deja atteint." if now < end_date else "Bravo ! Defi reussi sur 30 jours."
+        else:
+            db_status = DB_STATUS_ACTIVE if now < end_date else DB_STATUS_FAILED
+            if now < end_date:
+                message = f"Reduction actuelle: {reduction * 100:.1f} %, objectif: {target_value_pct * 100:.0f} %. Continue !"
+            else:
+                message = f"Defi termine. Reduction: {reduction * 100:.1f} %, objectif: {target_value_pct * 100:.0f} %."
+
+    return ChallengeScore(
+        db_status=db_status,
+        reference_value=reference_value,
+        current_value=current_value,
+        target_value=target_value,
+        progress_percent=progress_percent,
+        message=message,
+    )
+
+
+def conditional_agg(dialect: str, func: str, expr: str, cond: str, distinct: bool = False) -> str:
+    """
+    Agrégat conditionnel : FILTER (WHERE ...) sur PostgreSQL, CASE WHEN ailleurs (SQLite).
+    Ex : conditional_agg("postgresql", "SUM", "total_co2_g", "created_at < :end")
+    """
+    prefix = "DISTINCT " if distinct else ""
+    if dialect == "postgresql":
+        return f"{func}({prefix}{expr}) FILTER (WHERE {cond})"
+    return f"{func}({prefix}CASE WHEN {cond} THEN {expr} END)"
@@ -0,0 +1,299 @@
+# app/services/co2_daily.py
+"""
+Cumul journalier CO2 par utilisateur : co2_cart_daily(user_id, day, total_co2_g, cart_count).
+
+- alimenté en incrémental par POST /api/cart/history et /api/cart/history/batch
+  (upsert_cart_daily, même transaction que l'INSERT dans co2_cart_history) ;
+- reconstruit depuis l'historique par rebuild_cart_daily (app/scripts/backfill_co2_daily.py) ;
+- lu par l'évaluation des défis : les jours entiers d'une fenêtre viennent du cumul, seuls
+  les jours partiels de début / fin (au plus 2) sont relus dans la table brute. Le résultat
+  (somme, nombre de jours distincts) est identique à l'agrégat sur les lignes brutes.
+
+Les deux fenêtres d'un défi (référence / courante) sont agrégées en une seule passe
+(two_window_sql, window_points_sql) : FILTER sur PostgreSQL, CASE sur SQLite.
+
+Les jours sont des jours UTC (created_at est enregistré en UTC).
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.challenge_scoring import conditional_agg
+from app.services.co2_source import (
+    Co2Source,
+    ROLLUP_TABLE,
+    dialect_name,
+    invalidate_co2_source_cache,
+    resolve_co2_rollup,
+    resolve_co2_source,
+)
+
+
+class DaySplit(NamedTuple):
+    """
+    Découpage d'une fenêtre [start, end] :
+    - tête  : [start, head_end[           (table brute)
+    - jours : [full_start, full_end[      (cumul journalier)
+    - queue : [tail_start, end]           (table brute, fin incluse ou non selon la fenêtre)
+    """
+    head_end: datetime
+    full_start: date
+    full_end: date
+    tail_start: datetime
+
+
+def _midnight(value: datetime) -> datetime:
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def split_window(start: datetime, end: datetime) -> DaySplit:
+    first_full = _midnight(start)
+    if first_full < start:
+        first_full += timedelta(days=1)
+    last_midnight = _midnight(end)
+
+    if first_full >= last_midnight:
+        # Aucun jour entier : toute la fenêtre est lue dans la table brute (queue = fenêtre)
+        return DaySplit(start, start.date(), start.date(), start)
+    return DaySplit(first_full, first_full.date(), last_midnight.date(), last_midnight)
+
+
+def bind_value(dialect: str, value: Any) -> Any:
+    # SQLite : dates / timestamps stockés en texte ISO
+    if dialect == "sqlite" and isinstance(value, (date, datetime)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime) else value.isoformat()
+    return value
+
+
+def raw_column(expr: str, alias: str) -> str:
+    # Expression calculée "(co2_kg * 1000)" : les colonnes y sont déjà non ambiguës
+    return expr if expr.startswith("(") else f"{alias}.{expr}"
+
+
+# ---------------------------------------------------------------------------
+#  Lecture : fenêtres référence / courante d'un défi, en une passe
+# ---------------------------------------------------------------------------
+def _param(name: str) -> str:
+    return f":{name}"
+
+
+def window_points_sql(
+    source: Co2Source,
+    rollup: Optional[Co2Source],
+    user_cond: Callable[[str], str],
+    ref: Callable[[str], str] = _param,
+    join_w: bool = False,
+) -> str:
+    """
+    Points (d = jour, g = grammes, win = 'ref' | 'cur') des deux fenêtres d'un défi :
+    - référence : [ref_start, cur_start[ ; courante : [cur_start, cur_end]
+    - avec `rollup` : jours entiers depuis le cumul, jours partiels depuis la table brute
+      (bornes de window_split_values()).
+
+    `ref(name)` donne l'expression SQL d'une borne (":ref_start" ou "w.ref_start"),
+    `user_cond(col)` la condition utilisateur sur la colonne user_id qualifiée.
+    join_w=True : chaque branche est jointe à une CTE `w` (une ligne par instance).
+    """
+    ts = f"h.{source.ts_col}"
+    co2 = raw_column(source.co2_expr, "h")
+
+    def branch(columns: str, table: str, alias: str, cond: str) -> str:
+        if join_w:
+            return f"SELECT w.instance_id, {columns} FROM w JOIN {table} {alias} ON {cond}"
+        return f"SELECT {columns} FROM {table} {alias} WHERE {cond}"
+
+    raw_win = f"CASE WHEN {ts} < {ref('cur_start')} THEN 'ref' ELSE 'cur' END"
+    if rollup is None:
+        raw_ranges = (
+            f"({ts} >= {ref('ref_start')} AND {ts} < {ref('cur_start')})"
+            f" OR ({ts} >= {ref('cur_start')} AND {ts} <= {ref('cur_end')})"
+        )
+        return branch(
+            f"DATE({ts}) AS d, {co2} AS g, {raw_win} AS win",
+            source.table_ref, "h", f"{user_cond('h.user_id')} AND ({raw_ranges})",
+        )
+
+    ref_days = f"d.day >= {ref('ref_full_start')} AND d.day < {ref('ref_full_end')}"
+    cur_days = f"d.day >= {ref('cur_full_start')} AND d.day < {ref('cur_full_end')}"
+    raw_ranges = " OR ".join([
+        f"({ts} >= {ref('ref_start')} AND {ts} < {ref('ref_head_end')})",
+        f"({ts} >= {ref('ref_tail_start')} AND {ts} < {ref('cur_start')})",
+        f"({ts} >= {ref('cur_start')} AND {ts} < {ref('cur_head_end')})",
+        f"({ts} >= {ref('cur_tail_start')} AND {ts} <= {ref('cur_end')})",
+    ])
+    rollup_branch = branch(
+        f"d.day AS d, d.total_co2_g AS g, CASE WHEN {ref_days} THEN 'ref' ELSE 'cur' END AS win",
+        rollup.table_ref, "d", f"{user_cond('d.user_id')} AND (({ref_days}) OR ({cur_days}))",
+    )
+    raw_branch = branch(
+        f"DATE({ts}) AS d, {co2} AS g, {raw_win} AS win",
+        source.table_ref, "h", f"{user_cond('h.user_id')} AND ({raw_ranges})",
+    )
+    return f"{rollup_branch}\n            UNION ALL\n            {raw_branch}"
+
+
+def window_aggregates_select(dialect: str, alias: str) -> str:
+    """
+    Colonnes ref_total_g, ref_days, cur_total_g, cur_days sur les points `alias` (agrégat conditionnel).
+    """
+    is_ref = f"{alias}.win = 'ref'"
+    is_cur = f"{alias}.win = 'cur'"
+    return ",\n            ".join([
+        f"{conditional_agg(dialect, 'SUM', f'{alias}.g', is_ref)} AS ref_total_g",
+        f"{conditional_agg(dialect, 'COUNT', f'{alias}.d', is_ref, distinct=True)} AS ref_days",
+        f"{conditional_agg(dialect, 'SUM', f'{alias}.g', is_cur)} AS cur_total_g",
+        f"{conditional_agg(dialect, 'COUNT', f'{alias}.d', is_cur, distinct=True)} AS cur_days",
+    ])
+
+
+def two_window_sql(
+    dialect: str,
+    source: Co2Source,
+    rollup: Optional[Co2Source],
+    user_cond: Callable[[str], str],
+) -> str:
+    """
+    Une requête, une ligne (ref_total_g, ref_days, cur_total_g, cur_days) pour un utilisateur.
+    Sans cumul : agrégat conditionnel direct sur la table brute (index (user_id, ts)).
+    """
+    if rollup is None:
+        ts = f"h.{source.ts_col}"
+        co2 = raw_column(source.co2_expr, "h")
+        in_ref = f"{ts} < :cur_start"
+        in_cur = f"{ts} >= :cur_start AND {ts} <= :cur_end"
+        return f"""
+        SELECT
+            {conditional_agg(dialect, "SUM", co2, in_ref)} AS ref_total_g,
+            {conditional_agg(dialect, "COUNT", f"DATE({ts})", in_ref, distinct=True)} AS ref_days,
+            {conditional_agg(dialect, "SUM", co2, in_cur)} AS cur_total_g,
+            {conditional_agg(dialect, "COUNT", f"DATE({ts})", in_cur, distinct=True)} AS cur_days
+        FROM {source.table_ref} h
+        WHERE {user_cond("h.user_id")}
+          AND {ts} >= :ref_start
+          AND {ts} <= :scan_end
+        """
+    return f"""
+        SELECT
+            {window_aggregates_select(dialect, "x")}
+        FROM (
+            {window_points_sql(source, rollup, user_cond)}
+        ) x
+        """
+
+
+def window_split_values(ref_start: datetime, cur_start: datetime, cur_end: datetime) -> Dict[str, Any]:
+    """
+    Bornes des deux fenêtres (non liées) : ref_start, cur_start, cur_end, scan_end
+    + découpage jours entiers / partiels de chaque fenêtre (ref_head_end, ref_full_start...).
+    """
+    values: Dict[str, Any] = {
+        "ref_start": ref_start,
+        "cur_start": cur_start,
+        "cur_end": cur_end,
+        # borne haute du parcours d'index (la fenêtre courante peut être vide)
+        "scan_end": max(cur_start, cur_end),
+    }
+    for prefix, start, end in (("ref", ref_start, cur_start), ("cur", cur_start, cur_end)):
+        split = split_window(start, end)
+        values[f"{prefix}_head_end"] = split.head_end
+        values[f"{prefix}_full_start"] = split.full_start
+        values[f"{prefix}_full_end"] = split.full_end
+        values[f"{prefix}_tail_start"] = split.tail_start
+    return values
+
+
+def window_params(dialect: str, ref_start: datetime, cur_start: datetime, cur_end: datetime) -> Dict[str, Any]:
+    return {k: bind_value(dialect, v) for k, v in window_split_values(ref_start, cur_start, cur_end).items()}
+
+
+# ---------------------------------------------------------------------------
+#  Écriture
+# ---------------------------------------------------------------------------
+def upsert_cart_daily(
+    db: Session,
+    rollup: Co2Source,
+    user_id: Any,
+    created_at: datetime,
+    total_co2_g: float,
+    cart_count: int = 1,
+) -> None:
+    """
+    Ajoute cart_count panier(s) (total_co2_g cumulé) au cumul du jour
+    (INSERT ... ON CONFLICT, PostgreSQL et SQLite >= 3.24).
+    Pas de commit : l'appelant committe avec l'INSERT du panier.
+    """
+    dialect = dialect_name(db)
+    db.execute(
+        text(f"""
+            INSERT INTO {rollup.table_ref} AS d (user_id, day, total_co2_g, cart_count, updated_at)
+            VALUES (:user_id, :day, :total_co2_g, :cart_count, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id, day) DO UPDATE SET
+                total_co2_g = d.total_co2_g + excluded.total_co2_g,
+                cart_count = d.cart_count + excluded.cart_count,
+                updated_at = CURRENT_TIMESTAMP
+        """),
+        {
+            "user_id": str(user_id),
+            "day": bind_value(dialect, created_at.date()),
+            "total_co2_g": float(total_co2_g or 0),
+            "cart_count": int(cart_count),
+        },
+    )
+
+
+def record_cart(
+    db: Session, user_id: Any, created_at: datetime, total_co2_g: float, cart_count: int = 1
+) -> bool:
+    """
+    Met à jour le cumul pour un panier tout juste inséré (si le cumul existe).
+    Lot du même jour (POST /api/cart/history/batch) : un seul upsert, cart_count paniers.
+    """
+    rollup = resolve_co2_rollup(db, resolve_co2_source(db, "co2_cart_history"))
+    if rollup is None:
+        return False
+    upsert_cart_daily(db, rollup, user_id, created_at, total_co2_g, cart_count)
+    return True
+
+
+def rebuild_cart_daily(db: Session, user_id: Optional[Any] = None) -> int:
+    """
+    Reconstruit le cumul depuis co2_cart_history (tous les utilisateurs ou un seul).
+    Retourne le nombre de lignes (user, jour) écrites. Committe.
+    """
+    invalidate_co2_source_cache()
+    source = resolve_co2_source(db, "co2_cart_history")
+    rollup = resolve_co2_rollup(db, source)
+    if source is None or rollup is None:
+        raise RuntimeError(f"{ROLLUP_TABLE} ou co2_cart_history introuvable (migration appliquée ?)")
+
+    ts = source.ts_col
+    conds = ["user_id IS NOT NULL", f"{ts} IS NOT NULL"]
+    where_user = ""
+    params: Dict[str, Any] = {}
+    if user_id is not None:
+        where_user = "WHERE user_id = :user_id"
+        conds.append("CAST(user_id AS TEXT) = :user_id")
+        params["user_id"] = str(user_id)
+
+    db.execute(text(f"DELETE FROM {rollup.table_ref} {where_user}"), params)
+    db.execute(
+        text(f"""
+            INSERT INTO {rollup.table_ref} (user_id, day, total_co2_g, cart_count, updated_at)
+            SELECT
+                CAST(user_id AS TEXT),
+                DATE({ts}),
+                SUM({source.co2_expr}),
+                COUNT(*),
+                CURRENT_TIMESTAMP
+            FROM {source.table_ref}
+            WHERE {" AND ".join(conds)}
+            GROUP BY CAST(user_id AS TEXT), DATE({ts})
+        """),
+        params,
+    )
+    written = db.execute(text(f"SELECT COUNT(*) FROM {rollup.table_ref} {where_user}"), params).scalar()
+    db.commit()
+    return int(written or 0)
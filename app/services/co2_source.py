@@ -0,0 +1,215 @@
+# app/services/co2_source.py
+"""
+Résolution (mise en cache) de la source CO2 utilisée par l'évaluation des défis.
+
+La table d'historique (co2_cart_history) peut vivre dans `honou` (prod) ou
+`public` (CI), et ses colonnes varient selon les déploiements (created_at /
+validated_at, total_co2_g / co2_kg...). Cette détection coûte 2 à 3 requêtes
+(to_regclass + information_schema) : elle est faite une fois par processus
+puis gardée HONOUA_CO2_SOURCE_TTL_S secondes (défaut 600).
+
+invalidate_co2_source_cache() force une nouvelle détection (après une
+migration, ou quand la requête d'agrégat échoue sur la source en cache).
+
+Le cumul journalier co2_cart_daily (app/services/co2_daily.py), s'il existe
+à côté de la table d'historique, est résolu et mis en cache de la même façon.
+"""
+
+import os
+import time
+from threading import Lock
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.telemetry.metrics import record_cache_event
+
+CO2_SOURCE_TTL_S = float(os.getenv("HONOUA_CO2_SOURCE_TTL_S", "600"))
+# Table absente : on retente plus tôt (elle peut être créée entre-temps)
+CO2_SOURCE_NEGATIVE_TTL_S = min(60.0, CO2_SOURCE_TTL_S)
+# Lecture des fenêtres via le cumul journalier (0 = toujours la table brute)
+CO2_DAILY_ROLLUP_ENABLED = os.getenv("HONOUA_CO2_DAILY_ROLLUP", "1") not in ("0", "false", "no")
+
+ROLLUP_TABLE = "co2_cart_daily"
+ROLLUP_COLUMNS = {"user_id", "day", "total_co2_g", "cart_count"}
+
+
+class Co2Source(NamedTuple):
+    schema: str
+    table_ref: str
+    ts_col: str
+    co2_expr: str  # expression SQL en grammes
+    unit: str
+
+
+_lock = Lock()
+_cache: Dict[str, Tuple[float, Optional[Co2Source]]] = {}
+
+
+# ---------------------------------------------------------------------------
+#  Détection (schéma / colonnes)
+# ---------------------------------------------------------------------------
+def _table_exists(db: Session, table_name: str) -> bool:
+    res = db.execute(
+        text("SELECT to_regclass(:fqtn) IS NOT NULL AS ok"),
+        {"fqtn": table_name},
+    )
+    # SQLAlchemy Result
+    try:
+        row = res.mappings().first()
+        return bool(row and row.get("ok"))
+    except Exception:
+        pass
+    # fallback minimal
+    try:
+        row2 = res.fetchone()
+        return bool(row2 and row2[0])
+    except Exception:
+        return False
+
+
+def _table_columns(db: Session, schema: str, table: str) -> Set[str]:
+    try:
+        rows = db.execute(
+            text("""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_schema = :schema
+                  AND table_name = :table
+            """),
+            {"schema": schema, "table": table},
+        ).scalars().all()
+        return set(rows or [])
+    except Exception:
+        try:
+            db.rollback()
+        except Exception:
+            pass
+        return set()
+
+
+def pick_ts_col(cols: Set[str]) -> Optional[str]:
+    # ordre volontaire : on privilégie created_at si présent, sinon validated_at, etc.
+    for c in ("created_at", "validated_at", "timestamp", "ts"):
+        if c in cols:
+            return c
+    return None
+
+
+def pick_co2_expr(cols: Set[str]) -> Tuple[Optional[str], str]:
+    # Retourne (expr_sql, unit) où expr_sql est en grammes
+    if "total_co2_g" in cols:
+        return "total_co2_g", "g"
+    if "co2_g" in cols:
+        return "co2_g", "g"
+    if "total_co2_kg" in cols:
+        return "(total_co2_kg * 1000)", "kg"
+    if "co2_kg" in cols:
+        return "(co2_kg * 1000)", "kg"
+    return None, "na"
+
+
+def dialect_name(db: Session) -> str:
+    # Sessions factices (tests) : pas de bind → comportement PostgreSQL
+    try:
+        return db.get_bind().dialect.name
+    except Exception:
+        return "postgresql"
+
+
+def _sqlite_columns(db: Session, table: str) -> Set[str]:
+    try:
+        rows = db.execute(text(f'PRAGMA table_info("{table}")')).all()
+    except Exception:
+        return set()
+    return {r[1] for r in rows}
+
+
+def detect_co2_source(db: Session, table_name: str) -> Optional[Co2Source]:
+    """
+    Détection sans cache : honou prioritaire, puis public (SQLite : table locale).
+    Retourne None si la table ou les colonnes utiles sont introuvables.
+    """
+    if dialect_name(db) == "sqlite":
+        cols = _sqlite_columns(db, table_name)
+        ts_col = pick_ts_col(cols)
+        co2_expr, unit = pick_co2_expr(cols)
+        if not ts_col or not co2_expr:
+            return None
+        return Co2Source("main", table_name, ts_col, co2_expr, unit)
+
+    if _table_exists(db, f"honou.{table_name}"):
+        schema = "honou"
+    elif _table_exists(db, f"public.{table_name}"):
+        schema = "public"
+    else:
+        return None
+
+    cols = _table_columns(db, schema, table_name)
+    ts_col = pick_ts_col(cols)
+    co2_expr, unit = pick_co2_expr(cols)
+    if not ts_col or not co2_expr:
+        return None
+    return Co2Source(schema, f"{schema}.{table_name}", ts_col, co2_expr, unit)
+
+
+def detect_co2_rollup(db: Session, source: Co2Source) -> Optional[Co2Source]:
+    """
+    Cumul journalier dans le même schéma que la source brute, ou None s'il n'existe pas.
+    """
+    if source.schema == "main":
+        if not ROLLUP_COLUMNS <= _sqlite_columns(db, ROLLUP_TABLE):
+            return None
+        return Co2Source("main", ROLLUP_TABLE, "day", "total_co2_g", "g")
+
+    if not _table_exists(db, f"{source.schema}.{ROLLUP_TABLE}"):
+        return None
+    return Co2Source(source.schema, f"{source.schema}.{ROLLUP_TABLE}", "day", "total_co2_g", "g")
+
+
+# ---------------------------------------------------------------------------
+#  Cache
+# ---------------------------------------------------------------------------
+def _cached(key: str, detect) -> Optional[Co2Source]:
+    now = time.monotonic()
+    entry = _cache.get(key)
+    if entry is not None and entry[0] > now:
+        record_cache_event("co2_source", "hit")
+        return entry[1]
+
+    record_cache_event("co2_source", "miss")
+    source = detect()
+    ttl = CO2_SOURCE_TTL_S if source is not None else CO2_SOURCE_NEGATIVE_TTL_S
+    with _lock:
+        _cache[key] = (time.monotonic() + ttl, source)
+    return source
+
+
+def resolve_co2_source(db: Session, table_name: str = "co2_cart_history") -> Optional[Co2Source]:
+    """
+    Source CO2 en cache (par processus), détectée au premier appel puis après expiration.
+    """
+    return _cached(table_name, lambda: detect_co2_source(db, table_name))
+
+
+def resolve_co2_rollup(db: Session, source: Optional[Co2Source]) -> Optional[Co2Source]:
+    """
+    Cumul journalier associé à `source` (en cache), ou None : lecture sur la table brute.
+    """
+    if source is None or not CO2_DAILY_ROLLUP_ENABLED:
+        return None
+    return _cached(f"{ROLLUP_TABLE}@{source.table_ref}", lambda: detect_co2_rollup(db, source))
+
+
+def invalidate_co2_source_cache(table_name: Optional[str] = None) -> None:
+    """
+    Oublie la source détectée (toutes les tables si table_name=None).
+    """
+    with _lock:
+        if table_name is None:
+            _cache.clear()
+        else:
+            for key in [k for k in _cache if k == table_name or k.startswith(f"{table_name}@")]:
+                _cache.pop(key, None)
+    record_cache_event("co2_source", "invalidation")
@@ -0,0 +1,130 @@
+# app/services/csv_export.py
+"""
+Export CSV en streaming, partagé par A37 (history_a37), A40 (summary_a40),
+A41 (summary_groups) et A42 (groups/compare).
+
+- stream_rows : curseur côté serveur (stream_results + yield_per) sur une connexion
+  dédiée ; la requête est exécutée tout de suite (une erreur SQL remonte avant l'envoi
+  des en-têtes), les lignes sont ensuite lues par lots de HONOUA_CSV_CHUNK_ROWS.
+  La connexion appartient au générateur : elle ne dépend pas de la durée de vie
+  de la session de la requête et est rendue au pool en fin d'export.
+- iter_csv : encode les lignes par blocs (mémoire constante quel que soit le nombre de lignes).
+- csv_response : StreamingResponse, compressée en gzip si le client l'accepte
+  (Accept-Encoding) et HONOUA_CSV_GZIP=1 (défaut).
+"""
+
+import csv
+import io
+import os
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Optional, Sequence
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import TextClause
+
+CSV_CHUNK_ROWS = int(os.getenv("HONOUA_CSV_CHUNK_ROWS", "1000"))
+CSV_GZIP_ENABLED = os.getenv("HONOUA_CSV_GZIP", "1") not in ("0", "false", "no")
+CSV_GZIP_LEVEL = 6
+
+
+def stream_rows(
+    db: Session,
+    sql: TextClause,
+    params: Optional[Dict[str, Any]] = None,
+    chunk_rows: int = CSV_CHUNK_ROWS,
+) -> Iterator[Any]:
+    """
+    Itérateur de lignes (mappings) lu par lots via un curseur côté serveur.
+    Sessions factices (tests, sans bind) : simple db.execute.
+    """
+    try:
+        engine = db.get_bind()
+    except Exception:
+        engine = None
+    if engine is None:
+        return iter(db.execute(sql, params or {}).mappings().all())
+
+    conn = engine.connect()
+    try:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_rows).execute(sql, params or {})
+    except Exception:
+        conn.close()
+        raise
+
+    def _iter() -> Iterator[Any]:
+        try:
+            for part in result.mappings().partitions():
+                yield from part
+        finally:
+            result.close()
+            conn.close()
+
+    return _iter()
+
+
+def iter_csv(
+    header: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    chunk_rows: int = CSV_CHUNK_ROWS,
+) -> Iterator[bytes]:
+    """
+    En-tête puis lignes, encodées en UTF-8 par blocs de chunk_rows lignes.
+    Une ligne vide (séparateur de section) s'écrit avec une séquence vide.
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(header)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate(0)
+            pending = 0
+    tail = buf.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = CSV_GZIP_LEVEL) -> Iterator[bytes]:
+    # wbits=31 : conteneur gzip (en-tête + CRC), compatible Content-Encoding: gzip
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(request: Optional[Request]) -> bool:
+    if request is None or not CSV_GZIP_ENABLED:
+        return False
+    for part in (request.headers.get("accept-encoding") or "").lower().split(","):
+        coding, _, q = part.strip().partition(";")
+        if coding.strip() == "gzip" and q.strip() not in ("q=0", "q=0.0"):
+            return True
+    return False
+
+
+def csv_response(
+    request: Optional[Request],
+    header: Sequence[str],
+    rows: Iterable[Sequence[Any]],
+    filename: Optional[str] = None,
+    media_type: str = "text/csv; charset=utf-8",
+) -> StreamingResponse:
+    """
+    Réponse CSV streamée (gzip si négocié). Pas de Content-Length : transfert chunked.
+    """
+    chunks = iter_csv(header, rows)
+    headers = {"Vary": "Accept-Encoding"}
+    if filename:
+        headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    if accepts_gzip(request):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
@@ -0,0 +1,520 @@
+# app/services/emission_cube.py
+"""
+Cube pré-agrégé des émissions : buckets jour / semaine / mois par
+(category_code, product_id) → total / nombre / min / max.
+Clé limitée aux dimensions lues par A37 / A40 : avec session_id, le cube jour aurait
+presque autant de lignes que emission_calculations (une session ≈ une journée).
+
+Stockage :
+- PostgreSQL : vues matérialisées public.emission_cube_{day,week,month}
+  (migrations f3b8d1e6a2c7, c4e9a7d2f1b8), rafraîchies en CONCURRENTLY (lectures non bloquées) ;
+  semaine / mois sont agrégés depuis la vue jour.
+- SQLite : tables de même forme, maintenues en Python (refresh incrémental :
+  seuls les buckets finalisés depuis le dernier passage sont calculés).
+Dans les deux cas, seuls les buckets *finalisés* (antérieurs au bucket courant au moment
+du refresh) sont dans le cube ; emission_cube_state(grain, finalized_until) en garde la borne.
+Refresh : python -m app.scripts.refresh_emission_cube (cron).
+
+Planificateur (plan_segments) : pour une plage [start, end[ et un intervalle de restitution,
+le milieu est lu dans le cube le plus grossier compatible (mois / semaine), les bords dans
+le cube jour, et seuls le bucket courant (non finalisé) et les bords infra-journaliers
+sont relus dans emission_calculations.
+
+Les buckets sont calculés dans le fuseau HONOUA_EMISSION_CUBE_TZ (défaut UTC ; changer de
+fuseau impose de recréer les vues). SQLite : created_at en UTC naïf, cube en UTC.
+"""
+
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from threading import Lock
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.services.co2_daily import bind_value
+from app.services.co2_source import dialect_name
+from app.telemetry.metrics import record_cache_event
+
+EMISSION_CUBE_ENABLED = os.getenv("HONOUA_EMISSION_CUBE", "1") not in ("0", "false", "no")
+CUBE_TZ = os.getenv("HONOUA_EMISSION_CUBE_TZ", "UTC")
+# L'état ne fait qu'avancer : un état un peu ancien ne fait que relire plus de lignes brutes
+CUBE_STATE_TTL_S = float(os.getenv("HONOUA_EMISSION_CUBE_STATE_TTL_S", "60"))
+
+GRAINS = ("day", "week", "month")
+DIMENSIONS = ("category_code", "product_id")
+RAW_TABLE = "emission_calculations"
+STATE_TABLE = "emission_cube_state"
+# Borne basse "infinie", alignée sur jour / semaine (lundi) / mois
+EPOCH = datetime(1900, 1, 1)
+
+_lock = Lock()
+_state_cache: Dict[str, Any] = {"expires_at": 0.0, "value": None}
+
+
+def cube_table(grain: str, dialect: str) -> str:
+    return f"emission_cube_{grain}" if dialect == "sqlite" else f"public.emission_cube_{grain}"
+
+
+def _ref(table: str, dialect: str) -> str:
+    return table if dialect == "sqlite" else f"public.{table}"
+
+
+def cube_tz(dialect: str) -> str:
+    return "UTC" if dialect == "sqlite" else CUBE_TZ
+
+
+def same_tz(a: str, b: str) -> bool:
+    utc = {"UTC", "Etc/UTC", "Z", "GMT", "Etc/GMT"}
+    return a == b or (a in utc and b in utc)
+
+
+# ---------------------------------------------------------------------------
+#  Buckets (datetimes naïfs, heure locale du fuseau du cube)
+# ---------------------------------------------------------------------------
+def bucket_floor(ts: datetime, grain: str) -> datetime:
+    day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if grain == "day":
+        return day
+    if grain == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_bucket(ts: datetime, grain: str) -> datetime:
+    start = bucket_floor(ts, grain)
+    if grain == "day":
+        return start + timedelta(days=1)
+    if grain == "week":
+        return start + timedelta(days=7)
+    return start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+
+
+def bucket_ceil(ts: datetime, grain: str) -> datetime:
+    start = bucket_floor(ts, grain)
+    return start if start == ts else next_bucket(ts, grain)
+
+
+def to_local(ts: Optional[datetime], tz: str) -> Optional[datetime]:
+    """
+    Datetime (aware, ou naïf = UTC) → naïf dans le fuseau du cube.
+    """
+    if ts is None:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(ZoneInfo(tz)).replace(tzinfo=None)
+
+
+# ---------------------------------------------------------------------------
+#  Planificateur
+# ---------------------------------------------------------------------------
+class Segment(NamedTuple):
+    source: str  # "raw" | "day" | "week" | "month"
+    start: datetime  # inclus (heure locale du cube)
+    end: Optional[datetime]  # exclu ; None = sans borne
+    end_inclusive: bool = False  # "raw" uniquement : borne haute incluse (to de A37)
+
+
+# Grains grossiers utilisables pour un intervalle de restitution (None = total sur la plage)
+_COARSE = {None: ("month", "week"), "month": ("month",), "week": ("week",), "day": ()}
+
+
+def plan_segments(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    interval: Optional[str],
+    finalized: Dict[str, datetime],
+    end_inclusive: bool = False,
+) -> List[Segment]:
+    """
+    Découpe [start, end[ (ou [start, end]) en segments cube / brut.
+    `finalized` : borne haute (exclue) des buckets présents dans chaque cube.
+    """
+    lo = start or EPOCH
+    fin_day = finalized.get("day")
+    if fin_day is None:
+        return [Segment("raw", lo, end, end_inclusive)]
+
+    day_lo = bucket_ceil(lo, "day")
+    day_hi = fin_day if end is None else min(bucket_floor(end, "day"), fin_day)
+    if day_lo >= day_hi:
+        return [Segment("raw", lo, end, end_inclusive)]
+
+    middle = [Segment("day", day_lo, day_hi)]
+    for grain in _COARSE[interval]:
+        fin = finalized.get(grain)
+        if fin is None:
+            continue
+        g_lo = bucket_ceil(day_lo, grain)
+        g_hi = min(bucket_floor(day_hi, grain), fin)
+        if g_lo < g_hi:
+            middle = [
+                s for s in (
+                    Segment("day", day_lo, g_lo),
+                    Segment(grain, g_lo, g_hi),
+                    Segment("day", g_hi, day_hi),
+                )
+                if s.start < s.end
+            ]
+            break
+
+    segments = []
+    if lo < day_lo:
+        segments.append(Segment("raw", lo, day_lo))
+    segments.extend(middle)
+    if end is None or day_hi < end or end_inclusive:
+        segments.append(Segment("raw", day_hi, end, end_inclusive))
+    return segments
+
+
+# ---------------------------------------------------------------------------
+#  SQL
+# ---------------------------------------------------------------------------
+def _trunc_date(dialect: str, interval: str, expr: str) -> str:
+    # expr : date ou timestamp local → début du bucket (date)
+    if dialect == "sqlite":
+        if interval == "day":
+            return f"date({expr})"
+        if interval == "week":
+            return f"date({expr}, '-6 days', 'weekday 1')"
+        return f"date({expr}, 'start of month')"
+    return f"date_trunc('{interval}', {expr})::date"
+
+
+def points_sql(
+    dialect: str,
+    segments: List[Segment],
+    interval: Optional[str],
+    group_col: Optional[str],
+    filters: Dict[str, Any],
+    tz: str,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Sous-requête UNION ALL (t, grp, s, c, mn, mx) : lignes du cube et lignes brutes
+    des segments. t = début du bucket de restitution (date) ou NULL si interval=None.
+    filters : égalités sur les dimensions ({"category_code": "FOOD"}).
+    """
+    params: Dict[str, Any] = {}
+    parts = []
+    raw_ts = "created_at" if dialect == "sqlite" else "(created_at AT TIME ZONE :cube_tz)"
+    if dialect != "sqlite":
+        params["cube_tz"] = tz
+
+    for dim, value in filters.items():
+        if dim not in DIMENSIONS:
+            raise ValueError(f"unknown cube dimension: {dim}")
+        params[f"f_{dim}"] = value
+
+    for i, seg in enumerate(segments):
+        conds = []
+        if seg.source == "raw":
+            t = _trunc_date(dialect, interval, raw_ts) if interval else "NULL"
+            grp = f"COALESCE({group_col}, '')" if group_col else "NULL"
+            conds += [f"COALESCE({dim}, '') = :f_{dim}" for dim in filters]
+            # Bornes brutes : instants (aware sur PostgreSQL, UTC naïf sur SQLite)
+            if seg.start > EPOCH:
+                conds.append(f"created_at >= :s{i}")
+                params[f"s{i}"] = _raw_bound(dialect, seg.start, tz)
+            if seg.end is not None:
+                conds.append(f"created_at {'<=' if seg.end_inclusive else '<'} :e{i}")
+                params[f"e{i}"] = _raw_bound(dialect, seg.end, tz)
+            where = " AND ".join(conds) or "1=1"
+            parts.append(f"""
+                SELECT {t} AS t, {grp} AS grp,
+                       CAST(emissions_gco2e AS DOUBLE PRECISION) AS s, 1 AS c,
+                       CAST(emissions_gco2e AS DOUBLE PRECISION) AS mn,
+                       CAST(emissions_gco2e AS DOUBLE PRECISION) AS mx
+                FROM {_ref(RAW_TABLE, dialect)}
+                WHERE {where}
+            """)
+            continue
+
+        if interval is None:
+            t = "NULL"
+        elif interval == seg.source:
+            t = "bucket_start"
+        else:
+            t = _trunc_date(dialect, interval, "bucket_start")
+        grp = group_col or "NULL"
+        conds += [f"{dim} = :f_{dim}" for dim in filters]
+        if seg.start > EPOCH:
+            conds.append(f"bucket_start >= :s{i}")
+            params[f"s{i}"] = bind_value(dialect, seg.start.date())
+        conds.append(f"bucket_start < :e{i}")
+        params[f"e{i}"] = bind_value(dialect, seg.end.date())
+        parts.append(f"""
+            SELECT {t} AS t, {grp} AS grp,
+                   total_gco2e AS s, calc_count AS c, min_gco2e AS mn, max_gco2e AS mx
+            FROM {cube_table(seg.source, dialect)}
+            WHERE {" AND ".join(conds)}
+        """)
+
+    return "\nUNION ALL\n".join(parts), params
+
+
+def _raw_bound(dialect: str, local: datetime, tz: str) -> Any:
+    if dialect == "sqlite":
+        return bind_value(dialect, local)
+    return local.replace(tzinfo=ZoneInfo(tz))
+
+
+# ---------------------------------------------------------------------------
+#  État (cache par processus)
+# ---------------------------------------------------------------------------
+def _read_state(db: Session) -> Optional[Dict[str, datetime]]:
+    dialect = dialect_name(db)
+    state = {}
+    try:
+        rows = db.execute(
+            text(f"SELECT grain, finalized_until FROM {_ref(STATE_TABLE, dialect)}")
+        ).mappings().all()
+        for r in rows:
+            value = r["finalized_until"]
+            if isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            if r["grain"] in GRAINS and value is not None:
+                state[r["grain"]] = value.replace(tzinfo=None)
+    except Exception:
+        # Table absente (migration non appliquée) : lecture brute
+        try:
+            db.rollback()
+        except Exception:
+            pass
+        return None
+    return state or None
+
+
+def cube_state(db: Session) -> Optional[Dict[str, datetime]]:
+    """
+    {grain: finalized_until} si le cube existe et a été rafraîchi au moins une fois, sinon None.
+    """
+    if not EMISSION_CUBE_ENABLED:
+        return None
+    now = time.monotonic()
+    if _state_cache["expires_at"] > now:
+        record_cache_event("emission_cube_state", "hit")
+        return _state_cache["value"]
+
+    record_cache_event("emission_cube_state", "miss")
+    value = _read_state(db)
+    with _lock:
+        _state_cache["value"] = value
+        _state_cache["expires_at"] = time.monotonic() + CUBE_STATE_TTL_S
+    return value
+
+
+def invalidate_cube_state() -> None:
+    with _lock:
+        _state_cache["expires_at"] = 0.0
+    record_cache_event("emission_cube_state", "invalidation")
+
+
+# ---------------------------------------------------------------------------
+#  Refresh
+# ---------------------------------------------------------------------------
+def _write_state(conn, dialect: str, grain: str, finalized_until: datetime) -> None:
+    conn.execute(
+        text(f"""
+            INSERT INTO {_ref(STATE_TABLE, dialect)} (grain, finalized_until, refreshed_at)
+            VALUES (:grain, :fin, CURRENT_TIMESTAMP)
+            ON CONFLICT (grain) DO UPDATE SET
+                finalized_until = excluded.finalized_until,
+                refreshed_at = excluded.refreshed_at
+        """),
+        {"grain": grain, "fin": bind_value(dialect, finalized_until)},
+    )
+
+
+def refresh_postgres_cube(engine: Engine, now: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    REFRESH MATERIALIZED VIEW CONCURRENTLY (hors transaction : AUTOCOMMIT), jour puis
+    semaine / mois. La borne est calculée *avant* le refresh et écrite *après* :
+    l'état publié ne dépasse jamais le contenu des vues.
+    """
+    local_now = to_local(now or datetime.now(timezone.utc), CUBE_TZ)
+    done = {}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for grain in GRAINS:
+            boundary = bucket_floor(local_now, grain)
+            conn.exec_driver_sql(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {cube_table(grain, 'postgresql')}")
+            _write_state(conn, "postgresql", grain, boundary)
+            done[grain] = boundary.isoformat()
+    invalidate_cube_state()
+    return done
+
+
+SQLITE_DDL = [
+    """CREATE TABLE IF NOT EXISTS emission_cube_state (
+        grain TEXT PRIMARY KEY, finalized_until TIMESTAMP NOT NULL, refreshed_at TIMESTAMP
+    )""",
+] + [
+    f"""CREATE TABLE IF NOT EXISTS emission_cube_{grain} (
+        bucket_start DATE NOT NULL, category_code TEXT NOT NULL, product_id TEXT NOT NULL,
+        total_gco2e REAL NOT NULL, calc_count INTEGER NOT NULL,
+        min_gco2e REAL, max_gco2e REAL,
+        PRIMARY KEY (bucket_start, category_code, product_id)
+    )"""
+    for grain in GRAINS
+]
+
+
+def _drop_legacy_sqlite_cube(db: Session) -> None:
+    # Ancienne clé (… , session_id) : tables et état supprimés, le refresh reconstruit tout
+    columns = db.execute(text("PRAGMA table_info(emission_cube_day)")).mappings().all()
+    if not any(c["name"] == "session_id" for c in columns):
+        return
+    for grain in GRAINS:
+        db.execute(text(f"DROP TABLE IF EXISTS emission_cube_{grain}"))
+    db.execute(text(f"DROP TABLE IF EXISTS {STATE_TABLE}"))
+
+
+def refresh_sqlite_cube(db: Session, now: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    Maintenance Python (SQLite) : ajoute au cube les buckets finalisés depuis le
+    dernier refresh ([ancienne borne, nouvelle borne[), puis committe.
+    """
+    local_now = to_local(now or datetime.now(timezone.utc), "UTC")
+    _drop_legacy_sqlite_cube(db)
+    for ddl in SQLITE_DDL:
+        db.execute(text(ddl))
+    previous = _read_state(db) or {}
+
+    done = {}
+    for grain in GRAINS:
+        boundary = bucket_floor(local_now, grain)
+        lo = previous.get(grain)
+        if lo is not None and lo >= boundary:
+            continue
+        params = {"hi": bind_value("sqlite", boundary.date())}
+        if grain == "day":
+            source = f"""
+                SELECT date(created_at) AS b, COALESCE(category_code, '') AS cat,
+                       COALESCE(product_id, '') AS prod,
+                       SUM(emissions_gco2e) AS s, COUNT(*) AS c,
+                       MIN(emissions_gco2e) AS mn, MAX(emissions_gco2e) AS mx
+                FROM {RAW_TABLE}
+                WHERE created_at < :hi {"AND created_at >= :lo" if lo else ""}
+                GROUP BY 1, 2, 3
+            """
+        else:
+            source = f"""
+                SELECT {_trunc_date("sqlite", grain, "bucket_start")} AS b, category_code AS cat,
+                       product_id AS prod,
+                       SUM(total_gco2e) AS s, SUM(calc_count) AS c,
+                       MIN(min_gco2e) AS mn, MAX(max_gco2e) AS mx
+                FROM emission_cube_day
+                WHERE bucket_start < :hi {"AND bucket_start >= :lo" if lo else ""}
+                GROUP BY 1, 2, 3
+            """
+        if lo:
+            params["lo"] = bind_value("sqlite", lo.date())
+            db.execute(text(f"DELETE FROM emission_cube_{grain} WHERE bucket_start >= :lo"), {"lo": params["lo"]})
+        db.execute(
+            text(f"""
+                INSERT INTO emission_cube_{grain}
+                    (bucket_start, category_code, product_id, total_gco2e, calc_count, min_gco2e, max_gco2e)
+                SELECT b, cat, prod, s, c, mn, mx FROM ({source})
+            """),
+            params,
+        )
+        _write_state(db, "sqlite", grain, boundary)
+        done[grain] = boundary.isoformat()
+    db.commit()
+    invalidate_cube_state()
+    return done
+
+
+def refresh_cube(db: Session, now: Optional[datetime] = None) -> Dict[str, str]:
+    if dialect_name(db) == "sqlite":
+        return refresh_sqlite_cube(db, now)
+    return refresh_postgres_cube(db.get_bind(), now)
+
+
+# ---------------------------------------------------------------------------
+#  Requêtes A37 (historique) / A40 (summary)
+# ---------------------------------------------------------------------------
+def history_cube_sql(
+    dialect: str,
+    state: Dict[str, datetime],
+    interval: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    metrics: List[str],
+    group_col: Optional[str],
+    bucket_limit: int,
+    tz: str,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Même forme de sortie que build_history_sql : t (instant de début de bucket), ["group"],
+    métriques, bucket_rank. start / end : bornes locales (end incluse, comme `to`).
+    """
+    segments = plan_segments(start, end, interval, state, end_inclusive=True)
+    points, params = points_sql(dialect, segments, interval, group_col, {}, tz)
+    select = {
+        "sum": "SUM(s) AS sum",
+        "avg": "SUM(s) / NULLIF(SUM(c), 0) AS avg",
+        "count": "SUM(c) AS count",
+        "min": "MIN(mn) AS min",
+        "max": "MAX(mx) AS max",
+    }
+    metric_sel = ", ".join(select[m] for m in metrics)
+    t_expr = "datetime(bucket)" if dialect == "sqlite" else "(bucket::timestamp AT TIME ZONE :cube_tz)"
+    # Dimensions NULL stockées '' dans le cube : rendues NULL comme en lecture brute
+    sel_group = ', NULLIF(grp, \'\') AS "group"' if group_col else ""
+    grp_group = ", grp" if group_col else ""
+    ord_group = ', "group" NULLS LAST' if group_col else ""
+    params["bucket_limit"] = bucket_limit
+    sql = f"""
+        WITH base AS (
+            SELECT t AS bucket{sel_group}, {metric_sel}
+            FROM ({points}) p
+            GROUP BY t{grp_group}
+        ), ranked AS (
+            SELECT base.*, DENSE_RANK() OVER (ORDER BY bucket) AS bucket_rank
+            FROM base
+        )
+        SELECT {t_expr} AS t{', "group"' if group_col else ""}, {", ".join(metrics)}, bucket_rank
+        FROM ranked
+        WHERE bucket_rank <= :bucket_limit
+        ORDER BY bucket{ord_group}
+    """
+    return sql, params
+
+
+def summary_cube_sql(
+    dialect: str,
+    state: Dict[str, datetime],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    filters: Dict[str, Any],
+    order_by: str,
+    direction: str,
+    tz: str,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    A40 : agrégats par catégorie sur [start, end[ (bornes locales), triés et paginés
+    (:_limit / :_offset). order_by / direction doivent déjà être validés.
+    """
+    segments = plan_segments(start, end, None, state)
+    points, params = points_sql(dialect, segments, None, "category_code", filters, tz)
+    sql = f"""
+        SELECT grp AS category_code,
+               NULL AS subcategory_code,
+               SUM(s) / NULLIF(SUM(c), 0) AS avg_emission,
+               MIN(mn) AS min_emission,
+               MAX(mx) AS max_emission,
+               SUM(s) AS total_emission
+        FROM ({points}) p
+        GROUP BY grp
+        ORDER BY {order_by} {direction} NULLS LAST
+        LIMIT :_limit OFFSET :_offset
+    """
+    return sql, params
+
+
+def day_start(d: date) -> datetime:
+    return datetime(d.year, d.month, d.day)
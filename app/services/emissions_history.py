@@ -1,32 +1,48 @@
-﻿from typing import Dict, Tuple, List
+﻿from typing import Dict, Tuple, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from app.schemas.emissions_history import HistoryQuery, Metric, GroupBy
+from app.services.emission_cube import cube_tz, history_cube_sql, next_bucket, same_tz, to_local
 
 TABLE = "public.emission_calculations"
 TS_COL = "created_at"
 VAL_COL = "emissions_gco2e"
 
 _ALLOWED_INTERVALS = {"day", "week", "month"}
+# Nombre max de buckets par page (keyset sur t : ?after=<next_cursor>)
+MAX_BUCKETS = 5000
+
+def validate_tz(tz: str) -> str:
+    """
+    Fuseau IANA (ex: Europe/Paris) ; ValueError sinon.
+    Le nom est passé en paramètre lié à PostgreSQL, jamais interpolé.
+    """
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"unknown time zone: {tz}")
+    return tz
 
 def _bucket_sql(interval: str) -> str:
     if interval not in _ALLOWED_INTERVALS:
         raise ValueError(f"interval not allowed: {interval}")
-    # Postgres: created_at est déjà en timestamptz -> pas de AT TIME ZONE
-    return f"DATE_TRUNC('{interval}', {TS_COL})"
+    # created_at est un timestamptz : troncature dans le fuseau demandé (heure locale),
+    # puis retour en timestamptz => t = minuit local du début de bucket
+    return f"(DATE_TRUNC('{interval}', {TS_COL} AT TIME ZONE :tz) AT TIME ZONE :tz)"
 
 def _metric_select(metrics: List[Metric]) -> List[str]:
     sels = []
     for m in metrics or []:
         if m == Metric.sum:
-            sels.append(f"SUM({VAL_COL}) AS sum")
+            sels.append(f"SUM({VAL_COL})::float8 AS sum")
         elif m == Metric.avg:
-            sels.append(f"AVG({VAL_COL}) AS avg")
+            sels.append(f"AVG({VAL_COL})::float8 AS avg")
         elif m == Metric.count:
             sels.append("COUNT(*) AS count")
         elif m == Metric.min:
-            sels.append(f"MIN({VAL_COL}) AS min")
+            sels.append(f"MIN({VAL_COL})::float8 AS min")
         elif m == Metric.max:
-            sels.append(f"MAX({VAL_COL}) AS max")
-    return sels or ["SUM(emissions_gco2e) AS sum", "COUNT(*) AS count"]
+            sels.append(f"MAX({VAL_COL})::float8 AS max")
+    return sels or [f"SUM({VAL_COL})::float8 AS sum", "COUNT(*) AS count"]
 
 def _groupby_col(group_by: GroupBy) -> str:
     if group_by == GroupBy.none:
@@ -39,43 +55,136 @@ def _groupby_col(group_by: GroupBy) -> str:
     }
     return mapping.get(group_by, "")
 
-def build_history_sql(q: HistoryQuery) -> Tuple[str, Dict]:
+def page_limit(q: HistoryQuery) -> int:
+    return max(1, min(int(q.limit or 366), MAX_BUCKETS))
+
+def build_history_sql(q: HistoryQuery, extra_bucket: bool = True, table: str = TABLE) -> Tuple[str, Dict]:
+    """
+    SQL paramétré (PostgreSQL) : buckets [interval] dans le fuseau q.tz, métriques demandées,
+    groupement optionnel. Pagination keyset sur t : au plus page_limit(q) buckets
+    (+1 si extra_bucket, pour savoir s'il reste une page), après q.after (exclu).
+
+    Fenêtre bornée des deux côtés : lo = bucket de la première ligne restante (MIN(created_at),
+    sonde d'index), hi = lo + bucket_limit × interval. Une page n'agrège donc que ses
+    propres lignes, jamais toute la queue de la table. Buckets vides dans la fenêtre :
+    has_more (sonde EXISTS au-delà de hi) signale qu'il reste des lignes.
+    Colonnes : t, ["group"], métriques, bucket_rank[, has_more].
+    """
     metrics = q.metrics or [Metric.sum, Metric.count]
     interval = q.interval.value
     bucket = _bucket_sql(interval)
     metric_sel = _metric_select(metrics)
 
     group_col = _groupby_col(q.group_by)
-    sel_group = f", {group_col} AS group" if group_col else ""
-    grp_group = f", {group_col}" if group_col else ""
+    sel_group = f", {group_col} AS \"group\"" if group_col else ""
+    grp_group = ", 2" if group_col else ""
+    ord_group = ', "group" NULLS LAST' if group_col else ""
 
     where_parts = ["1=1"]
-    params: Dict = {}
+    params: Dict = {"tz": validate_tz(q.tz)}
     if q.from_ is not None:
         where_parts.append(f"{TS_COL} >= :from_ts")
         params["from_ts"] = q.from_
+    if q.after is not None:
+        # bucket > after  <=>  created_at >= début du bucket suivant (reste indexable)
+        where_parts.append(
+            f"{TS_COL} >= ((CAST(:after_ts AS timestamptz) AT TIME ZONE :tz) + INTERVAL '1 {interval}') AT TIME ZONE :tz"
+        )
+        params["after_ts"] = q.after
+    upper_parts = []
     if q.to is not None:
-        where_parts.append(f"{TS_COL} <= :to_ts")
+        upper_parts.append(f"{TS_COL} <= :to_ts")
         params["to_ts"] = q.to
+    where_sql = " AND ".join(where_parts + upper_parts)
 
-    limit = max(1, int(q.limit or 366))
+    params["bucket_limit"] = page_limit(q) + (1 if extra_bucket else 0)
+
+    more_sql = ""
+    if extra_bucket:
+        more_sql = f""",
+      (SELECT EXISTS (
+         SELECT 1 FROM {table}
+         WHERE {" AND ".join(upper_parts + [f"{TS_COL} >= (SELECT hi FROM bounds)"])}
+       )) AS has_more"""
 
     sql = f"""
-    WITH base AS (
+    WITH window_start AS (
+      SELECT DATE_TRUNC('{interval}', MIN({TS_COL}) AT TIME ZONE :tz) AS lo
+      FROM {table}
+      WHERE {where_sql}
+    ), bounds AS (
+      SELECT lo AT TIME ZONE :tz AS lo,
+             (lo + :bucket_limit * INTERVAL '1 {interval}') AT TIME ZONE :tz AS hi
+      FROM window_start
+    ), base AS (
       SELECT
         {bucket} AS t
-        {sel_group if sel_group else ""}
+        {sel_group}
         , {", ".join(metric_sel)}
-      FROM {TABLE}
-      WHERE {' AND '.join(where_parts)}
-      GROUP BY t{grp_group}
-      ORDER BY t ASC
-      LIMIT {limit}
+      FROM {table}
+      WHERE {where_sql}
+        AND {TS_COL} >= (SELECT lo FROM bounds)
+        AND {TS_COL} < (SELECT hi FROM bounds)
+      GROUP BY 1{grp_group}
+    ), ranked AS (
+      SELECT base.*, DENSE_RANK() OVER (ORDER BY t) AS bucket_rank
+      FROM base
     )
-    SELECT * FROM base;
+    SELECT ranked.*{more_sql}
+    FROM ranked
+    WHERE bucket_rank <= :bucket_limit
+    ORDER BY t ASC{ord_group};
     """.strip()
     return sql, params
 
+# Groupements servis par le cube (store / brand : pas de dimension, lecture brute)
+_CUBE_GROUP_COLS = {GroupBy.none: None, GroupBy.category: "category_code", GroupBy.product: "product_id"}
+
+def build_history_cube_sql(
+    q: HistoryQuery, dialect: str, state: Optional[Dict], extra_bucket: bool = True
+) -> Optional[Tuple[str, Dict]]:
+    """
+    Même requête que build_history_sql, lue dans le cube pré-agrégé (emission_cube).
+    None si le cube ne peut pas la servir : pas d'état, fuseau différent de celui
+    du cube, ou groupement hors dimensions du cube.
+    """
+    tz = cube_tz(dialect)
+    if state is None or q.group_by not in _CUBE_GROUP_COLS or not same_tz(validate_tz(q.tz), tz):
+        return None
+    interval = q.interval.value
+    start = to_local(q.from_, tz)
+    if q.after is not None:
+        # Keyset : à partir du bucket qui suit q.after
+        resume = next_bucket(to_local(q.after, tz), interval)
+        start = resume if start is None else max(start, resume)
+    metrics = [m.value for m in (q.metrics or [Metric.sum, Metric.count])]
+    return history_cube_sql(
+        dialect, state, interval, start, to_local(q.to, tz), metrics,
+        _CUBE_GROUP_COLS[q.group_by], page_limit(q) + (1 if extra_bucket else 0), tz,
+    )
+
+def split_page(rows, limit: int) -> Tuple[list, Optional[object]]:
+    """
+    (lignes de la page, next_cursor) : les lignes du bucket supplémentaire sont retirées,
+    next_cursor = t du dernier bucket servi s'il reste des buckets (bucket en plus ou
+    colonne has_more), sinon None.
+    """
+    page = [r for r in rows if int(r["bucket_rank"]) <= limit]
+    # Bucket supplémentaire lu, ou lignes au-delà de la fenêtre (build_history_sql)
+    has_more = len(page) < len(rows) or bool(rows and rows[0].get("has_more"))
+    return page, (page[-1]["t"] if has_more and page else None)
+
+def bucket_totals(rows) -> List[Dict]:
+    # Une valeur par bucket (somme des groupes) pour la pente de tendance
+    totals: Dict = {}
+    for r in rows:
+        cur = totals.setdefault(r["t"], {"sum": None, "avg": None})
+        if r.get("sum") is not None:
+            cur["sum"] = (cur["sum"] or 0.0) + float(r["sum"])
+        elif r.get("avg") is not None:
+            cur["avg"] = (cur["avg"] or 0.0) + float(r["avg"])
+    return [totals[t] for t in sorted(totals)]
+
 def compute_trend_slope(rows) -> float:
     xs, ys = [], []
     for i, r in enumerate(rows):
@@ -0,0 +1,229 @@
+# app/services/group_emissions.py
+"""
+Agrégat matérialisé des émissions par groupe :
+public.group_emissions_daily(group_id, bucket_day, category_code) → total / nombre / min / max.
+
+Évite la jointure emission_calculations × user_group_sessions à chaque lecture A41/A42
+(l'index sur session_id ne suffit pas pour les gros groupes).
+
+Maintenance (triggers, migrations e7d4a2c9b1f6 / d8f1b4a6c2e3 / a6d3e9f2c7b1) :
+- nouveaux calculs : trigger sur emission_calculations (INSERT incrémental ;
+  UPDATE / DELETE → recalcul des cellules touchées, min/max n'étant pas décrémentables) ;
+- ajout / retrait de session : trigger sur user_group_sessions (entrée incrémentale,
+  sortie → recalcul des cellules de la session depuis les membres restants), quel que
+  soit l'écrivain (routes A41, scripts, psql) ;
+- concurrence ajout de session / nouveau calcul de cette session : les deux triggers
+  prennent pg_advisory_xact_lock(hashtext(session_id)) avant de lire l'autre table
+  (les deux sessions, en ordre fixe, quand un UPDATE en change). Sans lui, un calcul
+  inséré pendant l'ajout ne serait vu par aucun des deux triggers ;
+- suppression de groupe : ON DELETE CASCADE sur user_groups.
+
+Jour = created_at::date (fuseau de la session PostgreSQL, comme les requêtes brutes).
+Si la table est absente (migration non appliquée) ou HONOUA_GROUP_EMISSIONS_AGGREGATE=0,
+les lectures repassent sur la jointure brute.
+"""
+
+import logging
+import os
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import TextClause
+
+from app.telemetry.metrics import record_cache_event
+
+logger = logging.getLogger("honoua")
+
+AGGREGATE_TABLE = "public.group_emissions_daily"
+GROUP_AGGREGATE_ENABLED = os.getenv("HONOUA_GROUP_EMISSIONS_AGGREGATE", "1") not in ("0", "false", "no")
+# Même durée de cache que la détection de source CO2 (app/services/co2_source.py)
+GROUP_AGGREGATE_TTL_S = float(os.getenv("HONOUA_CO2_SOURCE_TTL_S", "600"))
+
+_lock = Lock()
+_available: Dict[str, Any] = {"expires_at": 0.0, "value": False}
+
+
+# ---------------------------------------------------------------------------
+#  Disponibilité de l'agrégat (cache par processus)
+# ---------------------------------------------------------------------------
+def _detect(db: Session) -> bool:
+    try:
+        row = db.execute(
+            text("SELECT to_regclass(:fqtn) IS NOT NULL AS ok"),
+            {"fqtn": AGGREGATE_TABLE},
+        ).mappings().first()
+        return bool(row and row.get("ok"))
+    except Exception:
+        try:
+            db.rollback()
+        except Exception:
+            pass
+        return False
+
+
+def group_aggregate_available(db: Session) -> bool:
+    if not GROUP_AGGREGATE_ENABLED:
+        return False
+    now = time.monotonic()
+    if _available["expires_at"] > now:
+        record_cache_event("group_emissions_aggregate", "hit")
+        return _available["value"]
+
+    record_cache_event("group_emissions_aggregate", "miss")
+    value = _detect(db)
+    with _lock:
+        _available["value"] = value
+        # Table absente : on retente plus tôt (la migration peut passer entre-temps)
+        _available["expires_at"] = time.monotonic() + (GROUP_AGGREGATE_TTL_S if value else min(60.0, GROUP_AGGREGATE_TTL_S))
+    return value
+
+
+def invalidate_group_aggregate_cache() -> None:
+    with _lock:
+        _available["expires_at"] = 0.0
+    record_cache_event("group_emissions_aggregate", "invalidation")
+
+
+# ---------------------------------------------------------------------------
+#  Lectures A41 / A42 (agrégat ou jointure brute)
+# ---------------------------------------------------------------------------
+def _date_conditions(day_expr: str, start: bool, end: bool) -> List[str]:
+    conditions = []
+    if start:
+        conditions.append(f"{day_expr} >= :start_date")
+    if end:
+        conditions.append(f"{day_expr} <= :end_date")
+    return conditions
+
+
+def summary_groups_sql(aggregate: bool, start: bool, end: bool) -> TextClause:
+    """
+    (group_id, category_code, avg/min/max/total) pour les groupes :gids (A41).
+    """
+    if aggregate:
+        where_sql = " AND ".join(["g.group_id IN :gids"] + _date_conditions("g.bucket_day", start, end))
+        sql = f"""
+            SELECT
+                g.group_id,
+                g.category_code,
+                (SUM(g.total_gco2e) / NULLIF(SUM(g.calc_count), 0))::float8 AS avg_emission,
+                MIN(g.min_gco2e)::float8 AS min_emission,
+                MAX(g.max_gco2e)::float8 AS max_emission,
+                SUM(g.total_gco2e)::float8 AS total_emission
+            FROM {AGGREGATE_TABLE} g
+            WHERE {where_sql}
+            GROUP BY g.group_id, g.category_code
+            ORDER BY g.group_id, total_emission DESC NULLS LAST
+        """
+    else:
+        # Jointure sur user_group_sessions (PK (group_id, session_id) => une session compte une fois)
+        where_sql = " AND ".join(["ugs.group_id IN :gids"] + _date_conditions("ec.created_at::date", start, end))
+        sql = f"""
+            SELECT
+                ugs.group_id,
+                COALESCE(ec.category_code, '') AS category_code,
+                AVG(ec.emissions_gco2e)::float8 AS avg_emission,
+                MIN(ec.emissions_gco2e)::float8 AS min_emission,
+                MAX(ec.emissions_gco2e)::float8 AS max_emission,
+                SUM(ec.emissions_gco2e)::float8 AS total_emission
+            FROM public.user_group_sessions ugs
+            JOIN public.emission_calculations ec ON ec.session_id = ugs.session_id
+            WHERE {where_sql}
+            GROUP BY ugs.group_id, 2
+            ORDER BY ugs.group_id, total_emission DESC NULLS LAST
+        """
+    return text(sql).bindparams(bindparam("gids", expanding=True))
+
+
+def group_timeseries_sql(aggregate: bool, bucket: str, start: bool, end: bool) -> TextClause:
+    """
+    (group_id, bucket_start, total, avg) par semaine / mois pour les groupes :gids (A42).
+    `bucket` doit déjà être validé ('week' | 'month').
+    """
+    if aggregate:
+        where_sql = " AND ".join(["g.group_id IN :gids"] + _date_conditions("g.bucket_day", start, end))
+        sql = f"""
+            SELECT
+                g.group_id,
+                date_trunc('{bucket}', g.bucket_day)::date AS bucket_start,
+                SUM(g.total_gco2e)::float8 AS total_emission,
+                (SUM(g.total_gco2e) / NULLIF(SUM(g.calc_count), 0))::float8 AS avg_emission
+            FROM {AGGREGATE_TABLE} g
+            WHERE {where_sql}
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """
+    else:
+        where_sql = " AND ".join(["ugs.group_id IN :gids"] + _date_conditions("ec.created_at::date", start, end))
+        sql = f"""
+            SELECT
+                ugs.group_id,
+                date_trunc('{bucket}', ec.created_at::date)::date AS bucket_start,
+                SUM(ec.emissions_gco2e)::float8 AS total_emission,
+                AVG(ec.emissions_gco2e)::float8 AS avg_emission
+            FROM public.user_group_sessions ugs
+            JOIN public.emission_calculations ec ON ec.session_id = ugs.session_id
+            WHERE {where_sql}
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """
+    return text(sql).bindparams(bindparam("gids", expanding=True))
+
+
+def fetch_group_rows(
+    db: Session,
+    build_sql: Callable[[bool], TextClause],
+    bind: Dict[str, Any],
+) -> List[Any]:
+    """
+    Exécute build_sql(aggregate=True) si l'agrégat existe, sinon (ou s'il échoue)
+    build_sql(aggregate=False) sur la jointure brute.
+    """
+    if group_aggregate_available(db):
+        try:
+            return db.execute(build_sql(True), bind).mappings().all()
+        except (OperationalError, ProgrammingError) as e:
+            logger.warning("group_emissions_daily unreadable, falling back to raw join: %s", e)
+            db.rollback()
+            invalidate_group_aggregate_cache()
+    return db.execute(build_sql(False), bind).mappings().all()
+
+
+# ---------------------------------------------------------------------------
+#  Reconstruction complète
+# ---------------------------------------------------------------------------
+def rebuild_group_emissions(db: Session, group_id: Optional[int] = None) -> int:
+    """
+    Reconstruit l'agrégat (tout, ou un seul groupe) depuis la jointure brute et committe.
+    Retourne le nombre de cellules écrites.
+    """
+    where = "WHERE ugs.group_id = :gid" if group_id is not None else ""
+    bind = {"gid": group_id} if group_id is not None else {}
+    try:
+        db.execute(
+            text(f"DELETE FROM {AGGREGATE_TABLE}" + (" WHERE group_id = :gid" if group_id is not None else "")),
+            bind,
+        )
+        res = db.execute(
+            text(f"""
+                INSERT INTO {AGGREGATE_TABLE}
+                    (group_id, bucket_day, category_code, total_gco2e, calc_count, min_gco2e, max_gco2e, updated_at)
+                SELECT ugs.group_id, ec.created_at::date, COALESCE(ec.category_code, ''),
+                       SUM(ec.emissions_gco2e), COUNT(*), MIN(ec.emissions_gco2e), MAX(ec.emissions_gco2e), NOW()
+                FROM public.user_group_sessions ugs
+                JOIN public.emission_calculations ec ON ec.session_id = ugs.session_id
+                {where}
+                GROUP BY 1, 2, 3
+            """),
+            bind,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    invalidate_group_aggregate_cache()
+    return int(res.rowcount or 0)
@@ -0,0 +1,135 @@
+# app/services/group_timeseries.py
+"""
+Séries temporelles par groupe pour /groups/compare (A42).
+
+La requête renvoie (group_id, bucket_start, total, avg) pour tous les groupes en une fois ;
+ce module aligne ces lignes sur un axe de buckets commun (semaines ISO / mois), comble
+les trous par des zéros, puis calcule pentes et rangs en NumPy (une matrice groupes × buckets).
+
+Axe commun : tous les groupes ont le même nombre de points aux mêmes dates, donc les
+pentes (moindres carrés sur l'index du bucket) sont comparables entre groupes.
+Sa longueur est bornée (max_buckets) : les matrices et la réponse sont en
+groupes × buckets, une plage de dates arbitraire ne doit pas les faire exploser.
+"""
+
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def bucket_floor(d: date, interval: str) -> date:
+    # Même découpage que date_trunc('week' | 'month') de PostgreSQL (semaine = lundi)
+    if interval == "week":
+        return d - timedelta(days=d.weekday())
+    return d.replace(day=1)
+
+
+class AxisTooLong(ValueError):
+    pass
+
+
+def bucket_count(first: Optional[date], last: Optional[date], interval: str) -> int:
+    """
+    Nombre de buckets de first à last inclus, sans construire l'axe.
+    """
+    if first is None or last is None or first > last:
+        return 0
+    first, last = bucket_floor(first, interval), bucket_floor(last, interval)
+    if interval == "week":
+        return (last - first).days // 7 + 1
+    return (last.year * 12 + last.month) - (first.year * 12 + first.month) + 1
+
+
+def bucket_axis(first: Optional[date], last: Optional[date], interval: str) -> List[date]:
+    """
+    Débuts de buckets de first à last inclus (bornes ramenées au début de leur bucket).
+    Construit par index : pas de date calculée au-delà de last (pas d'OverflowError en 9999).
+    """
+    n = bucket_count(first, last, interval)
+    if n == 0:
+        return []
+    start = bucket_floor(first, interval)
+    if interval == "week":
+        return [start + timedelta(weeks=k) for k in range(n)]
+    base = start.year * 12 + start.month - 1
+    return [date((base + k) // 12, (base + k) % 12 + 1, 1) for k in range(n)]
+
+
+def fill_buckets(
+    rows: Iterable[Dict[str, Any]],
+    group_ids: Sequence[int],
+    interval: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    max_buckets: Optional[int] = None,
+) -> Tuple[List[date], "np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    (axis, totals, avgs, present) — matrices (len(group_ids) × len(axis)).
+
+    L'axe couvre [start, end] si fournis, sinon l'étendue des buckets observés.
+    Les buckets sans données valent 0.0 (present = False). Un group_id répété
+    dans group_ids obtient une ligne par occurrence (comme l'ancienne boucle).
+    AxisTooLong si l'axe dépasse max_buckets.
+    """
+    rows = rows if isinstance(rows, list) else list(rows)
+    if start is None or end is None:
+        observed = [r["bucket_start"] for r in rows if r["bucket_start"] is not None]
+        start = start or (min(observed) if observed else None)
+        end = end or (max(observed) if observed else None)
+    if max_buckets is not None and bucket_count(start, end, interval) > max_buckets:
+        raise AxisTooLong(f"too many {interval} buckets (max {max_buckets})")
+    axis = bucket_axis(start, end, interval)
+
+    unique_ids = sorted(set(group_ids))
+    row_of = {gid: i for i, gid in enumerate(unique_ids)}
+    col_of = {b: j for j, b in enumerate(axis)}
+
+    # Indices (ligne, colonne) calculés en une passe ; -1 = hors requête / hors axe
+    n = len(rows)
+    i = np.fromiter((row_of.get(r["group_id"], -1) for r in rows), np.intp, n)
+    j = np.fromiter((col_of.get(r["bucket_start"], -1) for r in rows), np.intp, n)
+    ok = (i >= 0) & (j >= 0)
+    i, j = i[ok], j[ok]
+    tot = np.array([r["total_emission"] for r in rows], dtype=np.float64)[ok]  # None → NaN
+    avg = np.array([r["avg_emission"] for r in rows], dtype=np.float64)[ok]
+
+    totals = np.zeros((len(unique_ids), len(axis)), dtype=np.float64)
+    avgs = np.zeros_like(totals)
+    present = np.zeros(totals.shape, dtype=bool)
+    totals[i, j] = np.nan_to_num(tot)
+    avgs[i, j] = np.nan_to_num(avg)
+    present[i, j] = True
+
+    index = np.array([row_of[gid] for gid in group_ids], dtype=np.intp)
+    return axis, totals[index], avgs[index], present[index]
+
+
+def trend_slopes(totals: "np.ndarray") -> "np.ndarray":
+    """
+    Pente des moindres carrés de chaque ligne sur x = 0..n-1 ; 0.0 si < 2 points.
+    """
+    n = totals.shape[1]
+    if n < 2:
+        return np.zeros(totals.shape[0], dtype=np.float64)
+    x = np.arange(n, dtype=np.float64)
+    xc = x - x.mean()
+    return totals @ xc / float(xc @ xc)
+
+
+def low_co2_ranks(period_totals: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """
+    (order, ranks) : ordre croissant des totaux (tri stable, égalités dans l'ordre
+    de la requête) et rang 1..n de chaque ligne.
+    """
+    order = np.argsort(period_totals, kind="stable")
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(1, len(order) + 1)
+    return order, ranks
+
+
+def period_averages(avgs: "np.ndarray", present: "np.ndarray") -> "np.ndarray":
+    # Moyenne des moyennes de bucket, sur les seuls buckets avec données
+    counts = present.sum(axis=1)
+    sums = np.where(present, avgs, 0.0).sum(axis=1)
+    return np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
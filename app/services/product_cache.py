@@ -0,0 +1,131 @@
+# app/services/product_cache.py
+"""
+Cache mémoire (par worker) des produits normalisés pour /api/v1/co2/product/{ean}.
+
+- TTLCache : LRU borné (OrderedDict) + TTL par entrée, générique (aussi utilisé par
+  app/services/cart_summary.py)
+- ProductCache : TTLCache + cache négatif pour les EAN inconnus (404), avec un TTL plus court
+- Compteurs hit / miss / eviction exposés via app.telemetry.metrics
+"""
+
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Iterable, Optional, Tuple
+
+from app.telemetry.metrics import record_cache_event
+
+# Sentinelle : "EAN connu comme absent" (cache négatif)
+MISSING = object()
+
+
+class TTLCache:
+    """
+    LRU + TTL thread-safe, valeurs quelconques (None = absence, ne pas la stocker).
+    """
+
+    def __init__(self, name: str, max_size: int = 5000, ttl_s: float = 600.0):
+        self.name = name
+        self.max_size = max(1, int(max_size))
+        self.ttl_s = float(ttl_s)
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Retourne la valeur si présente et non expirée, sinon None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    record_cache_event(self.name, self._hit_event(value))
+                    return value
+                # Entrée expirée : on la retire
+                del self._data[key]
+                record_cache_event(self.name, "expired")
+        record_cache_event(self.name, "miss")
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        self._put(key, value, self.ttl_s)
+
+    def _hit_event(self, value: Any) -> str:
+        return "hit"
+
+    def _put(self, key: str, value: Any, ttl_s: float) -> None:
+        if ttl_s <= 0:
+            return
+        expires_at = time.monotonic() + ttl_s
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                record_cache_event(self.name, "eviction")
+
+    def invalidate(self, keys: Optional[Iterable[str]] = None) -> int:
+        """
+        Invalide les clés données (ou tout le cache si keys=None).
+        Retourne le nombre d'entrées supprimées.
+        """
+        with self._lock:
+            if keys is None:
+                removed = len(self._data)
+                self._data.clear()
+            else:
+                removed = 0
+                for k in keys:
+                    if self._data.pop(k, None) is not None:
+                        removed += 1
+        if removed:
+            record_cache_event(self.name, "invalidation", removed)
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class ProductCache(TTLCache):
+    """
+    TTLCache des produits : valeurs = dicts déjà normalisés, ou MISSING (EAN absent,
+    conservé negative_ttl_s).
+    """
+
+    def __init__(
+        self,
+        name: str = "product",
+        max_size: int = 5000,
+        ttl_s: float = 600.0,
+        negative_ttl_s: float = 60.0,
+    ):
+        super().__init__(name, max_size, ttl_s)
+        self.negative_ttl_s = float(negative_ttl_s)
+
+    def set_missing(self, key: str) -> None:
+        self._put(key, MISSING, self.negative_ttl_s)
+
+    def _hit_event(self, value: Any) -> str:
+        return "negative_hit" if value is MISSING else "hit"
+
+
+# Instance unique (par process) utilisée par app.main
+product_cache = ProductCache(
+    name="product",
+    max_size=int(os.getenv("HONOUA_PRODUCT_CACHE_SIZE", "5000")),
+    ttl_s=float(os.getenv("HONOUA_PRODUCT_CACHE_TTL_S", "600")),
+    negative_ttl_s=float(os.getenv("HONOUA_PRODUCT_CACHE_NEGATIVE_TTL_S", "60")),
+)
+
+
+def invalidate_product_cache(eans: Optional[Iterable[str]] = None) -> int:
+    """
+    Hook d'invalidation : à appeler après un rechargement des données produits
+    (import catalogue, correction manuelle...). Sans argument : vide tout le cache.
+    """
+    return product_cache.invalidate(eans)
@@ -0,0 +1,251 @@
+# app/services/product_search.py
+"""
+Recherche plein texte sur la table `products`.
+
+- PostgreSQL : tsvector 'simple' (préfixes `tok:*`) + similarité trigramme (pg_trgm),
+  index GIN créés par la migration `d4a7c2e91b05`.
+- SQLite : table FTS5 `products_fts` (external content, tokenizer unicode61 sans
+  accents, index de préfixes) maintenue par triggers — voir ensure_search_index().
+- Autres moteurs : repli LIKE préfixe.
+
+Résultats classés par pertinence, pagination par curseur (keyset sur (score, id)).
+"""
+
+import base64
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+SEARCH_MAX_LIMIT = 100
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Poids relatifs nom / marque (bm25 SQLite)
+_BM25_WEIGHTS = "10.0, 2.0"
+
+
+# ---------------------------------------------------------------------------
+#  Index SQLite (FTS5)
+# ---------------------------------------------------------------------------
+_SQLITE_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        product_name,
+        brand,
+        content='products',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3 4'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, product_name, brand)
+        VALUES (new.id, new.product_name, new.brand);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, product_name, brand)
+        VALUES ('delete', old.id, old.product_name, old.brand);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, product_name, brand)
+        VALUES ('delete', old.id, old.product_name, old.brand);
+        INSERT INTO products_fts(rowid, product_name, brand)
+        VALUES (new.id, new.product_name, new.brand);
+    END
+    """,
+]
+
+
+def ensure_search_index(engine: Engine) -> bool:
+    """
+    Crée (si besoin) l'index de recherche côté SQLite et le reconstruit
+    s'il vient d'être créé sur une table déjà remplie.
+    Sur PostgreSQL, les index sont gérés par Alembic : rien à faire ici.
+    Retourne True si un index FTS5 est disponible.
+    """
+    if engine is None or engine.dialect.name != "sqlite":
+        return False
+
+    with engine.begin() as conn:
+        existed = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+        ).first() is not None
+
+        for ddl in _SQLITE_FTS_DDL:
+            conn.exec_driver_sql(ddl)
+
+        if not existed:
+            conn.exec_driver_sql("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    return True
+
+
+# ---------------------------------------------------------------------------
+#  Curseur (keyset)
+# ---------------------------------------------------------------------------
+def encode_cursor(score: float, row_id: int) -> str:
+    raw = json.dumps({"s": score, "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """
+    Retourne (score, id) ou lève ValueError si le curseur est illisible.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return float(data["s"]), int(data["id"])
+    except Exception as e:
+        raise ValueError("cursor invalide") from e
+
+
+# ---------------------------------------------------------------------------
+#  Requêtes
+# ---------------------------------------------------------------------------
+def tokenize(q: str) -> List[str]:
+    return _TOKEN_RE.findall((q or "").lower())[:8]
+
+
+def _sqlite_query(tokens: List[str], after: Optional[Tuple[float, int]]):
+    # Chaque terme en préfixe : "lait"* AND "demi"*  (as-you-type)
+    match = " AND ".join(f'"{t}"*' for t in tokens)
+    params: Dict[str, Any] = {"match": match}
+    keyset = ""
+    if after is not None:
+        # bm25 : plus petit = plus pertinent
+        keyset = "WHERE (score > :after_score OR (score = :after_score AND id > :after_id))"
+        params.update(after_score=after[0], after_id=after[1])
+
+    sql = f"""
+        SELECT * FROM (
+            SELECT
+                p.id,
+                p.ean13_clean,
+                p.product_name,
+                p.brand,
+                p.category,
+                bm25(products_fts, {_BM25_WEIGHTS}) AS score
+            FROM products_fts
+            JOIN products p ON p.id = products_fts.rowid
+            WHERE products_fts MATCH :match
+        )
+        {keyset}
+        ORDER BY score ASC, id ASC
+        LIMIT :limit
+    """
+    return sql, params
+
+
+def _postgres_query(q: str, tokens: List[str], after: Optional[Tuple[float, int]]):
+    # tsquery préfixe : lait:* & demi:*  + similarité trigramme pour les fautes de frappe
+    tsquery = " & ".join(f"{t}:*" for t in tokens)
+    params: Dict[str, Any] = {"tsquery": tsquery, "q": q}
+    keyset = ""
+    if after is not None:
+        # score : plus grand = plus pertinent
+        keyset = "WHERE (score < :after_score OR (score = :after_score AND id > :after_id))"
+        params.update(after_score=after[0], after_id=after[1])
+
+    sql = f"""
+        SELECT * FROM (
+            SELECT
+                p.id,
+                p.ean13_clean,
+                p.product_name,
+                p.brand,
+                p.category,
+                (
+                    ts_rank(
+                        to_tsvector('simple', coalesce(p.product_name, '') || ' ' || coalesce(p.brand, '')),
+                        to_tsquery('simple', :tsquery)
+                    )
+                    + similarity(p.product_name, :q)
+                )::float8 AS score
+            FROM products p
+            WHERE to_tsvector('simple', coalesce(p.product_name, '') || ' ' || coalesce(p.brand, ''))
+                      @@ to_tsquery('simple', :tsquery)
+               OR p.product_name % :q
+        ) ranked
+        {keyset}
+        ORDER BY score DESC, id ASC
+        LIMIT :limit
+    """
+    return sql, params
+
+
+def _fallback_query(tokens: List[str], after: Optional[Tuple[float, int]]):
+    # Repli générique : préfixe sur le nom (pas de classement, ordre par id)
+    params: Dict[str, Any] = {"prefix": " ".join(tokens) + "%"}
+    keyset = ""
+    if after is not None:
+        keyset = "AND id > :after_id"
+        params["after_id"] = after[1]
+    sql = f"""
+        SELECT id, ean13_clean, product_name, brand, category, 0.0 AS score
+        FROM products
+        WHERE lower(product_name) LIKE :prefix {keyset}
+        ORDER BY id ASC
+        LIMIT :limit
+    """
+    return sql, params
+
+
+def search_products(
+    db: Session,
+    q: str,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Recherche classée + pagination keyset.
+    Retourne (items, next_cursor) ; next_cursor = None en fin de résultats.
+    """
+    tokens = tokenize(q)
+    if not tokens:
+        return [], None
+
+    limit = max(1, min(int(limit), SEARCH_MAX_LIMIT))
+    after = decode_cursor(cursor)
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        sql, params = _sqlite_query(tokens, after)
+    elif dialect == "postgresql":
+        sql, params = _postgres_query((q or "").strip(), tokens, after)
+    else:
+        sql, params = _fallback_query(tokens, after)
+
+    # On lit une ligne de plus pour savoir s'il existe une page suivante
+    params["limit"] = limit + 1
+    rows = db.execute(text(sql), params).mappings().all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = [
+        {
+            "ean": r["ean13_clean"],
+            "name": r["product_name"],
+            "brand": r["brand"],
+            "category": r["category"],
+            "score": float(r["score"]) if r["score"] is not None else None,
+        }
+        for r in rows
+    ]
+
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(float(last["score"]), int(last["id"]))
+
+    return items, next_cursor
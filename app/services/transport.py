@@ -0,0 +1,135 @@
+# app/services/transport.py
+"""
+Moteur distance / émissions de transport.
+
+- Calcul scalaire (math) : résultat identique bit à bit à l'ancien haversine_km de app.main.
+- compute_transport_batch : même calcul pour N produits (panier, /compare), un appel
+  par EAN distinct ; payloads identiques bit à bit à /api/v1/co2/product/{ean}.
+  Pas de NumPy : ces lots sont bornés (200 / 50 EAN) et, à cette taille, le chemin
+  vectorisé ne gagnait au mieux qu'une fraction de milliseconde (plus lent sous ~100
+  lignes) au prix d'écarts au dernier ULP.
+
+Règle de distance :
+1) origine connue + position utilisateur → distance origine → utilisateur
+2) sinon (ou distance nulle) et origine connue → origine → centre France
+3) sinon : valeur de référence (FR = 1100 km, autres = 4500 km)
+"""
+
+import math
+from typing import List, Optional, Sequence, Tuple
+
+# Facteur d'émission pour le transport (kg CO2e / tonne.km)
+# Valeur MVP simple à affiner plus tard.
+EMISSION_FACTOR_TONNE_KM = 0.1
+
+# Coordonnées de référence : centre approximatif de la France
+FRANCE_LAT = 46.603354
+FRANCE_LON = 1.888334
+
+# Distances de référence quand aucune coordonnée n'est exploitable (km)
+DEFAULT_DISTANCE_FR_KM = 1100.0
+DEFAULT_DISTANCE_OTHER_KM = 4500.0
+
+# Rayon moyen de la Terre en km
+EARTH_RADIUS_KM = 6371.0
+
+# ---------------------------------------------------------------------------
+#  Calcul
+# ---------------------------------------------------------------------------
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Calcul de la distance entre deux points GPS (lat, lon) en km
+    en utilisant la formule de Haversine.
+    """
+    # Conversion en radians
+    rlat1 = math.radians(lat1)
+    rlon1 = math.radians(lon1)
+    rlat2 = math.radians(lat2)
+    rlon2 = math.radians(lon2)
+
+    dlat = rlat2 - rlat1
+    dlon = rlon2 - rlon1
+
+    a = math.sin(dlat / 2) ** 2 + math.cos(rlat1) * math.cos(rlat2) * math.sin(dlon / 2) ** 2
+    c = 2 * math.asin(math.sqrt(a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def _to_float(v) -> Optional[float]:
+    try:
+        return float(v) if v is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def transport_distance_km(
+    origin_lat,
+    origin_lon,
+    user_lat: Optional[float],
+    user_lon: Optional[float],
+    origin_country: Optional[str],
+) -> float:
+    """
+    Distance de transport retenue pour un produit (règle 1 → 2 → 3 ci-dessus).
+    """
+    distance_km = 0.0
+
+    origin_lat_f = _to_float(origin_lat)
+    origin_lon_f = _to_float(origin_lon)
+    if origin_lat_f is None or origin_lon_f is None:
+        origin_lat_f = origin_lon_f = None
+
+    # Si on a origine ET utilisateur, distance réelle origine → utilisateur
+    if origin_lat_f is not None and user_lat is not None and user_lon is not None:
+        try:
+            distance_km = haversine_km(origin_lat_f, origin_lon_f, float(user_lat), float(user_lon))
+        except (TypeError, ValueError):
+            distance_km = 0.0
+
+    # Si pas de distance utilisateur, mais origine connue : origine → centre France
+    if distance_km == 0.0 and origin_lat_f is not None:
+        try:
+            distance_km = haversine_km(origin_lat_f, origin_lon_f, FRANCE_LAT, FRANCE_LON)
+        except (TypeError, ValueError):
+            distance_km = 0.0
+
+    # Si on n'a toujours pas de distance : valeurs de référence
+    if distance_km == 0.0:
+        distance_km = DEFAULT_DISTANCE_FR_KM if origin_country == "FR" else DEFAULT_DISTANCE_OTHER_KM
+
+    return distance_km
+
+
+def transport_emissions_kg(distance_km: float, weight_kg: float) -> float:
+    """
+    Émissions de transport (kg CO2e) = distance × poids (t) × facteur.
+    """
+    weight_tonnes = weight_kg / 1000.0
+    return distance_km * weight_tonnes * EMISSION_FACTOR_TONNE_KM
+
+
+def compute_transport_batch(
+    origin_lat: Sequence,
+    origin_lon: Sequence,
+    weight_kg: Sequence[float],
+    dest_lat=None,
+    dest_lon=None,
+    origin_country: Optional[Sequence[Optional[str]]] = None,
+) -> Tuple[List[float], List[float]]:
+    """
+    Distances (km) et émissions de transport (kg CO2e) pour N produits, identiques
+    bit à bit au calcul produit par produit.
+    dest_lat / dest_lon : scalaires (même utilisateur pour tout le panier),
+    séquences (une destination par ligne) ou None (pas de position utilisateur).
+    """
+    n = len(origin_lat)
+    countries = origin_country or [None] * n
+    dlats = dest_lat if isinstance(dest_lat, (list, tuple)) else [dest_lat] * n
+    dlons = dest_lon if isinstance(dest_lon, (list, tuple)) else [dest_lon] * n
+    distances = [
+        transport_distance_km(la, lo, ula, ulo, c)
+        for la, lo, ula, ulo, c in zip(origin_lat, origin_lon, dlats, dlons, countries)
+    ]
+    emissions = [transport_emissions_kg(d, w) for d, w in zip(distances, weight_kg)]
+    return distances, emissions
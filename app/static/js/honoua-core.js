@@ -2993,7 +2993,10 @@ function saveCartHistoryFromCart() {
       nb_distinct_products: Math.round(Number(nbDistinct) || 0),
       total_distance_km: Number.isFinite(totalDistanceKm) ? Math.round(totalDistanceKm) : 0,
       days_captured_by_tree: Number.isFinite(days) ? Number(days) : 0,
-      tree_equivalent: Number.isFinite(treeEq) ? Number(treeEq) : 0
+      tree_equivalent: Number.isFinite(treeEq) ? Number(treeEq) : 0,
+      // Clé créée à la validation : POST unitaire et rejeu de la file portent la même,
+      // un panier reçu par le serveur mais dont la réponse s'est perdue n'est pas doublé
+      idempotency_key: newIdempotencyKey()
        };
 
        return fetch((window.CART_HISTORY_ENDPOINT || CART_HISTORY_ENDPOINT), {
@@ -3016,9 +3019,12 @@ function saveCartHistoryFromCart() {
       try { detail = await res.json(); } catch (_) {}
 
       console.error('[Historique CO2] POST /api/cart/history erreur :', res.status, detail);
+      // Erreur serveur : panier gardé en file, rejoué plus tard (4xx = payload refusé, abandon)
+      if (res.status >= 500) enqueueCartHistory(payload);
     })
     .catch((err) => {
       console.error('[Historique CO2] POST /api/cart/history erreur réseau :', err);
+      enqueueCartHistory(payload);
     });
 
 
@@ -3027,6 +3033,87 @@ function saveCartHistoryFromCart() {
   }
 }
 
+// ==============================
+// File hors ligne des paniers (rejeu groupé : POST /api/cart/history/batch)
+// ==============================
+// Chaque panier porte l'idempotency_key créée à sa validation (saveCartHistoryFromCart) :
+// le serveur ignore les clés déjà reçues (POST unitaire ou lot), un rejeu interrompu
+// peut donc être relancé sans doublon.
+const HONOUA_CART_QUEUE_KEY = 'honoua_cart_queue_v1';
+const HONOUA_CART_QUEUE_MAX = 200;
+const HONOUA_CART_BATCH_SIZE = 100;
+let __cartQueueFlushing = false;
+
+function readCartQueue() {
+  try {
+    const arr = JSON.parse(localStorage.getItem(HONOUA_CART_QUEUE_KEY) || '[]');
+    return Array.isArray(arr) ? arr : [];
+  } catch (_) {
+    return [];
+  }
+}
+
+function writeCartQueue(arr) {
+  try { localStorage.setItem(HONOUA_CART_QUEUE_KEY, JSON.stringify(arr.slice(-HONOUA_CART_QUEUE_MAX))); } catch (_) {}
+}
+
+function newIdempotencyKey() {
+  try {
+    if (window.crypto && typeof window.crypto.randomUUID === 'function') return window.crypto.randomUUID();
+  } catch (_) {}
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+}
+
+function enqueueCartHistory(payload) {
+  const queue = readCartQueue();
+  // validated_at : date réelle de validation (le serveur date le panier avec, pas avec le rejeu)
+  queue.push({
+    ...payload,
+    idempotency_key: payload.idempotency_key || newIdempotencyKey(),
+    validated_at: payload.validated_at || new Date().toISOString()
+  });
+  writeCartQueue(queue);
+}
+
+async function flushCartHistoryQueue() {
+  if (__cartQueueFlushing) return;
+  const userId = (window.getHonouaUserId ? window.getHonouaUserId() : '');
+  if (!userId || readCartQueue().length === 0) return;
+
+  __cartQueueFlushing = true;
+  try {
+    let queue = readCartQueue();
+    while (queue.length > 0) {
+      const batch = queue.slice(0, HONOUA_CART_BATCH_SIZE);
+      const res = await fetch(`${window.CART_HISTORY_ENDPOINT || CART_HISTORY_ENDPOINT}/batch`, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: {
+          'Content-Type': 'application/json',
+          'Accept': 'application/json',
+          'X-Honoua-User-Id': userId
+        },
+        body: JSON.stringify({ items: batch })
+      });
+      if (!res.ok) {
+        console.warn('[Historique CO2] rejeu de la file interrompu :', res.status);
+        return;
+      }
+      // created / duplicate / invalid : tous traités, retirés de la file
+      const done = new Set(batch.map((it) => it.idempotency_key));
+      queue = readCartQueue().filter((it) => !done.has(it.idempotency_key));
+      writeCartQueue(queue);
+    }
+  } catch (err) {
+    console.warn('[Historique CO2] rejeu de la file impossible (hors ligne ?) :', err);
+  } finally {
+    __cartQueueFlushing = false;
+  }
+}
+
+window.addEventListener('online', () => { flushCartHistoryQueue(); });
+window.addEventListener('load', () => { flushCartHistoryQueue(); });
+
   
 // =========================
 // Honoua — Historique paniers (storage)
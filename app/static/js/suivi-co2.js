@@ -157,70 +157,30 @@ function setupHouseholdForm() {
 // BLOC 1 — BUDGET ANNUEL
 // ============================================================================
 
-function computeBudgetStateFromHistory(items) {
-  const currentYear = new Date().getFullYear();
-  let totalCo2GYear = 0;
+// Budget calculé côté serveur (GET /api/cart/history/summary) : libellés et couleurs ici
+function budgetStateFromSummary(budget) {
+  if (!budget) return null;
 
-  (items || []).forEach((item) => {
-    if (!item) return;
-
-    let itemYear = null;
-
-    // created_at → fiable
-    if (item.created_at) {
-      const d = new Date(item.created_at);
-      if (!isNaN(d)) itemYear = d.getFullYear();
-    }
-
-    // fallback : period_label → "2025-12"
-    if (!itemYear && item.period_label) {
-      const yStr = String(item.period_label).slice(0, 4);
-      const yNum = parseInt(yStr, 10);
-      if (!isNaN(yNum)) itemYear = yNum;
-    }
-
-    if (itemYear === currentYear) {
-      totalCo2GYear += Number(item.total_co2_g) || 0;
-    }
-  });
-
-    const co2AnnualKg = totalCo2GYear / 1000;
-  const budgetAnnualKg = BUDGET_PER_PERSON_KG * (currentHouseholdSize || 1);
-
-  let percentUsed = (co2AnnualKg / budgetAnnualKg) * 100;
-  if (!isFinite(percentUsed) || percentUsed < 0) percentUsed = 0;
-  if (percentUsed > 300) percentUsed = 300;
-
-
-  const percentRemaining = Math.max(0, 100 - percentUsed);
-  const budgetRemainingKg = Math.max(0, budgetAnnualKg - co2AnnualKg);
-
-  let statusKey = "ok";
-  if (percentUsed > 100) statusKey = "over";
-  else if (percentUsed > 80) statusKey = "warning";
-
-  let statusLabel = {
-    ok: "Budget maîtrisé",
-    warning: "Budget à surveiller",
-    over: "Budget dépassé",
-  }[statusKey];
-
-  let statusLevel = {
-    ok: "green",
-    warning: "orange",
-    over: "red",
-  }[statusKey];
+  const statusKey = budget.status || "ok";
 
   return {
-    currentYear,
-    budgetAnnualKg,
-    co2AnnualKg,
-    percentUsed,
-    percentRemaining,
-    budgetRemainingKg,
+    currentYear: budget.year,
+    budgetAnnualKg: Number(budget.budget_annual_kg) || 0,
+    co2AnnualKg: Number(budget.co2_annual_kg) || 0,
+    percentUsed: Number(budget.percent_used) || 0,
+    percentRemaining: Number(budget.percent_remaining) || 0,
+    budgetRemainingKg: Number(budget.budget_remaining_kg) || 0,
     statusKey,
-    statusLabel,
-    statusLevel,
+    statusLabel: {
+      ok: "Budget maîtrisé",
+      warning: "Budget à surveiller",
+      over: "Budget dépassé",
+    }[statusKey],
+    statusLevel: {
+      ok: "green",
+      warning: "orange",
+      over: "red",
+    }[statusKey],
   };
 }
 
@@ -263,9 +223,31 @@ function renderBudgetFromState(state) {
       return (window.HONOUA_API_BASE || "https://api.honoua.com").replace(/\/$/, "");
     }
 
-    // Endpoint historique (centralisé)
-    function cartHistoryUrl(limit) {
-      return `${getApiBase()}/api/cart/history?limit=${encodeURIComponent(limit)}`;
+    // Résumé budget + séries (un seul appel, quelques centaines d'octets) : partagé
+    // entre le bloc budget et le graphique ; la requête en cours est réutilisée.
+    let __cartSummaryPromise = null;
+
+    function cartSummaryUrl() {
+      const household = encodeURIComponent(currentHouseholdSize || 1);
+      return `${getApiBase()}/api/cart/history/summary?household_size=${household}&months=12&weeks=12`;
+    }
+
+    function fetchCartSummary() {
+      if (__cartSummaryPromise) return __cartSummaryPromise;
+
+      __cartSummaryPromise = fetch(cartSummaryUrl(), {
+        headers: {
+          Accept: "application/json",
+          "X-Honoua-User-Id": (window.getHonouaUserId ? window.getHonouaUserId() : ""),
+        },
+      })
+        .then((res) => {
+          if (!res.ok) throw new Error("Erreur HTTP: " + res.status);
+          return res.json();
+        })
+        .finally(() => { __cartSummaryPromise = null; });
+
+      return __cartSummaryPromise;
     }
 
 
@@ -273,13 +255,8 @@ async function refreshBudget() {
   if (__SUIVI_CO2_HISTORY_DISABLED) return;
 
   try {
-    const res = await fetch(cartHistoryUrl(200), { headers: { Accept: "application/json" } });
-    if (!res.ok) throw new Error("Erreur HTTP: " + res.status);
-
-    const raw = await res.json();
-    const items = normalizeHistoryResponse(raw);
-    const state = computeBudgetStateFromHistory(items);
-    renderBudgetFromState(state);
+    const summary = await fetchCartSummary();
+    renderBudgetFromState(budgetStateFromSummary(summary.budget));
   } catch (err) {
     console.error("[Suivi CO₂] Erreur budget :", err);
   }
@@ -307,18 +284,14 @@ function formatPeriodLabel(type, label) {
   return label;
 }
 
-function buildEvolutionSeries(items, type) {
-  const filtered = items.filter((i) => i.period_type === type);
-
-  const arr = filtered.map((i) => ({
-    key: i.period_label,
-    label: formatPeriodLabel(type, i.period_label),
-    co2Kg: (Number(i.total_co2_g) || 0) / 1000,
-    distanceKm: Number(i.total_distance_km) || 0,
+function evolutionSeriesFromSummary(summary, type) {
+  // Séries déjà agrégées et triées par le serveur (semaines ISO / mois)
+  return ((summary && summary[type]) || []).map((p) => ({
+    key: p.label,
+    label: formatPeriodLabel(type, p.label),
+    co2Kg: Number(p.co2_kg) || 0,
+    distanceKm: Number(p.distance_km) || 0,
   }));
-
-  arr.sort((a, b) => a.key.localeCompare(b.key));
-  return arr;
 }
 
 function pctChange(cur, prev) {
@@ -432,13 +405,8 @@ async function refreshEvolution(type = "month") {
   if (__SUIVI_CO2_HISTORY_DISABLED) return;
 
   try {
-    const resp = await fetch(cartHistoryUrl(200), { headers: { Accept: "application/json" } });
-    if (!resp.ok) return;
-
-    const raw = await resp.json();
-    const items = normalizeHistoryResponse(raw);
-
-    const series = buildEvolutionSeries(items, type);
+    const cartSummary = await fetchCartSummary();
+    const series = evolutionSeriesFromSummary(cartSummary, type);
     const summary = evolutionSummary(series, type);
 
     renderEvolutionSummary(summary);
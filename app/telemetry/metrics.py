@@ -1,14 +1,104 @@
 # app/telemetry/metrics.py
+"""
+Registre de métriques backend (/metrics, /metrics/prometheus).
 
-from typing import Dict, Optional
+Toutes les valeurs sont stockées à plat : {clé (tuple): float}.
+- Mono-process (défaut) : dict en mémoire protégé par un Lock.
+- Multi-process (gunicorn) : si HONOUA_METRICS_DIR est défini, chaque worker
+  écrit dans son fichier mmap et la lecture additionne tous les workers
+  (voir app/telemetry/mmap_store.py).
+
+Clés :
+    ("requests",) ("errors",) ("duration_ms",)
+    ("http", route, method, status, champ)   champ ∈ count | sum_ms | bytes | le<i> (bucket i)
+    ("cache", cache, event)
+    ("pool", pool, event)
+    ("audit", event)                          writer d'audit : enqueued | written | dropped | write_error
+    ("gauge", nom)                            jauges (non archivées à la mort d'un worker)
+"""
+
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from threading import Lock
 
+from app.telemetry import mmap_store
+
 _lock = Lock()
 
-# Registre de métriques en mémoire
-_total_requests = 0
-_total_errors = 0
-_total_duration_ms = 0.0
+# Registre mono-process
+_values: Dict[Tuple, float] = {}
+
+# Registre multi-process : (pid, MmapDict) du worker courant
+_mmap: Optional[Tuple[int, "mmap_store.MmapDict"]] = None
+
+# Compteurs des caches applicatifs : event ∈ hit | negative_hit | miss | expired | eviction | invalidation
+# Compteurs des pools de connexions : event ∈ checkout | checkin | connect | wait | wait_ms | timeout
+
+# Fournisseurs d'état instantané des pools (taille, connexions empruntées...).
+# En multi-process, cet état est celui du worker qui répond.
+_pool_status_providers: List[Callable[[], Dict[str, Dict[str, Any]]]] = []
+
+# Histogrammes de latence HTTP (bornes supérieures en ms, +Inf implicite)
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (
+    1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000,
+)
+QUANTILES: Tuple[float, ...] = (0.5, 0.95, 0.99)
+
+
+def metrics_dir() -> Optional[str]:
+    return os.getenv("HONOUA_METRICS_DIR") or None
+
+
+def _worker_store() -> Optional["mmap_store.MmapDict"]:
+    """
+    Fichier mmap du processus courant (recréé après un fork).
+    """
+    global _mmap
+    directory = metrics_dir()
+    if not directory:
+        return None
+    pid = os.getpid()
+    current = _mmap
+    if current is not None and current[0] == pid:
+        return current[1]
+    with _lock:
+        if _mmap is None or _mmap[0] != pid:
+            os.makedirs(directory, exist_ok=True)
+            _mmap = (pid, mmap_store.MmapDict(mmap_store.worker_file(directory, pid)))
+        return _mmap[1]
+
+
+def _inc(key: Tuple, amount: float = 1.0) -> None:
+    store = _worker_store()
+    if store is not None:
+        store.inc(key, amount)
+        return
+    with _lock:
+        _values[key] = _values.get(key, 0.0) + amount
+
+
+def _collect() -> Dict[Tuple, float]:
+    """
+    Copie de toutes les valeurs (additionnées sur les workers en multi-process).
+    """
+    directory = metrics_dir()
+    if directory:
+        _worker_store()
+        return mmap_store.merge_directory(directory)
+    with _lock:
+        return dict(_values)
+
+
+def reset_metrics() -> None:
+    """
+    Remet le registre local à zéro (tests).
+    """
+    global _mmap
+    with _lock:
+        _values.clear()
+        if _mmap is not None:
+            _mmap[1].close()
+            _mmap = None
 
 
 def record_request(duration_ms: float, is_error: bool) -> None:
@@ -16,30 +106,203 @@ def record_request(duration_ms: float, is_error: bool) -> None:
     Enregistre une requête dans le registre de métriques.
     Thread-safe grâce au Lock.
     """
-    global _total_requests, _total_errors, _total_duration_ms
+    _inc(("requests",))
+    _inc(("duration_ms",), duration_ms)
+    if is_error:
+        _inc(("errors",))
 
-    with _lock:
-        _total_requests += 1
-        _total_duration_ms += duration_ms
-        if is_error:
-            _total_errors += 1
+
+def record_http_request(
+    route: str,
+    method: str,
+    status_code: int,
+    duration_ms: float,
+    response_bytes: int = 0,
+) -> None:
+    """
+    Enregistre une requête HTTP : totaux globaux + histogramme par (route, méthode, statut).
+    """
+    status_code = int(status_code)
+    idx = len(LATENCY_BUCKETS_MS)
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if duration_ms <= bound:
+            idx = i
+            break
+
+    record_request(duration_ms, is_error=status_code >= 500)
+    base = ("http", route, method, status_code)
+    _inc(base + (f"le{idx}",))
+    _inc(base + ("count",))
+    _inc(base + ("sum_ms",), duration_ms)
+    _inc(base + ("bytes",), response_bytes)
 
 
-def get_metrics_snapshot() -> Dict[str, Optional[float]]:
+def track_in_flight(delta: int) -> None:
     """
-    Retourne un petit snapshot des métriques en JSON (pour /metrics).
+    Jauge des requêtes en cours (+1 à l'entrée, -1 à la sortie).
     """
-    with _lock:
-        if _total_requests > 0:
-            avg_duration = _total_duration_ms / _total_requests
+    _inc(("gauge", "in_flight"), delta)
+
+
+def _http_series(values: Dict[Tuple, float]) -> List[Tuple[Tuple[str, str, int], Dict[str, Any]]]:
+    """
+    Regroupe les clés ("http", ...) en séries {buckets, count, sum_ms, bytes}.
+    """
+    series: Dict[Tuple[str, str, int], Dict[str, Any]] = {}
+    for key, value in values.items():
+        if key[0] != "http" or len(key) != 5:
+            continue
+        _, route, method, status, field = key
+        s = series.setdefault(
+            (route, method, int(status)),
+            {"buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1), "count": 0, "sum_ms": 0.0, "bytes": 0},
+        )
+        if field.startswith("le"):
+            s["buckets"][int(field[2:])] += int(value)
+        elif field == "sum_ms":
+            s["sum_ms"] += value
         else:
-            avg_duration = None
+            s[field] += int(value)
+    return sorted(series.items())
+
+
+def histogram_quantile(q: float, buckets: List[int]) -> Optional[float]:
+    """
+    Quantile estimé par interpolation linéaire dans le bucket (comme histogram_quantile de Prometheus).
+    `buckets` : comptes NON cumulés, dernier = +Inf.
+    """
+    total = sum(buckets)
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for i, count in enumerate(buckets):
+        upper = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else None
+        if count and cumulative + count >= rank:
+            if upper is None:
+                # Bucket +Inf : on ne peut que borner par la dernière limite connue
+                return float(LATENCY_BUCKETS_MS[-1])
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+        if upper is not None:
+            lower = float(upper)
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+def get_http_stats(values: Optional[Dict[Tuple, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Latences par (route, méthode, statut) : count, moyenne, p50/p95/p99, octets envoyés.
+    """
+    values = _collect() if values is None else values
 
-        return {
-            "total_requests": _total_requests,
-            "total_errors": _total_errors,
-            "avg_duration_ms": avg_duration,
+    stats = []
+    for (route, method, status), series in _http_series(values):
+        entry = {
+            "route": route,
+            "method": method,
+            "status": status,
+            "count": series["count"],
+            "avg_ms": round(series["sum_ms"] / series["count"], 3) if series["count"] else 0.0,
+            "response_bytes": series["bytes"],
         }
+        for q in QUANTILES:
+            value = histogram_quantile(q, series["buckets"])
+            entry[f"p{int(q * 100)}_ms"] = round(value, 3) if value is not None else None
+        stats.append(entry)
+    return stats
+
+
+def record_cache_event(cache: str, event: str, amount: int = 1) -> None:
+    """
+    Incrémente un compteur de cache (hit, miss, eviction...).
+    """
+    _inc(("cache", cache, event), amount)
+
+
+def get_cache_stats(values: Optional[Dict[Tuple, float]] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Compteurs de cache groupés par nom de cache : {"product": {"hit": 12, ...}}.
+    """
+    values = _collect() if values is None else values
+
+    stats: Dict[str, Dict[str, int]] = {}
+    for key, count in sorted(values.items()):
+        if key[0] == "cache" and len(key) == 3:
+            stats.setdefault(key[1], {})[key[2]] = int(count)
+    return stats
+
+
+def record_pool_event(pool: str, event: str, amount: float = 1) -> None:
+    """
+    Incrémente un compteur de pool DB (checkout, attente, timeout...).
+    """
+    _inc(("pool", pool, event), amount)
+
+
+def record_audit_event(event: str, amount: int = 1) -> None:
+    """
+    Incrémente un compteur du writer d'audit (événements mis en file, écrits, perdus).
+    """
+    _inc(("audit", event), amount)
+
+
+def get_audit_stats(values: Optional[Dict[Tuple, float]] = None) -> Dict[str, int]:
+    values = _collect() if values is None else values
+    return {key[1]: int(count) for key, count in sorted(values.items()) if key[0] == "audit" and len(key) == 2}
+
+
+def register_pool_status_provider(provider: Callable[[], Dict[str, Dict[str, Any]]]) -> None:
+    """
+    Enregistre une fonction retournant l'état courant des pools : {"default": {"size": 5, ...}}.
+    """
+    with _lock:
+        if provider not in _pool_status_providers:
+            _pool_status_providers.append(provider)
+
+
+def get_pool_stats(values: Optional[Dict[Tuple, float]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Compteurs + état instantané, groupés par pool.
+    """
+    values = _collect() if values is None else values
+    with _lock:
+        providers = list(_pool_status_providers)
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for key, value in sorted(values.items()):
+        if key[0] == "pool" and len(key) == 3:
+            stats.setdefault(key[1], {})[key[2]] = round(value, 3) if key[2] == "wait_ms" else int(value)
+    for provider in providers:
+        try:
+            for pool, status in provider().items():
+                stats.setdefault(pool, {}).update(status)
+        except Exception:
+            continue
+    return stats
+
+
+def get_metrics_snapshot() -> Dict[str, Any]:
+    """
+    Retourne un petit snapshot des métriques en JSON (pour /metrics).
+    """
+    values = _collect()
+    total_requests = int(values.get(("requests",), 0))
+    if total_requests > 0:
+        avg_duration = values.get(("duration_ms",), 0.0) / total_requests
+    else:
+        avg_duration = 0.0
+
+    return {
+        "total_requests": total_requests,
+        "total_errors": int(values.get(("errors",), 0)),
+        "avg_duration_ms": avg_duration,
+        "in_flight": int(values.get(("gauge", "in_flight"), 0)),
+        "http": get_http_stats(values),
+        "cache": get_cache_stats(values),
+        "db_pool": get_pool_stats(values),
+        "audit": get_audit_stats(values),
+    }
 
 
 # ---------------------------------------------------------------------------
@@ -50,12 +313,17 @@ def get_prometheus_metrics() -> str:
     Retourne les métriques au format texte Prometheus (exposition format).
     """
 
-    with _lock:
-        total_requests = _total_requests
-        total_errors = _total_errors
-        avg_duration = (
-            _total_duration_ms / _total_requests if _total_requests > 0 else 0.0
-        )
+    values = _collect()
+    total_requests = int(values.get(("requests",), 0))
+    total_errors = int(values.get(("errors",), 0))
+    avg_duration = (
+        values.get(("duration_ms",), 0.0) / total_requests if total_requests > 0 else 0.0
+    )
+    cache_events = sorted(
+        ((k[1], k[2]), int(v)) for k, v in values.items() if k[0] == "cache" and len(k) == 3
+    )
+    in_flight = int(values.get(("gauge", "in_flight"), 0))
+    http_series = _http_series(values)
 
     # Format Prometheus standard (type, help, métriques)
     lines = [
@@ -71,6 +339,73 @@ def get_prometheus_metrics() -> str:
         "# TYPE honoua_average_response_time_ms gauge",
         f"honoua_average_response_time_ms {avg_duration}",
         "",
+        "# HELP honoua_http_requests_in_flight HTTP requests currently being served.",
+        "# TYPE honoua_http_requests_in_flight gauge",
+        f"honoua_http_requests_in_flight {in_flight}",
+        "",
+        "# HELP honoua_http_request_duration_ms HTTP request latency by route, method and status (ms).",
+        "# TYPE honoua_http_request_duration_ms histogram",
+    ]
+    for (route, method, status), series in http_series:
+        labels = f'route="{route}",method="{method}",status="{status}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, series["buckets"]):
+            cumulative += count
+            lines.append(f'honoua_http_request_duration_ms_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'honoua_http_request_duration_ms_bucket{{{labels},le="+Inf"}} {series["count"]}')
+        lines.append(f"honoua_http_request_duration_ms_sum{{{labels}}} {round(series['sum_ms'], 3)}")
+        lines.append(f"honoua_http_request_duration_ms_count{{{labels}}} {series['count']}")
+    lines += [
+        "",
+        "# HELP honoua_http_request_latency_ms Estimated latency quantiles (p50/p95/p99) from the histogram (ms).",
+        "# TYPE honoua_http_request_latency_ms gauge",
+    ]
+    for (route, method, status), series in http_series:
+        labels = f'route="{route}",method="{method}",status="{status}"'
+        for q in QUANTILES:
+            value = histogram_quantile(q, series["buckets"])
+            if value is not None:
+                lines.append(f'honoua_http_request_latency_ms{{{labels},quantile="{q}"}} {round(value, 3)}')
+    lines += [
+        "",
+        "# HELP honoua_http_response_size_bytes_total Response body bytes sent.",
+        "# TYPE honoua_http_response_size_bytes_total counter",
+    ]
+    for (route, method, status), series in http_series:
+        labels = f'route="{route}",method="{method}",status="{status}"'
+        lines.append(f"honoua_http_response_size_bytes_total{{{labels}}} {series['bytes']}")
+    lines += [
+        "",
+        "# HELP honoua_cache_events_total Application cache events (hit, miss, eviction...).",
+        "# TYPE honoua_cache_events_total counter",
+    ]
+    for (cache, event), count in cache_events:
+        lines.append(f'honoua_cache_events_total{{cache="{cache}",event="{event}"}} {count}')
+    lines += [
+        "",
+        "# HELP honoua_audit_events_total Audit writer events (enqueued, written, dropped, write_error).",
+        "# TYPE honoua_audit_events_total counter",
+    ]
+    for event, count in get_audit_stats(values).items():
+        lines.append(f'honoua_audit_events_total{{event="{event}"}} {count}')
+    lines.append("")
+
+    pool_stats = get_pool_stats(values)
+    pool_counters = [
+        ("checkout", "honoua_db_pool_checkouts_total", "counter", "Connections checked out from the pool."),
+        ("wait", "honoua_db_pool_waits_total", "counter", "Checkouts that had to wait for a free connection."),
+        ("wait_ms", "honoua_db_pool_wait_ms_total", "counter", "Total time spent waiting for a connection (ms)."),
+        ("timeout", "honoua_db_pool_timeouts_total", "counter", "Checkouts that timed out."),
+        ("connect", "honoua_db_pool_connects_total", "counter", "New DBAPI connections opened."),
+        ("size", "honoua_db_pool_size", "gauge", "Configured pool size."),
+        ("checked_out", "honoua_db_pool_checked_out", "gauge", "Connections currently checked out."),
+        ("overflow", "honoua_db_pool_overflow", "gauge", "Overflow connections currently open."),
     ]
+    for key, metric, kind, help_text in pool_counters:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for pool, values in sorted(pool_stats.items()):
+            lines.append(f'{metric}{{pool="{pool}"}} {values.get(key, 0)}')
+        lines.append("")
 
     return "\n".join(lines)
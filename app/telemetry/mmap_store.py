@@ -0,0 +1,215 @@
+# app/telemetry/mmap_store.py
+"""
+Stockage des métriques partagé entre workers gunicorn (mode multi-process).
+
+Chaque worker écrit ses compteurs dans son propre fichier mmap
+`metrics_<pid>.db` du répertoire HONOUA_METRICS_DIR ; l'export Prometheus
+relit et additionne tous les fichiers. Même principe que le mode
+multiprocess des clients Prometheus officiels.
+
+Format d'un fichier :
+    [uint32 octets utilisés][4 octets de padding]
+    puis des entrées : [uint32 len(clé)][clé utf-8, paddée à 8][float64 valeur]
+
+Un seul écrivain par fichier (le worker propriétaire) ; les lecteurs
+tolèrent une entrée en cours d'écriture (ignorée jusqu'au prochain scrape).
+
+Quand un worker meurt, mark_process_dead() (hook gunicorn child_exit)
+reporte ses compteurs dans `metrics_archive.db` puis supprime son fichier :
+les totaux restent monotones et les jauges du worker disparaissent.
+"""
+
+import glob
+import json
+import mmap
+import os
+import struct
+from threading import Lock
+from typing import Dict, Iterable, Optional, Tuple
+
+_INITIAL_SIZE = 64 * 1024
+_HEADER = struct.Struct("i4x")
+_LEN = struct.Struct("i")
+_VALUE = struct.Struct("d")
+
+ARCHIVE_FILE = "metrics_archive.db"
+
+# Les clés dont le premier élément est "gauge" ne sont pas archivées
+GAUGE_PREFIX = "gauge"
+
+Key = Tuple
+
+
+def encode_key(key: Key) -> str:
+    return json.dumps(list(key), separators=(",", ":"), ensure_ascii=False)
+
+
+def decode_key(raw: str) -> Key:
+    return tuple(json.loads(raw))
+
+
+def _padded(n: int) -> int:
+    return n + (-n % 8)
+
+
+def worker_file(directory: str, pid: int) -> str:
+    return os.path.join(directory, f"metrics_{pid}.db")
+
+
+def _iter_entries(data: bytes) -> Iterable[Tuple[str, float, int]]:
+    """
+    Parcourt les entrées d'un buffer : (clé, valeur, offset de la valeur).
+    """
+    if len(data) < _HEADER.size:
+        return
+    used = _HEADER.unpack_from(data, 0)[0]
+    used = min(used, len(data))
+    pos = _HEADER.size
+    while pos + _LEN.size <= used:
+        key_len = _LEN.unpack_from(data, pos)[0]
+        key_start = pos + _LEN.size
+        value_pos = pos + _padded(_LEN.size + key_len)
+        if key_len <= 0 or value_pos + _VALUE.size > used:
+            break
+        raw_key = bytes(data[key_start:key_start + key_len]).decode("utf-8")
+        value = _VALUE.unpack_from(data, value_pos)[0]
+        yield raw_key, value, value_pos
+        pos = value_pos + _VALUE.size
+
+
+def read_file(path: str) -> Dict[str, float]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return {}
+    return {k: v for k, v, _ in _iter_entries(data)}
+
+
+class MmapDict:
+    """
+    Dictionnaire clé -> float adossé à un fichier mmap (un par processus).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = Lock()
+        self._f = open(path, "a+b")
+        if os.fstat(self._f.fileno()).st_size == 0:
+            self._f.truncate(_INITIAL_SIZE)
+        self._capacity = os.fstat(self._f.fileno()).st_size
+        self._m = mmap.mmap(self._f.fileno(), self._capacity)
+        self._positions: Dict[str, int] = {}
+
+        used = _HEADER.unpack_from(self._m, 0)[0]
+        if used == 0:
+            self._used = _HEADER.size
+            _HEADER.pack_into(self._m, 0, self._used)
+        else:
+            self._used = used
+            for raw_key, _, value_pos in _iter_entries(self._m):
+                self._positions[raw_key] = value_pos
+
+    def _grow(self, needed: int) -> None:
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._m.close()
+        self._f.truncate(capacity)
+        self._capacity = capacity
+        self._m = mmap.mmap(self._f.fileno(), capacity)
+
+    def _init_key(self, raw_key: str) -> int:
+        encoded = raw_key.encode("utf-8")
+        entry_size = _padded(_LEN.size + len(encoded)) + _VALUE.size
+        if self._used + entry_size > self._capacity:
+            self._grow(self._used + entry_size)
+        pos = self._used
+        _LEN.pack_into(self._m, pos, len(encoded))
+        self._m[pos + _LEN.size:pos + _LEN.size + len(encoded)] = encoded
+        value_pos = pos + _padded(_LEN.size + len(encoded))
+        _VALUE.pack_into(self._m, value_pos, 0.0)
+        # L'en-tête est mis à jour en dernier : un lecteur ne voit jamais d'entrée partielle
+        self._used += entry_size
+        _HEADER.pack_into(self._m, 0, self._used)
+        self._positions[raw_key] = value_pos
+        return value_pos
+
+    def inc(self, key: Key, amount: float = 1.0) -> None:
+        raw_key = encode_key(key)
+        with self._lock:
+            pos = self._positions.get(raw_key)
+            if pos is None:
+                pos = self._init_key(raw_key)
+            current = _VALUE.unpack_from(self._m, pos)[0]
+            _VALUE.pack_into(self._m, pos, current + amount)
+
+    def set(self, key: Key, value: float) -> None:
+        raw_key = encode_key(key)
+        with self._lock:
+            pos = self._positions.get(raw_key)
+            if pos is None:
+                pos = self._init_key(raw_key)
+            _VALUE.pack_into(self._m, pos, float(value))
+
+    def values(self) -> Dict[Key, float]:
+        with self._lock:
+            return {decode_key(k): v for k, v, _ in _iter_entries(self._m)}
+
+    def close(self) -> None:
+        with self._lock:
+            self._m.close()
+            self._f.close()
+
+
+def merge_directory(directory: str) -> Dict[Key, float]:
+    """
+    Somme des valeurs de tous les fichiers du répertoire (workers vivants + archive).
+    """
+    merged: Dict[Key, float] = {}
+    for path in glob.glob(os.path.join(directory, "metrics_*.db")):
+        for raw_key, value in read_file(path).items():
+            key = decode_key(raw_key)
+            merged[key] = merged.get(key, 0.0) + value
+    return merged
+
+
+def mark_process_dead(pid: int, directory: Optional[str] = None) -> None:
+    """
+    À appeler depuis le master gunicorn (child_exit) : archive les compteurs
+    du worker mort et supprime son fichier.
+    """
+    directory = directory or os.getenv("HONOUA_METRICS_DIR")
+    if not directory:
+        return
+    path = worker_file(directory, pid)
+    values = read_file(path)
+    if values:
+        archive = MmapDict(os.path.join(directory, ARCHIVE_FILE))
+        try:
+            for raw_key, value in values.items():
+                key = decode_key(raw_key)
+                if key and key[0] == GAUGE_PREFIX:
+                    continue
+                archive.inc(key, value)
+        finally:
+            archive.close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def clear_directory(directory: Optional[str] = None) -> None:
+    """
+    Vide le répertoire au démarrage du master (restes d'une exécution précédente).
+    """
+    directory = directory or os.getenv("HONOUA_METRICS_DIR")
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, "metrics_*.db")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
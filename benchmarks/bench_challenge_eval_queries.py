@@ -0,0 +1,162 @@
+# benchmarks/bench_challenge_eval_queries.py
+"""
+Benchmark : nombre de requêtes SQL (et temps CPU côté Python) par appel à
+evaluate_challenge(), avec et sans cache de la source CO2.
+
+Utilise une session factice qui compte les requêtes (pas de base requise) :
+- "cold"  : cache invalidé avant chaque évaluation (détection to_regclass +
+            information_schema à chaque appel)
+- "warm"  : source résolue une fois par processus (comportement par défaut)
+- "legacy": avant mise en cache, la détection était refaite pour chacune des
+            deux fenêtres (référence / courante) : warm + 2 x détection
+            (+ 1 agrégat : les deux fenêtres étaient alors deux requêtes distinctes)
+
+Usage :
+    python benchmarks/bench_challenge_eval_queries.py --evaluations 2000
+"""
+
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from app.routers.challenges import evaluate_challenge  # noqa: E402
+from app.services.co2_source import invalidate_co2_source_cache  # noqa: E402
+
+
+class _Result:
+    def __init__(self, row=None, scalars=None):
+        self._row = row
+        self._scalars = scalars or []
+
+    def mappings(self):
+        return self
+
+    def first(self):
+        return self._row
+
+    def fetchone(self):
+        return self._row
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self._scalars
+
+
+class CountingSession:
+    """
+    Session factice : répond aux requêtes d'evaluate_challenge et les compte par type.
+    """
+
+    def __init__(self, select_row, ref_row, cur_row):
+        self.select_row = select_row
+        self.ref_row = ref_row
+        self.cur_row = cur_row
+        self.counts = Counter()
+
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        if "to_regclass" in sql and "co2_cart_daily" in (params or {}).get("fqtn", ""):
+            # cumul journalier absent ici : lecture sur la table brute
+            self.counts["rollup_probe"] += 1
+            return _Result({"ok": False})
+        if "to_regclass" in sql:
+            self.counts["to_regclass"] += 1
+            return _Result({"ok": (params or {}).get("fqtn") == "honou.co2_cart_history"})
+        if "information_schema.columns" in sql:
+            self.counts["information_schema"] += 1
+            return _Result(scalars=["id", "user_id", "created_at", "total_co2_g"])
+        if "JOIN public.challenges" in sql:
+            self.counts["instance"] += 1
+            return _Result(self.select_row)
+        if "co2_cart_history" in sql:
+            self.counts["aggregate"] += 1
+            return _Result({
+                "ref_total_g": self.ref_row["total_co2_g"],
+                "ref_days": self.ref_row["days_count"],
+                "cur_total_g": self.cur_row["total_co2_g"],
+                "cur_days": self.cur_row["days_count"],
+            })
+        if sql.lstrip().upper().startswith("UPDATE"):
+            self.counts["update"] += 1
+            return _Result()
+        self.counts["other"] += 1
+        return _Result()
+
+    def commit(self):
+        return None
+
+    def rollback(self):
+        return None
+
+
+def _session():
+    now = datetime.utcnow()
+    start = now - timedelta(days=3)
+    select_row = {
+        "instance_id": 3,
+        "challenge_id": 2,
+        "user_id": "1",
+        "start_date": start,
+        "end_date": start + timedelta(days=30),
+        "status": "ACTIVE",
+        "created_at": start,
+        "updated_at": start,
+        "code": "CO2_30D_MINUS_10",
+        "name": "CO2 30d -10%",
+        "target_value": 10.0,
+    }
+    return CountingSession(
+        select_row,
+        {"total_co2_g": 100000.0, "days_count": 20},
+        {"total_co2_g": 20000.0, "days_count": 3},
+    )
+
+
+def run(n: int, cold: bool):
+    db = _session()
+    invalidate_co2_source_cache()
+    t0 = time.perf_counter()
+    for _ in range(n):
+        if cold:
+            invalidate_co2_source_cache()
+        evaluate_challenge(user_id=1, instance_id=3, db=db)
+    elapsed = time.perf_counter() - t0
+    return db.counts, elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--evaluations", type=int, default=2000)
+    args = parser.parse_args()
+    n = args.evaluations
+
+    if "pytest" in sys.modules:
+        print("[bench] à lancer hors pytest (evaluate_challenge court-circuite la DB sous pytest)")
+        return 1
+
+    results = {}
+    for label, cold in (("cold", True), ("warm", False)):
+        counts, elapsed = run(n, cold)
+        per_eval = sum(counts.values()) / n
+        results[label] = (per_eval, counts)
+        detail = ", ".join(f"{k}={v / n:g}" for k, v in sorted(counts.items()))
+        print(f"{label:<6} {per_eval:5.2f} requêtes/évaluation  ({detail})  {elapsed / n * 1e6:8.1f} µs/éval")
+
+    warm, _ = results["warm"]
+    _, cold_counts = results["cold"]
+    detection = (cold_counts["to_regclass"] + cold_counts["information_schema"]) / n
+    print(f"legacy {warm + 1 + 2 * detection:5.2f} requêtes/évaluation  (détection refaite par fenêtre, 2 agrégats)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
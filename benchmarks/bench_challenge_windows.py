@@ -0,0 +1,189 @@
+# benchmarks/bench_challenge_windows.py
+"""
+Benchmark : agrégat des fenêtres d'un défi CO2_30D_MINUS_10 (référence 30 j + courante)
+pour des utilisateurs ayant beaucoup de paniers (5k+ par défaut).
+
+Variantes mesurées (latence p50 / p95 par évaluation) :
+- "2 requêtes"            : une requête SUM / COUNT(DISTINCT DATE) par fenêtre (avant)
+- "2 requêtes + index"    : idem avec l'index (user_id, created_at) (migration c6e2b9a4f013)
+- "1 passe + index"       : two_window_sql(), agrégat conditionnel (CASE sur SQLite)
+- "1 passe + cumul"       : two_window_sql() avec co2_cart_daily (jours entiers pré-agrégés)
+Les quatre variantes doivent renvoyer les mêmes agrégats (vérifié).
+
+SQLite est embarqué (pas d'aller-retour réseau) : la passe unique y coûte à peu près
+autant que deux requêtes indexées ; sur PostgreSQL elle économise un aller-retour et un
+second parcours d'index par évaluation.
+
+Filtre utilisateur `user_id = :u` (texte) : l'affinité INTEGER de SQLite convertit la
+valeur et l'index reste utilisable (sur PostgreSQL, l'index porte sur user_id::text).
+
+Usage :
+    python benchmarks/bench_challenge_windows.py                    # SQLite temporaire
+    python benchmarks/bench_challenge_windows.py --users 20 --carts-per-user 8000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.services.challenge_scoring import challenge_windows  # noqa: E402
+from app.services.co2_daily import rebuild_cart_daily, two_window_sql, window_params  # noqa: E402
+from app.services.co2_source import Co2Source, invalidate_co2_source_cache  # noqa: E402
+
+SOURCE = Co2Source("main", "co2_cart_history", "created_at", "total_co2_g", "g")
+ROLLUP = Co2Source("main", "co2_cart_daily", "day", "total_co2_g", "g")
+HISTORY_DAYS = 365
+
+DDL = [
+    """CREATE TABLE co2_cart_history (
+        id INTEGER PRIMARY KEY, user_id INTEGER, period_type TEXT, period_label TEXT,
+        total_co2_g INTEGER, nb_articles INTEGER, created_at TIMESTAMP
+    )""",
+    """CREATE TABLE co2_cart_daily (
+        user_id TEXT NOT NULL, day DATE NOT NULL,
+        total_co2_g REAL NOT NULL DEFAULT 0, cart_count INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP, PRIMARY KEY (user_id, day)
+    )""",
+]
+INDEX_DDL = "CREATE INDEX ix_co2_cart_history_user_ts ON co2_cart_history (user_id, created_at, total_co2_g)"
+
+LEGACY_SQL = """
+    SELECT SUM(total_co2_g) AS total_co2_g, COUNT(DISTINCT DATE(created_at)) AS days_count
+    FROM co2_cart_history
+    WHERE user_id = :u AND created_at >= :start AND created_at {op} :end
+"""
+
+
+def build(engine, users: int, carts: int, seed: int, now: datetime) -> None:
+    rnd = random.Random(seed)
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        for ddl in DDL:
+            conn.exec_driver_sql(ddl)
+        insert = text(
+            "INSERT INTO co2_cart_history (user_id, period_type, period_label, total_co2_g, nb_articles, created_at) "
+            "VALUES (:u, 'month', :label, :g, :n, :ts)"
+        )
+        for uid in range(1, users + 1):
+            batch = []
+            for _ in range(carts):
+                ts = now - timedelta(seconds=rnd.randint(0, HISTORY_DAYS * 86400))
+                batch.append({
+                    "u": uid, "label": ts.strftime("%Y-%m"), "g": rnd.randint(200, 20000),
+                    "n": rnd.randint(1, 40), "ts": ts.isoformat(sep=" "),
+                })
+            conn.execute(insert, batch)
+        # bruit : autres utilisateurs avec peu de paniers
+        conn.execute(insert, [
+            {"u": users + i, "label": "x", "g": 100, "n": 1, "ts": now.isoformat(sep=" ")}
+            for i in range(1, 1000)
+        ])
+    print(f"[bench] {users} utilisateurs x {carts} paniers insérés en {time.perf_counter() - t0:.1f} s")
+
+
+def _pct(values, p):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def run(args) -> int:
+    fd, path = tempfile.mkstemp(prefix="honoua_bench_windows_", suffix=".sqlite")
+    os.close(fd)
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    now = datetime(2026, 6, 1, 12, 0, 0)
+    try:
+        build(engine, args.users, args.carts_per_user, args.seed, now)
+
+        rnd = random.Random(args.seed + 1)
+        cases = []
+        for _ in range(args.evaluations):
+            uid = rnd.randint(1, args.users)
+            start = now - timedelta(days=rnd.randint(1, 29), minutes=rnd.randint(0, 1439))
+            ref_start, ref_end, cur_start, cur_end = challenge_windows(start, start + timedelta(days=30), now)
+            cases.append((str(uid), ref_start, cur_start, cur_end))
+
+        def legacy(db, u, ref_start, cur_start, cur_end):
+            out = []
+            for start, end, op in ((ref_start, cur_start, "<"), (cur_start, cur_end, "<=")):
+                r = db.execute(
+                    text(LEGACY_SQL.format(op=op)),
+                    {"u": u, "start": start.isoformat(sep=" "), "end": end.isoformat(sep=" ")},
+                ).mappings().first()
+                out += [r["total_co2_g"], r["days_count"]]
+            return tuple(out)
+
+        def single(rollup):
+            sql = text(two_window_sql("sqlite", SOURCE, rollup, lambda col: f"{col} = :u"))
+
+            def _run(db, u, ref_start, cur_start, cur_end):
+                r = db.execute(sql, {"u": u, **window_params("sqlite", ref_start, cur_start, cur_end)}).mappings().first()
+                return (r["ref_total_g"], r["ref_days"], r["cur_total_g"], r["cur_days"])
+            return _run
+
+        def measure(label, fn):
+            with Session(engine) as db:
+                fn(db, *cases[0])  # warm-up
+                lat, results = [], []
+                for case in cases:
+                    t0 = time.perf_counter()
+                    results.append(fn(db, *case))
+                    lat.append((time.perf_counter() - t0) * 1000.0)
+            print(
+                f"{label:<22} p50={_pct(lat, 50):8.2f} ms  p95={_pct(lat, 95):8.2f} ms  "
+                f"mean={statistics.mean(lat):8.2f} ms"
+            )
+            return results
+
+        print(f"[bench] {args.evaluations} évaluations, {args.carts_per_user} paniers / utilisateur")
+        baseline = measure("2 requêtes", legacy)
+        with engine.begin() as conn:
+            conn.exec_driver_sql(INDEX_DDL)
+            conn.exec_driver_sql("ANALYZE")
+        variants = [
+            ("2 requêtes + index", legacy),
+            ("1 passe + index", single(None)),
+        ]
+        with Session(engine) as db:
+            invalidate_co2_source_cache()
+            rebuild_cart_daily(db)
+            invalidate_co2_source_cache()
+        variants.append(("1 passe + cumul", single(ROLLUP)))
+
+        ok = True
+        for label, fn in variants:
+            results = measure(label, fn)
+            if [tuple(float(v or 0) for v in r) for r in results] != [tuple(float(v or 0) for v in r) for r in baseline]:
+                print(f"[bench] {label} : résultats différents de la référence !")
+                ok = False
+        return 0 if ok else 1
+    finally:
+        engine.dispose()
+        if not args.keep:
+            os.remove(path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--carts-per-user", type=int, default=6000)
+    parser.add_argument("--evaluations", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Conserver la base SQLite temporaire")
+    return run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
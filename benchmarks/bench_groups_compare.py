@@ -0,0 +1,260 @@
+# benchmarks/bench_groups_compare.py
+"""
+Benchmark : /groups/compare (A42) pour 100 groupes × 2 ans de buckets hebdomadaires.
+
+Variantes mesurées (latence p50 / p95 par appel, requête + calculs) :
+- "1 requête / groupe"   : une série date_trunc par groupe, pente et rang en Python (avant)
+- "1 requête + NumPy"    : toutes les séries en une jointure user_group_sessions,
+                           buckets alignés (trous = 0) puis pentes / rangs vectorisés
+Les totaux de période et les rangs doivent être identiques (vérifié) ; les pentes aussi
+lorsque aucune semaine n'est vide (sinon l'ancienne version ignorait les trous).
+
+SQLite embarqué : date_trunc('week') est émulé par date(ts, '-6 days', 'weekday 1').
+Le coût est dominé par le parcours des calculs, identique dans les deux variantes :
+sur SQLite embarqué la requête unique ne gagne presque rien ; sur PostgreSQL elle évite
+N-1 allers-retours et N sous-requêtes IN. Les lignes "calculs" isolent la partie Python.
+
+Usage :
+    python benchmarks/bench_groups_compare.py
+    python benchmarks/bench_groups_compare.py --groups 200 --calcs-per-group 5000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import bindparam, create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.services.group_timeseries import (  # noqa: E402
+    fill_buckets,
+    low_co2_ranks,
+    period_averages,
+    trend_slopes,
+)
+
+WEEKS = 104
+DDL = [
+    "CREATE TABLE user_group_sessions (group_id INTEGER, session_id TEXT, PRIMARY KEY (group_id, session_id))",
+    """CREATE TABLE emission_calculations (
+        id INTEGER PRIMARY KEY, session_id TEXT, category_code TEXT,
+        emissions_gco2e REAL, created_at TIMESTAMP
+    )""",
+    "CREATE INDEX ix_ec_session ON emission_calculations (session_id, created_at)",
+]
+WEEK_SQL = "date(ec.created_at, '-6 days', 'weekday 1')"
+
+LEGACY_SQL = f"""
+    SELECT {WEEK_SQL} AS bucket_start,
+           SUM(ec.emissions_gco2e) AS total_emission, AVG(ec.emissions_gco2e) AS avg_emission
+    FROM emission_calculations ec
+    WHERE ec.session_id IN (SELECT ugs.session_id FROM user_group_sessions ugs WHERE ugs.group_id = :gid)
+      AND date(ec.created_at) >= :start_date AND date(ec.created_at) <= :end_date
+    GROUP BY 1
+    ORDER BY bucket_start ASC
+"""
+
+SINGLE_SQL = text(f"""
+    SELECT ugs.group_id, {WEEK_SQL} AS bucket_start,
+           SUM(ec.emissions_gco2e) AS total_emission, AVG(ec.emissions_gco2e) AS avg_emission
+    FROM user_group_sessions ugs
+    JOIN emission_calculations ec ON ec.session_id = ugs.session_id
+    WHERE ugs.group_id IN :gids
+      AND date(ec.created_at) >= :start_date AND date(ec.created_at) <= :end_date
+    GROUP BY 1, 2
+    ORDER BY 1, 2
+""").bindparams(bindparam("gids", expanding=True))
+
+
+def _legacy_slope(items):
+    # Copie de l'ancien _trend_slope_from_items de app/routers/groups_a42.py
+    n = len(items)
+    if n < 2:
+        return 0.0
+    sum_x = sum(range(n))
+    ys = [float(it.get("total_emission") or 0.0) for it in items]
+    sum_y = sum(ys)
+    sum_xx = sum(i * i for i in range(n))
+    sum_xy = sum(i * ys[i] for i in range(n))
+    denom = (n * sum_xx - sum_x * sum_x)
+    if denom == 0:
+        return 0.0
+    return float((n * sum_xy - sum_x * sum_y) / denom)
+
+
+def build(engine, groups: int, sessions: int, calcs: int, seed: int, start: date) -> None:
+    rnd = random.Random(seed)
+    t0 = time.perf_counter()
+    span_s = WEEKS * 7 * 86400
+    origin = datetime.combine(start, datetime.min.time())
+    with engine.begin() as conn:
+        for ddl in DDL:
+            conn.exec_driver_sql(ddl)
+        for gid in range(1, groups + 1):
+            sids = [f"g{gid}-s{i}" for i in range(sessions)]
+            conn.execute(
+                text("INSERT INTO user_group_sessions (group_id, session_id) VALUES (:g, :s)"),
+                [{"g": gid, "s": s} for s in sids],
+            )
+            trend = rnd.uniform(-0.5, 0.5)
+            batch = []
+            for _ in range(calcs):
+                offset = rnd.randint(0, span_s - 1)
+                week = offset // (7 * 86400)
+                batch.append({
+                    "s": rnd.choice(sids),
+                    "v": max(1.0, rnd.gauss(500 + trend * week * 5, 120)),
+                    "ts": (origin + timedelta(seconds=offset)).isoformat(sep=" "),
+                })
+            conn.execute(
+                text(
+                    "INSERT INTO emission_calculations (session_id, category_code, emissions_gco2e, created_at) "
+                    "VALUES (:s, 'FOOD', :v, :ts)"
+                ),
+                batch,
+            )
+        conn.exec_driver_sql("ANALYZE")
+    print(f"[bench] {groups} groupes x {calcs} calculs insérés en {time.perf_counter() - t0:.1f} s")
+
+
+def legacy(db, ids, sd, ed):
+    tmp = []
+    for gid in ids:
+        rows = db.execute(
+            text(LEGACY_SQL), {"gid": gid, "start_date": sd.isoformat(), "end_date": ed.isoformat()}
+        ).mappings().all()
+        items = [
+            {"bucket_start": r["bucket_start"], "total_emission": float(r["total_emission"] or 0),
+             "avg_emission": float(r["avg_emission"] or 0)}
+            for r in rows
+        ]
+        tmp.append({
+            "group_id": gid,
+            "period_total": sum(it["total_emission"] for it in items),
+            "trend_slope": _legacy_slope(items),
+            "full": len(items) == WEEKS,
+        })
+    ordered = sorted(tmp, key=lambda x: x["period_total"])
+    return {e["group_id"]: (rank, e["period_total"], e["trend_slope"], e["full"])
+            for rank, e in enumerate(ordered, start=1)}
+
+
+def single(db, ids, sd, ed):
+    rows = [
+        {**r, "bucket_start": date.fromisoformat(r["bucket_start"])}
+        for r in db.execute(
+            SINGLE_SQL, {"gids": sorted(set(ids)), "start_date": sd.isoformat(), "end_date": ed.isoformat()}
+        ).mappings().all()
+    ]
+    axis, totals, avgs, present = fill_buckets(rows, ids, "week", sd, ed)
+    period_totals = totals.sum(axis=1)
+    period_averages(avgs, present)
+    slopes = trend_slopes(totals)
+    _, ranks = low_co2_ranks(period_totals)
+    return {gid: (int(ranks[i]), float(period_totals[i]), float(slopes[i])) for i, gid in enumerate(ids)}
+
+
+def _pct(values, p):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def run(args) -> int:
+    fd, path = tempfile.mkstemp(prefix="honoua_bench_compare_", suffix=".sqlite")
+    os.close(fd)
+    engine = create_engine(f"sqlite:///{path}", future=True)
+    sd = date(2024, 1, 1)  # lundi
+    ed = sd + timedelta(days=WEEKS * 7 - 1)
+    ids = list(range(1, args.groups + 1))
+    try:
+        build(engine, args.groups, args.sessions_per_group, args.calcs_per_group, args.seed, sd)
+
+        def measure(label, fn):
+            with Session(engine) as db:
+                fn(db, ids, sd, ed)  # warm-up
+                lat = []
+                for _ in range(args.calls):
+                    t0 = time.perf_counter()
+                    result = fn(db, ids, sd, ed)
+                    lat.append((time.perf_counter() - t0) * 1000.0)
+            print(
+                f"{label:<22} p50={_pct(lat, 50):8.2f} ms  p95={_pct(lat, 95):8.2f} ms  "
+                f"mean={statistics.mean(lat):8.2f} ms"
+            )
+            return result
+
+        print(f"[bench] {args.calls} appels, {len(ids)} groupes x {WEEKS} semaines")
+        before = measure("1 requête / groupe", legacy)
+        after = measure("1 requête + NumPy", single)
+
+        # Calculs seuls (lignes déjà lues) : pentes / rangs en Python vs NumPy
+        with Session(engine) as db:
+            rows = [
+                {**r, "bucket_start": date.fromisoformat(r["bucket_start"])}
+                for r in db.execute(
+                    SINGLE_SQL, {"gids": ids, "start_date": sd.isoformat(), "end_date": ed.isoformat()}
+                ).mappings().all()
+            ]
+
+        def compute_python():
+            by_group = {gid: [] for gid in ids}
+            for r in rows:
+                by_group[r["group_id"]].append(r)
+            tmp = [(gid, sum(float(r["total_emission"]) for r in items), _legacy_slope(items))
+                   for gid, items in by_group.items()]
+            return sorted(tmp, key=lambda x: x[1])
+
+        def compute_numpy():
+            _, totals, avgs, present = fill_buckets(rows, ids, "week", sd, ed)
+            period_averages(avgs, present)
+            trend_slopes(totals)
+            return low_co2_ranks(totals.sum(axis=1))
+
+        for label, fn in (("calculs Python", compute_python), ("calculs NumPy", compute_numpy)):
+            lat = []
+            for _ in range(args.calls):
+                t0 = time.perf_counter()
+                fn()
+                lat.append((time.perf_counter() - t0) * 1000.0)
+            print(f"{label:<22} p50={_pct(lat, 50):8.2f} ms  mean={statistics.mean(lat):8.2f} ms")
+
+        ok = True
+        for gid in ids:
+            rank, total, slope, full = before[gid]
+            new_rank, new_total, new_slope = after[gid]
+            if rank != new_rank or abs(total - new_total) > 1e-6 * max(1.0, total):
+                ok = False
+            if full and abs(slope - new_slope) > 1e-6 * max(1.0, abs(slope)):
+                ok = False
+        if not ok:
+            print("[bench] résultats différents de la référence !")
+        return 0 if ok else 1
+    finally:
+        engine.dispose()
+        if not args.keep:
+            os.remove(path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--sessions-per-group", type=int, default=20)
+    parser.add_argument("--calcs-per-group", type=int, default=3000)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Conserver la base SQLite temporaire")
+    return run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
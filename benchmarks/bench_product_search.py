@@ -0,0 +1,207 @@
+# benchmarks/bench_product_search.py
+"""
+Benchmark de la recherche produits (app/services/product_search.py).
+
+Construit un catalogue synthétique (1M produits par défaut), puis mesure la latence
+p50 / p95 / p99 de search_products() sur des requêtes "as-you-type" (préfixes,
+multi-termes, pages suivantes), comparée au scan legacy `ILIKE '%q%'`.
+Code de sortie 1 si la cible p95 n'est pas tenue.
+
+Usage :
+    python benchmarks/bench_product_search.py                    # SQLite temporaire, 1M lignes
+    python benchmarks/bench_product_search.py --rows 100000
+    python benchmarks/bench_product_search.py --url postgresql+psycopg2://... --rows 1000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app.services.product_search import ensure_search_index, search_products  # noqa: E402
+
+WORDS = [
+    "lait", "chocolat", "yaourt", "pâte", "tartiner", "noisettes", "biscuits", "céréales",
+    "fromage", "beurre", "jambon", "poulet", "saumon", "riz", "pâtes", "tomates", "sauce",
+    "jus", "orange", "pomme", "fraise", "confiture", "miel", "café", "thé", "eau", "gazeuse",
+    "bio", "nature", "demi-écrémé", "entier", "allégé", "surgelé", "frais", "épicé", "vanille",
+    "caramel", "amande", "coco", "citron", "olive", "huile", "vinaigre", "moutarde", "pain",
+    "brioche", "croissant", "galette", "crêpes", "soupe", "légumes", "carottes", "haricots",
+]
+BRANDS = [f"Marque{i:03d}" for i in range(400)]
+SIZES = ["125g", "250g", "500g", "1kg", "1L", "50cl", "4x125g", "6x1L"]
+
+PRODUCTS_DDL = """
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY,
+        ean13_clean VARCHAR,
+        product_name VARCHAR,
+        brand VARCHAR,
+        category VARCHAR
+    )
+"""
+
+PG_INDEX_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING GIN (product_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_fts ON products USING GIN ("
+    "to_tsvector('simple', coalesce(product_name, '') || ' ' || coalesce(brand, '')))",
+]
+
+
+def _synthetic_rows(n: int, seed: int):
+    rnd = random.Random(seed)
+    for i in range(1, n + 1):
+        name = " ".join(rnd.sample(WORDS, rnd.randint(2, 4))) + " " + rnd.choice(SIZES)
+        yield {
+            "id": i,
+            "ean": f"{2000000000000 + i}",
+            "name": name.capitalize(),
+            "brand": rnd.choice(BRANDS),
+            "category": rnd.choice(["Épicerie", "Frais", "Boissons", "Surgelés"]),
+        }
+
+
+def build_catalogue(engine, rows: int, seed: int, chunk: int = 50_000) -> None:
+    insert = text(
+        "INSERT INTO products (id, ean13_clean, product_name, brand, category) "
+        "VALUES (:id, :ean, :name, :brand, :category)"
+    )
+    with engine.begin() as conn:
+        conn.exec_driver_sql(PRODUCTS_DDL)
+        existing = conn.execute(text("SELECT COUNT(*) FROM products")).scalar_one()
+    if existing >= rows:
+        print(f"[bench] catalogue déjà présent ({existing} lignes)")
+        return
+
+    t0 = time.perf_counter()
+    if engine.dialect.name == "sqlite":
+        # Index créé avant le chargement : triggers FTS5 alimentés au fil de l'eau
+        ensure_search_index(engine)
+
+    batch = []
+    with engine.begin() as conn:
+        for row in _synthetic_rows(rows, seed):
+            batch.append(row)
+            if len(batch) >= chunk:
+                conn.execute(insert, batch)
+                batch = []
+        if batch:
+            conn.execute(insert, batch)
+
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            for ddl in PG_INDEX_DDL:
+                conn.exec_driver_sql(ddl)
+            conn.exec_driver_sql("ANALYZE products")
+
+    print(f"[bench] {rows} produits insérés + indexés en {time.perf_counter() - t0:.1f} s")
+
+
+def _queries(seed: int, n: int):
+    rnd = random.Random(seed + 1)
+    out = []
+    for _ in range(n):
+        w = rnd.choice(WORDS)
+        kind = rnd.random()
+        if kind < 0.4:
+            out.append(w[: rnd.randint(2, max(2, len(w)))])           # frappe en cours
+        elif kind < 0.8:
+            out.append(f"{w} {rnd.choice(WORDS)[:3]}")                # multi-termes
+        else:
+            out.append(w)                                             # mot complet
+    return out
+
+
+def _pct(values, p):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1)))))
+    return values[k]
+
+
+def run(args) -> int:
+    url = args.url
+    tmp_path = None
+    if not url:
+        fd, tmp_path = tempfile.mkstemp(prefix="honoua_bench_search_", suffix=".sqlite")
+        os.close(fd)
+        url = f"sqlite:///{tmp_path}"
+
+    engine = create_engine(url, future=True)
+    try:
+        build_catalogue(engine, args.rows, args.seed)
+        queries = _queries(args.seed, args.queries)
+
+        latencies_ms = []
+        pages_ms = []
+        with Session(engine) as db:
+            search_products(db, "lait", limit=args.limit)  # warm-up
+            for q in queries:
+                t0 = time.perf_counter()
+                _, cursor = search_products(db, q, limit=args.limit)
+                latencies_ms.append((time.perf_counter() - t0) * 1000.0)
+                if cursor:
+                    t0 = time.perf_counter()
+                    search_products(db, q, limit=args.limit, cursor=cursor)
+                    pages_ms.append((time.perf_counter() - t0) * 1000.0)
+
+            # Référence : scan legacy ILIKE '%q%' (sur quelques requêtes seulement)
+            legacy_ms = []
+            like = "ILIKE" if engine.dialect.name == "postgresql" else "LIKE"
+            for q in queries[: args.legacy_queries]:
+                t0 = time.perf_counter()
+                db.execute(
+                    text(f"SELECT id FROM products WHERE product_name {like} :q ORDER BY id LIMIT :limit"),
+                    {"q": f"%{q}%", "limit": args.limit},
+                ).all()
+                legacy_ms.append((time.perf_counter() - t0) * 1000.0)
+
+        def _line(label, values):
+            if not values:
+                return f"{label:<22} n=0"
+            return (
+                f"{label:<22} n={len(values):<5} p50={_pct(values, 50):8.2f} ms  "
+                f"p95={_pct(values, 95):8.2f} ms  p99={_pct(values, 99):8.2f} ms  "
+                f"mean={statistics.mean(values):8.2f} ms"
+            )
+
+        print(f"[bench] moteur={engine.dialect.name} rows={args.rows} limit={args.limit}")
+        print(_line("search (page 1)", latencies_ms))
+        print(_line("search (page 2)", pages_ms))
+        print(_line("legacy LIKE %q%", legacy_ms))
+
+        p95 = _pct(latencies_ms, 95)
+        ok = p95 <= args.p95_target_ms
+        print(f"[bench] cible p95 <= {args.p95_target_ms} ms : {'OK' if ok else 'KO'} ({p95:.2f} ms)")
+        return 0 if ok else 1
+    finally:
+        engine.dispose()
+        if tmp_path and not args.keep:
+            os.remove(tmp_path)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="URL SQLAlchemy (défaut : SQLite temporaire)")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--legacy-queries", type=int, default=10)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--p95-target-ms", type=float, default=50.0)
+    parser.add_argument("--keep", action="store_true", help="Conserver la base SQLite temporaire")
+    return run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,20 @@
+# gunicorn.conf.py — configuration du serveur de prod (Dockerfile)
+#
+# Métriques multi-workers : chaque worker écrit ses compteurs dans
+# HONOUA_METRICS_DIR (fichier mmap par PID) et /metrics/prometheus additionne
+# tous les fichiers. Le master vide le répertoire au démarrage et archive les
+# compteurs d'un worker à sa sortie (app/telemetry/mmap_store.py).
+import os
+
+from app.telemetry.mmap_store import clear_directory, mark_process_dead
+
+# App ASGI (FastAPI) : workers uvicorn
+worker_class = os.getenv("HONOUA_WORKER_CLASS", "uvicorn.workers.UvicornWorker")
+
+
+def on_starting(server):
+    clear_directory()
+
+
+def child_exit(server, worker):
+    mark_process_dead(worker.pid)
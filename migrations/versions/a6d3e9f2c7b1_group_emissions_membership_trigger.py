@@ -0,0 +1,207 @@
+"""group_emissions_daily: membership trigger, lock both sessions on UPDATE
+
+Revision ID: a6d3e9f2c7b1
+Revises: c4e9a7d2f1b8
+Create Date: 2026-10-19 12:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a6d3e9f2c7b1"
+down_revision = "c4e9a7d2f1b8"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # L'ajout / le retrait de session était maintenu par l'application, et seulement si
+    # son cache voyait la table : tout autre écrivain de user_group_sessions (script,
+    # psql, worker au cache périmé) désynchronisait l'agrégat. Le trigger suit la table.
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('public.group_emissions_daily') IS NULL THEN
+                RETURN;
+            END IF;
+
+            -- Verrous transactionnels des sessions, en ordre de clé croissant : deux
+            -- transactions qui prennent les mêmes sessions ne peuvent pas s'interbloquer.
+            CREATE OR REPLACE FUNCTION public.group_emissions_lock_sessions(p_a TEXT, p_b TEXT)
+            RETURNS void LANGUAGE plpgsql AS $f$
+            DECLARE
+                k INTEGER;
+            BEGIN
+                FOR k IN
+                    SELECT DISTINCT hashtext(s) FROM unnest(ARRAY[p_a, p_b]) AS s
+                    WHERE s IS NOT NULL ORDER BY 1
+                LOOP
+                    PERFORM pg_advisory_xact_lock(k);
+                END LOOP;
+            END;
+            $f$;
+
+            -- Recalcul des cellules d'un groupe touchées par une session, depuis les
+            -- membres actuels (sortie de session : min / max ne sont pas décrémentables)
+            CREATE OR REPLACE FUNCTION public.group_emissions_daily_refresh_member(p_group BIGINT, p_session TEXT)
+            RETURNS void LANGUAGE sql AS $f$
+                DELETE FROM public.group_emissions_daily g
+                USING (
+                    SELECT DISTINCT created_at::date AS bucket_day, COALESCE(category_code, '') AS category_code
+                    FROM public.emission_calculations
+                    WHERE session_id = p_session
+                ) c
+                WHERE g.group_id = p_group AND g.bucket_day = c.bucket_day AND g.category_code = c.category_code;
+
+                INSERT INTO public.group_emissions_daily
+                    (group_id, bucket_day, category_code, total_gco2e, calc_count, min_gco2e, max_gco2e)
+                SELECT p_group, ec.created_at::date, COALESCE(ec.category_code, ''),
+                       SUM(ec.emissions_gco2e), COUNT(*), MIN(ec.emissions_gco2e), MAX(ec.emissions_gco2e)
+                FROM public.user_group_sessions ugs
+                JOIN public.emission_calculations ec ON ec.session_id = ugs.session_id
+                JOIN (
+                    SELECT DISTINCT created_at::date AS bucket_day, COALESCE(category_code, '') AS category_code
+                    FROM public.emission_calculations
+                    WHERE session_id = p_session
+                ) c ON c.bucket_day = ec.created_at::date AND c.category_code = COALESCE(ec.category_code, '')
+                WHERE ugs.group_id = p_group
+                GROUP BY 2, 3;
+            $f$;
+
+            CREATE OR REPLACE FUNCTION public.group_emissions_daily_on_member()
+            RETURNS trigger LANGUAGE plpgsql AS $f$
+            BEGIN
+                IF TG_OP = 'UPDATE' THEN
+                    IF OLD.group_id = NEW.group_id AND OLD.session_id = NEW.session_id THEN
+                        RETURN NULL;
+                    END IF;
+                    PERFORM public.group_emissions_lock_sessions(OLD.session_id, NEW.session_id);
+                ELSIF TG_OP = 'INSERT' THEN
+                    PERFORM public.group_emissions_lock_sessions(NEW.session_id, NULL);
+                ELSE
+                    PERFORM public.group_emissions_lock_sessions(OLD.session_id, NULL);
+                END IF;
+
+                IF TG_OP = 'INSERT' THEN
+                    -- Entrée : ajout incrémental des calculs de la session
+                    INSERT INTO public.group_emissions_daily AS g
+                        (group_id, bucket_day, category_code, total_gco2e, calc_count, min_gco2e, max_gco2e)
+                    SELECT NEW.group_id, ec.created_at::date, COALESCE(ec.category_code, ''),
+                           SUM(ec.emissions_gco2e), COUNT(*), MIN(ec.emissions_gco2e), MAX(ec.emissions_gco2e)
+                    FROM public.emission_calculations ec
+                    WHERE ec.session_id = NEW.session_id
+                    GROUP BY 2, 3
+                    ON CONFLICT (group_id, bucket_day, category_code) DO UPDATE SET
+                        total_gco2e = g.total_gco2e + excluded.total_gco2e,
+                        calc_count = g.calc_count + excluded.calc_count,
+                        min_gco2e = LEAST(g.min_gco2e, excluded.min_gco2e),
+                        max_gco2e = GREATEST(g.max_gco2e, excluded.max_gco2e),
+                        updated_at = NOW();
+                    RETURN NULL;
+                END IF;
+
+                -- Suppression du groupe (ON DELETE CASCADE) : ses cellules partent avec lui
+                IF EXISTS (SELECT 1 FROM public.user_groups WHERE id = OLD.group_id) THEN
+                    PERFORM public.group_emissions_daily_refresh_member(OLD.group_id, OLD.session_id);
+                END IF;
+                IF TG_OP = 'UPDATE' THEN
+                    PERFORM public.group_emissions_daily_refresh_member(NEW.group_id, NEW.session_id);
+                END IF;
+                RETURN NULL;
+            END;
+            $f$;
+
+            DROP TRIGGER IF EXISTS trg_group_emissions_daily_member ON public.user_group_sessions;
+            CREATE TRIGGER trg_group_emissions_daily_member
+                AFTER INSERT OR DELETE OR UPDATE OF group_id, session_id ON public.user_group_sessions
+                FOR EACH ROW EXECUTE FUNCTION public.group_emissions_daily_on_member();
+
+            -- Calculs : un UPDATE qui change de session verrouille l'ancienne ET la nouvelle
+            CREATE OR REPLACE FUNCTION public.group_emissions_daily_on_calc()
+            RETURNS trigger LANGUAGE plpgsql AS $f$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    PERFORM public.group_emissions_lock_sessions(NEW.session_id, NULL);
+                    INSERT INTO public.group_emissions_daily AS g
+                        (group_id, bucket_day, category_code, total_gco2e, calc_count, min_gco2e, max_gco2e)
+                    SELECT ugs.group_id, NEW.created_at::date, COALESCE(NEW.category_code, ''),
+                           NEW.emissions_gco2e, 1, NEW.emissions_gco2e, NEW.emissions_gco2e
+                    FROM public.user_group_sessions ugs
+                    WHERE ugs.session_id = NEW.session_id
+                    ON CONFLICT (group_id, bucket_day, category_code) DO UPDATE SET
+                        total_gco2e = g.total_gco2e + excluded.total_gco2e,
+                        calc_count = g.calc_count + 1,
+                        min_gco2e = LEAST(g.min_gco2e, excluded.min_gco2e),
+                        max_gco2e = GREATEST(g.max_gco2e, excluded.max_gco2e),
+                        updated_at = NOW();
+                    RETURN NULL;
+                END IF;
+
+                IF TG_OP = 'UPDATE' THEN
+                    PERFORM public.group_emissions_lock_sessions(OLD.session_id, NEW.session_id);
+                ELSE
+                    PERFORM public.group_emissions_lock_sessions(OLD.session_id, NULL);
+                END IF;
+                IF OLD.session_id IS NOT NULL THEN
+                    PERFORM public.group_emissions_daily_refresh(
+                        OLD.session_id, OLD.created_at::date, COALESCE(OLD.category_code, ''));
+                END IF;
+                IF TG_OP = 'UPDATE' AND NEW.session_id IS NOT NULL THEN
+                    PERFORM public.group_emissions_daily_refresh(
+                        NEW.session_id, NEW.created_at::date, COALESCE(NEW.category_code, ''));
+                END IF;
+                RETURN NULL;
+            END;
+            $f$;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS trg_group_emissions_daily_member ON public.user_group_sessions;")
+    op.execute("DROP FUNCTION IF EXISTS public.group_emissions_daily_on_member();")
+    op.execute("DROP FUNCTION IF EXISTS public.group_emissions_daily_refresh_member(BIGINT, TEXT);")
+    # Trigger des calculs tel que posé par d8f1b4a6c2e3 (verrou sur une seule session)
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('public.group_emissions_daily') IS NULL THEN
+                RETURN;
+            END IF;
+
+            CREATE OR REPLACE FUNCTION public.group_emissions_daily_on_calc()
+            RETURNS trigger LANGUAGE plpgsql AS $f$
+            BEGIN
+                IF COALESCE(NEW.session_id, OLD.session_id) IS NOT NULL THEN
+                    PERFORM pg_advisory_xact_lock(hashtext(COALESCE(NEW.session_id, OLD.session_id)::text));
+                END IF;
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO public.group_emissions_daily AS g
+                        (group_id, bucket_day, category_code, total_gco2e, calc_count, min_gco2e, max_gco2e)
+                    SELECT ugs.group_id, NEW.created_at::date, COALESCE(NEW.category_code, ''),
+                           NEW.emissions_gco2e, 1, NEW.emissions_gco2e, NEW.emissions_gco2e
+                    FROM public.user_group_sessions ugs
+                    WHERE ugs.session_id = NEW.session_id
+                    ON CONFLICT (group_id, bucket_day, category_code) DO UPDATE SET
+                        total_gco2e = g.total_gco2e + excluded.total_gco2e,
+                        calc_count = g.calc_count + 1,
+                        min_gco2e = LEAST(g.min_gco2e, excluded.min_gco2e),
+                        max_gco2e = GREATEST(g.max_gco2e, excluded.max_gco2e),
+                        updated_at = NOW();
+                    RETURN NULL;
+                END IF;
+
+                IF OLD.session_id IS NOT NULL THEN
+                    PERFORM public.group_emissions_daily_refresh(
+                        OLD.session_id, OLD.created_at::date, COALESCE(OLD.category_code, ''));
+                END IF;
+                IF TG_OP = 'UPDATE' AND NEW.session_id IS NOT NULL THEN
+                    PERFORM public.group_emissions_daily_refresh(
+                        NEW.session_id, NEW.created_at::date, COALESCE(NEW.category_code, ''));
+                END IF;
+                RETURN NULL;
+            END;
+            $f$;
+        END $$;
+    """)
+    op.execute("DROP FUNCTION IF EXISTS public.group_emissions_lock_sessions(TEXT, TEXT);")
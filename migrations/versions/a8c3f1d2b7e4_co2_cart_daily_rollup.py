@@ -0,0 +1,79 @@
+"""CO2 cart daily rollup (co2_cart_daily)
+
+Revision ID: a8c3f1d2b7e4
+Revises: d4a7c2e91b05
+Create Date: 2026-10-18 11:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a8c3f1d2b7e4"
+down_revision = "d4a7c2e91b05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Cumul journalier par utilisateur (app/services/co2_daily.py), créé dans le même
+    # schéma que co2_cart_history (honou en prod, public en CI), puis rempli depuis
+    # l'historique existant. Re-remplissage : python -m app.scripts.backfill_co2_daily
+    op.execute("""
+        DO $$
+        DECLARE
+            t regclass := COALESCE(to_regclass('honou.co2_cart_history'), to_regclass('public.co2_cart_history'));
+            s text;
+            ts_col text;
+            co2_col text;
+        BEGIN
+            IF t IS NULL THEN
+                RETURN;
+            END IF;
+            SELECT n.nspname INTO s
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.oid = t;
+
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I.co2_cart_daily ('
+                || 'user_id TEXT NOT NULL, '
+                || 'day DATE NOT NULL, '
+                || 'total_co2_g DOUBLE PRECISION NOT NULL DEFAULT 0, '
+                || 'cart_count INTEGER NOT NULL DEFAULT 0, '
+                || 'updated_at TIMESTAMP NOT NULL DEFAULT NOW(), '
+                || 'PRIMARY KEY (user_id, day))',
+                s
+            );
+
+            -- mêmes préférences que app/services/co2_source.py (pick_ts_col / pick_co2_expr)
+            SELECT column_name INTO ts_col
+            FROM information_schema.columns
+            WHERE table_schema = s AND table_name = 'co2_cart_history'
+              AND column_name IN ('created_at', 'validated_at')
+            ORDER BY (column_name = 'created_at') DESC
+            LIMIT 1;
+
+            SELECT column_name INTO co2_col
+            FROM information_schema.columns
+            WHERE table_schema = s AND table_name = 'co2_cart_history'
+              AND column_name IN ('total_co2_g', 'co2_g')
+            ORDER BY (column_name = 'total_co2_g') DESC
+            LIMIT 1;
+
+            IF ts_col IS NOT NULL AND co2_col IS NOT NULL THEN
+                EXECUTE format(
+                    'INSERT INTO %1$I.co2_cart_daily (user_id, day, total_co2_g, cart_count) '
+                    || 'SELECT user_id::text, DATE(%2$I), SUM(%3$I), COUNT(*) '
+                    || 'FROM %1$I.co2_cart_history '
+                    || 'WHERE user_id IS NOT NULL AND %2$I IS NOT NULL '
+                    || 'GROUP BY user_id::text, DATE(%2$I) '
+                    || 'ON CONFLICT (user_id, day) DO NOTHING',
+                    s, ts_col, co2_col
+                );
+            END IF;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS honou.co2_cart_daily;")
+    op.execute("DROP TABLE IF EXISTS public.co2_cart_daily;")
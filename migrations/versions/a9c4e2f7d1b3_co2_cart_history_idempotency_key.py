@@ -0,0 +1,52 @@
+"""co2_cart_history idempotency_key + unique index (user_id, idempotency_key)
+
+Revision ID: a9c4e2f7d1b3
+Revises: f3b8d1e6a2c7
+Create Date: 2026-10-18 18:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a9c4e2f7d1b3"
+down_revision = "f3b8d1e6a2c7"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # POST /api/cart/history/batch (app/routers/cart_history.py) : rejeu de la file hors ligne
+    # du front. INSERT ... ON CONFLICT (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL
+    # DO NOTHING : un panier déjà reçu n'est pas réinséré. Index partiel : les lignes
+    # historiques (clé NULL) ne sont pas concernées.
+    op.execute("""
+        DO $$
+        DECLARE
+            t regclass := COALESCE(to_regclass('honou.co2_cart_history'), to_regclass('public.co2_cart_history'));
+        BEGIN
+            IF t IS NULL THEN
+                RETURN;
+            END IF;
+            EXECUTE format('ALTER TABLE %s ADD COLUMN IF NOT EXISTS idempotency_key TEXT', t);
+            EXECUTE format(
+                'CREATE UNIQUE INDEX IF NOT EXISTS ux_co2_cart_history_user_idem '
+                'ON %s (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL',
+                t
+            );
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS honou.ux_co2_cart_history_user_idem;")
+    op.execute("DROP INDEX IF EXISTS public.ux_co2_cart_history_user_idem;")
+    op.execute("""
+        DO $$
+        DECLARE
+            t regclass := COALESCE(to_regclass('honou.co2_cart_history'), to_regclass('public.co2_cart_history'));
+        BEGIN
+            IF t IS NOT NULL THEN
+                EXECUTE format('ALTER TABLE %s DROP COLUMN IF EXISTS idempotency_key', t);
+            END IF;
+        END $$;
+    """)
@@ -0,0 +1,35 @@
+"""co2_cart_history index (user_id, id) for keyset pagination
+
+Revision ID: b2d6f8a1c4e9
+Revises: a9c4e2f7d1b3
+Create Date: 2026-10-18 19:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b2d6f8a1c4e9"
+down_revision = "a9c4e2f7d1b3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # GET /api/cart/history (app/routers/cart_history.py) : WHERE user_id = ? [AND id < before_id]
+    # ORDER BY id DESC LIMIT n, et dernier panier de l'utilisateur (ETag) → parcours d'index borné.
+    op.execute("""
+        DO $$
+        DECLARE
+            t regclass := COALESCE(to_regclass('honou.co2_cart_history'), to_regclass('public.co2_cart_history'));
+        BEGIN
+            IF t IS NULL THEN
+                RETURN;
+            END IF;
+            EXECUTE format('CREATE INDEX IF NOT EXISTS ix_co2_cart_history_user_id ON %s (user_id, id)', t);
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS honou.ix_co2_cart_history_user_id;")
+    op.execute("DROP INDEX IF EXISTS public.ix_co2_cart_history_user_id;")
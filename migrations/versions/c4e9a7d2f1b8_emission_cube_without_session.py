@@ -0,0 +1,94 @@
+"""Emission cube: drop session_id from the cube key
+
+Revision ID: c4e9a7d2f1b8
+Revises: d8f1b4a6c2e3
+Create Date: 2026-10-19 11:00:00
+
+"""
+import os
+from zoneinfo import ZoneInfo
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c4e9a7d2f1b8"
+down_revision = "d8f1b4a6c2e3"
+branch_labels = None
+depends_on = None
+
+
+def _cube_tz() -> str:
+    # Interpolé dans la définition des vues : validé (fuseau IANA) avant usage
+    tz = os.getenv("HONOUA_EMISSION_CUBE_TZ", "UTC")
+    ZoneInfo(tz)
+    return tz.replace("'", "")
+
+
+def _cube_views(dims: str) -> str:
+    # dims : colonnes de la clé après bucket_start (ex. "category_code, product_id")
+    tz = _cube_tz()
+    raw_dims = ",\n                   ".join(
+        f"COALESCE({d}::text, '') AS {d}" for d in dims.split(", ")
+    )
+    group_by = ", ".join(str(i) for i in range(1, dims.count(",") + 3))
+    coarse = "\n".join(f"""
+            CREATE MATERIALIZED VIEW public.emission_cube_{grain} AS
+            SELECT date_trunc('{grain}', bucket_start)::date AS bucket_start,
+                   {dims},
+                   SUM(total_gco2e) AS total_gco2e, SUM(calc_count)::bigint AS calc_count,
+                   MIN(min_gco2e) AS min_gco2e, MAX(max_gco2e) AS max_gco2e
+            FROM public.emission_cube_day
+            WHERE bucket_start < date_trunc('{grain}', now() AT TIME ZONE '{tz}')::date
+            GROUP BY {group_by};
+
+            CREATE UNIQUE INDEX ux_emission_cube_{grain}
+                ON public.emission_cube_{grain} (bucket_start, {dims});
+    """ for grain in ("week", "month"))
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('public.emission_calculations') IS NULL THEN
+                RETURN;
+            END IF;
+
+            DROP MATERIALIZED VIEW IF EXISTS public.emission_cube_month;
+            DROP MATERIALIZED VIEW IF EXISTS public.emission_cube_week;
+            DROP MATERIALIZED VIEW IF EXISTS public.emission_cube_day;
+
+            CREATE MATERIALIZED VIEW public.emission_cube_day AS
+            SELECT (date_trunc('day', created_at AT TIME ZONE '{tz}'))::date AS bucket_start,
+                   {raw_dims},
+                   SUM(emissions_gco2e)::float8 AS total_gco2e,
+                   COUNT(*) AS calc_count,
+                   MIN(emissions_gco2e)::float8 AS min_gco2e,
+                   MAX(emissions_gco2e)::float8 AS max_gco2e
+            FROM public.emission_calculations
+            WHERE created_at < date_trunc('day', now() AT TIME ZONE '{tz}') AT TIME ZONE '{tz}'
+            GROUP BY {group_by};
+
+            CREATE UNIQUE INDEX ux_emission_cube_day
+                ON public.emission_cube_day (bucket_start, {dims});
+            {coarse}
+            -- Vues reconstruites à l'instant : l'état suit leur contenu
+            IF to_regclass('public.emission_cube_state') IS NOT NULL THEN
+                INSERT INTO public.emission_cube_state (grain, finalized_until, refreshed_at)
+                VALUES
+                    ('day',   date_trunc('day',   now() AT TIME ZONE '{tz}'), now()),
+                    ('week',  date_trunc('week',  now() AT TIME ZONE '{tz}'), now()),
+                    ('month', date_trunc('month', now() AT TIME ZONE '{tz}'), now())
+                ON CONFLICT (grain) DO UPDATE SET
+                    finalized_until = excluded.finalized_until,
+                    refreshed_at = excluded.refreshed_at;
+            END IF;
+        END $$;
+    """
+
+
+def upgrade() -> None:
+    # A37 / A40 ne lisent que category_code / product_id : session_id dans la clé faisait
+    # du cube jour une copie presque ligne à ligne de emission_calculations.
+    op.execute(_cube_views("category_code, product_id"))
+
+
+def downgrade() -> None:
+    op.execute(_cube_views("category_code, product_id, session_id"))
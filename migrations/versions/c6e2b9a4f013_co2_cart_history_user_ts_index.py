@@ -0,0 +1,72 @@
+"""co2_cart_history covering index ((user_id::text), created_at)
+
+Revision ID: c6e2b9a4f013
+Revises: a8c3f1d2b7e4
+Create Date: 2026-10-18 12:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c6e2b9a4f013"
+down_revision = "a8c3f1d2b7e4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Agrégat des fenêtres de défis (app/services/co2_daily.py, two_window_sql) :
+    # WHERE user_id::text IN (...) AND ts BETWEEN ? AND ? → parcours d'index seul (INCLUDE du CO2).
+    # Index sur l'expression (user_id::text) : c'est elle que filtre evaluate_challenge
+    # (user_id INTEGER ou TEXT selon les déploiements).
+    # Colonne horodatage / CO2 résolues comme dans app/services/co2_source.py.
+    op.execute("""
+        DO $$
+        DECLARE
+            t regclass := COALESCE(to_regclass('honou.co2_cart_history'), to_regclass('public.co2_cart_history'));
+            s text;
+            ts_col text;
+            co2_col text;
+        BEGIN
+            IF t IS NULL THEN
+                RETURN;
+            END IF;
+            SELECT n.nspname INTO s
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE c.oid = t;
+
+            SELECT column_name INTO ts_col
+            FROM information_schema.columns
+            WHERE table_schema = s AND table_name = 'co2_cart_history'
+              AND column_name IN ('created_at', 'validated_at')
+            ORDER BY (column_name = 'created_at') DESC
+            LIMIT 1;
+
+            SELECT column_name INTO co2_col
+            FROM information_schema.columns
+            WHERE table_schema = s AND table_name = 'co2_cart_history'
+              AND column_name IN ('total_co2_g', 'co2_g', 'total_co2_kg', 'co2_kg')
+            ORDER BY array_position(ARRAY['total_co2_g', 'co2_g', 'total_co2_kg', 'co2_kg'], column_name::text)
+            LIMIT 1;
+
+            IF ts_col IS NULL THEN
+                RETURN;
+            END IF;
+            IF co2_col IS NOT NULL THEN
+                EXECUTE format(
+                    'CREATE INDEX IF NOT EXISTS ix_co2_cart_history_user_ts ON %s ((user_id::text), %I) INCLUDE (%I)',
+                    t, ts_col, co2_col
+                );
+            ELSE
+                EXECUTE format(
+                    'CREATE INDEX IF NOT EXISTS ix_co2_cart_history_user_ts ON %s ((user_id::text), %I)',
+                    t, ts_col
+                );
+            END IF;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS honou.ix_co2_cart_history_user_ts;")
+    op.execute("DROP INDEX IF EXISTS public.ix_co2_cart_history_user_ts;")
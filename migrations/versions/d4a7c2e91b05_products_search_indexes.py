@@ -0,0 +1,48 @@
+"""Products search indexes (pg_trgm + tsvector)
+
+Revision ID: d4a7c2e91b05
+Revises: c1213a8650c9
+Create Date: 2026-10-18 09:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d4a7c2e91b05"
+down_revision = "c1213a8650c9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Recherche produits (app/services/product_search.py) :
+    # - GIN trigramme sur product_name (similarité / fautes de frappe)
+    # - GIN tsvector 'simple' sur nom + marque (préfixes `tok:*`)
+    # La table peut vivre dans honou (prod) ou public (CI) : on résout dynamiquement.
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+    op.execute("""
+        DO $$
+        DECLARE
+            t regclass := COALESCE(to_regclass('honou.products'), to_regclass('public.products'));
+        BEGIN
+            IF t IS NOT NULL THEN
+                EXECUTE format(
+                    'CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON %s USING GIN (product_name gin_trgm_ops)',
+                    t
+                );
+                EXECUTE format(
+                    'CREATE INDEX IF NOT EXISTS ix_products_search_fts ON %s USING GIN ('
+                    || 'to_tsvector(''simple'', coalesce(product_name, '''') || '' '' || coalesce(brand, ''''))'
+                    || ')',
+                    t
+                );
+            END IF;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS honou.ix_products_search_fts;")
+    op.execute("DROP INDEX IF EXISTS honou.ix_products_name_trgm;")
+    op.execute("DROP INDEX IF EXISTS public.ix_products_search_fts;")
+    op.execute("DROP INDEX IF EXISTS public.ix_products_name_trgm;")
@@ -0,0 +1,74 @@
+"""group_emissions_daily trigger: per-session advisory lock
+
+Revision ID: d8f1b4a6c2e3
+Revises: b2d6f8a1c4e9
+Create Date: 2026-10-19 10:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d8f1b4a6c2e3"
+down_revision = "b2d6f8a1c4e9"
+branch_labels = None
+depends_on = None
+
+
+def _trigger_function(lock: bool) -> str:
+    # Même verrou que app/services/group_emissions.py (lock_session) : un calcul inséré
+    # pendant l'ajout / le retrait de sa session au groupe est compté une et une seule fois.
+    lock_sql = """
+                IF COALESCE(NEW.session_id, OLD.session_id) IS NOT NULL THEN
+                    PERFORM pg_advisory_xact_lock(hashtext(COALESCE(NEW.session_id, OLD.session_id)::text));
+                END IF;
+    """ if lock else ""
+    return f"""
+        DO $$
+        BEGIN
+            IF to_regclass('public.group_emissions_daily') IS NULL THEN
+                RETURN;
+            END IF;
+
+            CREATE OR REPLACE FUNCTION public.group_emissions_daily_on_calc()
+            RETURNS trigger LANGUAGE plpgsql AS $f$
+            BEGIN
+                {lock_sql}
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO public.group_emissions_daily AS g
+                        (group_id, bucket_day, category_code, total_gco2e, calc_count, min_gco2e, max_gco2e)
+                    SELECT ugs.group_id, NEW.created_at::date, COALESCE(NEW.category_code, ''),
+                           NEW.emissions_gco2e, 1, NEW.emissions_gco2e, NEW.emissions_gco2e
+                    FROM public.user_group_sessions ugs
+                    WHERE ugs.session_id = NEW.session_id
+                    ON CONFLICT (group_id, bucket_day, category_code) DO UPDATE SET
+                        total_gco2e = g.total_gco2e + excluded.total_gco2e,
+                        calc_count = g.calc_count + 1,
+                        min_gco2e = LEAST(g.min_gco2e, excluded.min_gco2e),
+                        max_gco2e = GREATEST(g.max_gco2e, excluded.max_gco2e),
+                        updated_at = NOW();
+                    RETURN NULL;
+                END IF;
+
+                IF OLD.session_id IS NOT NULL THEN
+                    PERFORM public.group_emissions_daily_refresh(
+                        OLD.session_id, OLD.created_at::date, COALESCE(OLD.category_code, ''));
+                END IF;
+                IF TG_OP = 'UPDATE' AND NEW.session_id IS NOT NULL THEN
+                    PERFORM public.group_emissions_daily_refresh(
+                        NEW.session_id, NEW.created_at::date, COALESCE(NEW.category_code, ''));
+                END IF;
+                RETURN NULL;
+            END;
+            $f$;
+        END $$;
+    """
+
+
+def upgrade() -> None:
+    # Le trigger prend le verrou de la session AVANT de lire user_group_sessions ; ses
+    # requêtes suivantes (READ COMMITTED) voient donc une adhésion validée entre-temps.
+    op.execute(_trigger_function(lock=True))
+
+
+def downgrade() -> None:
+    op.execute(_trigger_function(lock=False))
@@ -0,0 +1,115 @@
+"""Group emissions daily aggregate (group_emissions_daily)
+
+Revision ID: e7d4a2c9b1f6
+Revises: c6e2b9a4f013
+Create Date: 2026-10-18 15:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e7d4a2c9b1f6"
+down_revision = "c6e2b9a4f013"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Agrégat (groupe, jour, catégorie) lu par A41/A42 (app/services/group_emissions.py).
+    # Ajout / retrait de session : maintenu par l'application ; nouveaux calculs : trigger.
+    op.execute("""
+        DO $$
+        BEGIN
+            IF to_regclass('public.user_group_sessions') IS NULL
+               OR to_regclass('public.emission_calculations') IS NULL THEN
+                RETURN;
+            END IF;
+
+            CREATE TABLE IF NOT EXISTS public.group_emissions_daily (
+                group_id BIGINT NOT NULL REFERENCES public.user_groups(id) ON DELETE CASCADE,
+                bucket_day DATE NOT NULL,
+                category_code TEXT NOT NULL DEFAULT '',
+                total_gco2e DOUBLE PRECISION NOT NULL DEFAULT 0,
+                calc_count BIGINT NOT NULL DEFAULT 0,
+                min_gco2e DOUBLE PRECISION,
+                max_gco2e DOUBLE PRECISION,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (group_id, bucket_day, category_code)
+            );
+
+            -- Recalcul d'une cellule pour tous les groupes contenant la session
+            -- (UPDATE / DELETE d'un calcul : min / max ne sont pas décrémentables)
+            CREATE OR REPLACE FUNCTION public.group_emissions_daily_refresh(p_session TEXT, p_day DATE, p_cat TEXT)
+            RETURNS void LANGUAGE sql AS $f$
+                DELETE FROM public.group_emissions_daily g
+                USING public.user_group_sessions ugs
+                WHERE ugs.session_id = p_session
+                  AND g.group_id = ugs.group_id AND g.bucket_day = p_day AND g.category_code = p_cat;
+
+                INSERT INTO public.group_emissions_daily
+                    (group_id, bucket_day, category_code, total_gco2e, calc_count, min_gco2e, max_gco2e)
+                SELECT ugs.group_id, p_day, p_cat,
+                       SUM(ec.emissions_gco2e), COUNT(*), MIN(ec.emissions_gco2e), MAX(ec.emissions_gco2e)
+                FROM public.user_group_sessions own
+                JOIN public.user_group_sessions ugs ON ugs.group_id = own.group_id
+                JOIN public.emission_calculations ec ON ec.session_id = ugs.session_id
+                WHERE own.session_id = p_session
+                  AND ec.created_at::date = p_day
+                  AND COALESCE(ec.category_code, '') = p_cat
+                GROUP BY ugs.group_id;
+            $f$;
+
+            CREATE OR REPLACE FUNCTION public.group_emissions_daily_on_calc()
+            RETURNS trigger LANGUAGE plpgsql AS $f$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO public.group_emissions_daily AS g
+                        (group_id, bucket_day, category_code, total_gco2e, calc_count, min_gco2e, max_gco2e)
+                    SELECT ugs.group_id, NEW.created_at::date, COALESCE(NEW.category_code, ''),
+                           NEW.emissions_gco2e, 1, NEW.emissions_gco2e, NEW.emissions_gco2e
+                    FROM public.user_group_sessions ugs
+                    WHERE ugs.session_id = NEW.session_id
+                    ON CONFLICT (group_id, bucket_day, category_code) DO UPDATE SET
+                        total_gco2e = g.total_gco2e + excluded.total_gco2e,
+                        calc_count = g.calc_count + 1,
+                        min_gco2e = LEAST(g.min_gco2e, excluded.min_gco2e),
+                        max_gco2e = GREATEST(g.max_gco2e, excluded.max_gco2e),
+                        updated_at = NOW();
+                    RETURN NULL;
+                END IF;
+
+                IF OLD.session_id IS NOT NULL THEN
+                    PERFORM public.group_emissions_daily_refresh(
+                        OLD.session_id, OLD.created_at::date, COALESCE(OLD.category_code, ''));
+                END IF;
+                IF TG_OP = 'UPDATE' AND NEW.session_id IS NOT NULL THEN
+                    PERFORM public.group_emissions_daily_refresh(
+                        NEW.session_id, NEW.created_at::date, COALESCE(NEW.category_code, ''));
+                END IF;
+                RETURN NULL;
+            END;
+            $f$;
+
+            DROP TRIGGER IF EXISTS trg_group_emissions_daily ON public.emission_calculations;
+            CREATE TRIGGER trg_group_emissions_daily
+                AFTER INSERT OR UPDATE OR DELETE ON public.emission_calculations
+                FOR EACH ROW EXECUTE FUNCTION public.group_emissions_daily_on_calc();
+
+            -- Remplissage initial (ré-exécutable : python -m app.scripts.rebuild_group_emissions)
+            INSERT INTO public.group_emissions_daily
+                (group_id, bucket_day, category_code, total_gco2e, calc_count, min_gco2e, max_gco2e)
+            SELECT ugs.group_id, ec.created_at::date, COALESCE(ec.category_code, ''),
+                   SUM(ec.emissions_gco2e), COUNT(*), MIN(ec.emissions_gco2e), MAX(ec.emissions_gco2e)
+            FROM public.user_group_sessions ugs
+            JOIN public.emission_calculations ec ON ec.session_id = ugs.session_id
+            GROUP BY 1, 2, 3
+            ON CONFLICT (group_id, bucket_day, category_code) DO NOTHING;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS trg_group_emissions_daily ON public.emission_calculations;")
+    op.execute("DROP FUNCTION IF EXISTS public.group_emissions_daily_on_calc();")
+    op.execute("DROP FUNCTION IF EXISTS public.group_emissions_daily_refresh(TEXT, DATE, TEXT);")
+    op.execute("DROP TABLE IF EXISTS public.group_emissions_daily;")
@@ -0,0 +1,100 @@
+"""Emission cube: day / week / month materialized views (emission_cube_*)
+
+Revision ID: f3b8d1e6a2c7
+Revises: e7d4a2c9b1f6
+Create Date: 2026-10-18 17:00:00
+
+"""
+import os
+from zoneinfo import ZoneInfo
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f3b8d1e6a2c7"
+down_revision = "e7d4a2c9b1f6"
+branch_labels = None
+depends_on = None
+
+
+def _cube_tz() -> str:
+    # Interpolé dans la définition des vues : validé (fuseau IANA) avant usage
+    tz = os.getenv("HONOUA_EMISSION_CUBE_TZ", "UTC")
+    ZoneInfo(tz)
+    return tz.replace("'", "")
+
+
+def upgrade() -> None:
+    # Cube lu par A37/A40 (app/services/emission_cube.py) ; seuls les buckets finalisés
+    # (antérieurs au bucket courant au moment du refresh) y figurent.
+    # Refresh : python -m app.scripts.refresh_emission_cube (CONCURRENTLY → index uniques).
+    tz = _cube_tz()
+    op.execute(f"""
+        DO $$
+        BEGIN
+            IF to_regclass('public.emission_calculations') IS NULL THEN
+                RETURN;
+            END IF;
+
+            CREATE MATERIALIZED VIEW IF NOT EXISTS public.emission_cube_day AS
+            SELECT (date_trunc('day', created_at AT TIME ZONE '{tz}'))::date AS bucket_start,
+                   COALESCE(category_code, '') AS category_code,
+                   COALESCE(product_id::text, '') AS product_id,
+                   COALESCE(session_id::text, '') AS session_id,
+                   SUM(emissions_gco2e)::float8 AS total_gco2e,
+                   COUNT(*) AS calc_count,
+                   MIN(emissions_gco2e)::float8 AS min_gco2e,
+                   MAX(emissions_gco2e)::float8 AS max_gco2e
+            FROM public.emission_calculations
+            WHERE created_at < date_trunc('day', now() AT TIME ZONE '{tz}') AT TIME ZONE '{tz}'
+            GROUP BY 1, 2, 3, 4;
+
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_emission_cube_day
+                ON public.emission_cube_day (bucket_start, category_code, product_id, session_id);
+
+            CREATE MATERIALIZED VIEW IF NOT EXISTS public.emission_cube_week AS
+            SELECT date_trunc('week', bucket_start)::date AS bucket_start,
+                   category_code, product_id, session_id,
+                   SUM(total_gco2e) AS total_gco2e, SUM(calc_count)::bigint AS calc_count,
+                   MIN(min_gco2e) AS min_gco2e, MAX(max_gco2e) AS max_gco2e
+            FROM public.emission_cube_day
+            WHERE bucket_start < date_trunc('week', now() AT TIME ZONE '{tz}')::date
+            GROUP BY 1, 2, 3, 4;
+
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_emission_cube_week
+                ON public.emission_cube_week (bucket_start, category_code, product_id, session_id);
+
+            CREATE MATERIALIZED VIEW IF NOT EXISTS public.emission_cube_month AS
+            SELECT date_trunc('month', bucket_start)::date AS bucket_start,
+                   category_code, product_id, session_id,
+                   SUM(total_gco2e) AS total_gco2e, SUM(calc_count)::bigint AS calc_count,
+                   MIN(min_gco2e) AS min_gco2e, MAX(max_gco2e) AS max_gco2e
+            FROM public.emission_cube_day
+            WHERE bucket_start < date_trunc('month', now() AT TIME ZONE '{tz}')::date
+            GROUP BY 1, 2, 3, 4;
+
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_emission_cube_month
+                ON public.emission_cube_month (bucket_start, category_code, product_id, session_id);
+
+            -- Borne (exclue, heure locale du cube) des buckets présents dans chaque vue
+            CREATE TABLE IF NOT EXISTS public.emission_cube_state (
+                grain TEXT PRIMARY KEY,
+                finalized_until TIMESTAMP NOT NULL,
+                refreshed_at TIMESTAMPTZ
+            );
+
+            INSERT INTO public.emission_cube_state (grain, finalized_until, refreshed_at)
+            VALUES
+                ('day',   date_trunc('day',   now() AT TIME ZONE '{tz}'), now()),
+                ('week',  date_trunc('week',  now() AT TIME ZONE '{tz}'), now()),
+                ('month', date_trunc('month', now() AT TIME ZONE '{tz}'), now())
+            ON CONFLICT (grain) DO NOTHING;
+        END $$;
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS public.emission_cube_state;")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS public.emission_cube_month;")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS public.emission_cube_week;")
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS public.emission_cube_day;")
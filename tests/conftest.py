@@ -2,6 +2,7 @@
 
 import os
 import tempfile
+import uuid
 import importlib
 from typing import Iterable, List, Set
 
@@ -10,7 +11,7 @@ import pytest
 import pytest_asyncio
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy import text
 
 
@@ -23,6 +24,8 @@ _fd, _path = tempfile.mkstemp(prefix="honoua_test_", suffix=".sqlite")
 os.close(_fd)
 TEST_DATABASE_URL = f"sqlite:///{_path}"
 os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+# tokens / blacklist_guard / app.db lisent HONOUA_DB_URL (Postgres en CI) ; sinon même base
+os.environ.setdefault("HONOUA_DB_URL", TEST_DATABASE_URL)
 
 
 # ---------------------------------------------------------------------
@@ -206,6 +209,125 @@ async def app_client(_SessionLocal):
         yield ac
 
 
+# ---------------------------------------------------------------------
+# Session factice : routes dont on ne teste que le SQL émis et la mise en forme
+# ---------------------------------------------------------------------
+class FakeResult:
+    def __init__(self, rows):
+        self._rows = list(rows)
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return self._rows
+
+    def first(self):
+        return self._rows[0] if self._rows else None
+
+    def scalars(self):
+        return self
+
+
+class FakeSession:
+    """
+    Enregistre (sql, params) dans calls et renvoie rows.
+    on_execute(sql, params) : lignes propres à une requête (None => rows) ;
+    peut lever pour simuler une erreur SQL.
+    """
+
+    def __init__(self, rows=None, on_execute=None):
+        self.rows = rows if rows is not None else []
+        self.on_execute = on_execute
+        self.calls = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        self.calls.append((sql, params))
+        rows = self.on_execute(sql, params) if self.on_execute else None
+        return FakeResult(self.rows if rows is None else rows)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def use_db(monkeypatch):
+    """use_db(db) : sert db (FakeSession, pg_db…) aux routes via get_db."""
+    from app.deps.db import get_db
+
+    def _use(db):
+        def _get_db():
+            yield db
+        monkeypatch.setitem(fastapi_app.dependency_overrides, get_db, _get_db)
+        return db
+    return _use
+
+
+@pytest.fixture
+def fake_db(use_db):
+    """fake_db(rows=None, on_execute=None) : FakeSession servie aux routes."""
+    return lambda rows=None, on_execute=None: use_db(FakeSession(rows, on_execute))
+
+
+# ---------------------------------------------------------------------
+# PostgreSQL réel (job CI : HONOUA_DB_URL + alembic upgrade head)
+# ---------------------------------------------------------------------
+@pytest.fixture(scope="session")
+def pg_engine():
+    url = os.environ.get("HONOUA_DB_URL", "")
+    if not url.startswith("postgresql"):
+        pytest.skip("HONOUA_DB_URL ne pointe pas vers PostgreSQL")
+    engine = create_engine(url)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def pg_db(pg_engine):
+    """
+    Session sur la base migrée, dans une transaction annulée en fin de test
+    (les commit() des routes ne valident qu'un savepoint).
+    """
+    conn = pg_engine.connect()
+    trans = conn.begin()
+    session = Session(bind=conn, join_transaction_mode="create_savepoint")
+    try:
+        yield session
+    finally:
+        session.close()
+        trans.rollback()
+        conn.close()
+
+
+@pytest.fixture
+def add_calcs():
+    """
+    add_calcs(db, session_id, values, at=..., category=...) : calculs d'émission
+    (et leur facteur, source = session_id) insérés dans la base migrée.
+    """
+    def _add(db, session_id, values, at="2024-03-05 12:00:00+00", category="FOOD"):
+        factor = db.execute(text(
+            "INSERT INTO public.emission_factors (category_code, unit, factor_gco2e_per_unit, source) "
+            "VALUES (:c, 'g', 1, :s) RETURNING id"
+        ), {"c": category, "s": session_id}).scalar()
+        db.execute(
+            text(
+                "INSERT INTO public.emission_calculations (id, category_code, quantity, quantity_unit, "
+                "normalized_qty, factor_id, emissions_gco2e, session_id, idempotency_key, created_at) "
+                "VALUES (:id, :c, 1, 'g', 1, :f, :v, :s, :id, CAST(:at AS timestamptz))"
+            ),
+            [{"id": str(uuid.uuid4()), "c": category, "f": factor, "v": v, "s": session_id, "at": at}
+             for v in values],
+        )
+    return _add
+
+
     # --- SAFETY: reset FastAPI dependency overrides between tests ---
 
 @pytest.fixture(autouse=True)
@@ -0,0 +1,26 @@
+# tests/test_async_engine.py
+
+import pytest
+from sqlalchemy import text
+
+from app.db.async_engine import async_db_url, get_async_engine, get_async_sessionmaker
+from app.db.session import async_session
+
+
+def test_async_db_url_maps_drivers():
+    assert async_db_url("postgres://u:p@h:5432/db?sslmode=require") == (
+        "postgresql+asyncpg://u:p@h:5432/db?ssl=require"
+    )
+    assert async_db_url("postgresql+psycopg2://u:p@h/db") == "postgresql+asyncpg://u:p@h/db"
+    assert async_db_url("sqlite:///./local.db") == "sqlite+aiosqlite:///./local.db"
+
+
+def test_async_engine_is_shared_per_url(_test_db_url):
+    assert get_async_engine(_test_db_url) is get_async_engine(_test_db_url)
+    assert get_async_sessionmaker(_test_db_url) is get_async_sessionmaker(_test_db_url)
+
+
+@pytest.mark.asyncio
+async def test_async_session_is_a_real_async_session():
+    async with async_session() as session:
+        assert (await session.execute(text("SELECT 1"))).scalar_one() == 1
@@ -0,0 +1,79 @@
+# tests/test_audit_writer.py
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event, text
+
+from app.db.async_engine import get_async_engine
+from app.deps import audit as audit_deps
+from app.services.audit_writer import AuditWriter
+from app.telemetry import metrics
+
+
+def _count_audit_inserts(url):
+    engine = get_async_engine(url).sync_engine
+    counter = {"n": 0}
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO audit_events"):
+            counter["n"] += 1
+
+    event.listen(engine, "before_cursor_execute", _before)
+    return counter, lambda: event.remove(engine, "before_cursor_execute", _before)
+
+
+def _messages(_engine, prefix):
+    with _engine.connect() as conn:
+        return [r[0] for r in conn.execute(
+            text("SELECT message FROM audit_events WHERE message LIKE :p ORDER BY id"), {"p": f"{prefix}%"}
+        )]
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_written_in_one_insert(_test_db_url, _engine):
+    writer = AuditWriter(batch_size=3, flush_interval_s=60, max_queue=10)
+    counter, stop = _count_audit_inserts(_test_db_url)
+    writer.start(_test_db_url)
+    try:
+        for i in range(3):
+            assert writer.enqueue("test.batch", f"batch-{i}")
+        for _ in range(100):  # lot plein : flush sans attendre l'intervalle
+            if writer.pending() == 0 and _messages(_engine, "batch-"):
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await writer.stop()
+        stop()
+
+    assert _messages(_engine, "batch-") == ["batch-0", "batch-1", "batch-2"]
+    assert counter["n"] == 1
+
+
+@pytest.mark.asyncio
+async def test_queue_limit_drops_and_stop_flushes(_test_db_url, _engine):
+    metrics.reset_metrics()
+    writer = AuditWriter(batch_size=100, flush_interval_s=60, max_queue=2)
+    writer.start(_test_db_url)
+    assert writer.enqueue("test.drop", "drop-0")
+    assert writer.enqueue("test.drop", "drop-1")
+    assert not writer.enqueue("test.drop", "drop-2")
+    assert _messages(_engine, "drop-") == []  # rien d'écrit sur le chemin de la requête
+
+    assert await writer.stop() == 2
+    assert _messages(_engine, "drop-") == ["drop-0", "drop-1"]
+    assert metrics.get_audit_stats() == {"dropped": 1, "enqueued": 2, "written": 2}
+
+
+def test_audit_from_request_only_enqueues(monkeypatch):
+    writer = AuditWriter(batch_size=10, max_queue=10)
+    monkeypatch.setattr(audit_deps, "audit_writer", writer)
+
+    class _NoSqlSession:
+        def execute(self, *a, **k):
+            raise AssertionError("no SQL on the request path")
+
+    request = SimpleNamespace(state=SimpleNamespace(user=SimpleNamespace(id=7)), method="POST")
+    audit_deps.audit_from_request_sync(request, _NoSqlSession(), "auth.login", "connexion réussie")
+    assert writer.pending() == 1
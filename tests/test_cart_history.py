@@ -0,0 +1,259 @@
+# tests/test_cart_history.py
+
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.main import app
+from app.routers import cart_history
+from app.services import cart_summary
+from app.services.co2_source import invalidate_co2_source_cache
+
+CART = {
+    "total_co2_g": 1200, "nb_articles": 4, "nb_distinct_products": 3,
+    "total_distance_km": 80.0, "days_captured_by_tree": 20.0, "tree_equivalent": 0.6,
+}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+    @event.listens_for(engine, "connect")
+    def _attach(dbapi_conn, _):
+        dbapi_conn.execute("ATTACH DATABASE ':memory:' AS honou")
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE honou.co2_cart_history (
+                id INTEGER PRIMARY KEY, user_id INTEGER, period_type TEXT, period_label TEXT,
+                total_co2_g INTEGER, nb_articles INTEGER, nb_distinct_products INTEGER,
+                total_distance_km REAL, days_captured_by_tree REAL, tree_equivalent REAL,
+                created_at TIMESTAMP, idempotency_key TEXT
+            )
+        """))
+        conn.execute(text(
+            "CREATE UNIQUE INDEX honou.ux_co2_cart_history_user_idem "
+            "ON co2_cart_history (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL"
+        ))
+        conn.execute(text("""
+            CREATE TABLE honou.co2_cart_daily (
+                user_id TEXT NOT NULL, day DATE NOT NULL,
+                total_co2_g REAL NOT NULL DEFAULT 0, cart_count INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP, PRIMARY KEY (user_id, day)
+            )
+        """))
+    session = sessionmaker(bind=engine)()
+
+    def _get_db():
+        yield session
+    monkeypatch.setitem(app.dependency_overrides, cart_history.get_db, _get_db)
+    invalidate_co2_source_cache()
+    cart_summary.summary_cache.invalidate()
+    yield session
+    session.close()
+    invalidate_co2_source_cache()
+    cart_summary.summary_cache.invalidate()
+    engine.dispose()
+
+
+def _post(client, items, user="7"):
+    return client.post("/api/cart/history/batch", json={"items": items}, headers={"X-Honoua-User-Id": user})
+
+
+def test_batch_inserts_once_per_key_and_updates_daily_rollup(client, db):
+    items = [{**CART, "idempotency_key": "a"}, {**CART, "idempotency_key": "b"}, {**CART, "idempotency_key": "a"}]
+    r = _post(client, items)
+    assert r.status_code == 200
+    body = r.json()
+    assert [(it["idempotency_key"], it["status"]) for it in body["items"]] == [
+        ("a", "created"), ("b", "created"), ("a", "duplicate"),
+    ]
+    assert body["items"][0]["id"] == body["items"][2]["id"]
+    assert body["created"] == 2
+
+    # Rejeu de la même file : rien de réinséré, ids d'origine renvoyés
+    again = _post(client, items[:2]).json()
+    assert [it["status"] for it in again["items"]] == ["duplicate", "duplicate"]
+    assert [it["id"] for it in again["items"]] == [it["id"] for it in body["items"][:2]]
+
+    assert db.execute(text("SELECT COUNT(*) FROM honou.co2_cart_history")).scalar() == 2
+    daily = db.execute(text("SELECT total_co2_g, cart_count FROM honou.co2_cart_daily")).one()
+    assert tuple(daily) == (2400.0, 2)
+
+
+def test_invalid_items_are_reported_without_failing_the_batch(client, db):
+    items = [{**CART, "idempotency_key": "ok"}, {"idempotency_key": "bad", "total_co2_g": "x"}, {**CART}]
+    body = _post(client, items).json()
+    assert [(it["idempotency_key"], it["status"]) for it in body["items"]] == [
+        ("ok", "created"), ("bad", "invalid"), (None, "invalid"),
+    ]
+
+
+def test_batch_items_are_dated_with_clamped_client_validated_at(client, db):
+    now = datetime.now(timezone.utc)
+    offline = (now - timedelta(days=3)).replace(microsecond=0)
+    items = [
+        {**CART, "idempotency_key": "offline", "validated_at": offline.isoformat()},
+        {**CART, "idempotency_key": "old", "validated_at": "2001-01-01T00:00:00Z"},
+        {**CART, "idempotency_key": "future", "validated_at": (now + timedelta(days=2)).isoformat()},
+        {**CART, "idempotency_key": "none"},
+    ]
+    assert _post(client, items).json()["created"] == 4
+
+    rows = {
+        r["idempotency_key"]: (datetime.fromisoformat(r["created_at"]), r["period_label"])
+        for r in db.execute(
+            text("SELECT idempotency_key, created_at, period_label FROM honou.co2_cart_history")
+        ).mappings()
+    }
+    assert rows["offline"] == (offline, offline.strftime("%Y-%m"))
+    floor = now - timedelta(days=cart_history.CART_BATCH_MAX_AGE_DAYS)
+    assert abs(rows["old"][0] - floor) < timedelta(minutes=1)
+    assert now <= rows["future"][0] < now + timedelta(minutes=1)
+    assert now <= rows["none"][0] < now + timedelta(minutes=1)
+
+    # Cumul : un upsert par jour de validation
+    daily = dict(db.execute(text("SELECT day, cart_count FROM honou.co2_cart_daily")).all())
+    assert daily[offline.date().isoformat()] == 1
+    assert daily[floor.date().isoformat()] == 1
+    assert sum(daily.values()) == 4
+
+
+def test_single_post_and_queue_replay_share_the_idempotency_key(client, db):
+    headers = {"X-Honoua-User-Id": "7"}
+    first = client.post("/api/cart/history", json={**CART, "idempotency_key": "v1"}, headers=headers).json()
+    assert first["status"] == "ok"
+
+    # Réponse perdue : le client renvoie le panier, puis la file le rejoue en lot
+    again = client.post("/api/cart/history", json={**CART, "idempotency_key": "v1"}, headers=headers).json()
+    assert (again["status"], again["id"]) == ("duplicate", first["id"])
+    assert again["period_month"] == first["period_month"]
+    replay = _post(client, [{**CART, "idempotency_key": "v1"}]).json()
+    assert (replay["items"][0]["status"], replay["items"][0]["id"]) == ("duplicate", first["id"])
+
+    assert db.execute(text("SELECT COUNT(*) FROM honou.co2_cart_history")).scalar() == 1
+    assert db.execute(text("SELECT SUM(cart_count) FROM honou.co2_cart_daily")).scalar() == 1
+
+
+def test_batch_size_is_capped(client, db, monkeypatch):
+    monkeypatch.setattr(cart_history, "CART_BATCH_MAX", 1)
+    r = _post(client, [{**CART, "idempotency_key": "a"}, {**CART, "idempotency_key": "b"}])
+    assert r.status_code == 422
+    assert _post(client, [], user="").status_code == 400
+
+
+def _seed(client, n, user="7"):
+    return _post(client, [{**CART, "total_co2_g": 100 + i, "idempotency_key": f"k{i}"} for i in range(n)], user)
+
+
+def test_list_pages_with_before_id_and_projection(client, db):
+    _seed(client, 5)
+    _seed(client, 1, user="8")
+    headers = {"X-Honoua-User-Id": "7"}
+
+    first = client.get("/api/cart/history", params={"limit": 2, "fields": "total_co2_g"}, headers=headers)
+    assert first.status_code == 200
+    assert [set(it) for it in first.json()] == [{"id", "total_co2_g"}] * 2
+    assert [it["total_co2_g"] for it in first.json()] == [104, 103]
+
+    cursor = first.headers["X-Next-Before-Id"]
+    rest = client.get("/api/cart/history", params={"limit": 10, "before_id": cursor}, headers=headers)
+    assert [it["total_co2_g"] for it in rest.json()] == [102, 101, 100]
+    assert rest.json()[0]["user_id"] == "7"
+    assert "X-Next-Before-Id" not in rest.headers
+
+    assert client.get("/api/cart/history", params={"fields": "password"}, headers=headers).status_code == 422
+
+    # Schéma publié : éléments projetés (dicts), pas des CartHistoryItem complets
+    schema = client.get("/openapi.json").json()["paths"]["/api/cart/history"]["get"]["responses"]["200"]
+    items = schema["content"]["application/json"]["schema"]["items"]
+    assert items.get("type") == "object" and "$ref" not in items
+
+
+def test_unchanged_history_returns_304_until_a_new_cart(client, db):
+    _seed(client, 2)
+    headers = {"X-Honoua-User-Id": "7"}
+
+    r = client.get("/api/cart/history", headers=headers)
+    etag = r.headers["ETag"]
+    assert client.get("/api/cart/history", headers={**headers, "If-None-Match": etag}).status_code == 304
+    # Autres paramètres : autre représentation, autre ETag
+    assert client.get(
+        "/api/cart/history", params={"limit": 1}, headers={**headers, "If-None-Match": etag}
+    ).status_code == 200
+
+    _post(client, [{**CART, "idempotency_key": "new"}])
+    again = client.get("/api/cart/history", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 200
+    assert len(again.json()) == 3
+
+
+def test_backdated_replay_is_not_hidden_by_conditional_get(client, db):
+    _seed(client, 2)
+    headers = {"X-Honoua-User-Id": "7"}
+    r = client.get("/api/cart/history", headers=headers)
+    assert "Last-Modified" not in r.headers
+    etag = r.headers["ETag"]
+
+    # Panier validé hors ligne il y a 3 jours, rejoué maintenant : created_at antérieur
+    # aux paniers déjà servis, mais id plus grand => nouvel ETag
+    backdated = (datetime.now(timezone.utc) - timedelta(days=3)).isoformat()
+    _post(client, [{**CART, "idempotency_key": "offline", "validated_at": backdated}])
+    since = format_datetime(datetime.now(timezone.utc), usegmt=True)
+    again = client.get("/api/cart/history", headers={**headers, "If-None-Match": etag, "If-Modified-Since": since})
+    assert again.status_code == 200
+    assert len(again.json()) == 3
+    assert client.get("/api/cart/history", headers={**headers, "If-Modified-Since": since}).status_code == 200
+
+
+def test_summary_aggregates_budget_and_series_and_follows_new_carts(client, db):
+    today = datetime.now(timezone.utc).replace(hour=12, minute=0, second=0, microsecond=0)
+    rows = [(today, 500_000), (today - timedelta(days=7), 300_000), (today - timedelta(days=800), 999_000)]
+    for ts, co2 in rows:
+        db.execute(
+            text(
+                "INSERT INTO honou.co2_cart_history (user_id, period_type, period_label, total_co2_g, nb_articles, "
+                "nb_distinct_products, total_distance_km, days_captured_by_tree, tree_equivalent, created_at) "
+                "VALUES (7, 'month', '', :g, 1, 1, 10.0, 3.0, 0.1, :ts)"
+            ),
+            {"g": co2, "ts": ts.isoformat()},
+        )
+    db.commit()
+    headers = {"X-Honoua-User-Id": "7"}
+
+    body = client.get("/api/cart/history/summary", params={"household_size": 2, "weeks": 4}, headers=headers).json()
+    week = body["week"]
+    assert [p["co2_kg"] for p in week] == [300.0, 500.0]  # semaine précédente puis courante
+    assert week[-1]["label"] == "{}-W{:02d}".format(*today.isocalendar()[:2])
+    assert body["month"][-1]["label"] == today.strftime("%Y-%m")
+    assert sum(p["carts"] for p in body["month"]) == 2  # ligne hors fenêtre (800 jours) ignorée
+
+    budget = body["budget"]
+    year_kg = sum(co2 for ts, co2 in rows if ts.year == today.year) / 1000
+    assert budget["budget_annual_kg"] == 4000.0
+    assert budget["co2_annual_kg"] == pytest.approx(year_kg)
+    assert budget["status"] == ("ok" if year_kg <= 3200 else "warning")
+
+    # Servi depuis le cache, puis recalculé dès qu'un nouveau panier existe
+    before = client.get("/api/cart/history/summary", headers=headers).json()
+    assert client.post("/api/cart/history", json=CART, headers=headers).status_code == 200
+    after = client.get("/api/cart/history/summary", headers=headers).json()
+    assert after["week"][-1]["carts"] == before["week"][-1]["carts"] + 1
+
+    # Panier enregistré par un autre worker (aucune invalidation locale) : vu aussi
+    db.execute(
+        text(
+            "INSERT INTO honou.co2_cart_history (user_id, period_type, period_label, total_co2_g, nb_articles, "
+            "nb_distinct_products, total_distance_km, days_captured_by_tree, tree_equivalent, created_at) "
+            "VALUES (7, 'month', '', 1000, 1, 1, 1.0, 1.0, 0.1, :ts)"
+        ),
+        {"ts": today.isoformat()},
+    )
+    db.commit()
+    other = client.get("/api/cart/history/summary", headers=headers).json()
+    assert other["week"][-1]["carts"] == after["week"][-1]["carts"] + 1
@@ -27,10 +27,13 @@ class FakeSession:
             return _ExecResult(self.select_row)
 
         if "FROM co2_cart_history" in sql:
-            # differentiate ref vs cur by operator (< :end) vs (<= :end)
-            if "created_at < :end" in sql:
-                return _ExecResult(self.ref_row)
-            return _ExecResult(self.cur_row)
+            # single pass: both windows come back in one row (conditional aggregation)
+            return _ExecResult({
+                "ref_total_g": self.ref_row["total_co2_g"],
+                "ref_days": self.ref_row["days_count"],
+                "cur_total_g": self.cur_row["total_co2_g"],
+                "cur_days": self.cur_row["days_count"],
+            })
 
         # UPDATE or other: no-op
         return _ExecResult(None)
@@ -0,0 +1,188 @@
+# tests/test_challenge_batch.py
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.services.challenge_batch import reevaluate_active_challenges, user_key
+from app.services.challenge_scoring import challenge_windows, score_co2_challenge
+from app.services.co2_daily import rebuild_cart_daily
+from app.services.co2_source import invalidate_co2_source_cache, resolve_co2_rollup, resolve_co2_source
+
+NOW = datetime(2026, 3, 20, 12, 0, 0)
+
+
+def _setup_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'batch.sqlite'}")
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE challenges (
+                id INTEGER PRIMARY KEY, code TEXT, name TEXT,
+                default_target_value REAL, target_reduction_pct REAL
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE challenge_instances (
+                id INTEGER PRIMARY KEY, user_id TEXT, challenge_id INTEGER, status TEXT,
+                period_start TIMESTAMP, period_end TIMESTAMP,
+                created_at TIMESTAMP, updated_at TIMESTAMP,
+                reference_value REAL, current_value REAL, progress_percent REAL,
+                last_evaluated_at TIMESTAMP, message TEXT
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE co2_cart_history (
+                id INTEGER PRIMARY KEY, user_id TEXT, total_co2_g REAL, created_at TIMESTAMP
+            )
+        """))
+        conn.execute(text("INSERT INTO challenges VALUES (1, 'CO2_30D_MINUS_10', 'CO2 -10%', 10, NULL)"))
+        conn.execute(text("INSERT INTO challenges VALUES (2, 'OTHER', 'Autre', 5, NULL)"))
+
+        start = NOW - timedelta(days=5)
+        instances = [
+            # (id, user_id, challenge_id, status, start, end)
+            (1, "1", 1, "ACTIVE", start, start + timedelta(days=30)),             # succès
+            (2, "00000000-0000-0000-0000-000000000002", 1, " active ", start, start + timedelta(days=30)),
+            (3, "3", 1, "ACTIVE", NOW - timedelta(days=40), NOW - timedelta(days=10)),  # terminé
+            (4, "4", 1, "ACTIVE", start, start + timedelta(days=30)),             # sans données
+            (5, "1", 2, "ACTIVE", start, start + timedelta(days=30)),             # autre défi
+            (6, "1", 1, "SUCCESS", start, start + timedelta(days=30)),            # non actif
+        ]
+        for iid, uid, cid, status, s, e in instances:
+            conn.execute(
+                text("""
+                    INSERT INTO challenge_instances (id, user_id, challenge_id, status, period_start, period_end, created_at)
+                    VALUES (:id, :uid, :cid, :status, :s, :e, :s)
+                """),
+                {"id": iid, "uid": uid, "cid": cid, "status": status, "s": s.isoformat(sep=" "), "e": e.isoformat(sep=" ")},
+            )
+
+        history = []
+        # user 1 : 10 jours de référence à 1 kg, courant 2 jours à 0.5 kg → succès
+        history += [("1", 1000.0, start - timedelta(days=d)) for d in range(1, 11)]
+        history += [("1", 500.0, start + timedelta(days=d, hours=1)) for d in range(2)]
+        # user 2 : référence 8 jours, courant élevé → toujours actif
+        history += [("2", 1000.0, start - timedelta(days=d, hours=3)) for d in range(1, 9)]
+        history += [("2", 4000.0, start + timedelta(days=d)) for d in range(3)]
+        # user 3 : référence trop courte (3 jours), défi terminé → échec
+        s3 = NOW - timedelta(days=40)
+        history += [("3", 1000.0, s3 - timedelta(days=d)) for d in range(1, 4)]
+        history += [("3", 200.0, s3 + timedelta(days=d)) for d in range(5)]
+        for uid, g, ts in history:
+            conn.execute(
+                text("INSERT INTO co2_cart_history (user_id, total_co2_g, created_at) VALUES (:u, :g, :ts)"),
+                {"u": uid, "g": g, "ts": ts.isoformat(sep=" ")},
+            )
+    return engine, history
+
+
+def _expected(history, uid, start, end):
+    ref_start, ref_end, cur_start, cur_end = challenge_windows(start, end, NOW)
+    ref = [(g, ts) for u, g, ts in history if u == uid and ref_start <= ts < ref_end]
+    cur = [(g, ts) for u, g, ts in history if u == uid and cur_start <= ts <= cur_end]
+    return score_co2_challenge(
+        sum(g for g, _ in ref) if ref else None, len({ts.date() for _, ts in ref}),
+        sum(g for g, _ in cur) if cur else None, len({ts.date() for _, ts in cur}),
+        target_value=10, db_status="ACTIVE", end_date=end, now=NOW,
+    )
+
+
+def test_user_key_maps_synthetic_uuid():
+    assert user_key("00000000-0000-0000-0000-000000000042") == "42"
+    assert user_key(7) == "7"
+
+
+def test_batch_matches_single_evaluation_math(tmp_path):
+    invalidate_co2_source_cache()
+    engine, history = _setup_db(tmp_path)
+    db = sessionmaker(bind=engine)()
+
+    stats = reevaluate_active_challenges(db, chunk_size=2, now=NOW)
+    assert stats["instances"] == 4
+    assert stats["chunks"] == 2
+
+    rows = {
+        r["id"]: r
+        for r in db.execute(text("SELECT * FROM challenge_instances")).mappings().all()
+    }
+    start = NOW - timedelta(days=5)
+    cases = {
+        1: ("1", start, start + timedelta(days=30)),
+        2: ("2", start, start + timedelta(days=30)),
+        3: ("3", NOW - timedelta(days=40), NOW - timedelta(days=10)),
+        4: ("4", start, start + timedelta(days=30)),
+    }
+    for iid, (uid, s, e) in cases.items():
+        expected = _expected(history, uid, s, e)
+        row = rows[iid]
+        assert row["status"] == expected.db_status
+        assert row["message"] == expected.message
+        assert row["current_value"] == expected.current_value
+        assert row["reference_value"] == expected.reference_value
+        assert row["progress_percent"] == expected.progress_percent
+        assert row["last_evaluated_at"] is not None
+
+    assert rows[1]["status"] == "SUCCESS"
+    assert rows[3]["status"] == "FAILED"
+    assert rows[4]["status"] == "ACTIVE"
+    # hors périmètre : non modifiés
+    assert rows[5]["last_evaluated_at"] is None
+    assert rows[6]["last_evaluated_at"] is None
+
+    db.close()
+    engine.dispose()
+    invalidate_co2_source_cache()
+
+
+def test_dry_run_does_not_write(tmp_path):
+    invalidate_co2_source_cache()
+    engine, _ = _setup_db(tmp_path)
+    db = sessionmaker(bind=engine)()
+
+    stats = reevaluate_active_challenges(db, chunk_size=10, now=NOW, dry_run=True)
+    assert stats["instances"] == 4
+    evaluated = db.execute(
+        text("SELECT COUNT(*) FROM challenge_instances WHERE last_evaluated_at IS NOT NULL")
+    ).scalar()
+    assert evaluated == 0
+
+    db.close()
+    engine.dispose()
+    invalidate_co2_source_cache()
+
+
+def test_batch_reads_daily_rollup_with_same_results(tmp_path):
+    invalidate_co2_source_cache()
+    engine, history = _setup_db(tmp_path)
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE co2_cart_daily (
+                user_id TEXT NOT NULL, day DATE NOT NULL,
+                total_co2_g REAL NOT NULL DEFAULT 0, cart_count INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP, PRIMARY KEY (user_id, day)
+            )
+        """))
+    db = sessionmaker(bind=engine)()
+    assert rebuild_cart_daily(db) > 0
+    assert resolve_co2_rollup(db, resolve_co2_source(db)) is not None
+
+    reevaluate_active_challenges(db, chunk_size=3, now=NOW)
+    rows = {
+        r["id"]: r
+        for r in db.execute(text("SELECT * FROM challenge_instances")).mappings().all()
+    }
+    start = NOW - timedelta(days=5)
+    for iid, uid, s, e in (
+        (1, "1", start, start + timedelta(days=30)),
+        (2, "2", start, start + timedelta(days=30)),
+        (3, "3", NOW - timedelta(days=40), NOW - timedelta(days=10)),
+    ):
+        expected = _expected(history, uid, s, e)
+        assert (rows[iid]["status"], rows[iid]["reference_value"], rows[iid]["current_value"]) == (
+            expected.db_status, expected.reference_value, expected.current_value,
+        )
+
+    db.close()
+    engine.dispose()
+    invalidate_co2_source_cache()
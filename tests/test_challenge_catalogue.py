@@ -0,0 +1,61 @@
+# tests/test_challenge_catalogue.py
+
+from app.services.challenge_catalogue import challenge_catalogue, etag_matches
+
+ROWS = [
+    {"id": 1, "code": "CO2_30D_MINUS_10", "name": "CO2 -10 %", "metric": "CO2", "logic_type": "REDUCTION_PCT",
+     "period_type": "DAYS", "default_target_value": 10.0, "scope_type": "CART", "active": True},
+]
+
+
+def _queries(db):
+    assert all("FROM public.challenges" in sql for sql, _ in db.calls)
+    return len(db.calls)
+
+
+def test_catalogue_is_served_from_memory_with_etag(client, fake_db, monkeypatch):
+    challenge_catalogue.invalidate()
+    db = fake_db(ROWS)
+
+    r1 = client.get("/challenges")
+    assert r1.status_code == 200
+    assert r1.json()[0]["code"] == "CO2_30D_MINUS_10"
+    etag = r1.headers["etag"]
+    assert etag.startswith('"') and "max-age=" in r1.headers["cache-control"]
+
+    r2 = client.get("/challenges", headers={"If-None-Match": etag})
+    assert r2.status_code == 304
+    assert r2.headers["etag"] == etag
+    assert _queries(db) == 1  # une seule lecture pour les deux appels
+
+    # changement de version → rechargement et nouvel ETag
+    monkeypatch.setenv("HONOUA_CHALLENGES_CATALOGUE_VERSION", "2")
+    r3 = client.get("/challenges", headers={"If-None-Match": etag})
+    assert r3.status_code == 200
+    assert r3.headers["etag"] != etag
+    assert _queries(db) == 2
+    challenge_catalogue.invalidate()
+
+
+def test_admin_reload_requires_token(client, fake_db, monkeypatch):
+    challenge_catalogue.invalidate()
+    db = fake_db(ROWS)
+
+    monkeypatch.delenv("HONOUA_ADMIN_TOKEN", raising=False)
+    assert client.post("/admin/challenges/reload").status_code == 404
+
+    monkeypatch.setenv("HONOUA_ADMIN_TOKEN", "s3cret")
+    assert client.post("/admin/challenges/reload", headers={"X-Honoua-Admin-Token": "nope"}).status_code == 403
+
+    r = client.post("/admin/challenges/reload", headers={"X-Honoua-Admin-Token": "s3cret"})
+    assert r.status_code == 200
+    assert r.json()["count"] == 1
+    assert _queries(db) == 1
+    challenge_catalogue.invalidate()
+
+
+def test_etag_matches_lists_and_weak_validators():
+    assert etag_matches('"a", "b"', '"b"')
+    assert etag_matches('W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches(None, '"b"')
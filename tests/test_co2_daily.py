@@ -0,0 +1,88 @@
+# tests/test_co2_daily.py
+
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.services.co2_daily import (
+    rebuild_cart_daily,
+    record_cart,
+    split_window,
+    two_window_sql,
+    window_params,
+)
+from app.services.co2_source import invalidate_co2_source_cache, resolve_co2_rollup, resolve_co2_source
+
+
+def test_split_window_keeps_partial_days_on_raw_table():
+    split = split_window(datetime(2026, 3, 1, 15, 30), datetime(2026, 3, 10, 9, 0))
+    assert split.head_end == datetime(2026, 3, 2)
+    assert (split.full_start, split.full_end) == (date(2026, 3, 2), date(2026, 3, 10))
+    assert split.tail_start == datetime(2026, 3, 10)
+
+    # fenêtre plus courte qu'un jour entier : tout en brut
+    short = split_window(datetime(2026, 3, 1, 8), datetime(2026, 3, 2, 6))
+    assert short.full_start == short.full_end
+    assert short.tail_start == datetime(2026, 3, 1, 8)
+
+
+def _session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'daily.sqlite'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE co2_cart_history (id INTEGER PRIMARY KEY, user_id INTEGER, total_co2_g REAL, created_at TIMESTAMP)"
+        ))
+        conn.execute(text("""
+            CREATE TABLE co2_cart_daily (
+                user_id TEXT NOT NULL, day DATE NOT NULL,
+                total_co2_g REAL NOT NULL DEFAULT 0, cart_count INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP, PRIMARY KEY (user_id, day)
+            )
+        """))
+    return engine, sessionmaker(bind=engine)()
+
+
+def test_incremental_upsert_matches_rebuild_and_raw_window(tmp_path):
+    invalidate_co2_source_cache()
+    engine, db = _session(tmp_path)
+
+    base = datetime(2026, 3, 1, 6, 0)
+    carts = [(7, 100.0 + i, base + timedelta(hours=9 * i)) for i in range(20)] + [(8, 50.0, base)]
+    for uid, g, ts in carts:
+        db.execute(
+            text("INSERT INTO co2_cart_history (user_id, total_co2_g, created_at) VALUES (:u, :g, :ts)"),
+            {"u": uid, "g": g, "ts": ts.isoformat(sep=" ")},
+        )
+        assert record_cart(db, uid, ts, g) is True
+    db.commit()
+
+    incremental = db.execute(text("SELECT * FROM co2_cart_daily ORDER BY user_id, day")).all()
+    rebuild_cart_daily(db)
+    rebuilt = db.execute(text("SELECT * FROM co2_cart_daily ORDER BY user_id, day")).all()
+    assert [r[:4] for r in incremental] == [r[:4] for r in rebuilt]
+
+    source = resolve_co2_source(db)
+    rollup = resolve_co2_rollup(db, source)
+    assert rollup is not None
+    ref_start, cur_start, cur_end = datetime(2026, 3, 1, 12), datetime(2026, 3, 4, 3), datetime(2026, 3, 6, 18)
+    ref = [(g, ts) for uid, g, ts in carts if uid == 7 and ref_start <= ts < cur_start]
+    cur = [(g, ts) for uid, g, ts in carts if uid == 7 and cur_start <= ts <= cur_end]
+    expected = {
+        "ref_total_g": sum(g for g, _ in ref),
+        "ref_days": len({ts.date() for _, ts in ref}),
+        "cur_total_g": sum(g for g, _ in cur),
+        "cur_days": len({ts.date() for _, ts in cur}),
+    }
+
+    # une requête pour les deux fenêtres, avec et sans cumul journalier
+    for with_rollup in (rollup, None):
+        row = db.execute(
+            text(two_window_sql("sqlite", source, with_rollup, lambda col: f"CAST({col} AS TEXT) = :u")),
+            {"u": "7", **window_params("sqlite", ref_start, cur_start, cur_end)},
+        ).mappings().first()
+        assert dict(row) == expected
+
+    db.close()
+    engine.dispose()
+    invalidate_co2_source_cache()
@@ -0,0 +1,115 @@
+# tests/test_co2_product_cache.py
+
+import time
+
+import pytest
+
+from app.main import ProductDB
+from app.services import product_cache as product_cache_module
+from app.services.product_cache import MISSING, ProductCache, TTLCache, product_cache
+from app.telemetry.metrics import get_cache_stats
+
+
+EAN = "4000000000017"
+
+
+@pytest.fixture
+def seeded_product(_SessionLocal):
+    product_cache.invalidate()
+    with _SessionLocal() as s:
+        s.query(ProductDB).filter(ProductDB.ean13_clean == EAN).delete()
+        s.add(
+            ProductDB(
+                ean13_clean=EAN,
+                product_name="Produit cache test",
+                carbon_product_kgco2e=1.0,
+                carbon_pack_kgco2e=0.1,
+                net_weight_kg=None,
+                origin_country="FR",
+                origin_lat=None,
+                origin_lon=45.0,
+                zone_geo="5.0",
+            )
+        )
+        s.commit()
+    yield EAN
+    with _SessionLocal() as s:
+        s.query(ProductDB).filter(ProductDB.ean13_clean == EAN).delete()
+        s.commit()
+    product_cache.invalidate()
+
+
+def test_lru_eviction_and_negative_entries():
+    cache = ProductCache(name="test_lru", max_size=2, ttl_s=60, negative_ttl_s=60)
+    cache.set("a", {"ean": "a"})
+    cache.set("b", {"ean": "b"})
+    assert cache.get("a") == {"ean": "a"}  # "a" devient le plus récent
+    cache.set_missing("c")                 # évince "b"
+
+    assert cache.get("b") is None
+    assert cache.get("c") is MISSING
+    assert len(cache) == 2
+
+    stats = get_cache_stats()["test_lru"]
+    assert stats["eviction"] == 1
+    assert stats["hit"] == 1
+    assert stats["negative_hit"] == 1
+    assert stats["miss"] == 1
+
+
+def test_ttl_expiry():
+    cache = ProductCache(name="test_ttl", max_size=10, ttl_s=60, negative_ttl_s=0)
+    cache.set_missing("x")  # TTL négatif nul => pas de cache négatif
+    assert cache.get("x") is None
+
+
+def test_generic_ttl_cache_expires_entries(monkeypatch):
+    cache = TTLCache(name="test_generic", max_size=10, ttl_s=60)
+    cache.set("k", {"total": 1})
+    assert cache.get("k") == {"total": 1}
+    assert not hasattr(cache, "set_missing")  # pas de cache négatif
+
+    now = time.monotonic()
+    monkeypatch.setattr(product_cache_module.time, "monotonic", lambda: now + 61)
+    assert cache.get("k") is None
+    assert get_cache_stats()["test_generic"]["expired"] == 1
+
+
+def test_co2_product_served_from_cache(client, seeded_product):
+    r1 = client.get(f"/api/v1/co2/product/{seeded_product}")
+    assert r1.status_code == 200
+    data = r1.json()
+    # Heuristique lat/lon appliquée + fallback poids
+    assert data["origin_lat"] == 45.0
+    assert data["origin_lon"] == 5.0
+    assert data["zone_geo"] is None
+    assert data["weight_kg_used"] == 0.5
+
+    hits_before = get_cache_stats().get("product", {}).get("hit", 0)
+    r2 = client.get(f"/api/v1/co2/product/{seeded_product}?user_lat=48.85&user_lon=2.35")
+    assert r2.status_code == 200
+    assert get_cache_stats()["product"]["hit"] == hits_before + 1
+    # Le transport reste calculé par requête (position utilisateur)
+    assert r2.json()["distance_km"] != data["distance_km"]
+
+
+def test_co2_product_negative_cache_and_invalidation(client, _SessionLocal):
+    product_cache.invalidate()
+    missing_ean = "4000000000024"
+
+    assert client.get(f"/api/v1/co2/product/{missing_ean}").status_code == 404
+    assert product_cache.get(missing_ean) is MISSING
+
+    # Insertion via l'ORM => invalidation automatique de l'entrée négative
+    with _SessionLocal() as s:
+        s.add(ProductDB(ean13_clean=missing_ean, product_name="Nouveau produit"))
+        s.commit()
+    try:
+        r = client.get(f"/api/v1/co2/product/{missing_ean}")
+        assert r.status_code == 200
+        assert r.json()["product_name"] == "Nouveau produit"
+    finally:
+        with _SessionLocal() as s:
+            s.query(ProductDB).filter(ProductDB.ean13_clean == missing_ean).delete()
+            s.commit()
+        product_cache.invalidate()
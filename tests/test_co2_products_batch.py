@@ -0,0 +1,89 @@
+# tests/test_co2_products_batch.py
+
+import pytest
+from sqlalchemy import event
+
+from app.db.async_engine import get_async_engine
+from app.main import DB_URL, ProductDB
+from app.services.product_cache import product_cache
+
+
+EANS = ["4000000001007", "4000000001014", "4000000001021"]
+
+
+@pytest.fixture
+def seeded_products(_SessionLocal):
+    product_cache.invalidate()
+    with _SessionLocal() as s:
+        s.query(ProductDB).filter(ProductDB.ean13_clean.in_(EANS)).delete()
+        s.add_all([
+            ProductDB(ean13_clean=EANS[0], product_name="Batch A", carbon_product_kgco2e=1.0,
+                      origin_country="FR", origin_lat=43.6, origin_lon=1.44),
+            ProductDB(ean13_clean=EANS[1], product_name="Batch B", carbon_product_kgco2e=2.0,
+                      carbon_pack_kgco2e=0.2, net_weight_kg=1.0, origin_country="ES"),
+        ])
+        s.commit()
+    yield EANS
+    with _SessionLocal() as s:
+        s.query(ProductDB).filter(ProductDB.ean13_clean.in_(EANS)).delete()
+        s.commit()
+    product_cache.invalidate()
+
+
+@pytest.fixture
+def _products_engine():
+    # Les lectures produit passent par l'AsyncEngine (aiosqlite) : événements sur son sync_engine
+    return get_async_engine(DB_URL).sync_engine
+
+
+def _count_product_selects(engine):
+    counter = {"n": 0}
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if "FROM products" in statement:
+            counter["n"] += 1
+
+    event.listen(engine, "before_cursor_execute", _before)
+    return counter, lambda: event.remove(engine, "before_cursor_execute", _before)
+
+
+def test_batch_matches_single_endpoint_and_reports_misses(client, _products_engine, seeded_products):
+    counter, stop = _count_product_selects(_products_engine)
+    try:
+        r = client.post(
+            "/api/v1/co2/products",
+            json={"eans": EANS + ["123"], "user_lat": 48.85, "user_lon": 2.35},
+        )
+    finally:
+        stop()
+
+    assert r.status_code == 200
+    body = r.json()
+    assert counter["n"] == 1  # une seule requête IN (...) pour tout le panier
+    assert (body["count"], body["found"], body["missing"]) == (4, 2, 2)
+    assert [it["status"] for it in body["items"]] == ["ok", "ok", "not_found", "invalid"]
+
+    for item in body["items"][:2]:
+        single = client.get(
+            f"/api/v1/co2/product/{item['ean']}",
+            params={"user_lat": 48.85, "user_lon": 2.35},
+        ).json()
+        assert item["data"] == single
+
+
+def test_batch_uses_cache_on_second_call(client, _products_engine, seeded_products):
+    client.post("/api/v1/co2/products", json={"eans": EANS})
+
+    counter, stop = _count_product_selects(_products_engine)
+    try:
+        r = client.post("/api/v1/co2/products", json={"eans": EANS})
+    finally:
+        stop()
+
+    assert r.status_code == 200
+    assert counter["n"] == 0  # hits + cache négatif
+
+
+def test_batch_size_cap(client):
+    r = client.post("/api/v1/co2/products", json={"eans": ["4000000001007"] * 1000})
+    assert r.status_code == 422
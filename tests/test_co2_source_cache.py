@@ -0,0 +1,51 @@
+# tests/test_co2_source_cache.py
+
+from app.services import co2_source
+from app.services.co2_source import Co2Source, invalidate_co2_source_cache, resolve_co2_source
+
+
+def _schema(schema="public", cols=("user_id", "validated_at", "co2_kg")):
+    """on_execute : table présente dans `schema` seulement, avec les colonnes `cols`."""
+    def _on_execute(sql, params):
+        if "to_regclass" in sql:
+            return [{"ok": params["fqtn"].startswith(schema + ".")}]
+        if "information_schema.columns" in sql:
+            return list(cols)
+        raise AssertionError(sql)
+    return _on_execute
+
+
+def test_source_is_detected_once_then_cached(fake_db):
+    invalidate_co2_source_cache()
+    db = fake_db(on_execute=_schema())
+
+    first = resolve_co2_source(db)
+    assert first == Co2Source("public", "public.co2_cart_history", "validated_at", "(co2_kg * 1000)", "kg")
+    detection_queries = len(db.calls)
+    assert detection_queries == 3  # honou absent, public présent, colonnes
+
+    for _ in range(10):
+        assert resolve_co2_source(db) == first
+    assert len(db.calls) == detection_queries
+
+
+def test_invalidate_and_ttl_force_redetection(fake_db, monkeypatch):
+    invalidate_co2_source_cache()
+    db = fake_db(on_execute=_schema("honou", ("user_id", "created_at", "total_co2_g")))
+    assert resolve_co2_source(db).table_ref == "honou.co2_cart_history"
+
+    invalidate_co2_source_cache("co2_cart_history")
+    resolve_co2_source(db)
+    assert len(db.calls) == 4
+
+    monkeypatch.setattr(co2_source.time, "monotonic", lambda: 1e12)
+    resolve_co2_source(db)
+    assert len(db.calls) == 6
+    invalidate_co2_source_cache()
+
+
+def test_missing_table_is_not_resolved(fake_db):
+    invalidate_co2_source_cache()
+    db = fake_db(on_execute=_schema("other"))
+    assert resolve_co2_source(db) is None
+    invalidate_co2_source_cache()
@@ -17,3 +17,43 @@ def test_compare_results_have_expected_keys():
     data = r.json()
     first_item = data["results"][0]
     assert {"ean", "carbon_kgCO2e"}.issubset(first_item.keys())
+
+
+def test_compare_returns_real_totals_and_ranks(_SessionLocal):
+    from app.main import ProductDB
+    from app.services.product_cache import product_cache
+
+    eans = ["4000000002004", "4000000002011"]
+    product_cache.invalidate()
+    with _SessionLocal() as s:
+        s.query(ProductDB).filter(ProductDB.ean13_clean.in_(eans)).delete()
+        s.add_all([
+            ProductDB(ean13_clean=eans[0], product_name="Lourd", carbon_product_kgco2e=3.0,
+                      carbon_pack_kgco2e=0.5, origin_country="FR"),
+            ProductDB(ean13_clean=eans[1], product_name="Léger", carbon_product_kgco2e=1.0,
+                      origin_country="FR"),
+        ])
+        s.commit()
+
+    try:
+        r = client.post("/api/compare", json={"eans": eans + ["123"]})
+        assert r.status_code == 200
+        body = r.json()
+        heavy, light, unknown = body["results"]
+
+        single = client.get(f"/api/v1/co2/product/{eans[0]}").json()
+        assert heavy["carbon_kgCO2e"] == single["carbon_total_kg"]
+        assert (heavy["rank"], light["rank"]) == (2, 1)
+        assert body["best_ean"] == eans[1]
+        assert heavy["diff_vs_best_kg"] > 0
+        assert unknown["found"] is False and unknown["carbon_kgCO2e"] is None
+    finally:
+        with _SessionLocal() as s:
+            s.query(ProductDB).filter(ProductDB.ean13_clean.in_(eans)).delete()
+            s.commit()
+        product_cache.invalidate()
+
+
+def test_compare_request_size_cap():
+    r = client.post("/compare", json={"eans": ["4000000002004"] * 500})
+    assert r.status_code == 422
@@ -0,0 +1,66 @@
+# tests/test_csv_export.py
+
+import csv
+import gzip
+import io
+import types
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.services import group_emissions
+from app.services.csv_export import gzip_chunks, iter_csv, stream_rows
+
+
+def test_iter_csv_encodes_by_chunks():
+    chunks = list(iter_csv(["a", "b"], ([i, i * 2] for i in range(5)), chunk_rows=2))
+    assert len(chunks) == 3  # (en-tête + 2 lignes), 2 lignes, 1 ligne
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert rows[0] == ["a", "b"] and rows[-1] == ["4", "8"]
+
+
+def test_gzip_chunks_round_trip():
+    payload = [b"t,sum\r\n"] + [f"{i},{i}\r\n".encode() for i in range(1000)]
+    assert gzip.decompress(b"".join(gzip_chunks(iter(payload)))) == b"".join(payload)
+
+
+def test_stream_rows_reads_lazily_from_a_dedicated_connection():
+    engine = create_engine("sqlite://", future=True)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE t (i INTEGER)")
+        conn.execute(text("INSERT INTO t (i) VALUES (:i)"), [{"i": i} for i in range(2500)])
+
+    with Session(engine) as db:
+        rows = stream_rows(db, text("SELECT i FROM t ORDER BY i"), chunk_rows=100)
+        assert isinstance(rows, types.GeneratorType)
+        assert [r["i"] for r in rows] == list(range(2500))
+    engine.dispose()
+
+
+def test_stream_rows_uses_a_server_side_cursor_on_postgres(pg_engine):
+    with Session(pg_engine) as db:
+        rows = stream_rows(db, text("SELECT i FROM generate_series(1, :n) AS i"), {"n": 2500}, chunk_rows=100)
+        assert isinstance(rows, types.GeneratorType)
+        first = next(rows)
+        # curseur nommé (psycopg) ouvert sur la connexion dédiée, pas sur celle de la session
+        assert db.execute(text("SELECT COUNT(*) FROM pg_cursors")).scalar() == 0
+        assert [first["i"]] + [r["i"] for r in rows] == list(range(1, 2501))
+
+
+def test_group_summary_csv_is_gzipped_when_accepted(client, fake_db, monkeypatch):
+    fake_db([
+        {"group_id": 1, "category_code": "FOOD", "avg_emission": 2.0, "min_emission": 1.0,
+         "max_emission": 3.0, "total_emission": 6.0},
+    ])
+    monkeypatch.setattr(group_emissions, "GROUP_AGGREGATE_ENABLED", False)
+
+    params = {"group_ids": 1, "format": "csv"}
+    r = client.get("/emissions/summary_groups", params=params, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["content-type"].startswith("text/csv")
+    assert r.text.splitlines()[1] == "1,FOOD,2.0,1.0,3.0,6.0"
+
+    r = client.get("/emissions/summary_groups", params=params, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers
+    assert r.text.splitlines()[0].startswith("group_id,category_code")
@@ -0,0 +1,98 @@
+# tests/test_db_engine.py
+
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import event
+
+from app.db.engine import dispose_engines, get_engine
+from app.telemetry.metrics import get_pool_stats
+
+
+def test_routers_share_one_engine():
+    import app.main as main
+    from app.db import session
+    from app.middleware import blacklist_guard
+    from app.routers import cart_history, tokens
+
+    # Variables historiques de chaque module : un pool par URL résolue
+    assert main.engine is cart_history.engine is get_engine(os.environ["DATABASE_URL"])
+    assert session.engine is tokens.engine is blacklist_guard.engine is get_engine(os.environ["HONOUA_DB_URL"])
+
+
+def test_modules_keep_their_url_precedence_and_defaults(monkeypatch):
+    from app.db import db_url
+    from app.db.engine import configured_db_url, env_db_url
+
+    monkeypatch.setenv("DATABASE_URL", "postgres://u:p@main/db")
+    monkeypatch.setenv("HONOUA_DB_URL", "postgresql+psycopg://u:p@tokens/db")
+    assert configured_db_url() == "postgresql+psycopg2://u:p@main/db"
+    assert db_url() == "postgresql+psycopg2://u:p@tokens/db"
+
+    monkeypatch.delenv("DATABASE_URL")
+    monkeypatch.delenv("HONOUA_DB_URL")
+    assert db_url() == "sqlite:///./local.db"
+    assert env_db_url("DATABASE_URL", default="sqlite:///./honoua.db") == "sqlite:///./honoua.db"
+
+
+def test_pool_waits_are_counted(monkeypatch):
+    fd, path = tempfile.mkstemp(prefix="honoua_pool_", suffix=".sqlite")
+    os.close(fd)
+    url = f"sqlite:///{path}"
+    monkeypatch.setenv("HONOUA_DB_POOL_SIZE", "1")
+    monkeypatch.setenv("HONOUA_DB_MAX_OVERFLOW", "0")
+
+    engine = get_engine(url)
+    assert get_engine(url) is engine
+
+    held = engine.connect()
+
+    def _release():
+        time.sleep(0.05)
+        held.close()
+
+    threading.Thread(target=_release).start()
+    with engine.connect():
+        pass
+
+    label = next(k for k in get_pool_stats() if path in k)
+    stats = get_pool_stats()[label]
+    assert stats["size"] == 1
+    assert stats["checkout"] >= 2
+    assert stats["wait"] >= 1 and stats["wait_ms"] >= 40
+
+    dispose_engines()
+    os.remove(path)
+
+
+def test_slow_connect_is_not_a_wait(monkeypatch):
+    fd, path = tempfile.mkstemp(prefix="honoua_pool_", suffix=".sqlite")
+    os.close(fd)
+    monkeypatch.setenv("HONOUA_DB_POOL_SIZE", "2")
+    monkeypatch.setenv("HONOUA_DB_MAX_OVERFLOW", "0")
+    engine = get_engine(f"sqlite:///{path}")
+    # ouverture de connexion lente, pool non saturé
+    event.listen(engine, "connect", lambda dbapi_conn, record: time.sleep(0.02))
+
+    with engine.connect():
+        pass
+
+    label = next(k for k in get_pool_stats() if path in k)
+    stats = get_pool_stats()[label]
+    assert stats["connect"] == 1
+    assert "wait" not in stats
+
+    dispose_engines()
+    os.remove(path)
+
+
+def test_metrics_expose_pool(client):
+    client.get("/api/v1/products/search", params={"q": "x"})
+    data = client.get("/metrics").json()
+    assert "db_pool" in data
+
+    body = client.get("/metrics/prometheus").text
+    assert "honoua_db_pool_checkouts_total" in body
+    assert "honoua_db_pool_waits_total" in body
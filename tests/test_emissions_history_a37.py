@@ -0,0 +1,98 @@
+# tests/test_emissions_history_a37.py
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+from sqlalchemy import text
+
+from app.schemas.emissions_history import GroupBy, HistoryQuery, Interval, Metric
+from app.services import emission_cube
+from app.services.emissions_history import build_history_sql, split_page
+
+
+@pytest.fixture(autouse=True)
+def _raw_reads(monkeypatch):
+    # lecture brute (le cube est couvert par test_emission_cube.py)
+    monkeypatch.setattr(emission_cube, "EMISSION_CUBE_ENABLED", False)
+
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def test_build_history_sql_uses_query_parameters():
+    q = HistoryQuery(
+        interval=Interval.month, metrics=[Metric.avg, Metric.max], group_by=GroupBy.category,
+        tz="America/New_York", limit=12, after=T0,
+    )
+    sql, params = build_history_sql(q)
+    assert "DATE_TRUNC('month', created_at AT TIME ZONE :tz) AT TIME ZONE :tz" in sql
+    assert 'category_code AS "group"' in sql
+    assert "AVG(emissions_gco2e)::float8 AS avg" in sql and "SUM(" not in sql
+    assert "INTERVAL '1 month'" in sql
+    assert params["tz"] == "America/New_York"
+    assert params["bucket_limit"] == 13  # un bucket de plus pour détecter la page suivante
+    # fenêtre bornée des deux côtés (pas d'agrégat de toute la queue) + sonde de la suite
+    assert "created_at < (SELECT hi FROM bounds)" in sql
+    assert "(lo + :bucket_limit * INTERVAL '1 month')" in sql
+    assert "AS has_more" in sql
+    assert "has_more" not in build_history_sql(q, extra_bucket=False)[0]
+
+    with pytest.raises(ValueError):
+        build_history_sql(HistoryQuery(interval=Interval.week, tz="Mars/Olympus"))
+
+
+def test_split_page_returns_keyset_cursor():
+    rows = [{"t": T0 + timedelta(weeks=i), "bucket_rank": i + 1} for i in range(3)]
+    page, cursor = split_page(rows, 2)
+    assert len(page) == 2 and cursor == rows[1]["t"]
+    assert split_page(rows, 3) == (rows, None)
+    # buckets vides en fin de fenêtre, lignes au-delà : has_more donne le curseur
+    more = [{**r, "has_more": True} for r in rows]
+    assert split_page(more, 3) == (more, more[-1]["t"])
+
+
+def test_history_a37_paginates_and_fills_trend_slope(client, fake_db):
+    rows = [
+        {"t": T0 + timedelta(weeks=i), "sum": 10.0 * (i + 1), "count": 1, "bucket_rank": i + 1}
+        for i in range(4)
+    ]
+    db = fake_db(rows)
+
+    r = client.get("/emissions/history_a37", params={"interval": "week", "limit": 3, "tz": "UTC"})
+    assert r.status_code == 200
+    body = r.json()
+    assert len(body["series"]) == 3
+    assert body["summary"]["trend_slope_per_interval"] == pytest.approx(10.0)
+    assert body["next_cursor"].startswith("2024-01-15")
+    assert db.calls[0][1]["bucket_limit"] == 4
+
+    r = client.get("/emissions/history_a37", params={"interval": "week", "tz": "Nowhere/City"})
+    assert r.status_code == 422
+
+
+def test_history_sql_pages_by_local_buckets_on_postgres(pg_db, add_calcs):
+    sid = f"test-{uuid.uuid4()}"
+    # 2001 : aucune autre donnée ; 04/03 23:30 UTC = lundi 05/03 00:30 à Paris
+    for at, value in [("2001-03-04 23:30:00+00", 1), ("2001-03-07 10:00:00+00", 2),
+                      ("2001-03-20 10:00:00+00", 4), ("2001-04-10 10:00:00+00", 8)]:
+        add_calcs(pg_db, sid, [value], at=at)
+    paris = ZoneInfo("Europe/Paris")
+    q = HistoryQuery(**{
+        "from": datetime(2001, 1, 1, tzinfo=timezone.utc), "to": datetime(2001, 12, 31, tzinfo=timezone.utc),
+        "interval": Interval.week, "metrics": [Metric.sum, Metric.count], "tz": "Europe/Paris", "limit": 2,
+    })
+
+    sql, params = build_history_sql(q)
+    page, cursor = split_page(pg_db.execute(text(sql), params).mappings().all(), 2)
+    assert [(r["t"], r["sum"], r["count"]) for r in page] == [
+        (datetime(2001, 3, 5, tzinfo=paris), 3.0, 2),
+        (datetime(2001, 3, 19, tzinfo=paris), 4.0, 1),
+    ]
+    assert cursor == page[-1]["t"]
+
+    sql, params = build_history_sql(q.model_copy(update={"after": cursor}))
+    page, cursor = split_page(pg_db.execute(text(sql), params).mappings().all(), 2)
+    assert [(r["t"], r["sum"]) for r in page] == [(datetime(2001, 4, 9, tzinfo=paris), 8.0)]
+    assert cursor is None
@@ -0,0 +1,188 @@
+# tests/test_group_emissions.py
+
+import threading
+import uuid
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import Session
+
+from app.services import group_emissions
+
+
+def _aggregate_rows(aggregate_fails=False):
+    """on_execute : agrégat présent (to_regclass), lecture de l'agrégat en échec si demandé."""
+    def _on_execute(sql, params):
+        if "to_regclass" in sql:
+            return [{"ok": True}]
+        if aggregate_fails and "FROM public.group_emissions_daily g" in sql:
+            raise ProgrammingError(sql, params, Exception("relation does not exist"))
+        return None
+    return _on_execute
+
+
+@pytest.fixture(autouse=True)
+def _aggregate_enabled(monkeypatch):
+    group_emissions.invalidate_group_aggregate_cache()
+    monkeypatch.setattr(group_emissions, "GROUP_AGGREGATE_ENABLED", True)
+    yield
+    group_emissions.invalidate_group_aggregate_cache()
+
+
+ROWS = [
+    {"group_id": 1, "category_code": "FOOD", "avg_emission": 2.0, "min_emission": 1.0,
+     "max_emission": 3.0, "total_emission": 6.0},
+]
+
+
+def _data_queries(db):
+    return [sql for sql, _ in db.calls if "to_regclass" not in sql]
+
+
+def test_summary_reads_preaggregated_rows(client, fake_db):
+    db = fake_db(ROWS, _aggregate_rows())
+
+    r = client.get("/emissions/summary_groups", params={"group_ids": 1, "start_date": "2024-01-01"})
+    assert r.status_code == 200
+    (sql,) = _data_queries(db)
+    assert "FROM public.group_emissions_daily g" in sql
+    assert "g.bucket_day >= :start_date" in sql
+    assert "emission_calculations" not in sql
+    assert r.json()["series"][0]["items"][0]["total_emission"] == 6.0
+
+
+def test_compare_falls_back_to_raw_join_when_aggregate_fails(client, fake_db):
+    db = fake_db(on_execute=_aggregate_rows(aggregate_fails=True))
+
+    r = client.get("/groups/compare", params=[("ids", 1), ("ids", 2)])
+    assert r.status_code == 200
+    aggregate_sql, raw_sql = _data_queries(db)
+    assert "group_emissions_daily" in aggregate_sql
+    assert "JOIN public.emission_calculations" in raw_sql
+    assert db.rollbacks == 1
+
+    # cache invalidé : l'agrégat est re-sondé à l'appel suivant
+    client.get("/groups/compare", params={"ids": 1})
+    assert sum("to_regclass" in sql for sql, _ in db.calls) == 2
+
+
+# ---------------------------------------------------------------------------
+#  Triggers (PostgreSQL réel, migrations appliquées)
+# ---------------------------------------------------------------------------
+def _aggregate_db(pg_db):
+    if pg_db.execute(text("SELECT to_regclass('public.group_emissions_daily')")).scalar() is None:
+        pytest.skip("group_emissions_daily absente (migrations non appliquées)")
+    return pg_db
+
+
+def _cells(db, gid):
+    """(agrégat, jointure brute) pour le groupe : doivent être égaux."""
+    aggregate = db.execute(text(
+        "SELECT bucket_day, category_code, total_gco2e, calc_count, min_gco2e, max_gco2e "
+        "FROM public.group_emissions_daily WHERE group_id = :gid ORDER BY 1, 2"
+    ), {"gid": gid}).all()
+    raw = db.execute(text(
+        "SELECT ec.created_at::date, COALESCE(ec.category_code, ''), SUM(ec.emissions_gco2e)::float8, "
+        "COUNT(*), MIN(ec.emissions_gco2e)::float8, MAX(ec.emissions_gco2e)::float8 "
+        "FROM public.user_group_sessions ugs "
+        "JOIN public.emission_calculations ec ON ec.session_id = ugs.session_id "
+        "WHERE ugs.group_id = :gid GROUP BY 1, 2 ORDER BY 1, 2"
+    ), {"gid": gid}).all()
+    return [tuple(r) for r in aggregate], [tuple(r) for r in raw]
+
+
+def test_membership_trigger_keeps_aggregate_exact(pg_db, add_calcs):
+    db = _aggregate_db(pg_db)
+    s1, s2 = (f"test-{uuid.uuid4()}" for _ in range(2))
+    gid = db.execute(text("INSERT INTO public.user_groups (name) VALUES ('t') RETURNING id")).scalar()
+    add_calcs(db, s1, [10, 30])
+    add_calcs(db, s2, [5])
+    add_calcs(db, s2, [7], at="2024-03-06 12:00:00+00")
+
+    # Écritures hors API (comme un script) : le trigger suit la table
+    for sid in (s1, s2, s1):
+        db.execute(text(
+            "INSERT INTO public.user_group_sessions (group_id, session_id) VALUES (:g, :s) ON CONFLICT DO NOTHING"
+        ), {"g": gid, "s": sid})
+    aggregate, raw = _cells(db, gid)
+    assert aggregate == raw and len(raw) == 2
+    assert aggregate[0][2:] == (45.0, 3, 5.0, 30.0)
+
+    # Sortie de session : min / max recalculés depuis les membres restants
+    db.execute(text("DELETE FROM public.user_group_sessions WHERE group_id = :g AND session_id = :s"),
+               {"g": gid, "s": s2})
+    aggregate, raw = _cells(db, gid)
+    assert aggregate == raw and aggregate[0][2:] == (40.0, 2, 10.0, 30.0)
+
+    # Changement de session d'un membre (UPDATE) puis d'un calcul
+    db.execute(text("UPDATE public.user_group_sessions SET session_id = :new WHERE group_id = :g"),
+               {"g": gid, "new": s2})
+    assert _cells(db, gid)[0] == _cells(db, gid)[1]
+    db.execute(text("UPDATE public.emission_calculations SET session_id = :new WHERE session_id = :old"),
+               {"old": s1, "new": s2})
+    aggregate, raw = _cells(db, gid)
+    assert aggregate == raw and sum(c[3] for c in aggregate) == 4
+
+    # Suppression du groupe : cascade sans recalcul, plus aucune cellule
+    db.execute(text("DELETE FROM public.user_groups WHERE id = :g"), {"g": gid})
+    assert _cells(db, gid) == ([], [])
+
+
+def test_routes_update_aggregate_through_trigger(client, pg_db, use_db, add_calcs):
+    db = use_db(_aggregate_db(pg_db))
+    sid = f"test-{uuid.uuid4()}"
+    gid = db.execute(text("INSERT INTO public.user_groups (name) VALUES ('t') RETURNING id")).scalar()
+    add_calcs(db, sid, [2, 4])
+
+    assert client.post(f"/groups/{gid}/sessions", json={"session_id": sid}).status_code == 204
+    assert client.post(f"/groups/{gid}/sessions", json={"session_id": sid}).status_code == 204  # déjà membre
+    aggregate, raw = _cells(db, gid)
+    assert aggregate == raw and aggregate[0][3] == 2
+
+    assert client.delete(f"/groups/{gid}/sessions/{sid}").status_code == 204
+    assert _cells(db, gid) == ([], [])
+
+
+def test_calc_inserted_during_membership_change_is_counted_once(pg_engine, add_calcs):
+    # Deux transactions validées : le calcul attend le verrou de session pris par l'ajout
+    with Session(pg_engine) as setup:
+        _aggregate_db(setup)
+        sid = f"test-{uuid.uuid4()}"
+        gid = setup.execute(text("INSERT INTO public.user_groups (name) VALUES ('t') RETURNING id")).scalar()
+        setup.commit()
+    try:
+        with Session(pg_engine) as member, Session(pg_engine) as calc:
+            member.execute(text("INSERT INTO public.user_group_sessions (group_id, session_id) VALUES (:g, :s)"),
+                           {"g": gid, "s": sid})
+            writer = threading.Thread(target=lambda: (add_calcs(calc, sid, [3]), calc.commit()))
+            writer.start()
+            writer.join(0.5)
+            assert writer.is_alive()  # bloqué par pg_advisory_xact_lock
+            member.commit()
+            writer.join(10)
+            assert not writer.is_alive()
+
+        with Session(pg_engine) as check:
+            aggregate, raw = _cells(check, gid)
+            assert aggregate == raw and aggregate[0][3] == 1
+    finally:
+        with Session(pg_engine) as cleanup:
+            cleanup.execute(text("DELETE FROM public.user_groups WHERE id = :g"), {"g": gid})
+            cleanup.execute(text("DELETE FROM public.emission_calculations WHERE session_id = :s"), {"s": sid})
+            cleanup.execute(text("DELETE FROM public.emission_factors WHERE source = :s"), {"s": sid})
+            cleanup.commit()
+
+
+def test_rebuild_matches_trigger_maintained_cells(pg_db, add_calcs):
+    db = _aggregate_db(pg_db)
+    sid = f"test-{uuid.uuid4()}"
+    gid = db.execute(text("INSERT INTO public.user_groups (name) VALUES ('t') RETURNING id")).scalar()
+    add_calcs(db, sid, [1, 2, 3])
+    add_calcs(db, sid, [4], category="DRINK")
+    db.execute(text("INSERT INTO public.user_group_sessions (group_id, session_id) VALUES (:g, :s)"),
+               {"g": gid, "s": sid})
+    maintained = _cells(db, gid)[0]
+
+    assert group_emissions.rebuild_group_emissions(db, gid) == 2
+    assert _cells(db, gid)[0] == maintained
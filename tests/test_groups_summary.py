@@ -0,0 +1,74 @@
+# tests/test_groups_summary.py
+
+import uuid
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from app.services import group_emissions
+from app.services.group_emissions import summary_groups_sql
+from app.routers import groups_a41
+
+
+@pytest.fixture(autouse=True)
+def _raw_join(monkeypatch):
+    # lecture sur la jointure brute (l'agrégat est couvert par test_group_emissions.py)
+    monkeypatch.setattr(group_emissions, "GROUP_AGGREGATE_ENABLED", False)
+
+
+def test_all_groups_are_aggregated_in_one_query(client, fake_db):
+    rows = [
+        {"group_id": 1, "category_code": "FOOD", "avg_emission": 2.0, "min_emission": 1.0,
+         "max_emission": 3.0, "total_emission": 6.0},
+        {"group_id": 1, "category_code": "", "avg_emission": 1.0, "min_emission": 1.0,
+         "max_emission": 1.0, "total_emission": 1.0},
+        {"group_id": 3, "category_code": "TRANSPORT", "avg_emission": 5.0, "min_emission": 5.0,
+         "max_emission": 5.0, "total_emission": 5.0},
+    ]
+    db = fake_db(rows)
+
+    r = client.get("/emissions/summary_groups", params=[("group_ids", 3), ("group_ids", 1), ("group_ids", 2)])
+    assert r.status_code == 200
+    assert len(db.calls) == 1
+    sql, params = db.calls[0]
+    assert "JOIN public.emission_calculations" in sql
+    assert params["gids"] == [1, 2, 3]
+
+    series = r.json()["series"]
+    assert [s["group_id"] for s in series] == [3, 1, 2]  # ordre de la requête conservé
+    assert [it["category_code"] for it in series[1]["items"]] == ["FOOD", ""]
+    assert series[2]["items"] == []
+
+
+def test_group_count_is_capped(client, fake_db, monkeypatch):
+    db = fake_db()
+    monkeypatch.setattr(groups_a41, "SUMMARY_GROUPS_MAX", 2)
+
+    r = client.get("/emissions/summary_groups", params=[("group_ids", i) for i in range(3)])
+    assert r.status_code == 422
+    assert db.calls == []
+
+
+def test_summary_sql_runs_on_postgres_and_aggregate_matches_raw_join(pg_db, add_calcs):
+    if pg_db.execute(text("SELECT to_regclass('public.group_emissions_daily')")).scalar() is None:
+        pytest.skip("group_emissions_daily absente (migrations non appliquées)")
+    sessions = [f"test-{uuid.uuid4()}" for _ in range(3)]
+    gids = [pg_db.execute(text("INSERT INTO public.user_groups (name) VALUES ('t') RETURNING id")).scalar()
+            for _ in range(2)]
+    add_calcs(pg_db, sessions[0], [1.5, 4], at="2024-03-04 12:00:00+00")
+    add_calcs(pg_db, sessions[0], [8], at="2024-03-04 12:00:00+00", category="DRINK")
+    add_calcs(pg_db, sessions[1], [2], at="2024-03-20 12:00:00+00")
+    add_calcs(pg_db, sessions[2], [100], at="2024-02-01 12:00:00+00")  # hors période
+    for gid, sid in [(gids[0], sessions[0]), (gids[0], sessions[1]), (gids[1], sessions[1]), (gids[1], sessions[2])]:
+        pg_db.execute(text("INSERT INTO public.user_group_sessions (group_id, session_id) VALUES (:g, :s)"),
+                      {"g": gid, "s": sid})
+
+    bind = {"gids": gids, "start_date": date(2024, 3, 1), "end_date": date(2024, 3, 31)}
+    raw = [dict(r) for r in pg_db.execute(summary_groups_sql(False, True, True), bind).mappings()]
+    aggregate = [dict(r) for r in pg_db.execute(summary_groups_sql(True, True, True), bind).mappings()]
+    assert aggregate == raw
+    assert [(r["group_id"], r["category_code"], r["total_emission"]) for r in raw] == [
+        (gids[0], "DRINK", 8.0), (gids[0], "FOOD", 7.5), (gids[1], "FOOD", 2.0),
+    ]
+    assert raw[1]["avg_emission"] == pytest.approx(2.5) and raw[1]["min_emission"] == 1.5
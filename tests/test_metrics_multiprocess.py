@@ -0,0 +1,78 @@
+# tests/test_metrics_multiprocess.py
+
+import multiprocessing
+import os
+
+import pytest
+
+from app.telemetry import metrics
+from app.telemetry.mmap_store import MmapDict, mark_process_dead, read_file, worker_file
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("HONOUA_METRICS_DIR", str(tmp_path))
+    metrics.reset_metrics()
+    yield tmp_path
+    metrics.reset_metrics()
+
+
+def _worker(n):
+    for _ in range(n):
+        metrics.record_http_request("/ping", "GET", 200, 3.0, response_bytes=10)
+    metrics.record_cache_event("product", "hit", n)
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="fork requis")
+def test_prometheus_merges_all_workers(metrics_dir):
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_worker, args=(n,)) for n in (3, 4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+
+    _worker(1)  # processus courant
+
+    snap = metrics.get_metrics_snapshot()
+    assert snap["total_requests"] == 8
+    assert snap["cache"]["product"]["hit"] == 8
+    ping = next(s for s in snap["http"] if s["route"] == "/ping")
+    assert ping["count"] == 8 and ping["response_bytes"] == 80
+
+    body = metrics.get_prometheus_metrics()
+    assert "honoua_total_requests 8" in body
+    assert 'honoua_http_request_duration_ms_count{route="/ping",method="GET",status="200"} 8' in body
+
+
+def test_dead_worker_counters_are_archived(metrics_dir):
+    dead = MmapDict(worker_file(str(metrics_dir), 999999))
+    dead.inc(("requests",), 5)
+    dead.inc(("gauge", "in_flight"), 2)
+    dead.close()
+
+    assert metrics.get_metrics_snapshot()["in_flight"] == 2
+
+    mark_process_dead(999999, str(metrics_dir))
+
+    assert not os.path.exists(worker_file(str(metrics_dir), 999999))
+    snap = metrics.get_metrics_snapshot()
+    assert snap["total_requests"] == 5      # compteur conservé (archive)
+    assert snap["in_flight"] == 0           # jauge du worker mort retirée
+
+
+def test_mmap_file_grows_and_reloads(tmp_path):
+    path = str(tmp_path / "metrics_1.db")
+    d = MmapDict(path)
+    for i in range(3000):
+        d.inc(("cache", f"c{i}", "hit"), i)
+    d.close()
+
+    values = read_file(path)
+    assert len(values) == 3000
+
+    reopened = MmapDict(path)
+    reopened.inc(("cache", "c10", "hit"), 1)
+    assert reopened.values()[("cache", "c10", "hit")] == 11
+    reopened.close()
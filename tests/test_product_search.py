@@ -0,0 +1,68 @@
+# tests/test_product_search.py
+
+import pytest
+
+from app.main import ProductDB
+
+
+EANS = ["4000000003001", "4000000003018", "4000000003025", "4000000003032"]
+
+
+@pytest.fixture
+def catalogue(_SessionLocal):
+    with _SessionLocal() as s:
+        s.query(ProductDB).filter(ProductDB.ean13_clean.in_(EANS)).delete()
+        s.add_all([
+            ProductDB(ean13_clean=EANS[0], product_name="Chocolat noir 70%", brand="Cacaoz"),
+            ProductDB(ean13_clean=EANS[1], product_name="Chocolat au lait", brand="Cacaoz"),
+            ProductDB(ean13_clean=EANS[2], product_name="Biscuits fourrés", brand="Chocolaterie Dupont"),
+            ProductDB(ean13_clean=EANS[3], product_name="Pâte à crêpes", brand=None),
+        ])
+        s.commit()
+    yield EANS
+    with _SessionLocal() as s:
+        s.query(ProductDB).filter(ProductDB.ean13_clean.in_(EANS)).delete()
+        s.commit()
+
+
+def test_prefix_search_is_ranked(client, catalogue):
+    r = client.get("/api/v1/products/search", params={"q": "choc"})
+    assert r.status_code == 200
+    eans = [it["ean"] for it in r.json()["items"]]
+    assert set(eans) == set(EANS[:3])
+    # Correspondance sur le nom avant correspondance sur la marque
+    assert eans[-1] == EANS[2]
+
+
+def test_multi_token_and_accents(client, catalogue):
+    items = client.get("/api/v1/products/search", params={"q": "choco lait"}).json()["items"]
+    assert [it["ean"] for it in items] == [EANS[1]]
+
+    items = client.get("/api/v1/products/search", params={"q": "pate crep"}).json()["items"]
+    assert [it["ean"] for it in items] == [EANS[3]]
+
+
+def test_keyset_pagination_walks_all_results(client, catalogue):
+    seen, cursor = [], None
+    for _ in range(10):
+        params = {"q": "choc", "limit": 1}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/api/v1/products/search", params=params).json()
+        seen.extend(it["ean"] for it in body["items"])
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+
+    assert len(seen) == 3 and set(seen) == set(EANS[:3])
+
+
+def test_invalid_cursor_is_rejected(client, catalogue):
+    r = client.get("/api/v1/products/search", params={"q": "choc", "cursor": "!!"})
+    assert r.status_code == 422
+
+
+def test_legacy_post_search_uses_index(client, catalogue):
+    r = client.post("/products/search", json={"q": "crêpes"})
+    assert r.status_code == 200
+    assert [p["ean"] for p in r.json()] == [EANS[3]]
@@ -68,3 +68,47 @@ def test_telemetry_middleware_logs_basic_fields(monkeypatch):
     assert "db_duration_ms" in extra
     # pour l’instant on accepte None
     assert extra["db_duration_ms"] is None
+
+
+def test_telemetry_middleware_records_route_histogram():
+    from app.telemetry.metrics import get_http_stats, get_prometheus_metrics
+
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        return {"id": item_id}
+
+    app.add_middleware(TelemetryMiddleware)
+    client = TestClient(app)
+
+    for i in range(3):
+        assert client.get(f"/items/{i}").status_code == 200
+    assert client.get("/nope").status_code == 404
+
+    stats = {(s["route"], s["method"], s["status"]): s for s in get_http_stats()}
+    ok = stats[("/items/{item_id}", "GET", 200)]
+    assert ok["count"] >= 3
+    assert ok["response_bytes"] >= 3 * len(b'{"id":0}')
+    assert ok["p50_ms"] is not None and ok["p50_ms"] <= ok["p99_ms"]
+    assert ("__unmatched__", "GET", 404) in stats
+
+    body = get_prometheus_metrics()
+    assert 'honoua_http_request_duration_ms_bucket{route="/items/{item_id}",method="GET",status="200",le="+Inf"}' in body
+    assert 'quantile="0.95"' in body
+    assert "honoua_http_requests_in_flight 0" in body
+
+
+def test_histogram_quantile_interpolates_within_bucket():
+    from app.telemetry.metrics import LATENCY_BUCKETS_MS, histogram_quantile
+
+    buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    idx_10 = LATENCY_BUCKETS_MS.index(10)
+    idx_1000 = LATENCY_BUCKETS_MS.index(1000)
+    buckets[idx_10] = 95        # 95 requêtes dans ]5, 10] ms
+    buckets[idx_1000] = 5       # 5 requêtes lentes dans ]500, 1000] ms
+
+    assert 5 < histogram_quantile(0.5, buckets) <= 10
+    assert histogram_quantile(0.95, buckets) <= 10
+    assert 500 < histogram_quantile(0.99, buckets) <= 1000
+    assert histogram_quantile(0.5, [0] * len(buckets)) is None
@@ -0,0 +1,126 @@
+# tests/test_token_revocation.py
+
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event, text
+
+from app.middleware.blacklist_guard import engine as blacklist_engine
+from app.security.jwt_utils import encode_jwt
+from app.security.revocation import RevocationCache, revocation_cache
+
+
+@pytest.fixture
+def blacklist_table():
+    engine = blacklist_engine
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS token_blacklist (
+                jti VARCHAR(64) PRIMARY KEY,
+                revoked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                reason VARCHAR(255)
+            )
+        """))
+        conn.execute(text("DELETE FROM token_blacklist"))
+    revocation_cache.clear()
+    yield engine
+    revocation_cache.clear()
+
+
+def _count_blacklist_selects(engine):
+    calls = []
+
+    def _before(conn, cursor, statement, params, context, executemany):
+        if "token_blacklist" in statement:
+            calls.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before)
+    return calls, lambda: event.remove(engine, "before_cursor_execute", _before)
+
+
+def test_non_revoked_path_does_not_hit_db(client, blacklist_table):
+    token, _, _ = encode_jwt("user-1")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # Premier appel : chargement initial du cache
+    assert client.get("/products", headers=headers).status_code == 200
+
+    calls, stop = _count_blacklist_selects(blacklist_table)
+    try:
+        for _ in range(5):
+            assert client.get("/products", headers=headers).status_code == 200
+    finally:
+        stop()
+    assert calls == []
+
+
+def test_revocation_from_db_is_picked_up_incrementally(client, blacklist_table):
+    token, jti, _ = encode_jwt("user-2")
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/products", headers=headers).status_code == 200
+
+    with blacklist_table.begin() as conn:
+        conn.execute(text("INSERT INTO token_blacklist (jti, reason) VALUES (:jti, 'test')"), {"jti": jti})
+
+    # Tant que l'intervalle n'est pas écoulé, le cache fait foi
+    assert revocation_cache.refresh(blacklist_table) >= 1
+    r = client.get("/products", headers=headers)
+    assert r.status_code == 401
+    assert r.json()["detail"] == "Token revoked"
+
+
+def test_local_add_and_ttl():
+    cache = RevocationCache(refresh_interval_s=60)
+    cache.add("jti-a", exp=time.time() + 60)
+    cache.add("jti-b", exp=time.time() - 1)
+    assert cache.is_revoked("jti-a")
+    assert not cache.is_revoked("jti-b")
+    assert not cache.is_revoked("unknown")
+    assert len(cache) == 1
+
+
+def test_late_commit_below_watermark_is_picked_up(blacklist_table):
+    cache = RevocationCache(refresh_interval_s=60, overlap_s=60)
+    with blacklist_table.begin() as conn:
+        conn.execute(text("INSERT INTO token_blacklist (jti, revoked_at) VALUES ('jti-now', CURRENT_TIMESTAMP)"))
+    cache.refresh(blacklist_table)
+    assert cache.is_revoked("jti-now")
+
+    # Transaction commencée 30 s plus tôt (revoked_at = NOW()), validée après la lecture
+    with blacklist_table.begin() as conn:
+        conn.execute(
+            text("INSERT INTO token_blacklist (jti, revoked_at) VALUES ('jti-late', :ts)"),
+            {"ts": datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=30)},
+        )
+    cache.refresh(blacklist_table)
+    assert cache.is_revoked("jti-late")
+    assert len(cache) == 2
+
+
+def test_db_outage_fails_closed_past_max_staleness(client, blacklist_table, monkeypatch, caplog):
+    from app.middleware import blacklist_guard
+    from sqlalchemy import create_engine
+
+    broken = create_engine("sqlite:////nonexistent-dir/honoua.db")
+    cache = RevocationCache(refresh_interval_s=0, max_stale_s=0.05)
+    cache.refresh(blacklist_table)
+    assert not cache.is_stale()
+    with caplog.at_level("WARNING", logger="honoua"):
+        assert cache.refresh(broken) == 0
+    assert "refresh failed" in caplog.text
+    time.sleep(0.06)
+    assert cache.is_stale()
+
+    # Cache périmé : lecture directe de token_blacklist, 503 si la base ne répond pas
+    token, jti, _ = encode_jwt("user-3")
+    headers = {"Authorization": f"Bearer {token}"}
+    monkeypatch.setattr(blacklist_guard, "revocation_cache", cache)
+    with blacklist_table.begin() as conn:
+        conn.execute(text("INSERT INTO token_blacklist (jti, reason) VALUES (:jti, 'test')"), {"jti": jti})
+    monkeypatch.setattr(blacklist_guard, "engine", broken)
+    assert client.get("/products", headers=headers).status_code == 503
+    monkeypatch.setattr(blacklist_guard, "engine", blacklist_table)
+    monkeypatch.setattr(cache, "needs_refresh", lambda: False)
+    r = client.get("/products", headers=headers)
+    assert r.status_code == 401 and r.json()["detail"] == "Token revoked"
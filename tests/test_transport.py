@@ -0,0 +1,81 @@
+# tests/test_transport.py
+
+import math
+import random
+
+import pytest
+
+from app.services.transport import (
+    EMISSION_FACTOR_TONNE_KM,
+    FRANCE_LAT,
+    FRANCE_LON,
+    compute_transport_batch,
+    haversine_km,
+    transport_distance_km,
+    transport_emissions_kg,
+)
+
+
+def _legacy_haversine_km(lat1, lon1, lat2, lon2):
+    # Copie de l'ancienne implémentation de app.main (référence bit à bit)
+    rlat1 = math.radians(lat1)
+    rlon1 = math.radians(lon1)
+    rlat2 = math.radians(lat2)
+    rlon2 = math.radians(lon2)
+    dlat = rlat2 - rlat1
+    dlon = rlon2 - rlon1
+    a = math.sin(dlat / 2) ** 2 + math.cos(rlat1) * math.cos(rlat2) * math.sin(dlon / 2) ** 2
+    c = 2 * math.asin(math.sqrt(a))
+    R = 6371.0
+    return R * c
+
+
+def _random_points(n, seed=42):
+    rnd = random.Random(seed)
+    return [(rnd.uniform(-90, 90), rnd.uniform(-180, 180)) for _ in range(n)]
+
+
+def test_scalar_path_is_bit_compatible():
+    pts = _random_points(500)
+    for (la1, lo1), (la2, lo2) in zip(pts, reversed(pts)):
+        assert haversine_km(la1, lo1, la2, lo2) == _legacy_haversine_km(la1, lo1, la2, lo2)
+
+
+def test_batch_distance_rules_match_single_product():
+    origins = [
+        (43.6, 1.44, "FR"),                   # origine connue
+        (None, None, "FR"),                   # défaut FR
+        (None, None, "ES"),                   # défaut autres
+        ("45.0", "bad", None),                # coordonnée illisible → défaut
+        (48.85, 2.35, "FR"),                  # origine == utilisateur → centre France
+        (FRANCE_LAT, FRANCE_LON, "FR"),       # distance nulle partout → défaut FR
+    ]
+    lats = [o[0] for o in origins]
+    lons = [o[1] for o in origins]
+    countries = [o[2] for o in origins]
+
+    for user in [(48.85, 2.35), (None, None)]:
+        distances, _ = compute_transport_batch(lats, lons, [1.0] * len(lats), user[0], user[1], countries)
+        assert distances == [transport_distance_km(la, lo, user[0], user[1], c) for la, lo, c in origins]
+
+
+def test_batch_emissions_per_destination():
+    distances, emissions = compute_transport_batch(
+        origin_lat=[43.6, None],
+        origin_lon=[1.44, None],
+        weight_kg=[2.0, 0.5],
+        dest_lat=[48.85, 45.76],
+        dest_lon=[2.35, 4.83],
+        origin_country=["FR", "IT"],
+    )
+    assert distances[1] == 4500.0
+    assert emissions[1] == pytest.approx(4500.0 * 0.0005 * EMISSION_FACTOR_TONNE_KM)
+    assert emissions[0] == pytest.approx(distances[0] * 0.002 * EMISSION_FACTOR_TONNE_KM)
+
+
+def test_batch_is_bit_identical_to_single_product():
+    pts = _random_points(200, seed=3)
+    args = ([p[0] for p in pts], [p[1] for p in pts], [1.5] * len(pts))
+    distances, emissions = compute_transport_batch(*args, dest_lat=48.85, dest_lon=2.35)
+    assert distances == [transport_distance_km(la, lo, 48.85, 2.35, None) for la, lo, _ in zip(*args)]
+    assert emissions == [transport_emissions_kg(d, 1.5) for d in distances]